@@ -0,0 +1,286 @@
+"""Pool of OpenAI-compatible AI endpoints with health scoring and failover.
+
+Purpose:
+- Without a pool every request is bound to one `*_base_url`; a provider
+  outage or a 429 storm pauses the whole run.
+- With a pool, requests are routed by weight and health, failing endpoints
+  are taken out by a circuit breaker and a request fails over to the next
+  endpoint before the run is paused.
+
+Input / Output:
+- Endpoints: name, base_url, model, api_key and routing weight.
+- `call(send)` picks an endpoint, calls `send(endpoint, is_last)` and fails
+  over on any exception; `is_last` tells the caller to use its full retry
+  budget because nothing is left to fail over to.
+- `stats()` returns per-endpoint health and counters for metrics and the
+  worker `/api/status`.
+
+Important invariants:
+- Routing is deterministic (smooth weighted round robin): the effective
+  weight is `weight * (1 - error_ewma) * fastest_latency / latency`.
+- A circuit opens after `failure_threshold` consecutive failures or after a
+  pause error (429/quota), for `max(open_seconds, retry_after)`. After that
+  one trial request is let through (half-open); success closes it again.
+- When every endpoint failed, the last pause error is re-raised (its
+  retry-after is shortened to the next circuit reopening). Without a pause
+  error, the last error is re-raised while some circuit is still closed;
+  only when all circuits are open `AllEndpointsUnavailable` carries the wait.
+
+How to debug:
+- Run `python3 -m unittest tests.test_ai_endpoints`.
+- Check `last_run.performance.pipeline.ai_endpoints` in `run_metrics.json`
+  or `ai_endpoints` in the worker `/api/status`.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple, Type, TypeVar
+
+
+T = TypeVar("T")
+
+PRIMARY_ENDPOINT_NAME = "primary"
+CIRCUIT_CLOSED = "closed"
+CIRCUIT_OPEN = "open"
+CIRCUIT_HALF_OPEN = "half_open"
+# Untergrenze, damit ein einzelner sehr schneller Messwert nicht alles dominiert.
+MIN_LATENCY_SECONDS = 0.05
+MIN_HEALTH_FACTOR = 0.05
+
+
+class AllEndpointsUnavailable(Exception):
+    """Alle Endpoints sind fehlgeschlagen oder per Circuit Breaker gesperrt."""
+
+    def __init__(self, message: str, *, retry_after_seconds: float) -> None:
+        super().__init__(message)
+        self.retry_after_seconds = retry_after_seconds
+
+
+@dataclass
+class AiEndpoint:
+    """One OpenAI-compatible endpoint and its health state."""
+
+    name: str
+    base_url: str
+    model: str
+    api_key: str
+    weight: float = 1.0
+    # Pro Endpoint eigener Limiter (gesetzt vom Aufrufer), None = ungebremst.
+    rate_limiter: Optional[Any] = None
+    state: str = CIRCUIT_CLOSED
+    open_until: float = 0.0
+    trial_in_flight: bool = False
+    consecutive_failures: int = 0
+    latency_ewma: Optional[float] = None
+    error_ewma: float = 0.0
+    current_weight: float = 0.0
+    counters: Dict[str, int] = field(
+        default_factory=lambda: {
+            "requests": 0,
+            "successes": 0,
+            "failures": 0,
+            "pause_errors": 0,
+            "failovers": 0,
+            "circuit_opens": 0,
+        }
+    )
+
+
+class AiEndpointPool:
+    """Weighted, health-aware routing over several endpoints (thread-safe)."""
+
+    def __init__(
+        self,
+        endpoints: Iterable[AiEndpoint],
+        *,
+        ewma_alpha: float = 0.3,
+        failure_threshold: int = 3,
+        open_seconds: float = 60.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.endpoints: List[AiEndpoint] = list(endpoints)
+        if not self.endpoints:
+            raise ValueError("AiEndpointPool benötigt mindestens einen Endpoint.")
+        names = [endpoint.name for endpoint in self.endpoints]
+        if len(set(names)) != len(names):
+            raise ValueError(f"Endpoint-Namen müssen eindeutig sein: {names}")
+        self.ewma_alpha = min(1.0, max(0.01, float(ewma_alpha)))
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.open_seconds = max(0.0, float(open_seconds))
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.failovers = 0
+        self.exhausted = 0
+
+    def _available(self, endpoint: AiEndpoint, now: float) -> bool:
+        if endpoint.state == CIRCUIT_OPEN and now >= endpoint.open_until:
+            endpoint.state = CIRCUIT_HALF_OPEN
+            endpoint.trial_in_flight = False
+        if endpoint.state == CIRCUIT_OPEN:
+            return False
+        if endpoint.state == CIRCUIT_HALF_OPEN:
+            return not endpoint.trial_in_flight
+        return True
+
+    def _effective_weights(self, candidates: Sequence[AiEndpoint]) -> List[float]:
+        measured = [endpoint.latency_ewma for endpoint in candidates if endpoint.latency_ewma is not None]
+        fastest = max(MIN_LATENCY_SECONDS, min(measured)) if measured else None
+        weights = []
+        for endpoint in candidates:
+            health = max(MIN_HEALTH_FACTOR, 1.0 - endpoint.error_ewma)
+            speed = 1.0
+            if fastest is not None and endpoint.latency_ewma is not None:
+                speed = fastest / max(MIN_LATENCY_SECONDS, endpoint.latency_ewma)
+            weights.append(max(0.0, endpoint.weight) * health * speed)
+        return weights
+
+    def choose(self, exclude: Sequence[str] = ()) -> Tuple[Optional[AiEndpoint], int]:
+        """Next endpoint by smooth weighted round robin and the number of other
+        endpoints that would still be available afterwards."""
+
+        with self._lock:
+            now = self._clock()
+            candidates = [
+                endpoint
+                for endpoint in self.endpoints
+                if endpoint.name not in exclude and self._available(endpoint, now)
+            ]
+            if not candidates:
+                return None, 0
+            weights = self._effective_weights(candidates)
+            total = sum(weights)
+            if total <= 0.0:
+                weights = [1.0] * len(candidates)
+                total = float(len(candidates))
+            for endpoint, weight in zip(candidates, weights):
+                endpoint.current_weight += weight
+            chosen = max(candidates, key=lambda endpoint: endpoint.current_weight)
+            chosen.current_weight -= total
+            if chosen.state == CIRCUIT_HALF_OPEN:
+                chosen.trial_in_flight = True
+            chosen.counters["requests"] += 1
+            return chosen, len(candidates) - 1
+
+    def record_success(self, endpoint: AiEndpoint, latency_seconds: float) -> None:
+        with self._lock:
+            alpha = self.ewma_alpha
+            latency = max(0.0, float(latency_seconds))
+            if endpoint.latency_ewma is None:
+                endpoint.latency_ewma = latency
+            else:
+                endpoint.latency_ewma = alpha * latency + (1.0 - alpha) * endpoint.latency_ewma
+            endpoint.error_ewma = (1.0 - alpha) * endpoint.error_ewma
+            endpoint.consecutive_failures = 0
+            endpoint.state = CIRCUIT_CLOSED
+            endpoint.trial_in_flight = False
+            endpoint.counters["successes"] += 1
+
+    def record_failure(self, endpoint: AiEndpoint, *, retry_after_seconds: Optional[float] = None, pause: bool = False) -> None:
+        with self._lock:
+            alpha = self.ewma_alpha
+            endpoint.error_ewma = alpha + (1.0 - alpha) * endpoint.error_ewma
+            endpoint.consecutive_failures += 1
+            endpoint.counters["failures"] += 1
+            if pause:
+                endpoint.counters["pause_errors"] += 1
+            half_open_trial = endpoint.state == CIRCUIT_HALF_OPEN
+            endpoint.trial_in_flight = False
+            if pause or half_open_trial or endpoint.consecutive_failures >= self.failure_threshold:
+                open_for = max(self.open_seconds, float(retry_after_seconds or 0.0))
+                endpoint.state = CIRCUIT_OPEN
+                endpoint.open_until = self._clock() + open_for
+                endpoint.counters["circuit_opens"] += 1
+
+    def seconds_until_available(self) -> float:
+        with self._lock:
+            now = self._clock()
+            if any(self._available(endpoint, now) for endpoint in self.endpoints):
+                return 0.0
+            waits = [endpoint.open_until - now for endpoint in self.endpoints if endpoint.state == CIRCUIT_OPEN]
+            return max(0.0, min(waits)) if waits else 0.0
+
+    def call(
+        self,
+        send: Callable[[AiEndpoint, bool], T],
+        *,
+        pause_errors: Tuple[Type[BaseException], ...] = (),
+    ) -> T:
+        """Runs `send` on healthy endpoints until one succeeds."""
+
+        tried: List[str] = []
+        last_exc: Optional[BaseException] = None
+        last_pause: Optional[BaseException] = None
+        while True:
+            endpoint, remaining = self.choose(exclude=tried)
+            if endpoint is None:
+                break
+            if tried:
+                with self._lock:
+                    self.failovers += 1
+            tried.append(endpoint.name)
+            started = time.perf_counter()
+            try:
+                result = send(endpoint, remaining == 0)
+            except Exception as exc:  # noqa: BLE001 - jeder Fehler zählt gegen den Endpoint
+                is_pause = isinstance(exc, pause_errors)
+                self.record_failure(
+                    endpoint,
+                    retry_after_seconds=getattr(exc, "retry_after_seconds", None) if is_pause else None,
+                    pause=is_pause,
+                )
+                if remaining:
+                    with self._lock:
+                        endpoint.counters["failovers"] += 1
+                last_exc = exc
+                if is_pause:
+                    last_pause = exc
+                continue
+            self.record_success(endpoint, time.perf_counter() - started)
+            return result
+
+        with self._lock:
+            self.exhausted += 1
+        wait_seconds = self.seconds_until_available()
+        if last_pause is not None:
+            retry_after = getattr(last_pause, "retry_after_seconds", None)
+            if wait_seconds > 0.0 and (retry_after is None or wait_seconds < float(retry_after)):
+                # Der nächste Endpoint ist früher wieder frei als der letzte Anbieter.
+                setattr(last_pause, "retry_after_seconds", wait_seconds)
+            raise last_pause
+        if last_exc is not None and wait_seconds <= 0.0:
+            # Mindestens ein Endpoint ist weiter verfügbar: Fehler des Requests
+            # (z. B. ungültige Antwort), kein Grund für eine Laufpause.
+            raise last_exc
+        raise AllEndpointsUnavailable(
+            f"Alle KI-Endpoints fehlgeschlagen oder gesperrt ({', '.join(tried) or 'keiner verfügbar'}); "
+            f"nächster Versuch in {wait_seconds:.0f}s.",
+            retry_after_seconds=wait_seconds,
+        ) from last_exc
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            now = self._clock()
+            endpoints = []
+            for endpoint in self.endpoints:
+                endpoints.append(
+                    {
+                        "name": endpoint.name,
+                        "base_url": endpoint.base_url,
+                        "model": endpoint.model,
+                        "weight": endpoint.weight,
+                        "state": endpoint.state,
+                        "open_for_seconds": (
+                            round(max(0.0, endpoint.open_until - now), 1) if endpoint.state == CIRCUIT_OPEN else 0.0
+                        ),
+                        "latency_ewma_seconds": (
+                            round(endpoint.latency_ewma, 3) if endpoint.latency_ewma is not None else None
+                        ),
+                        "error_rate_ewma": round(endpoint.error_ewma, 4),
+                        "consecutive_failures": endpoint.consecutive_failures,
+                        **endpoint.counters,
+                    }
+                )
+            return {"failovers": self.failovers, "exhausted": self.exhausted, "endpoints": endpoints}
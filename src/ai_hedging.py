@@ -0,0 +1,238 @@
+"""Hedged AI requests to cut tail latency.
+
+Purpose:
+- A few slow provider responses dominate the p99 of a run; in batch mode
+  every one of them stalls the whole batch.
+- If a request has not answered within the observed p90 latency, a duplicate
+  is sent (same or secondary endpoint) and whichever answers first wins.
+
+Input / Output:
+- `RequestHedger.call(attempt)` runs `attempt("primary")` and, if needed,
+  `attempt("hedge")` and returns the first successful result.
+- `stats()` reports how often hedging was armed, fired and won, budget skips,
+  the current hedge delay and the duplicate tokens spent on losers.
+
+Important invariants:
+- Until `min_samples` latencies are known, requests run unhedged in the
+  calling thread (no extra threads, no duplicates).
+- Duplicates are capped by `max_ratio` (hedges per request) and optionally by
+  `max_duplicate_tokens`; once a cap is reached, hedging stops firing.
+- A blocking HTTP call cannot be aborted from another thread. The loser runs
+  to completion in the background; its result is discarded and its tokens
+  are reported via `record_duplicate_tokens`. `wait_for_discarded` lets the
+  caller wait (bounded) for losers still running before it writes costs.
+- If the first finished attempt failed, the other one is awaited; only when
+  both fail is the primary's error raised.
+
+How to debug:
+- Run `python3 -m unittest tests.test_ai_hedging`.
+- Check `last_run.performance.pipeline.hedging` in `run_metrics.json`.
+"""
+
+from __future__ import annotations
+
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, TimeoutError as FutureTimeout, wait
+import math
+import threading
+import time
+from typing import Any, Callable, Deque, Dict, Optional, TypeVar
+
+
+T = TypeVar("T")
+
+HEDGE_LATENCY_WINDOW = 200
+# Wartezeit am Laufende auf noch laufende Verlierer, bevor Kosten geschrieben werden.
+HEDGE_DISCARD_WAIT_SECONDS = 10.0
+ATTEMPT_PRIMARY = "primary"
+ATTEMPT_HEDGE = "hedge"
+
+
+def _start_attempt(fn: Callable[[], T]) -> "Future[T]":
+    """Runs `fn` in a daemon thread; the thread outlives the caller if needed."""
+
+    future: "Future[T]" = Future()
+
+    def runner() -> None:
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(fn())
+        except BaseException as exc:  # noqa: BLE001 - wird über das Future weitergereicht
+            future.set_exception(exc)
+
+    threading.Thread(target=runner, name="ai-hedge-attempt", daemon=True).start()
+    return future
+
+
+class RequestHedger:
+    """Shared p90 tracker and hedge budget for all classifier workers."""
+
+    def __init__(
+        self,
+        *,
+        percentile: float = 0.9,
+        min_delay_seconds: float = 2.0,
+        min_samples: int = 20,
+        max_ratio: float = 0.1,
+        max_duplicate_tokens: int = 0,
+        window: int = HEDGE_LATENCY_WINDOW,
+    ) -> None:
+        self.percentile = min(0.99, max(0.5, float(percentile)))
+        self.min_delay_seconds = max(0.0, float(min_delay_seconds))
+        self.min_samples = max(1, int(min_samples))
+        self.max_ratio = min(1.0, max(0.0, float(max_ratio)))
+        self.max_duplicate_tokens = max(0, int(max_duplicate_tokens))
+        self._latencies: Deque[float] = deque(maxlen=max(self.min_samples, int(window)))
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.armed = 0
+        self.fired = 0
+        self.hedge_wins = 0
+        self.primary_wins_after_fire = 0
+        self.budget_skips = 0
+        self.duplicate_prompt_tokens = 0
+        self.duplicate_completion_tokens = 0
+        self.duplicate_cached_prompt_tokens = 0
+        self._pending_discards = 0
+        self._discards_settled = threading.Condition(self._lock)
+
+    def record_latency(self, seconds: float) -> None:
+        with self._lock:
+            self._latencies.append(max(0.0, float(seconds)))
+
+    def record_duplicate_tokens(
+        self,
+        prompt_tokens: int,
+        completion_tokens: int,
+        cached_prompt_tokens: int = 0,
+    ) -> None:
+        """Tokens of a discarded attempt; the provider bills them anyway."""
+
+        prompt_tokens = max(0, int(prompt_tokens))
+        with self._lock:
+            self.duplicate_prompt_tokens += prompt_tokens
+            self.duplicate_completion_tokens += max(0, int(completion_tokens))
+            self.duplicate_cached_prompt_tokens += min(prompt_tokens, max(0, int(cached_prompt_tokens)))
+
+    def hedge_delay(self) -> Optional[float]:
+        """p-th percentile of recent primary latencies, None while warming up."""
+
+        with self._lock:
+            if len(self._latencies) < self.min_samples:
+                return None
+            ordered = sorted(self._latencies)
+        index = min(len(ordered) - 1, max(0, math.ceil(self.percentile * len(ordered)) - 1))
+        return max(self.min_delay_seconds, ordered[index])
+
+    def _reserve_hedge(self) -> bool:
+        with self._lock:
+            over_ratio = self.fired + 1 > self.max_ratio * self.requests
+            duplicate_tokens = self.duplicate_prompt_tokens + self.duplicate_completion_tokens
+            over_tokens = bool(self.max_duplicate_tokens) and duplicate_tokens >= self.max_duplicate_tokens
+            if over_ratio or over_tokens:
+                self.budget_skips += 1
+                return False
+            self.fired += 1
+            return True
+
+    def call(
+        self,
+        attempt: Callable[[str], T],
+        *,
+        on_discarded: Optional[Callable[[str, T], None]] = None,
+    ) -> T:
+        """Runs the primary attempt and hedges once it is slower than the delay."""
+
+        with self._lock:
+            self.requests += 1
+        delay = self.hedge_delay()
+        if delay is None or self.max_ratio <= 0.0:
+            started = time.perf_counter()
+            result = attempt(ATTEMPT_PRIMARY)
+            self.record_latency(time.perf_counter() - started)
+            return result
+
+        with self._lock:
+            self.armed += 1
+        primary_started = time.perf_counter()
+        primary = _start_attempt(lambda: attempt(ATTEMPT_PRIMARY))
+
+        def primary_finished(future: "Future[T]") -> None:
+            # Auch langsame Primär-Antworten zählen, sonst unterschätzt p90 das Ende.
+            if future.exception() is None:
+                self.record_latency(time.perf_counter() - primary_started)
+
+        primary.add_done_callback(primary_finished)
+        try:
+            return primary.result(timeout=delay)
+        except FutureTimeout:
+            pass
+        if not self._reserve_hedge():
+            return primary.result()
+
+        hedge = _start_attempt(lambda: attempt(ATTEMPT_HEDGE))
+        labels = {id(primary): ATTEMPT_PRIMARY, id(hedge): ATTEMPT_HEDGE}
+        pending = {primary, hedge}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    continue
+                with self._lock:
+                    if future is hedge:
+                        self.hedge_wins += 1
+                    else:
+                        self.primary_wins_after_fire += 1
+                for loser in pending:
+                    self._discard(loser, labels[id(loser)], on_discarded)
+                return future.result()
+        # Beide fehlgeschlagen: Fehler des Primär-Requests weitergeben.
+        return primary.result()
+
+    def _discard(
+        self,
+        future: "Future[T]",
+        label: str,
+        on_discarded: Optional[Callable[[str, T], None]],
+    ) -> None:
+        if future.cancel() or on_discarded is None:
+            return
+        with self._lock:
+            self._pending_discards += 1
+
+        def finished(done: "Future[T]") -> None:
+            try:
+                if done.exception() is None:
+                    on_discarded(label, done.result())
+            finally:
+                with self._lock:
+                    self._pending_discards -= 1
+                    self._discards_settled.notify_all()
+
+        future.add_done_callback(finished)
+
+    def wait_for_discarded(self, timeout: float = HEDGE_DISCARD_WAIT_SECONDS) -> int:
+        """Waits until running losers have reported their tokens; returns how many are still running."""
+
+        with self._lock:
+            self._discards_settled.wait_for(lambda: self._pending_discards == 0, max(0.0, float(timeout)))
+            return self._pending_discards
+
+    def stats(self) -> Dict[str, Any]:
+        delay = self.hedge_delay()
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "armed": self.armed,
+                "fired": self.fired,
+                "fire_rate": round(self.fired / self.requests, 4) if self.requests else 0.0,
+                "hedge_wins": self.hedge_wins,
+                "primary_wins_after_fire": self.primary_wins_after_fire,
+                "budget_skips": self.budget_skips,
+                "hedge_delay_seconds": round(delay, 3) if delay is not None else None,
+                "duplicate_prompt_tokens": self.duplicate_prompt_tokens,
+                "duplicate_completion_tokens": self.duplicate_completion_tokens,
+                "duplicate_cached_prompt_tokens": self.duplicate_cached_prompt_tokens,
+                "pending_discards": self._pending_discards,
+            }
@@ -0,0 +1,592 @@
+"""Concurrency helpers for the Paperless KIplus document pipeline.
+
+Purpose:
+- Keep a fixed number of AI classification slots busy instead of waiting for
+  the slowest request of a fixed-size batch.
+- Hand finished results back to the (single-threaded) caller so Paperless
+  writes, counters and pause/resume bookkeeping stay on one thread.
+- Run read-only Paperless stages (page fetch, precheck lookups) ahead of the
+  caller with bounded queues, so network reads overlap with AI latency.
+- Read the next pages of a paginated Paperless listing in the background
+  (`PagePrefetcher`), so page latency stays off the caller's path.
+
+Input / Output:
+- Input: a worker callable and the items it should process.
+- Output: `WorkResult` tuples `(item, result, exception, duration_seconds)`
+  that the caller applies in completion or submission order.
+- `StagedPipeline` always yields in source order and reports queue depth,
+  idle and stall times per stage via `stats()`.
+- `PagePrefetcher` yields pages in source order and counts how often the
+  caller had to wait for a page.
+
+Important invariants:
+- Workers never touch shared run state; they only compute results.
+- Every submitted item is returned exactly once, either through `collect()`
+  or `drain()`. Nothing is silently dropped on errors.
+- `in_flight_items()` lists every item that was submitted but not yet handed
+  back. The sorter persists exactly these items as pending on pause.
+
+How to debug:
+- Run `python3 -m unittest tests.test_ai_pipeline`.
+- Inspect `stats()` for submitted/completed counts and caller wait times.
+"""
+
+from __future__ import annotations
+
+import concurrent.futures
+from dataclasses import dataclass
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, Generic, Iterable, Iterator, List, Optional, TypeVar
+
+
+ItemT = TypeVar("ItemT")
+
+APPLY_ORDER_COMPLETION = "completion"
+APPLY_ORDER_SUBMISSION = "submission"
+SUPPORTED_APPLY_ORDERS = {APPLY_ORDER_COMPLETION, APPLY_ORDER_SUBMISSION}
+
+
+@dataclass
+class WorkResult(Generic[ItemT]):
+    """Result of one worker call, handed back to the caller thread."""
+
+    item: ItemT
+    result: Any
+    error: Optional[BaseException]
+    duration_seconds: float
+
+
+class BoundedWorkQueue(Generic[ItemT]):
+    """Thread pool with a fixed number of in-flight slots.
+
+    Unlike a barrier batch, a free slot is refilled as soon as any single
+    worker finishes. The caller decides when to collect results; this keeps
+    all side effects on the caller thread.
+
+    Example:
+    - `max_in_flight=5`, one request takes 60s, the others 3s.
+    - Batch mode: four slots idle for ~57s.
+    - This queue: the four fast slots keep processing new documents.
+    """
+
+    def __init__(
+        self,
+        worker: Callable[[ItemT], Any],
+        *,
+        max_in_flight: int,
+        apply_order: str = APPLY_ORDER_COMPLETION,
+        thread_name_prefix: str = "paperless-ai",
+    ) -> None:
+        if apply_order not in SUPPORTED_APPLY_ORDERS:
+            raise ValueError(f"Unbekannte Ergebnis-Reihenfolge: {apply_order}")
+        self.worker = worker
+        self.max_in_flight = max(1, int(max_in_flight))
+        self.apply_order = apply_order
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.max_in_flight,
+            thread_name_prefix=thread_name_prefix,
+        )
+        self._sequence = 0
+        # Sequence -> (item, future). Dict order equals submission order.
+        self._in_flight: Dict[int, tuple[ItemT, concurrent.futures.Future]] = {}
+        self._lock = threading.Lock()
+        self._closed = False
+        self._submitted = 0
+        self._completed = 0
+        self._caller_wait_seconds = 0.0
+        self._caller_waits = 0
+        self._peak_in_flight = 0
+
+    def _run(self, item: ItemT) -> tuple[Any, float]:
+        started = time.perf_counter()
+        result = self.worker(item)
+        return result, max(0.0, time.perf_counter() - started)
+
+    def has_capacity(self) -> bool:
+        """True, wenn ein weiteres Item ohne Warten gestartet werden kann."""
+
+        return len(self._in_flight) < self.max_in_flight
+
+    def __len__(self) -> int:
+        return len(self._in_flight)
+
+    def in_flight_items(self) -> List[ItemT]:
+        """Alle gestarteten, aber noch nicht zurückgegebenen Items in Startreihenfolge."""
+
+        return [item for item, _future in self._in_flight.values()]
+
+    def submit(self, item: ItemT) -> None:
+        """Startet ein Item. Der Aufrufer prüft vorher `has_capacity()`."""
+
+        if self._closed:
+            raise RuntimeError("Work-Queue ist bereits geschlossen.")
+        with self._lock:
+            self._sequence += 1
+            future = self._executor.submit(self._run, item)
+            self._in_flight[self._sequence] = (item, future)
+            self._submitted += 1
+            self._peak_in_flight = max(self._peak_in_flight, len(self._in_flight))
+
+    def _pop_result(self, sequence: int) -> WorkResult[ItemT]:
+        item, future = self._in_flight.pop(sequence)
+        self._completed += 1
+        try:
+            result, duration_seconds = future.result()
+            return WorkResult(item=item, result=result, error=None, duration_seconds=duration_seconds)
+        except BaseException as exc:  # noqa: BLE001 - Fehler gehen an den Aufrufer zurück.
+            return WorkResult(item=item, result=None, error=exc, duration_seconds=0.0)
+
+    def _ready_sequences(self) -> List[int]:
+        if self.apply_order == APPLY_ORDER_SUBMISSION:
+            ready: List[int] = []
+            for sequence, (_item, future) in self._in_flight.items():
+                if not future.done():
+                    break
+                ready.append(sequence)
+            return ready
+        return [
+            sequence
+            for sequence, (_item, future) in self._in_flight.items()
+            if future.done()
+        ]
+
+    def collect(self, *, block: bool = False) -> List[WorkResult[ItemT]]:
+        """Gibt fertige Ergebnisse zurück.
+
+        Mit `block=True` wartet der Aufruf, bis mindestens ein Ergebnis
+        (bei Submission-Reihenfolge: das älteste) fertig ist.
+        """
+
+        if not self._in_flight:
+            return []
+        if block:
+            wait_started = time.perf_counter()
+            if self.apply_order == APPLY_ORDER_SUBMISSION:
+                _item, head_future = next(iter(self._in_flight.values()))
+                concurrent.futures.wait([head_future])
+            else:
+                concurrent.futures.wait(
+                    [future for _item, future in self._in_flight.values()],
+                    return_when=concurrent.futures.FIRST_COMPLETED,
+                )
+            self._caller_wait_seconds += max(0.0, time.perf_counter() - wait_started)
+            self._caller_waits += 1
+        return [self._pop_result(sequence) for sequence in self._ready_sequences()]
+
+    def drain(self) -> List[WorkResult[ItemT]]:
+        """Wartet auf alle laufenden Items und gibt deren Ergebnisse zurück."""
+
+        results: List[WorkResult[ItemT]] = []
+        while self._in_flight:
+            results.extend(self.collect(block=True))
+        return results
+
+    def close(self) -> None:
+        """Beendet den Thread-Pool. Noch nicht gestartete Items werden verworfen."""
+
+        if self._closed:
+            return
+        self._closed = True
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> Dict[str, Any]:
+        """Kompakte Kennzahlen für Logs und Run-Metriken."""
+
+        return {
+            "max_in_flight": self.max_in_flight,
+            "apply_order": self.apply_order,
+            "submitted": self._submitted,
+            "completed": self._completed,
+            "peak_in_flight": self._peak_in_flight,
+            "caller_waits": self._caller_waits,
+            "caller_wait_seconds": round(self._caller_wait_seconds, 6),
+        }
+
+
+@dataclass
+class StageSpec:
+    """Configuration of one stage in a `StagedPipeline`.
+
+    - `func` receives the output of the previous stage (or the source item).
+    - `workers` threads run `func` concurrently.
+    - `queue_size` bounds the input queue of this stage (backpressure).
+    """
+
+    name: str
+    func: Callable[[Any], Any]
+    workers: int = 1
+    queue_size: int = 0
+
+
+class _StageMetrics:
+    """Thread-safe counters for one pipeline stage."""
+
+    def __init__(self, spec: StageSpec, queue_size: int) -> None:
+        self.spec = spec
+        self.queue_size = queue_size
+        self.lock = threading.Lock()
+        self.processed = 0
+        self.errors = 0
+        self.busy_seconds = 0.0
+        self.input_wait_seconds = 0.0
+        self.output_stall_seconds = 0.0
+        self.max_queue_depth = 0
+        self.depth_samples = 0
+        self.depth_total = 0
+
+    def sample_depth(self, depth: int) -> None:
+        with self.lock:
+            self.max_queue_depth = max(self.max_queue_depth, depth)
+            self.depth_samples += 1
+            self.depth_total += depth
+
+    def as_dict(self) -> Dict[str, Any]:
+        with self.lock:
+            avg_depth = (self.depth_total / self.depth_samples) if self.depth_samples else 0.0
+            return {
+                "workers": max(1, int(self.spec.workers)),
+                "queue_size": self.queue_size,
+                "processed": self.processed,
+                "errors": self.errors,
+                "busy_seconds": round(self.busy_seconds, 6),
+                "input_wait_seconds": round(self.input_wait_seconds, 6),
+                "output_stall_seconds": round(self.output_stall_seconds, 6),
+                "max_queue_depth": self.max_queue_depth,
+                "avg_queue_depth": round(avg_depth, 3),
+            }
+
+
+_PIPELINE_END = object()
+
+
+class StagedPipeline:
+    """Runs `source -> stage 1 -> ... -> stage n -> caller` on worker threads.
+
+    Every stage has its own bounded input queue and worker count, so slow
+    network reads of one stage overlap with the work of the others. The caller
+    iterates the pipeline and receives `WorkResult` objects in source order;
+    a stage error is attached to its item instead of stopping the pipeline.
+
+    Stats per stage:
+    - `input_wait_seconds`: workers idle because the previous stage was slower.
+    - `output_stall_seconds`: workers blocked because the next stage was full.
+    - `max_queue_depth` / `avg_queue_depth`: sampled input queue depth.
+    """
+
+    _POLL_SECONDS = 0.1
+
+    def __init__(
+        self,
+        source: Iterable[Any],
+        stages: List[StageSpec],
+        *,
+        source_name: str = "fetch",
+        sink_name: str = "apply",
+        sink_queue_size: int = 0,
+        thread_name_prefix: str = "paperless-stage",
+    ) -> None:
+        self._source = source
+        self._stages = list(stages)
+        self._source_name = source_name
+        self._thread_name_prefix = thread_name_prefix
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._queues: List[queue.Queue] = []
+        self._metrics: List[_StageMetrics] = []
+        for spec in self._stages:
+            size = int(spec.queue_size) if int(spec.queue_size) > 0 else 2 * max(1, int(spec.workers))
+            self._queues.append(queue.Queue(maxsize=size))
+            self._metrics.append(_StageMetrics(spec, size))
+        output_size = int(sink_queue_size) if int(sink_queue_size) > 0 else 4
+        self._output: queue.Queue = queue.Queue(maxsize=output_size)
+        self._source_metrics = _StageMetrics(StageSpec(name=source_name, func=lambda item: item), 0)
+        # Der Aufrufer ist die letzte Stufe; er liest aus `_output`.
+        self._sink_metrics = _StageMetrics(StageSpec(name=sink_name, func=lambda item: item), output_size)
+        # Begrenzt die Anzahl Items zwischen Quelle und Aufrufer. Ohne dieses
+        # Fenster könnte der Reorder-Puffer bei einem hängenden Item wachsen.
+        window = output_size + sum(
+            metrics.queue_size + max(1, int(metrics.spec.workers)) for metrics in self._metrics
+        )
+        self._window = threading.Semaphore(window)
+        self._reorder: Dict[int, Any] = {}
+        self._next_sequence = 0
+        self._finished_sequence: Optional[int] = None
+        self._source_error: Optional[BaseException] = None
+        self._started = False
+
+    # -- Thread helpers -------------------------------------------------
+
+    def _put(self, target: queue.Queue, payload: Any, metrics: _StageMetrics) -> bool:
+        """Blockierendes Put mit Stop-Prüfung; misst Stau-Zeit."""
+
+        started = time.perf_counter()
+        while not self._stop.is_set():
+            try:
+                target.put(payload, timeout=self._POLL_SECONDS)
+                break
+            except queue.Full:
+                continue
+        else:
+            return False
+        with metrics.lock:
+            metrics.output_stall_seconds += max(0.0, time.perf_counter() - started)
+        return True
+
+    def _acquire_window(self) -> bool:
+        while not self._stop.is_set():
+            if self._window.acquire(timeout=self._POLL_SECONDS):
+                return True
+        return False
+
+    def _run_source(self) -> None:
+        first_queue = self._queues[0] if self._queues else self._output
+        metrics = self._source_metrics
+        sequence = 0
+        iterator = iter(self._source)
+        try:
+            while not self._stop.is_set():
+                if not self._acquire_window():
+                    return
+                started = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    self._window.release()
+                    break
+                with metrics.lock:
+                    metrics.busy_seconds += max(0.0, time.perf_counter() - started)
+                    metrics.processed += 1
+                payload = (sequence, WorkResult(item=item, result=item, error=None, duration_seconds=0.0))
+                if not self._put(first_queue, payload, metrics):
+                    return
+                sequence += 1
+        except BaseException as exc:  # noqa: BLE001 - Quellfehler gehen an den Aufrufer.
+            self._source_error = exc
+            with metrics.lock:
+                metrics.errors += 1
+        self._put(self._output, (sequence, _PIPELINE_END), metrics)
+
+    def _run_stage(self, index: int) -> None:
+        spec = self._stages[index]
+        metrics = self._metrics[index]
+        source_queue = self._queues[index]
+        target_queue = self._queues[index + 1] if index + 1 < len(self._queues) else self._output
+        while not self._stop.is_set():
+            wait_started = time.perf_counter()
+            try:
+                sequence, work = source_queue.get(timeout=self._POLL_SECONDS)
+            except queue.Empty:
+                with metrics.lock:
+                    metrics.input_wait_seconds += max(0.0, time.perf_counter() - wait_started)
+                continue
+            with metrics.lock:
+                metrics.input_wait_seconds += max(0.0, time.perf_counter() - wait_started)
+            metrics.sample_depth(source_queue.qsize())
+            if work.error is None:
+                started = time.perf_counter()
+                try:
+                    result = spec.func(work.result)
+                    work = WorkResult(
+                        item=work.item,
+                        result=result,
+                        error=None,
+                        duration_seconds=work.duration_seconds + max(0.0, time.perf_counter() - started),
+                    )
+                except BaseException as exc:  # noqa: BLE001 - Fehler hängen am Item.
+                    work = WorkResult(item=work.item, result=None, error=exc, duration_seconds=work.duration_seconds)
+                    with metrics.lock:
+                        metrics.errors += 1
+                with metrics.lock:
+                    metrics.busy_seconds += max(0.0, time.perf_counter() - started)
+                    metrics.processed += 1
+            if not self._put(target_queue, (sequence, work), metrics):
+                return
+
+    def start(self) -> "StagedPipeline":
+        """Startet Quelle und Stage-Worker (idempotent)."""
+
+        if self._started:
+            return self
+        self._started = True
+        threads = [
+            threading.Thread(
+                target=self._run_source,
+                name=f"{self._thread_name_prefix}-{self._source_name}",
+                daemon=True,
+            )
+        ]
+        for index, spec in enumerate(self._stages):
+            for worker_index in range(max(1, int(spec.workers))):
+                threads.append(
+                    threading.Thread(
+                        target=self._run_stage,
+                        args=(index,),
+                        name=f"{self._thread_name_prefix}-{spec.name}-{worker_index + 1}",
+                        daemon=True,
+                    )
+                )
+        self._threads = threads
+        for thread in threads:
+            thread.start()
+        return self
+
+    # -- Consumer side --------------------------------------------------
+
+    def __iter__(self) -> Iterator[WorkResult[Any]]:
+        self.start()
+        while True:
+            if self._next_sequence in self._reorder:
+                work = self._reorder.pop(self._next_sequence)
+                self._next_sequence += 1
+                self._window.release()
+                with self._sink_metrics.lock:
+                    self._sink_metrics.processed += 1
+                yield work
+                continue
+            if self._finished_sequence is not None and self._next_sequence >= self._finished_sequence:
+                if self._source_error is not None:
+                    raise self._source_error
+                return
+            self._sink_metrics.sample_depth(self._output.qsize())
+            wait_started = time.perf_counter()
+            sequence, payload = self._output.get()
+            with self._sink_metrics.lock:
+                self._sink_metrics.input_wait_seconds += max(0.0, time.perf_counter() - wait_started)
+            if payload is _PIPELINE_END:
+                self._finished_sequence = sequence
+                continue
+            self._reorder[sequence] = payload
+
+    def close(self) -> None:
+        """Stoppt alle Threads; bereits vorgezogene Items werden verworfen."""
+
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout=2 * self._POLL_SECONDS + 1.0)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Kennzahlen je Stage; die letzte Stage ist der Aufrufer selbst.
+
+        `busy_seconds` misst der Aufrufer selbst; für ihn bleibt der Wert 0.
+        """
+
+        stages: Dict[str, Dict[str, Any]] = {self._source_name: self._source_metrics.as_dict()}
+        for metrics in self._metrics:
+            stages[metrics.spec.name] = metrics.as_dict()
+        stages[self._sink_metrics.spec.name] = self._sink_metrics.as_dict()
+        return stages
+
+
+_PREFETCH_END = object()
+_PREFETCH_HANDOFF = object()
+
+
+class PagePrefetcher(Generic[ItemT]):
+    """Keeps up to `max_ahead` pages of a paginated listing fetched in advance.
+
+    One background thread advances the page iterator; the caller receives
+    the pages in order. Memory stays bounded by `max_ahead` pages.
+
+    Stop handling:
+    - `stop_requested()` is checked before every background fetch. Once it
+      returns True the thread stops reading ahead and hands the iterator back:
+      the caller fetches the remaining pages itself, so a stop request never
+      shortens the listing, it only ends the background requests.
+    - `close()` (also on early exit of the caller) stops the thread; pages
+      already fetched are discarded.
+
+    Stats: `waits` counts pages the caller had to wait for (the first page
+    always waits), `wait_seconds` the summed waiting time.
+    """
+
+    _POLL_SECONDS = 0.1
+
+    def __init__(
+        self,
+        pages: Iterable[ItemT],
+        *,
+        max_ahead: int = 2,
+        stop_requested: Optional[Callable[[], bool]] = None,
+        thread_name: str = "paperless-prefetch",
+    ) -> None:
+        self._pages = iter(pages)
+        self._queue: queue.Queue = queue.Queue(maxsize=max(1, int(max_ahead)))
+        self._stop = threading.Event()
+        self._stop_requested = stop_requested
+        self._thread = threading.Thread(target=self._run, name=thread_name, daemon=True)
+        self._started = False
+        self.pages = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.handed_off = False
+
+    def _put(self, payload: Any) -> bool:
+        while not self._stop.is_set():
+            try:
+                self._queue.put(payload, timeout=self._POLL_SECONDS)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _run(self) -> None:
+        try:
+            while not self._stop.is_set():
+                if self._stop_requested is not None and self._stop_requested():
+                    self._put((_PREFETCH_HANDOFF, None))
+                    return
+                try:
+                    page = next(self._pages)
+                except StopIteration:
+                    self._put((_PREFETCH_END, None))
+                    return
+                if not self._put((page, None)):
+                    return
+        except BaseException as exc:  # noqa: BLE001 - Fehler gehen an den Aufrufer.
+            self._put((_PREFETCH_END, exc))
+
+    def __iter__(self) -> Iterator[ItemT]:
+        if not self._started:
+            self._started = True
+            self._thread.start()
+        try:
+            while True:
+                try:
+                    page, error = self._queue.get_nowait()
+                except queue.Empty:
+                    wait_started = time.perf_counter()
+                    page, error = self._queue.get()
+                    self.waits += 1
+                    self.wait_seconds += max(0.0, time.perf_counter() - wait_started)
+                if page is _PREFETCH_END:
+                    if error is not None:
+                        raise error
+                    return
+                if page is _PREFETCH_HANDOFF:
+                    # Stop angefordert: restliche Seiten ohne Hintergrund-Thread.
+                    self.handed_off = True
+                    for page in self._pages:
+                        self.pages += 1
+                        yield page
+                    return
+                self.pages += 1
+                yield page
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        """Stops reading ahead (idempotent)."""
+
+        self._stop.set()
+        if self._started and self._thread is not threading.current_thread():
+            self._thread.join(timeout=2 * self._POLL_SECONDS + 1.0)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pages": self.pages,
+            "waits": self.waits,
+            "wait_seconds": round(self.wait_seconds, 6),
+            "handed_off": self.handed_off,
+        }
@@ -0,0 +1,293 @@
+"""Client-side token-bucket rate limiter for AI requests.
+
+Purpose:
+- Hold requests back before the provider answers with 429. Without it every
+  rate limit ends in a sleep or a full run pause with auto-resume, which
+  costs minutes per run.
+- One instance is shared by the classifier, all pool workers and (for the
+  same endpoint) the tax enrichment extractor.
+
+Input / Output:
+- Configured limits: tokens and requests per minute (0 = unknown).
+- Provider feedback: `x-ratelimit-limit-*`, `x-ratelimit-remaining-*` and
+  `x-ratelimit-reset-*` headers (OpenAI format, e.g. `reset-tokens: 6m0s`).
+- `acquire(estimated_tokens)` blocks until the request fits into both buckets
+  and returns the seconds waited; `stats()` returns counters for metrics.
+
+Important invariants:
+- Reservations are taken up front, so concurrent callers queue fairly
+  instead of all waking up at the same moment. Successful requests settle
+  them with `record_usage`, failed attempts hand them back with `release`.
+- Header values only ever lower the local budget; configured limits are an
+  upper bound, header limits fill in when nothing is configured.
+- Waits longer than `max_wait_seconds` raise `RateLimitWaitTooLong`; the
+  caller turns that into the regular run pause.
+- Without any known limit the limiter never waits.
+
+How to debug:
+- Run `python3 -m unittest tests.test_ai_rate_limiter`.
+- Check `last_run.performance.pipeline.rate_limiter` in `run_metrics.json`.
+"""
+
+from __future__ import annotations
+
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, Mapping, Optional
+
+
+# Geschätzte Antwort-Tokens, wenn der Request kein `max_tokens` setzt.
+DEFAULT_COMPLETION_TOKENS_ESTIMATE = 400
+
+_DURATION_PART_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+
+
+class RateLimitWaitTooLong(Exception):
+    """Die nötige Wartezeit übersteigt `max_wait_seconds`."""
+
+    def __init__(self, message: str, *, wait_seconds: float) -> None:
+        super().__init__(message)
+        self.wait_seconds = wait_seconds
+
+
+def parse_reset_duration(value: Any) -> Optional[float]:
+    """Parses `1s`, `6m0s`, `20ms`, `1h2m3.5s` or plain seconds; None if unknown."""
+
+    if value in (None, ""):
+        return None
+    text = str(value).strip().lower()
+    try:
+        return max(0.0, float(text))
+    except ValueError:
+        pass
+    total = 0.0
+    position = 0
+    for match in _DURATION_PART_RE.finditer(text):
+        if match.start() != position:
+            return None
+        amount = float(match.group(1))
+        unit = match.group(2)
+        total += amount * {"h": 3600.0, "m": 60.0, "s": 1.0, "ms": 0.001}[unit]
+        position = match.end()
+    if position != len(text) or position == 0:
+        return None
+    return total
+
+
+def _header_number(headers: Mapping[str, Any], name: str) -> Optional[float]:
+    raw = headers.get(name)
+    if raw in (None, ""):
+        return None
+    try:
+        return float(raw)
+    except (TypeError, ValueError):
+        return None
+
+
+class _Bucket:
+    """Token bucket with a per-minute capacity; the level may go negative (reservations)."""
+
+    def __init__(self, per_minute: float, now: float) -> None:
+        self.configured = max(0.0, float(per_minute))
+        self.capacity = self.configured
+        self.level = self.capacity
+        self.updated_at = now
+
+    @property
+    def active(self) -> bool:
+        return self.capacity > 0.0
+
+    @property
+    def rate(self) -> float:
+        return self.capacity / 60.0
+
+    def refill(self, now: float) -> None:
+        if self.active and now > self.updated_at:
+            self.level = min(self.capacity, self.level + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def wait_for(self, cost: float) -> float:
+        if not self.active:
+            return 0.0
+        # Größer als das Minutenbudget würde ewig warten: auf Kapazität kappen.
+        cost = min(cost, self.capacity)
+        return 0.0 if self.level >= cost else (cost - self.level) / self.rate
+
+    def take(self, cost: float) -> None:
+        if self.active:
+            self.level -= min(cost, self.capacity)
+
+    def observe(self, *, limit: Optional[float], remaining: Optional[float], reset: Optional[float], now: float) -> None:
+        self.refill(now)
+        if limit is not None and limit > 0:
+            new_capacity = min(self.configured, limit) if self.configured else limit
+            if not self.active:
+                self.level = new_capacity
+            self.capacity = new_capacity
+            self.level = min(self.level, self.capacity)
+        if not self.active:
+            return
+        if remaining is not None:
+            self.level = min(self.level, remaining)
+        if reset is not None:
+            # Der Anbieter ist erst nach `reset` Sekunden wieder voll.
+            self.level = min(self.level, self.capacity - reset * self.rate)
+
+    def block_for(self, seconds: float, now: float) -> None:
+        self.refill(now)
+        if self.active:
+            self.level = min(self.level, -seconds * self.rate)
+
+
+class AiRateLimiter:
+    """Shared token/request buckets for one AI endpoint."""
+
+    def __init__(
+        self,
+        *,
+        tokens_per_minute: float = 0,
+        requests_per_minute: float = 0,
+        max_wait_seconds: float = 120.0,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> None:
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        now = clock()
+        self._tokens = _Bucket(tokens_per_minute, now)
+        self._requests = _Bucket(requests_per_minute, now)
+        self._blocked_until = 0.0
+        self.max_wait_seconds = max(0.0, float(max_wait_seconds))
+        self.requests = 0
+        self.throttled_requests = 0
+        self.wait_seconds_total = 0.0
+        self.header_updates = 0
+        self.provider_429 = 0
+        self.estimated_tokens_total = 0
+        self.actual_tokens_total = 0
+        self.released_tokens_total = 0
+
+    @staticmethod
+    def estimate_request_tokens(prompt_tokens: int, req_body: Mapping[str, Any]) -> int:
+        """Prompt estimate plus the completion budget the provider reserves."""
+
+        completion = req_body.get("max_tokens") or req_body.get("max_completion_tokens")
+        try:
+            completion_tokens = int(completion) if completion else DEFAULT_COMPLETION_TOKENS_ESTIMATE
+        except (TypeError, ValueError):
+            completion_tokens = DEFAULT_COMPLETION_TOKENS_ESTIMATE
+        return max(1, int(prompt_tokens) + completion_tokens)
+
+    def acquire(self, estimated_tokens: int) -> float:
+        """Reserves budget for one request and sleeps until it fits; returns seconds waited."""
+
+        estimated_tokens = max(0, int(estimated_tokens))
+        with self._lock:
+            now = self._clock()
+            self._tokens.refill(now)
+            self._requests.refill(now)
+            wait = max(
+                self._tokens.wait_for(estimated_tokens),
+                self._requests.wait_for(1),
+                self._blocked_until - now,
+                0.0,
+            )
+            if wait > self.max_wait_seconds:
+                raise RateLimitWaitTooLong(
+                    f"KI-Rate-Limit: Wartezeit {wait:.1f}s überschreitet {self.max_wait_seconds:.0f}s.",
+                    wait_seconds=wait,
+                )
+            self._tokens.take(estimated_tokens)
+            self._requests.take(1)
+            self.requests += 1
+            self.estimated_tokens_total += estimated_tokens
+            if wait > 0.0:
+                self.throttled_requests += 1
+                self.wait_seconds_total += wait
+        if wait > 0.0:
+            self._sleep(wait)
+        return wait
+
+    def record_usage(self, estimated_tokens: int, actual_tokens: int) -> None:
+        """Corrects the token bucket by the difference between estimate and real usage."""
+
+        if actual_tokens <= 0:
+            return
+        with self._lock:
+            self.actual_tokens_total += int(actual_tokens)
+            if self._tokens.active:
+                self._tokens.refill(self._clock())
+                self._tokens.level = min(
+                    self._tokens.capacity,
+                    self._tokens.level + max(0, int(estimated_tokens)) - int(actual_tokens),
+                )
+
+    def release(self, estimated_tokens: int) -> None:
+        """Returns the token reservation of an attempt that failed without a usage block.
+
+        The request slot stays taken: providers count failed attempts against
+        the request limit, but not against the token limit.
+        """
+
+        estimated_tokens = max(0, int(estimated_tokens))
+        if estimated_tokens <= 0:
+            return
+        with self._lock:
+            self.released_tokens_total += estimated_tokens
+            if self._tokens.active:
+                self._tokens.refill(self._clock())
+                self._tokens.level = min(self._tokens.capacity, self._tokens.level + estimated_tokens)
+
+    def update_from_headers(self, headers: Optional[Mapping[str, Any]]) -> None:
+        """Feeds `x-ratelimit-*` response headers into both buckets."""
+
+        if not headers:
+            return
+        token_remaining = _header_number(headers, "x-ratelimit-remaining-tokens")
+        request_remaining = _header_number(headers, "x-ratelimit-remaining-requests")
+        token_limit = _header_number(headers, "x-ratelimit-limit-tokens")
+        request_limit = _header_number(headers, "x-ratelimit-limit-requests")
+        if token_remaining is None and request_remaining is None and token_limit is None and request_limit is None:
+            return
+        with self._lock:
+            now = self._clock()
+            self._tokens.observe(
+                limit=token_limit,
+                remaining=token_remaining,
+                reset=parse_reset_duration(headers.get("x-ratelimit-reset-tokens")),
+                now=now,
+            )
+            self._requests.observe(
+                limit=request_limit,
+                remaining=request_remaining,
+                reset=parse_reset_duration(headers.get("x-ratelimit-reset-requests")),
+                now=now,
+            )
+            self.header_updates += 1
+
+    def penalize(self, retry_after_seconds: Optional[float]) -> None:
+        """After a 429 all callers wait at least `retry_after_seconds`."""
+
+        with self._lock:
+            self.provider_429 += 1
+            if retry_after_seconds and retry_after_seconds > 0:
+                now = self._clock()
+                self._blocked_until = max(self._blocked_until, now + float(retry_after_seconds))
+                self._tokens.block_for(0.0, now)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "tokens_per_minute": int(self._tokens.capacity),
+                "requests_per_minute": int(self._requests.capacity),
+                "requests": self.requests,
+                "throttled_requests": self.throttled_requests,
+                "wait_seconds": round(self.wait_seconds_total, 3),
+                "header_updates": self.header_updates,
+                "provider_429": self.provider_429,
+                "estimated_tokens": self.estimated_tokens_total,
+                "actual_tokens": self.actual_tokens_total,
+                "released_tokens": self.released_tokens_total,
+            }
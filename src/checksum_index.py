@@ -0,0 +1,134 @@
+"""Run-wide in-memory checksum index for the exact duplicate gate.
+
+Purpose:
+- `PaperlessClient.find_classified_duplicate` runs up to two
+  `/api/documents/?checksum=...` searches for every document that reaches the
+  duplicate gate; on large runs that is tens of thousands of extra requests.
+- This index maps checksum -> classified documents once per run, so the gate
+  answers locally. It is filled either from the document pages the run
+  streams anyway or from one lightweight `fields=` scan at startup.
+
+Input / Output:
+- Input: document dicts (`observe`), full or projected to `SCAN_FIELDS`;
+  PATCH responses keep entries current while the run updates documents.
+- Output: `find(current_document_id=..., checksum=...)` with the same
+  contract as `find_classified_duplicate` (another document with document
+  type and tags, newest `created` first) and `stats()` counters.
+- `record_query_fallback(document)` counts a miss that was answered by a
+  Paperless query instead and keeps the found original for later lookups.
+
+Important invariants:
+- Partial dicts never erase known fields: a PATCH response without
+  `checksum` keeps the checksum seen before.
+- Only identity and classification fields are kept per document (a few
+  hundred bytes), never the OCR content.
+- Thread-safe: precheck workers and the main thread share one instance.
+- A streamed index only knows documents this run has listed. Listings are
+  filtered and sorted `-created`, so the older original is usually missing;
+  the caller must treat a miss as "unknown" and query Paperless.
+
+How to debug:
+- Run `python3 -m unittest tests.test_checksum_index`.
+- Check `last_run.performance.pipeline.checksum_index` in `run_metrics.json`.
+"""
+
+from __future__ import annotations
+
+import threading
+from typing import Any, Dict, Iterable, Optional, Set
+
+
+SCAN_FIELDS = ("id", "checksum", "tags", "document_type", "correspondent", "storage_path", "created")
+
+
+class ChecksumIndex:
+    """Checksum -> classified Paperless documents, built once per run."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._documents: Dict[int, Dict[str, Any]] = {}
+        self._by_checksum: Dict[str, Set[int]] = {}
+        self.observed = 0
+        self.lookups = 0
+        self.hits = 0
+        self.query_fallbacks = 0
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._documents)
+
+    def observe(self, document: Dict[str, Any]) -> None:
+        """Adds or refreshes one document from a listing page or a PATCH response."""
+
+        try:
+            doc_id = int(document["id"])
+        except (KeyError, TypeError, ValueError):
+            return
+        with self._lock:
+            self.observed += 1
+            entry = self._documents.get(doc_id, {})
+            old_checksum = str(entry.get("checksum") or "")
+            entry = {**entry, **{key: document[key] for key in SCAN_FIELDS if key in document}}
+            entry["id"] = doc_id
+            checksum = str(entry.get("checksum") or "").strip()
+            if old_checksum and old_checksum != checksum:
+                self._discard(old_checksum, doc_id)
+            if not checksum:
+                self._documents.pop(doc_id, None)
+                return
+            entry["checksum"] = checksum
+            self._documents[doc_id] = entry
+            self._by_checksum.setdefault(checksum, set()).add(doc_id)
+
+    def observe_many(self, documents: Iterable[Dict[str, Any]]) -> int:
+        count = 0
+        for document in documents:
+            self.observe(document)
+            count += 1
+        return count
+
+    def _discard(self, checksum: str, doc_id: int) -> None:
+        ids = self._by_checksum.get(checksum)
+        if ids is not None:
+            ids.discard(doc_id)
+            if not ids:
+                del self._by_checksum[checksum]
+
+    def find(self, *, current_document_id: int, checksum: str) -> Optional[Dict[str, Any]]:
+        """Newest other classified document with the same checksum, or None."""
+
+        checksum = str(checksum or "").strip()
+        with self._lock:
+            self.lookups += 1
+            candidates = [
+                self._documents[doc_id]
+                for doc_id in self._by_checksum.get(checksum, ())
+                if doc_id != int(current_document_id)
+                and self._documents[doc_id].get("document_type") is not None
+                and self._documents[doc_id].get("tags")
+            ]
+            if not candidates:
+                return None
+            self.hits += 1
+            # Wie die API-Abfrage mit `ordering=-created`.
+            best = max(candidates, key=lambda entry: (str(entry.get("created") or ""), entry["id"]))
+            return dict(best)
+
+    def record_query_fallback(self, document: Optional[Dict[str, Any]]) -> None:
+        """Counts an index miss answered by Paperless; a found original is indexed."""
+
+        with self._lock:
+            self.query_fallbacks += 1
+        if document:
+            self.observe(document)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._documents),
+                "checksums": len(self._by_checksum),
+                "observed": self.observed,
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "query_fallbacks": self.query_fallbacks,
+            }
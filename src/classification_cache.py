@@ -0,0 +1,286 @@
+"""Persistent classification result cache for the Paperless KIplus sorter.
+
+Purpose:
+- Backfills and `reprocess_ki_tagged_documents` send identical documents to
+  the model run after run. A local SQLite cache returns the stored prediction
+  instead of a new AI request.
+- Re-runs after config tweaks that do not change the prompt become nearly
+  free, because the key only covers what the model actually sees.
+
+Input / Output:
+- Key: sha256 over title, content preview, system prompt fingerprint and
+  model name (`build_cache_key`).
+- Value: the sanitized prediction as JSON plus the token usage of the
+  original request, so saved tokens can be reported.
+- `stats()` returns hit/miss/store/eviction counters and the hit rate.
+
+Important invariants:
+- A changed system prompt (new entities, rules, layout) or model yields a
+  different key; stale entries are never reused, only aged out.
+- Entries older than `max_age_days` are ignored and deleted; above
+  `max_entries` the least recently used entries are evicted.
+- Cache errors never abort a run: on any SQLite error the cache logs a
+  warning and disables itself for the rest of the run.
+
+How to debug:
+- Run `python3 -m unittest tests.test_classification_cache`.
+- Inspect the file with `sqlite3 classification_cache.sqlite3 'select count(*) from entries'`.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+from pathlib import Path
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+
+LOGGER = logging.getLogger("paperless_ai_sorter")
+
+CACHE_SCHEMA_VERSION = 1
+# Eviction nach so vielen neuen Einträgen, damit der Cache auch in langen
+# Läufen nicht über `max_entries` hinauswächst.
+EVICT_EVERY_STORES = 100
+
+
+def build_cache_key(
+    *,
+    title: str,
+    content_preview: str,
+    prompt_fingerprint: str,
+    model: str,
+) -> str:
+    """Stable cache key for one document as the model would see it."""
+
+    payload = json.dumps(
+        {
+            "v": CACHE_SCHEMA_VERSION,
+            "title": title,
+            "content_preview": content_preview,
+            "prompt_fingerprint": prompt_fingerprint,
+            "model": model,
+        },
+        ensure_ascii=False,
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ClassificationCache:
+    """Thread-safe SQLite cache for sanitized AI predictions."""
+
+    def __init__(
+        self,
+        path: str | Path,
+        *,
+        max_entries: int = 5000,
+        max_age_days: float = 90.0,
+    ) -> None:
+        self.path = Path(path)
+        self.max_entries = max(1, int(max_entries))
+        self.max_age_seconds = max(0.0, float(max_age_days)) * 86400.0
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.saved_prompt_tokens = 0
+        self.saved_completion_tokens = 0
+        self._stores_since_evict = 0
+        try:
+            if self.path.parent and not self.path.parent.exists():
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), timeout=10.0, check_same_thread=False)
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                " key TEXT PRIMARY KEY,"
+                " model TEXT NOT NULL,"
+                " prompt_fingerprint TEXT NOT NULL,"
+                " prediction TEXT NOT NULL,"
+                " prompt_tokens INTEGER NOT NULL DEFAULT 0,"
+                " completion_tokens INTEGER NOT NULL DEFAULT 0,"
+                " created_at REAL NOT NULL,"
+                " last_used_at REAL NOT NULL,"
+                " hits INTEGER NOT NULL DEFAULT 0)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_last_used ON entries(last_used_at)")
+            conn.commit()
+            self._conn = conn
+        except (sqlite3.Error, OSError) as exc:
+            LOGGER.warning("Klassifizierungs-Cache deaktiviert (%s): %s", self.path, exc)
+            return
+        self.evict()
+
+    @property
+    def enabled(self) -> bool:
+        return self._conn is not None
+
+    def _disable(self, exc: Exception) -> None:
+        LOGGER.warning("Klassifizierungs-Cache deaktiviert nach Fehler: %s", exc)
+        conn = self._conn
+        self._conn = None
+        if conn is not None:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Returns a copy of the cached prediction or None on miss/expiry."""
+
+        with self._lock:
+            if self._conn is None:
+                return None
+            now = time.time()
+            try:
+                row = self._conn.execute(
+                    "SELECT prediction, prompt_tokens, completion_tokens, created_at"
+                    " FROM entries WHERE key = ?",
+                    (key,),
+                ).fetchone()
+                if row is not None and self.max_age_seconds and now - float(row[3]) > self.max_age_seconds:
+                    self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                    self._conn.commit()
+                    self.evictions += 1
+                    row = None
+                if row is None:
+                    self.misses += 1
+                    return None
+                prediction = json.loads(row[0])
+                self._conn.execute(
+                    "UPDATE entries SET last_used_at = ?, hits = hits + 1 WHERE key = ?",
+                    (now, key),
+                )
+                self._conn.commit()
+            except (sqlite3.Error, ValueError) as exc:
+                self._disable(exc)
+                self.misses += 1
+                return None
+            if not isinstance(prediction, dict):
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.saved_prompt_tokens += int(row[1] or 0)
+            self.saved_completion_tokens += int(row[2] or 0)
+            return prediction
+
+    def put(
+        self,
+        key: str,
+        prediction: Dict[str, Any],
+        *,
+        model: str,
+        prompt_fingerprint: str,
+        prompt_tokens: int = 0,
+        completion_tokens: int = 0,
+    ) -> None:
+        """Stores a prediction; internal `_meta*` keys are not persisted."""
+
+        stored = {name: value for name, value in prediction.items() if not str(name).startswith("_meta")}
+        try:
+            encoded = json.dumps(stored, ensure_ascii=False)
+        except (TypeError, ValueError) as exc:
+            LOGGER.debug("Klassifizierungs-Cache: Ergebnis nicht serialisierbar: %s", exc)
+            return
+        with self._lock:
+            if self._conn is None:
+                return
+            now = time.time()
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO entries"
+                    " (key, model, prompt_fingerprint, prediction, prompt_tokens,"
+                    "  completion_tokens, created_at, last_used_at, hits)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0)",
+                    (
+                        key,
+                        model,
+                        prompt_fingerprint,
+                        encoded,
+                        max(0, int(prompt_tokens)),
+                        max(0, int(completion_tokens)),
+                        now,
+                        now,
+                    ),
+                )
+                self._conn.commit()
+            except sqlite3.Error as exc:
+                self._disable(exc)
+                return
+            self.stores += 1
+            self._stores_since_evict += 1
+            evict_due = self._stores_since_evict >= EVICT_EVERY_STORES
+        if evict_due:
+            self.evict()
+
+    def evict(self) -> int:
+        """Deletes expired entries and trims the cache to `max_entries` (LRU)."""
+
+        with self._lock:
+            if self._conn is None:
+                return 0
+            self._stores_since_evict = 0
+            removed = 0
+            try:
+                if self.max_age_seconds:
+                    cursor = self._conn.execute(
+                        "DELETE FROM entries WHERE created_at < ?",
+                        (time.time() - self.max_age_seconds,),
+                    )
+                    removed += max(0, cursor.rowcount)
+                count = int(self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0])
+                overflow = count - self.max_entries
+                if overflow > 0:
+                    cursor = self._conn.execute(
+                        "DELETE FROM entries WHERE key IN ("
+                        " SELECT key FROM entries ORDER BY last_used_at ASC LIMIT ?)",
+                        (overflow,),
+                    )
+                    removed += max(0, cursor.rowcount)
+                self._conn.commit()
+            except sqlite3.Error as exc:
+                self._disable(exc)
+                return removed
+            self.evictions += removed
+            return removed
+
+    def entry_count(self) -> int:
+        with self._lock:
+            if self._conn is None:
+                return 0
+            try:
+                return int(self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0])
+            except sqlite3.Error:
+                return 0
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stores": self.stores,
+            "evictions": self.evictions,
+            "entries": self.entry_count(),
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "saved_prompt_tokens": self.saved_prompt_tokens,
+            "saved_completion_tokens": self.saved_completion_tokens,
+        }
+
+    def close(self) -> None:
+        """Trims the cache and closes the connection (idempotent)."""
+
+        self.evict()
+        with self._lock:
+            conn = self._conn
+            self._conn = None
+        if conn is not None:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
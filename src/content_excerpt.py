@@ -0,0 +1,178 @@
+"""Token-aware content excerpts for AI prompts.
+
+Purpose:
+- Replace the fixed `content[:N]` truncation with an excerpt that fits a
+  token budget and keeps the parts that matter for classification.
+- Long contracts waste tokens on boilerplate, while totals, dates, IBANs and
+  file numbers often sit at the end or deep inside the text.
+
+Input / Output:
+- Input: raw OCR text and a token budget.
+- Output: `ContentExcerpt` with the excerpt text, its estimated token count
+  and how many characters were dropped.
+- `estimate_tokens` is a fast local heuristic (no tokenizer dependency).
+
+Important invariants:
+- Texts within the budget are returned unchanged.
+- The excerpt always starts with the head of the document and ends with its
+  tail; keyword windows in between keep document order.
+- Omitted parts are marked with `EXCERPT_GAP_MARKER` so the model knows
+  text is missing.
+
+How to debug:
+- Run `python3 -m unittest tests.test_content_excerpt`.
+- Compare `estimated_prompt_tokens` with actual `prompt_tokens` in
+  `run_metrics.json` (`last_run.performance.pipeline.content_excerpt`).
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+import re
+from typing import Any, Dict, Iterable, List, Tuple
+
+
+EXCERPT_GAP_MARKER = "\n[...]\n"
+# Pauschaler Overhead pro Chat-Nachricht (Rolle, Trennzeichen).
+MESSAGE_OVERHEAD_TOKENS = 4
+# Anteile des Token-Budgets; der Rest geht an Schlüsselwort-Fenster.
+HEAD_BUDGET_SHARE = 0.40
+TAIL_BUDGET_SHARE = 0.25
+KEYWORD_WINDOW_CHARS = 160
+
+_TOKEN_PIECE_RE = re.compile(r"[A-Za-zÄÖÜäöüß]+|\d+|[^\sA-Za-zÄÖÜäöüß\d]")
+
+# (Gewicht, Muster): höhere Gewichte werden bei knappem Budget bevorzugt.
+KEYWORD_PATTERNS: Tuple[Tuple[int, re.Pattern[str]], ...] = (
+    (5, re.compile(r"\b[A-Z]{2}\d{2}(?: ?[A-Z0-9]{4}){3,7}(?: ?[A-Z0-9]{1,3})?\b")),
+    (
+        4,
+        re.compile(
+            r"(?i)\b(?:gesamtbetrag|rechnungsbetrag|endbetrag|zu zahlen|summe|brutto|netto|"
+            r"zahlbetrag|betrag|fällig|faellig)\b"
+        ),
+    ),
+    (4, re.compile(r"(?<![\d.,])\d{1,3}(?:\.\d{3})*,\d{2}\s*(?:€|EUR)|(?:€|EUR)\s*\d{1,3}(?:\.\d{3})*,\d{2}")),
+    (
+        3,
+        re.compile(
+            r"(?i)\b(?:aktenzeichen|az\.|geschäftszeichen|rechnungs-?(?:nummer|nr\.?)|kunden-?(?:nummer|nr\.?)|"
+            r"vertrags-?(?:nummer|nr\.?)|steuer-?(?:nummer|nr\.?)|versicherungs-?(?:nummer|schein)|"
+            r"policen-?(?:nummer|nr\.?)|mandatsreferenz)\b"
+        ),
+    ),
+    (2, re.compile(r"\b\d{1,2}\.\d{1,2}\.(?:\d{4}|\d{2})\b|\b\d{4}-\d{2}-\d{2}\b")),
+    (
+        1,
+        re.compile(
+            r"(?i)\b(?:leistungszeitraum|zeitraum|vertragsbeginn|laufzeit|kündigung|kuendigung|"
+            r"rechnungsdatum|datum)\b"
+        ),
+    ),
+)
+
+
+@dataclass(frozen=True)
+class ContentExcerpt:
+    """Result of `build_excerpt`."""
+
+    text: str
+    estimated_tokens: int
+    original_chars: int
+    truncated: bool
+
+    @property
+    def omitted_chars(self) -> int:
+        return max(0, self.original_chars - len(self.text)) if self.truncated else 0
+
+
+def estimate_tokens(text: str) -> int:
+    """Fast BPE-like estimate: words count per 4 letters, digits per 3, symbols as 1."""
+
+    total = 0
+    for piece in _TOKEN_PIECE_RE.findall(text):
+        if piece[0].isdigit():
+            total += (len(piece) + 2) // 3
+        elif piece[0].isalpha():
+            total += (len(piece) + 3) // 4
+        else:
+            total += 1
+    return total
+
+
+def estimate_message_tokens(messages: Iterable[Dict[str, Any]]) -> int:
+    """Estimated prompt tokens of a chat-completions `messages` list."""
+
+    total = 0
+    for message in messages:
+        total += MESSAGE_OVERHEAD_TOKENS + estimate_tokens(str(message.get("content") or ""))
+    return total
+
+
+def _keyword_windows(text: str, start: int, end: int) -> List[Tuple[int, int, int]]:
+    """Returns merged `(weight, begin, end)` windows around keyword hits in `text[start:end]`."""
+
+    hits: List[Tuple[int, int, int]] = []
+    for weight, pattern in KEYWORD_PATTERNS:
+        for match in pattern.finditer(text, start, end):
+            begin = max(start, match.start() - KEYWORD_WINDOW_CHARS // 2)
+            stop = min(end, match.end() + KEYWORD_WINDOW_CHARS // 2)
+            # Auf Zeilen- bzw. Wortgrenzen erweitern, damit Beträge nicht zerschnitten werden.
+            line_begin = text.rfind("\n", max(start, begin - 40), begin)
+            if line_begin != -1:
+                begin = line_begin + 1
+            line_end = text.find("\n", stop, min(end, stop + 40))
+            if line_end != -1:
+                stop = line_end
+            hits.append((begin, stop, weight))
+    hits.sort()
+    merged: List[Tuple[int, int, int]] = []
+    for begin, stop, weight in hits:
+        if merged and begin <= merged[-1][2]:
+            prev_weight, prev_begin, prev_stop = merged[-1]
+            merged[-1] = (prev_weight + weight, prev_begin, max(prev_stop, stop))
+        else:
+            merged.append((weight, begin, stop))
+    return merged
+
+
+def build_excerpt(text: str, max_tokens: int) -> ContentExcerpt:
+    """Builds head + keyword windows + tail within `max_tokens` (estimated)."""
+
+    text = str(text or "")
+    max_tokens = max(1, int(max_tokens))
+    total_tokens = estimate_tokens(text)
+    if total_tokens <= max_tokens:
+        return ContentExcerpt(text=text, estimated_tokens=total_tokens, original_chars=len(text), truncated=False)
+
+    chars_per_token = len(text) / max(1, total_tokens)
+    gap_tokens = estimate_tokens(EXCERPT_GAP_MARKER)
+    head_chars = int(max_tokens * HEAD_BUDGET_SHARE * chars_per_token)
+    tail_chars = int(max_tokens * TAIL_BUDGET_SHARE * chars_per_token)
+    head_end = head_chars
+    tail_start = max(head_end, len(text) - tail_chars)
+
+    window_budget = max_tokens - estimate_tokens(text[:head_end]) - estimate_tokens(text[tail_start:]) - gap_tokens
+    chosen: List[Tuple[int, int]] = []
+    candidates = _keyword_windows(text, head_end, tail_start)
+    # Wichtigste Fenster zuerst; bei Gleichstand das frühere.
+    for weight, begin, stop in sorted(candidates, key=lambda item: (-item[0], item[1])):
+        cost = estimate_tokens(text[begin:stop]) + gap_tokens
+        if cost > window_budget:
+            continue
+        chosen.append((begin, stop))
+        window_budget -= cost
+
+    middle = [text[begin:stop] for begin, stop in sorted(chosen)]
+    excerpt = _join_segments([text[:head_end], *middle, text[tail_start:]])
+    estimated = estimate_tokens(excerpt)
+    while estimated > max_tokens and head_end > 0:
+        # Schätzfehler durch ungleich verteilte Zeichen: Kopf kürzen, Ende bleibt erhalten.
+        head_end = max(0, head_end - int((estimated - max_tokens) * chars_per_token) - 1)
+        excerpt = _join_segments([text[:head_end], *middle, text[tail_start:]])
+        estimated = estimate_tokens(excerpt)
+    return ContentExcerpt(text=excerpt, estimated_tokens=estimated, original_chars=len(text), truncated=True)
+
+
+def _join_segments(segments: List[str]) -> str:
+    return EXCERPT_GAP_MARKER.join(segment.strip("\n") for segment in segments if segment.strip("\n"))
@@ -0,0 +1,260 @@
+"""Incremental delta sync over the Paperless `modified` timestamp.
+
+Purpose:
+- A normal run lists every matching document via `iter_documents` and
+  re-evaluates the skip rules one by one. Scheduled runs on large archives
+  spend minutes on documents that did not change since the last run.
+- Delta mode persists a watermark (highest `modified` handled plus the ids
+  exactly on it) and later runs only list documents changed since then.
+
+Input / Output:
+- Input: the persisted state dict and the query scope of the run
+  (`DeltaSync(scope, state)`), every document the main loop consumes
+  (`observe`) and failed documents (`mark_failed`).
+- Output: the changed documents (`iter_changed`, given a page fetcher such
+  as `PaperlessClient.iter_documents`), id chunks of failed documents to
+  retry (`retry_id_chunks`) and the next state (`to_state`).
+
+Important invariants:
+- The listing is sorted by `modified` ascending, so everything below the
+  highest consumed `modified` has been seen, even when `max_documents` or a
+  budget cuts the run short.
+- Pages are fetched by cursor (`modified__gte` of the last document), not
+  by offset: every PATCH of the run moves a document to the end of the
+  order, and offset pages would silently skip documents. An upper bound
+  taken at the start (`modified__lte`) keeps the run's own updates out.
+- Documents exactly on the cursor that were already handled are dropped via
+  their ids. Plain `modified__gt` would lose documents sharing the
+  timestamp, e.g. after a bulk edit. Only after a run that consumed its
+  whole listing does the next run start with `modified__gt`.
+- A changed scope (other tag filter, other mode) discards the watermark
+  and falls back to a full listing.
+- Failed documents are kept as retry ids and listed again by id, because the
+  watermark moves past them.
+
+How to debug:
+- Run `python3 -m unittest tests.test_delta_sync`.
+- Check `last_run.performance.pipeline.delta_sync` in `run_metrics.json`.
+- Delete the state file to force one full listing.
+"""
+
+from __future__ import annotations
+
+import datetime as dt
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set
+
+
+STATE_VERSION = 1
+# `id__in`-Listen klein halten, damit die URL nicht zu lang wird.
+RETRY_CHUNK_SIZE = 100
+DELTA_PAGE_SIZE = 100
+
+# `(limit, params) -> Dokumente`, z. B. `PaperlessClient.iter_documents`.
+PageFetcher = Callable[[Optional[int], Dict[str, Any]], Iterable[Dict[str, Any]]]
+
+
+def parse_modified(value: Any) -> Optional[dt.datetime]:
+    """Parses a Paperless `modified` value; naive values count as UTC."""
+
+    text = str(value or "").strip()
+    if not text:
+        return None
+    if text.endswith("Z"):
+        text = text[:-1] + "+00:00"
+    try:
+        parsed = dt.datetime.fromisoformat(text)
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=dt.timezone.utc)
+    return parsed
+
+
+def _normalize_scope(scope: Dict[str, Any]) -> Dict[str, str]:
+    return {str(key): str(value) for key, value in sorted(scope.items())}
+
+
+def _int_ids(values: Any) -> Set[int]:
+    ids: Set[int] = set()
+    for value in values or []:
+        try:
+            ids.add(int(value))
+        except (TypeError, ValueError):
+            continue
+    return ids
+
+
+class DeltaSync:
+    """Watermark bookkeeping for one run in delta mode."""
+
+    def __init__(self, scope: Dict[str, Any], state: Optional[Dict[str, Any]] = None) -> None:
+        self.scope = _normalize_scope(scope)
+        state = state or {}
+        usable = int(state.get("version", 0) or 0) == STATE_VERSION and state.get("scope") == self.scope
+        self.scope_changed = bool(state) and not usable
+        self.watermark = str(state.get("watermark") or "") if usable else ""
+        self.boundary_ids = _int_ids(state.get("boundary_ids")) if usable else set()
+        self.retry_ids = _int_ids(state.get("retry_ids")) if usable else set()
+        self.boundary_complete = bool(state.get("boundary_complete")) if usable else False
+        self._watermark_at = parse_modified(self.watermark)
+        if self._watermark_at is None:
+            self.watermark = ""
+            self.boundary_ids = set()
+        self._max_raw = self.watermark
+        self._max_at = self._watermark_at
+        self._max_ids: Set[int] = set(self.boundary_ids)
+        self.failed_ids: Set[int] = set()
+        self._listing_done = False
+        self._last_listed_id: Optional[int] = None
+        self._last_consumed_id: Optional[int] = None
+        self._pending: Optional[Dict[str, Any]] = None
+        self.listed = 0
+        self.consumed = 0
+        self.boundary_skipped = 0
+
+    def query_params(self) -> Dict[str, Any]:
+        """Params on top of the scope that count the changed documents."""
+
+        return {"modified__gte": self.watermark} if self.watermark else {}
+
+    def retry_id_chunks(self) -> List[str]:
+        """`id__in` values for documents that failed in earlier delta runs."""
+
+        ids = sorted(self.retry_ids)
+        return [
+            ",".join(str(doc_id) for doc_id in ids[start : start + RETRY_CHUNK_SIZE])
+            for start in range(0, len(ids), RETRY_CHUNK_SIZE)
+        ]
+
+    def iter_changed(
+        self,
+        fetch: PageFetcher,
+        scope_params: Dict[str, Any],
+        limit: Optional[int],
+        *,
+        page_size: int = DELTA_PAGE_SIZE,
+    ) -> Iterator[Dict[str, Any]]:
+        """Documents changed since the watermark, oldest change first, paged by cursor."""
+
+        newest = list(fetch(1, {**scope_params, "ordering": "-modified", "page_size": 1}))
+        upper_bound = str(newest[0].get("modified") or "") if newest else ""
+        if not upper_bound:
+            return
+        base = {**scope_params, "ordering": "modified", "modified__lte": upper_bound}
+        cursor_raw = self.watermark
+        cursor_at = self._watermark_at
+        cursor_ids = set(self.boundary_ids)
+        yielded = 0
+        strict = self.boundary_complete
+        while limit is None or yielded < limit:
+            params = dict(base, page_size=page_size)
+            if cursor_raw:
+                params["modified__gt" if strict else "modified__gte"] = cursor_raw
+            page = list(fetch(page_size, params))
+            strict = False
+            fresh = []
+            for document in page:
+                self.listed += 1
+                modified_at = parse_modified(document.get("modified"))
+                if modified_at is None:
+                    continue
+                if modified_at == cursor_at and document.get("id") in cursor_ids:
+                    self.boundary_skipped += 1
+                    continue
+                fresh.append(document)
+            if not fresh and len(page) >= page_size:
+                # Mehr Dokumente mit identischem `modified` als eine Seite:
+                # Gruppe vollständig laden, bevor Updates die Reihenfolge ändern.
+                tie_params = dict(base, page_size=page_size, modified__gte=cursor_raw, modified__lte=cursor_raw)
+                fresh = [document for document in fetch(None, tie_params) if document.get("id") not in cursor_ids]
+                self.listed += len(fresh)
+                strict = True
+            elif not fresh:
+                self._listing_done = True
+                return
+            for document in fresh:
+                modified_at = parse_modified(document.get("modified"))
+                if modified_at is not None and (cursor_at is None or modified_at > cursor_at):
+                    cursor_raw = str(document.get("modified") or "")
+                    cursor_at = modified_at
+                    cursor_ids = set()
+                if document.get("id") in self.retry_ids:
+                    # Bereits über die Wiederholungsliste geladen.
+                    cursor_ids.add(document.get("id"))
+                    continue
+                cursor_ids.add(document.get("id"))
+                self._last_listed_id = document.get("id")
+                yield document
+                yielded += 1
+                if limit is not None and yielded >= limit:
+                    return
+
+    def observe(self, document: Dict[str, Any]) -> None:
+        """Records the document the main loop starts; the previous one counts as handled.
+
+        The current document may still hit the budget limit (`break`), so it
+        only moves the watermark with the next `observe` or with `finish`.
+        """
+
+        self._commit_pending()
+        self._pending = document
+
+    def finish(self) -> None:
+        """The main loop ran to the end: the last document counts as handled too."""
+
+        self._commit_pending()
+
+    def _commit_pending(self) -> None:
+        document, self._pending = self._pending, None
+        if document is None:
+            return
+        try:
+            doc_id = int(document["id"])
+        except (KeyError, TypeError, ValueError):
+            return
+        self.consumed += 1
+        if doc_id in self.retry_ids:
+            return
+        self._last_consumed_id = doc_id
+        modified_raw = str(document.get("modified") or "")
+        modified_at = parse_modified(modified_raw)
+        if modified_at is None:
+            return
+        if self._max_at is None or modified_at > self._max_at:
+            self._max_at = modified_at
+            self._max_raw = modified_raw
+            self._max_ids = {doc_id}
+        elif modified_at == self._max_at:
+            self._max_ids.add(doc_id)
+
+    def mark_failed(self, doc_id: Any) -> None:
+        try:
+            self.failed_ids.add(int(doc_id))
+        except (TypeError, ValueError):
+            return
+
+    def to_state(self, *, quarantined_ids: Iterable[Any] = ()) -> Dict[str, Any]:
+        """Next persisted state; failed and quarantined documents stay retryable."""
+
+        return {
+            "version": STATE_VERSION,
+            "scope": self.scope,
+            "watermark": self._max_raw,
+            "boundary_ids": sorted(self._max_ids),
+            # Ganze Liste verarbeitet: am Wasserzeichen fehlt kein Dokument mehr.
+            "boundary_complete": self._listing_done and self._last_consumed_id == self._last_listed_id,
+            "retry_ids": sorted(self.failed_ids | _int_ids(quarantined_ids)),
+            "updated_at": dt.datetime.now(dt.timezone.utc).isoformat(),
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "watermark_before": self.watermark,
+            "watermark_after": self._max_raw,
+            "listed": self.listed,
+            "consumed": self.consumed,
+            "boundary_skipped": self.boundary_skipped,
+            "retry_ids": len(self.retry_ids),
+            "failed": len(self.failed_ids),
+            "scope_changed": self.scope_changed,
+        }
@@ -0,0 +1,172 @@
+"""Per-document shortlists of known Paperless entities for the AI prompt.
+
+Purpose:
+- With `include_existing_entities_in_prompt` the full lists of document
+  types, correspondents and storage paths go into every request. On large
+  instances that is thousands of names and most of the prompt tokens.
+- A small local index ranks entity names against the document text, so only
+  the top-k plausible candidates are sent.
+
+Input / Output:
+- Input: entity names once per run, then title + content preview per document.
+- Output: up to k names ranked by coverage score, i.e. the share of the
+  name's character n-gram weight (IDF over all names) found in the document.
+- `benchmark_recall` and the CLI measure recall@k against documents that
+  already have a correspondent / document type.
+
+Important invariants:
+- Pure Python and deterministic: same names and text give the same order
+  (ties are broken by name), so classification cache keys stay stable.
+- Names without any match are not returned; the list may be shorter than k.
+- Nothing here talks to the AI provider.
+
+How to debug:
+- Run `python3 -m unittest tests.test_entity_shortlist`.
+- Measure recall on your own instance:
+  `python src/entity_shortlist.py --config config.yaml --limit 300 --k 5,10,20,40`.
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import math
+import re
+import sys
+import time
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+
+NGRAM_SIZE = 3
+_UMLAUT_TABLE = str.maketrans({"ä": "ae", "ö": "oe", "ü": "ue", "ß": "ss"})
+_NON_ALNUM_RE = re.compile(r"[^a-z0-9]+")
+
+
+def normalize_text(text: str) -> str:
+    """Lowercase, umlauts spelled out, everything else collapsed to single spaces."""
+
+    lowered = str(text or "").lower().translate(_UMLAUT_TABLE)
+    return _NON_ALNUM_RE.sub(" ", lowered).strip()
+
+
+def char_ngrams(text: str, size: int = NGRAM_SIZE) -> Set[str]:
+    """Character n-grams of the normalized text, padded so word starts/ends count."""
+
+    normalized = normalize_text(text)
+    if not normalized:
+        return set()
+    padded = f" {normalized} "
+    if len(padded) <= size:
+        return {padded}
+    return {padded[index : index + size] for index in range(len(padded) - size + 1)}
+
+
+class EntityShortlistIndex:
+    """TF-IDF style n-gram index over entity names."""
+
+    def __init__(self, names: Iterable[str], *, ngram_size: int = NGRAM_SIZE) -> None:
+        self.ngram_size = ngram_size
+        self.names: List[str] = sorted({str(name) for name in names if str(name or "").strip()})
+        grams_per_name = [char_ngrams(name, ngram_size) for name in self.names]
+        document_frequency: Dict[str, int] = {}
+        for grams in grams_per_name:
+            for gram in grams:
+                document_frequency[gram] = document_frequency.get(gram, 0) + 1
+        total = max(1, len(self.names))
+        idf = {gram: math.log((1 + total) / (1 + count)) + 1.0 for gram, count in document_frequency.items()}
+        # Posting-Listen: n-gram -> [(Namensindex, Anteil am Gesamtgewicht des Namens)].
+        self._postings: Dict[str, List[Tuple[int, float]]] = {}
+        for name_index, grams in enumerate(grams_per_name):
+            mass = sum(idf[gram] ** 2 for gram in grams)
+            if mass <= 0:
+                continue
+            for gram in grams:
+                self._postings.setdefault(gram, []).append((name_index, idf[gram] ** 2 / mass))
+        self.signature = hashlib.sha256("\n".join(self.names).encode("utf-8")).hexdigest()[:12]
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def rank(self, text: str, k: int) -> List[Tuple[str, float]]:
+        """Returns up to `k` `(name, score)` pairs, best first; score is in (0, 1]."""
+
+        if k <= 0 or not self.names:
+            return []
+        scores: Dict[int, float] = {}
+        for gram in char_ngrams(text, self.ngram_size):
+            for name_index, weight in self._postings.get(gram, ()):
+                scores[name_index] = scores.get(name_index, 0.0) + weight
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], self.names[item[0]]))
+        return [(self.names[name_index], round(score, 4)) for name_index, score in ranked[:k]]
+
+    def top_k(self, text: str, k: int) -> List[str]:
+        return [name for name, _score in self.rank(text, k)]
+
+
+def benchmark_recall(
+    index: EntityShortlistIndex,
+    samples: Sequence[Tuple[str, str]],
+    ks: Sequence[int],
+) -> Dict[int, float]:
+    """recall@k for `(document_text, expected_name)` samples."""
+
+    if not samples:
+        return {k: 0.0 for k in ks}
+    largest = max(ks)
+    hits = {k: 0 for k in ks}
+    for text, expected in samples:
+        ranked = index.top_k(text, largest)
+        for k in ks:
+            if expected in ranked[:k]:
+                hits[k] += 1
+    return {k: round(hits[k] / len(samples), 4) for k in ks}
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    """Benchmark against already classified Paperless documents."""
+
+    parser = argparse.ArgumentParser(description="Recall@k der Entitäten-Vorauswahl messen")
+    parser.add_argument("--config", default="config.yaml", help="Pfad zur YAML-Konfiguration")
+    parser.add_argument("--limit", type=int, default=300, help="Anzahl Dokumente (Default: 300)")
+    parser.add_argument("--k", default="5,10,20,40", help="Kommagetrennte k-Werte (Default: 5,10,20,40)")
+    args = parser.parse_args(argv)
+
+    from paperless_ai_sorter import ConfigError, PaperlessClient, load_config
+
+    try:
+        config = load_config(args.config, True)
+        ks = sorted({max(1, int(value)) for value in str(args.k).split(",") if value.strip()})
+    except (ConfigError, ValueError) as exc:
+        print(f"[CONFIG-ERROR] {exc}", file=sys.stderr)
+        return 2
+
+    client = PaperlessClient(config)
+    kinds = {
+        "correspondent": client.list_named_entities("/api/correspondents/"),
+        "document_type": client.list_named_entities("/api/document_types/"),
+    }
+    names_by_id = {
+        kind: {entity_id: name for name, entity_id in name_to_id.items()} for kind, name_to_id in kinds.items()
+    }
+    samples: Dict[str, List[Tuple[str, str]]] = {kind: [] for kind in kinds}
+    for document in client.iter_documents(args.limit):
+        text = f"{document.get('title') or ''}\n{str(document.get('content') or '')[:6000]}"
+        for kind in kinds:
+            expected = names_by_id[kind].get(document.get(kind))
+            if expected:
+                samples[kind].append((text, expected))
+
+    for kind, name_to_id in kinds.items():
+        index = EntityShortlistIndex(name_to_id.keys())
+        started = time.perf_counter()
+        recall = benchmark_recall(index, samples[kind], ks)
+        elapsed = time.perf_counter() - started
+        per_doc_ms = elapsed * 1000.0 / max(1, len(samples[kind]))
+        print(f"{kind}: {len(index)} Namen | {len(samples[kind])} Dokumente | {per_doc_ms:.2f} ms/Dokument")
+        for k in ks:
+            print(f"  recall@{k}: {recall[k] * 100.0:.1f} %")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
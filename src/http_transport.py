@@ -0,0 +1,194 @@
+"""Shared, connection-pooled HTTP transport for Paperless clients.
+
+Purpose:
+- Every `PaperlessClient` used to own a plain `requests.Session` with the
+  default pool size of 10 connections. Threads sharing a client (precheck
+  workers, prefetch) beyond that size make urllib3 discard connections, and
+  the worker API built a fresh client and TCP/TLS connection for each review
+  or merge request.
+- One `HttpTransport` holds a single `HTTPAdapter` whose connection pool is
+  sized to the configured concurrency. Sessions created through it keep
+  their own headers and cookies but share the pooled keep-alive connections.
+
+Input / Output:
+- Input: pool size (`pool_maxsize`), whether responses may be compressed
+  (`compression`) and the default headers of each new session.
+- Output: sessions from `new_session(headers)` and per-host connection
+  counters from `stats()`: `requests`, `opened`, `reused`, `failed`.
+
+Important invariants:
+- `Session.close()` of a single session does not close the shared pool;
+  only `HttpTransport.close()` does.
+- Connections are opened lazily; `reused` is `requests - opened`, i.e. every
+  request that found an idle keep-alive connection (and thus skipped DNS,
+  TCP and TLS setup).
+- The pool never blocks: above `pool_maxsize` concurrent requests urllib3
+  opens extra connections and drops them afterwards (counted as `opened`).
+- With `compression` the sessions accept every encoding urllib3 can decode
+  (gzip/deflate, plus br/zstd when the optional packages are installed);
+  without it they ask for `identity`.
+
+How to debug:
+- Run `python3 -m unittest tests.test_http_transport`.
+- Check `paperless_http` in the worker's `/api/status` or
+  `last_run.performance.pipeline.http_transport` in `run_metrics.json`.
+"""
+
+from __future__ import annotations
+
+import threading
+from typing import Any, Dict, Mapping, Optional, Type
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+try:
+    from urllib3.util.request import ACCEPT_ENCODING
+except ImportError:  # pragma: no cover - sehr alte urllib3-Versionen
+    ACCEPT_ENCODING = "gzip,deflate"
+
+
+DEFAULT_POOL_MAXSIZE = 10
+# Verschiedene Hosts pro Prozess: Paperless, ggf. ein Reverse-Proxy-Host.
+DEFAULT_POOL_CONNECTIONS = 4
+
+
+class _HostStats:
+    """Thread-safe counters per `host:port`."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._hosts: Dict[str, Dict[str, int]] = {}
+
+    def _entry(self, host: str) -> Dict[str, int]:
+        entry = self._hosts.get(host)
+        if entry is None:
+            entry = {"requests": 0, "opened": 0, "failed": 0}
+            self._hosts[host] = entry
+        return entry
+
+    def add(self, host: str, key: str) -> None:
+        with self._lock:
+            self._entry(host)[key] += 1
+
+    def snapshot(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            return {
+                host: {
+                    "requests": entry["requests"],
+                    "opened": entry["opened"],
+                    "reused": max(0, entry["requests"] - entry["opened"]),
+                    "failed": entry["failed"],
+                }
+                for host, entry in sorted(self._hosts.items())
+            }
+
+
+def _counting_pool_class(base: Type[HTTPConnectionPool], stats: _HostStats) -> Type[HTTPConnectionPool]:
+    class CountingPool(base):  # type: ignore[valid-type, misc]
+        def _new_conn(self):  # type: ignore[no-untyped-def]
+            stats.add(f"{self.host}:{self.port}", "opened")
+            return super()._new_conn()
+
+    CountingPool.__name__ = f"Counting{base.__name__}"
+    return CountingPool
+
+
+class _CountingAdapter(HTTPAdapter):
+    """`HTTPAdapter` that counts requests, new connections and failures per host."""
+
+    def __init__(self, stats: _HostStats, **kwargs: Any) -> None:
+        self._stats = stats
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args: Any, **kwargs: Any) -> None:
+        super().init_poolmanager(*args, **kwargs)
+        # Eigenes Dict: das Standard-Mapping von urllib3 ist modulweit geteilt.
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _counting_pool_class(HTTPConnectionPool, self._stats),
+            "https": _counting_pool_class(HTTPSConnectionPool, self._stats),
+        }
+
+    def send(self, request: requests.PreparedRequest, *args: Any, **kwargs: Any) -> requests.Response:
+        parts = urlsplit(str(request.url or ""))
+        port = parts.port or (443 if parts.scheme == "https" else 80)
+        host = f"{parts.hostname or ''}:{port}"
+        self._stats.add(host, "requests")
+        try:
+            return super().send(request, *args, **kwargs)
+        except requests.RequestException:
+            self._stats.add(host, "failed")
+            raise
+
+
+class _SharedPoolSession(requests.Session):
+    """Session whose `close()` leaves the shared pool open for other sessions."""
+
+    def __init__(self, shared_adapter: HTTPAdapter) -> None:
+        super().__init__()
+        self._shared_adapter = shared_adapter
+        self.mount("http://", shared_adapter)
+        self.mount("https://", shared_adapter)
+
+    def close(self) -> None:
+        for adapter in self.adapters.values():
+            if adapter is not self._shared_adapter:
+                adapter.close()
+
+
+class HttpTransport:
+    """Connection pool shared by all sessions created through it."""
+
+    def __init__(
+        self,
+        *,
+        pool_maxsize: int = DEFAULT_POOL_MAXSIZE,
+        pool_connections: int = DEFAULT_POOL_CONNECTIONS,
+        compression: bool = True,
+    ) -> None:
+        self.pool_maxsize = max(1, int(pool_maxsize))
+        self.pool_connections = max(1, int(pool_connections))
+        self.compression = bool(compression)
+        self._stats = _HostStats()
+        self._adapter = _CountingAdapter(
+            self._stats,
+            pool_connections=self.pool_connections,
+            pool_maxsize=self.pool_maxsize,
+            pool_block=False,
+        )
+
+    def new_session(self, headers: Optional[Mapping[str, str]] = None) -> requests.Session:
+        """Session with its own headers/cookies on top of the shared pool."""
+
+        session = _SharedPoolSession(self._adapter)
+        session.headers.update(
+            {
+                "Connection": "keep-alive",
+                "Accept-Encoding": ACCEPT_ENCODING if self.compression else "identity",
+            }
+        )
+        if headers:
+            session.headers.update(headers)
+        return session
+
+    def matches(self, *, pool_maxsize: int, compression: bool) -> bool:
+        return self.pool_maxsize == max(1, int(pool_maxsize)) and self.compression == bool(compression)
+
+    def stats(self) -> Dict[str, Any]:
+        hosts = self._stats.snapshot()
+        return {
+            "pool_maxsize": self.pool_maxsize,
+            "compression": self.compression,
+            "requests": sum(entry["requests"] for entry in hosts.values()),
+            "opened": sum(entry["opened"] for entry in hosts.values()),
+            "reused": sum(entry["reused"] for entry in hosts.values()),
+            "failed": sum(entry["failed"] for entry in hosts.values()),
+            "hosts": hosts,
+        }
+
+    def close(self) -> None:
+        """Closes all pooled connections; sessions created earlier stay usable."""
+
+        self._adapter.close()
@@ -0,0 +1,330 @@
+"""Persisted MinHash index for near-duplicate documents.
+
+Purpose:
+- `precheck_duplicate_hash_gate` only finds byte-identical files (same
+  `checksum`). Rescans and re-exported PDFs carry the same text with
+  different bytes and went to the AI again.
+- A MinHash signature over word shingles of the OCR text estimates their
+  Jaccard similarity and finds such near duplicates locally. The metadata of the classified original is stored
+  alongside the signature, so a hit can be applied like an exact
+  duplicate without any Paperless query.
+
+Input / Output:
+- Input: document id, OCR text and the metadata snapshot (`document_type`,
+  `correspondent`, `storage_path`, `created`, `tags`) of classified
+  documents (`add`).
+- Output: `find(text)` returns a `NearDuplicateMatch` (id, estimated
+  similarity, number overlap, stored metadata) or None.
+- `stats()` returns entry count and lookup / hit counters.
+
+Important invariants:
+- Lookups use LSH band buckets (`LSH_BANDS` bands of `LSH_ROWS` values), so
+  only signatures sharing a complete band are compared; the cost does not
+  grow with a linear scan over all entries. At similarity 0.8 a pair shares
+  a band with > 99.9 % probability, at 0.3 with about 12 %.
+- MinHash instead of SimHash: a few OCR errors on a short page move a 64-bit
+  SimHash by 5-10 bits, which no safe Hamming threshold tolerates, while the
+  MinHash estimate degrades only proportionally.
+- Numbers are part of the shingles and additionally compared as a set
+  (`min_number_overlap`): a recurring invoice with new amounts and dates is
+  similar, but not a duplicate, and must not inherit `created`.
+- Texts with fewer than `MIN_SHINGLES` shingles are not indexed or looked up;
+  short forms would collide too easily.
+- Index errors never abort a run: on any SQLite error the index logs a
+  warning and keeps working in memory only.
+
+How to debug:
+- Run `python3 -m unittest tests.test_near_duplicate_index`.
+- Check `last_run.performance.pipeline.near_duplicate_gate` in
+  `run_metrics.json` and the `near_duplicate_gate` precheck notes.
+- Inspect the file with
+  `sqlite3 near_duplicate_index.sqlite3 'select doc_id, metadata from documents'`.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+import hashlib
+import json
+import logging
+from pathlib import Path
+import random
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, FrozenSet, List, Optional, Set, Tuple
+
+from entity_shortlist import normalize_text
+
+
+LOGGER = logging.getLogger("paperless_ai_sorter")
+
+SHINGLE_SIZE = 3
+MIN_SHINGLES = 20
+NUM_PERMUTATIONS = 64
+LSH_BANDS = 16
+LSH_ROWS = NUM_PERMUTATIONS // LSH_BANDS
+MAX_NUMBERS_PER_DOCUMENT = 200
+DUPLICATE_METADATA_FIELDS = ("document_type", "correspondent", "storage_path", "created", "tags")
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+# Fester Seed: Signaturen müssen über Läufe hinweg vergleichbar bleiben.
+_PERMUTATIONS = [
+    (rng.randrange(1, _MERSENNE_PRIME), rng.randrange(0, _MERSENNE_PRIME))
+    for rng in [random.Random(0x5EED)]
+    for _ in range(NUM_PERMUTATIONS)
+]
+
+Signature = Tuple[int, ...]
+
+
+def _shingle_hash(shingle: str) -> int:
+    return int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def signature(text: str) -> Optional[Tuple[Signature, FrozenSet[str]]]:
+    """MinHash signature of the word shingles plus the number tokens, None if too short."""
+
+    tokens = normalize_text(text).split()
+    shingles = {" ".join(tokens[index : index + SHINGLE_SIZE]) for index in range(len(tokens) - SHINGLE_SIZE + 1)}
+    if len(shingles) < MIN_SHINGLES:
+        return None
+    hashes = [_shingle_hash(shingle) for shingle in shingles]
+    minhash = tuple(
+        min(((a * value + b) % _MERSENNE_PRIME) & _MAX_HASH for value in hashes) for a, b in _PERMUTATIONS
+    )
+    numbers = sorted({token for token in tokens if len(token) >= 2 and any(char.isdigit() for char in token)})
+    return minhash, frozenset(numbers[:MAX_NUMBERS_PER_DOCUMENT])
+
+
+def estimated_similarity(left: Signature, right: Signature) -> float:
+    """Share of equal MinHash values, an estimate of the shingle Jaccard similarity."""
+
+    return sum(1 for a, b in zip(left, right) if a == b) / float(NUM_PERMUTATIONS)
+
+
+def number_overlap(left: FrozenSet[str], right: FrozenSet[str]) -> float:
+    """Jaccard overlap of the number tokens; two texts without numbers count as equal."""
+
+    if not left and not right:
+        return 1.0
+    return len(left & right) / float(len(left | right))
+
+
+@dataclass
+class NearDuplicateMatch:
+    """Most similar indexed document and its stored metadata."""
+
+    doc_id: int
+    similarity: float
+    number_overlap: float
+    metadata: Dict[str, Any]
+
+
+class NearDuplicateIndex:
+    """Thread-safe MinHash/LSH index, persisted in SQLite."""
+
+    def __init__(self, path: str | Path, *, min_similarity: float = 0.8, min_number_overlap: float = 0.9) -> None:
+        self.path = Path(path)
+        self.min_similarity = min(1.0, max(0.5, float(min_similarity)))
+        self.min_number_overlap = min(1.0, max(0.0, float(min_number_overlap)))
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._entries: Dict[int, Tuple[Signature, FrozenSet[str], Dict[str, Any]]] = {}
+        self._buckets: Dict[Tuple[int, Signature], Set[int]] = {}
+        self._pending_writes: Dict[int, Optional[Tuple[Signature, FrozenSet[str], Dict[str, Any], str]]] = {}
+        self.watermark = ""
+        self.lookups = 0
+        self.hits = 0
+        self.added = 0
+        self.removed = 0
+        try:
+            if self.path.parent and not self.path.parent.exists():
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), timeout=10.0, check_same_thread=False)
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS documents ("
+                " doc_id INTEGER PRIMARY KEY,"
+                " signature TEXT NOT NULL,"
+                " numbers TEXT NOT NULL,"
+                " metadata TEXT NOT NULL,"
+                " modified TEXT NOT NULL DEFAULT '',"
+                " updated_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            conn.commit()
+            for doc_id, stored_signature, numbers, metadata in conn.execute(
+                "SELECT doc_id, signature, numbers, metadata FROM documents"
+            ):
+                values = tuple(int(value) for value in json.loads(stored_signature))
+                if len(values) != NUM_PERMUTATIONS:
+                    # Signatur aus anderer Version: beim nächsten Abgleich neu berechnet.
+                    continue
+                self._insert(int(doc_id), values, frozenset(json.loads(numbers)), json.loads(metadata))
+            row = conn.execute("SELECT value FROM meta WHERE key = 'watermark'").fetchone()
+            self.watermark = str(row[0]) if row else ""
+            self._conn = conn
+        except (sqlite3.Error, OSError, ValueError) as exc:
+            LOGGER.warning("Dubletten-Index nur im Speicher (%s): %s", self.path, exc)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    @staticmethod
+    def _band_keys(minhash: Signature) -> List[Tuple[int, Signature]]:
+        return [(band, minhash[band * LSH_ROWS : (band + 1) * LSH_ROWS]) for band in range(LSH_BANDS)]
+
+    def _insert(self, doc_id: int, minhash: Signature, numbers: FrozenSet[str], metadata: Dict[str, Any]) -> None:
+        self._delete(doc_id)
+        self._entries[doc_id] = (minhash, numbers, metadata)
+        for key in self._band_keys(minhash):
+            self._buckets.setdefault(key, set()).add(doc_id)
+
+    def _delete(self, doc_id: int) -> bool:
+        entry = self._entries.pop(doc_id, None)
+        if entry is None:
+            return False
+        for key in self._band_keys(entry[0]):
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.discard(doc_id)
+                if not bucket:
+                    del self._buckets[key]
+        return True
+
+    def add(self, doc_id: int, text: str, metadata: Dict[str, Any], *, modified: str = "") -> bool:
+        """Adds or replaces a classified document; False if the text is too short."""
+
+        result = signature(text)
+        with self._lock:
+            if result is None:
+                if self._delete(int(doc_id)):
+                    self._pending_writes[int(doc_id)] = None
+                return False
+            minhash, numbers = result
+            self._insert(int(doc_id), minhash, numbers, dict(metadata))
+            self._pending_writes[int(doc_id)] = (minhash, numbers, dict(metadata), modified)
+            self.added += 1
+            return True
+
+    def remove(self, doc_id: int) -> None:
+        """Drops a document, e.g. when it lost its classification in Paperless."""
+
+        with self._lock:
+            if self._delete(int(doc_id)):
+                self._pending_writes[int(doc_id)] = None
+                self.removed += 1
+
+    def find(self, text: str, *, exclude_id: Optional[int] = None) -> Optional[NearDuplicateMatch]:
+        """Most similar document above `min_similarity` with enough number overlap."""
+
+        result = signature(text)
+        with self._lock:
+            self.lookups += 1
+            if result is None:
+                return None
+            minhash, numbers = result
+            candidates: Set[int] = set()
+            for key in self._band_keys(minhash):
+                candidates.update(self._buckets.get(key, ()))
+            candidates.discard(exclude_id)  # type: ignore[arg-type]
+            best: Optional[Tuple[float, float, int]] = None
+            for doc_id in candidates:
+                other_minhash, other_numbers, _metadata = self._entries[doc_id]
+                similarity = estimated_similarity(minhash, other_minhash)
+                if similarity < self.min_similarity:
+                    continue
+                overlap = number_overlap(numbers, other_numbers)
+                if overlap < self.min_number_overlap:
+                    continue
+                # Höchste Ähnlichkeit, dann größte Zahlen-Übereinstimmung, dann neuestes Dokument.
+                rank = (similarity, overlap, doc_id)
+                if best is None or rank > best:
+                    best = rank
+            if best is None:
+                return None
+            self.hits += 1
+            return NearDuplicateMatch(
+                doc_id=best[2],
+                similarity=round(best[0], 4),
+                number_overlap=round(best[1], 4),
+                metadata=dict(self._entries[best[2]][2]),
+            )
+
+    def set_watermark(self, modified: str) -> None:
+        with self._lock:
+            if modified > self.watermark:
+                self.watermark = modified
+
+    def flush(self) -> None:
+        """Writes pending changes and the watermark to SQLite."""
+
+        with self._lock:
+            pending = self._pending_writes
+            self._pending_writes = {}
+            if self._conn is None:
+                return
+            now = time.time()
+            try:
+                self._conn.executemany(
+                    "DELETE FROM documents WHERE doc_id = ?",
+                    [(doc_id,) for doc_id, entry in pending.items() if entry is None],
+                )
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO documents"
+                    " (doc_id, signature, numbers, metadata, modified, updated_at)"
+                    " VALUES (?, ?, ?, ?, ?, ?)",
+                    [
+                        (
+                            doc_id,
+                            json.dumps(entry[0]),
+                            json.dumps(sorted(entry[1])),
+                            json.dumps(entry[2], ensure_ascii=False, sort_keys=True),
+                            entry[3],
+                            now,
+                        )
+                        for doc_id, entry in pending.items()
+                        if entry is not None
+                    ],
+                )
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO meta (key, value) VALUES ('watermark', ?)",
+                    (self.watermark,),
+                )
+                self._conn.commit()
+            except sqlite3.Error as exc:
+                LOGGER.warning("Dubletten-Index konnte nicht gespeichert werden, nur im Speicher: %s", exc)
+                conn = self._conn
+                self._conn = None
+                try:
+                    conn.close()
+                except sqlite3.Error:
+                    pass
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "watermark": self.watermark,
+                "min_similarity": self.min_similarity,
+                "added": self.added,
+                "removed": self.removed,
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "hit_rate": round(self.hits / self.lookups, 4) if self.lookups else 0.0,
+            }
+
+    def close(self) -> None:
+        """Flushes and closes the connection (idempotent)."""
+
+        self.flush()
+        with self._lock:
+            conn = self._conn
+            self._conn = None
+        if conn is not None:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
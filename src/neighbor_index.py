@@ -0,0 +1,346 @@
+"""Nearest-neighbour classifier over already classified Paperless documents.
+
+Purpose:
+- Most inbound documents are recurring (monthly invoices of the same
+  utility, payslips, insurer letters). Their metadata equals that of earlier
+  documents the AI (or a human) already classified.
+- A local sparse TF-IDF index over the OCR text of documents carrying the
+  `KI` tag finds the nearest neighbours of a new document. If they agree on
+  document type, correspondent and storage path, that decision is reused
+  and the model is not called.
+
+Input / Output:
+- Input: document id, OCR text and the Paperless ids of document type,
+  correspondent and storage path of classified documents (`add`).
+- Output: `predict(text)` returns a `NeighborVote` (labels, agreement, top
+  similarity, neighbour ids) or None when the neighbours are not convincing.
+- `stats()` returns entry count and query / confident-vote counters.
+
+Important invariants:
+- Pure Python (dicts instead of NumPy): the index is a few hundred terms per
+  document, and query cost is bounded by only generating candidates from the
+  rarest query terms.
+- Tokens contain letters only (no digits), so amounts, dates and invoice
+  numbers that change every month do not separate recurring documents.
+- Persisted in SQLite together with a `modified` watermark; the caller
+  refreshes from Paperless incrementally (`modified__gt=watermark`).
+- Index errors never abort a run: on any SQLite error the index logs a
+  warning and keeps working in memory only.
+
+How to debug:
+- Run `python3 -m unittest tests.test_neighbor_index`.
+- Check `last_run.performance.pipeline.neighbor_classifier` in
+  `run_metrics.json`; in dry-run it contains the precision against the AI.
+- Inspect the file with `sqlite3 neighbor_index.sqlite3 'select count(*) from documents'`.
+"""
+
+from __future__ import annotations
+
+from collections import Counter
+from dataclasses import dataclass
+import json
+import logging
+import math
+from pathlib import Path
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+from entity_shortlist import normalize_text
+
+
+LOGGER = logging.getLogger("paperless_ai_sorter")
+
+NEIGHBOR_FIELDS = ("document_type", "correspondent", "storage_path")
+MAX_TERMS_PER_DOCUMENT = 300
+MIN_TOKEN_LENGTH = 3
+# Nur die seltensten Begriffe der Anfrage erzeugen Kandidaten.
+CANDIDATE_QUERY_TERMS = 24
+MAX_CANDIDATES = 400
+# Normen aller Dokumente erst neu, wenn sich die Dokumentzahl um 5 % ändert.
+NORM_REFRESH_DRIFT = 0.05
+
+Labels = Tuple[int, int, int]
+
+
+def term_counts(text: str) -> Dict[str, int]:
+    """Letter-only tokens of the normalized text, capped to the most frequent."""
+
+    counts = Counter(
+        token
+        for token in normalize_text(text).split()
+        if len(token) >= MIN_TOKEN_LENGTH and token.isalpha()
+    )
+    if len(counts) > MAX_TERMS_PER_DOCUMENT:
+        # Gleichstand deterministisch nach Begriff, damit Index und Anfrage übereinstimmen.
+        ranked = sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+        return dict(ranked[:MAX_TERMS_PER_DOCUMENT])
+    return dict(counts)
+
+
+@dataclass
+class NeighborVote:
+    """Agreed labels of the nearest neighbours of one document."""
+
+    labels: Labels
+    agreement: float
+    similarity: float
+    neighbor_ids: List[int]
+
+
+class NeighborIndex:
+    """Thread-safe sparse TF-IDF index persisted in SQLite."""
+
+    def __init__(self, path: str | Path) -> None:
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._terms: Dict[int, Dict[str, int]] = {}
+        self._labels: Dict[int, Labels] = {}
+        self._postings: Dict[str, Set[int]] = {}
+        self._norms: Dict[int, float] = {}
+        self._norms_total = 0
+        self._pending_writes: Dict[int, Optional[Tuple[Labels, str, str]]] = {}
+        self.watermark = ""
+        self.queries = 0
+        self.confident = 0
+        self.added = 0
+        self.removed = 0
+        try:
+            if self.path.parent and not self.path.parent.exists():
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), timeout=10.0, check_same_thread=False)
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS documents ("
+                " doc_id INTEGER PRIMARY KEY,"
+                " document_type INTEGER NOT NULL,"
+                " correspondent INTEGER NOT NULL,"
+                " storage_path INTEGER NOT NULL,"
+                " terms TEXT NOT NULL,"
+                " modified TEXT NOT NULL DEFAULT '',"
+                " updated_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            conn.commit()
+            for doc_id, document_type, correspondent, storage_path, terms in conn.execute(
+                "SELECT doc_id, document_type, correspondent, storage_path, terms FROM documents"
+            ):
+                self._insert(int(doc_id), json.loads(terms), (int(document_type), int(correspondent), int(storage_path)))
+            row = conn.execute("SELECT value FROM meta WHERE key = 'watermark'").fetchone()
+            self.watermark = str(row[0]) if row else ""
+            self._conn = conn
+        except (sqlite3.Error, OSError, ValueError) as exc:
+            LOGGER.warning("Nachbar-Index nur im Speicher (%s): %s", self.path, exc)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._terms)
+
+    def _insert(self, doc_id: int, terms: Dict[str, int], labels: Labels) -> None:
+        self._delete(doc_id)
+        self._terms[doc_id] = terms
+        self._labels[doc_id] = labels
+        for term in terms:
+            self._postings.setdefault(term, set()).add(doc_id)
+
+    def _delete(self, doc_id: int) -> bool:
+        terms = self._terms.pop(doc_id, None)
+        if terms is None:
+            return False
+        self._labels.pop(doc_id, None)
+        for term in terms:
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.discard(doc_id)
+                if not postings:
+                    del self._postings[term]
+        self._norms.pop(doc_id, None)
+        return True
+
+    def add(self, doc_id: int, text: str, labels: Labels, *, modified: str = "") -> bool:
+        """Adds or replaces a classified document; False if the text has no usable terms."""
+
+        terms = term_counts(text)
+        with self._lock:
+            if not terms:
+                if self._delete(int(doc_id)):
+                    self._pending_writes[int(doc_id)] = None
+                return False
+            self._insert(int(doc_id), terms, labels)
+            self._pending_writes[int(doc_id)] = (labels, json.dumps(terms, ensure_ascii=False), modified)
+            self.added += 1
+            return True
+
+    def remove(self, doc_id: int) -> None:
+        """Drops a document, e.g. when its metadata was cleared in Paperless."""
+
+        with self._lock:
+            if self._delete(int(doc_id)):
+                self._pending_writes[int(doc_id)] = None
+                self.removed += 1
+
+    def _idf(self, term: str, total: int) -> float:
+        return math.log((1.0 + total) / (1.0 + len(self._postings.get(term, ())))) + 1.0
+
+    def _weights(self, terms: Dict[str, int], total: int) -> Dict[str, float]:
+        return {term: (1.0 + math.log(count)) * self._idf(term, total) for term, count in terms.items()}
+
+    def _norm(self, terms: Dict[str, int], total: int) -> float:
+        return math.sqrt(sum(weight * weight for weight in self._weights(terms, total).values())) or 1.0
+
+    def _refresh_norms(self) -> None:
+        total = len(self._terms)
+        if abs(total - self._norms_total) > NORM_REFRESH_DRIFT * max(1, self._norms_total):
+            # IDF hat sich merklich verschoben: alle Normen neu berechnen.
+            self._norms = {doc_id: self._norm(terms, total) for doc_id, terms in self._terms.items()}
+            self._norms_total = total
+            return
+        # Einzelne neue Dokumente im Lauf: nur deren Norm nachrechnen.
+        for doc_id, terms in self._terms.items():
+            if doc_id not in self._norms:
+                self._norms[doc_id] = self._norm(terms, total)
+
+    def neighbors(self, text: str, *, k: int = 5, exclude_id: Optional[int] = None) -> List[Tuple[int, float]]:
+        """Top-k documents by cosine similarity (descending, ties by id)."""
+
+        query_terms = term_counts(text)
+        with self._lock:
+            total = len(self._terms)
+            if not query_terms or not total:
+                return []
+            self._refresh_norms()
+            query = self._weights(query_terms, total)
+            query_norm = math.sqrt(sum(weight * weight for weight in query.values())) or 1.0
+            rare_terms = sorted(
+                (term for term in query if term in self._postings),
+                key=lambda term: (len(self._postings[term]), term),
+            )[:CANDIDATE_QUERY_TERMS]
+            shared: Counter = Counter()
+            for term in rare_terms:
+                shared.update(self._postings[term])
+            shared.pop(exclude_id, None)
+            candidates = [doc_id for doc_id, _count in shared.most_common(MAX_CANDIDATES)]
+            scored: List[Tuple[int, float]] = []
+            for doc_id in candidates:
+                terms = self._terms[doc_id]
+                dot = sum(
+                    weight * (1.0 + math.log(terms[term])) * self._idf(term, total)
+                    for term, weight in query.items()
+                    if term in terms
+                )
+                scored.append((doc_id, dot / (query_norm * self._norms[doc_id])))
+        scored.sort(key=lambda item: (-item[1], item[0]))
+        return scored[: max(1, int(k))]
+
+    def labels_of(self, doc_id: int) -> Optional[Labels]:
+        with self._lock:
+            return self._labels.get(int(doc_id))
+
+    def predict(
+        self,
+        text: str,
+        *,
+        k: int = 5,
+        min_similarity: float = 0.8,
+        min_neighbors: int = 2,
+        min_agreement: float = 0.9,
+        exclude_id: Optional[int] = None,
+    ) -> Optional[NeighborVote]:
+        """Similarity-weighted vote over the close neighbours, None if not convincing."""
+
+        close = [
+            (doc_id, similarity)
+            for doc_id, similarity in self.neighbors(text, k=k, exclude_id=exclude_id)
+            if similarity >= min_similarity
+        ]
+        vote = None
+        if len(close) >= max(1, int(min_neighbors)):
+            weights: Dict[Labels, float] = {}
+            with self._lock:
+                for doc_id, similarity in close:
+                    labels = self._labels[doc_id]
+                    weights[labels] = weights.get(labels, 0.0) + similarity
+            labels, weight = max(weights.items(), key=lambda item: (item[1], item[0]))
+            agreement = weight / sum(weights.values())
+            if agreement >= min_agreement:
+                vote = NeighborVote(
+                    labels=labels,
+                    agreement=round(agreement, 4),
+                    similarity=round(close[0][1], 4),
+                    neighbor_ids=[doc_id for doc_id, _similarity in close],
+                )
+        with self._lock:
+            self.queries += 1
+            if vote is not None:
+                self.confident += 1
+        return vote
+
+    def set_watermark(self, modified: str) -> None:
+        with self._lock:
+            if modified > self.watermark:
+                self.watermark = modified
+
+    def flush(self) -> None:
+        """Writes pending changes and the watermark to SQLite."""
+
+        with self._lock:
+            pending = self._pending_writes
+            self._pending_writes = {}
+            if self._conn is None:
+                return
+            now = time.time()
+            try:
+                self._conn.executemany(
+                    "DELETE FROM documents WHERE doc_id = ?",
+                    [(doc_id,) for doc_id, entry in pending.items() if entry is None],
+                )
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO documents"
+                    " (doc_id, document_type, correspondent, storage_path, terms, modified, updated_at)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    [
+                        (doc_id, *entry[0], entry[1], entry[2], now)
+                        for doc_id, entry in pending.items()
+                        if entry is not None
+                    ],
+                )
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO meta (key, value) VALUES ('watermark', ?)",
+                    (self.watermark,),
+                )
+                self._conn.commit()
+            except sqlite3.Error as exc:
+                LOGGER.warning("Nachbar-Index konnte nicht gespeichert werden, nur im Speicher: %s", exc)
+                conn = self._conn
+                self._conn = None
+                try:
+                    conn.close()
+                except sqlite3.Error:
+                    pass
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                "entries": len(self._terms),
+                "terms": len(self._postings),
+                "watermark": self.watermark,
+                "added": self.added,
+                "removed": self.removed,
+                "queries": self.queries,
+                "confident": self.confident,
+                "confident_rate": round(self.confident / self.queries, 4) if self.queries else 0.0,
+            }
+
+    def close(self) -> None:
+        """Flushes and closes the connection (idempotent)."""
+
+        self.flush()
+        with self._lock:
+            conn = self._conn
+            self._conn = None
+        if conn is not None:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
@@ -0,0 +1,207 @@
+"""Persisted note-presence index for the `already_classified_skip` gate.
+
+Purpose:
+- `has_ki_summary_note` pages through `/api/documents/{id}/notes/` for every
+  candidate of `already_classified_skip`: at least one extra round-trip per
+  document and run, although the notes of most documents never change.
+- This index remembers per document whether a KI summary note exists,
+  together with the document's `modified` timestamp. Unchanged documents
+  skip the notes fetch.
+
+Input / Output:
+- Input: `lookup(doc_id, modified)` before a fetch, `record(...)` after a
+  fetch, `record_written_note(doc_id)` when the run writes a summary note,
+  `observe_document(document)` for PATCH responses of this run.
+- Output: True / False from the index, or None when the notes have to be
+  fetched (unknown document or `modified` changed).
+
+Important invariants:
+- An entry is only used while `modified` matches exactly; any change in
+  Paperless invalidates it.
+- A note written by this run is stored without `modified` (the PATCH before
+  it changed the timestamp anyway) and adopts the next `modified` it is
+  looked up with.
+- PATCH responses of this run (`observe_document`) move a known entry to the
+  new `modified`: own tag/field updates never change the notes, so removing
+  `#NEU` does not invalidate the entry.
+- Index errors never abort a run: on any SQLite error the index logs a
+  warning and keeps working in memory only.
+
+How to debug:
+- Run `python3 -m unittest tests.test_note_index`.
+- Check `last_run.performance.pipeline.note_index` in `run_metrics.json`.
+- Inspect the file with `sqlite3 note_index.sqlite3 'select * from notes limit 20'`.
+"""
+
+from __future__ import annotations
+
+import logging
+from pathlib import Path
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+
+LOGGER = logging.getLogger("paperless_ai_sorter")
+
+# Zwischendurch speichern, damit ein Abbruch nicht den ganzen Lauf verliert.
+FLUSH_EVERY_PENDING = 500
+
+
+def is_ki_summary_note(text: str) -> bool:
+    """True for KI update notes that contain the short summary."""
+
+    text_lower = str(text or "").lower()
+    return "[ki-update" in text_lower and "kurz-zusammenfassung:" in text_lower
+
+
+class NoteIndex:
+    """Thread-safe `doc_id -> (modified, has_summary)` map persisted in SQLite."""
+
+    def __init__(self, path: str | Path) -> None:
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._entries: Dict[int, Tuple[str, bool]] = {}
+        self._pending: Dict[int, Tuple[str, bool]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.recorded = 0
+        try:
+            if self.path.parent and not self.path.parent.exists():
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), timeout=10.0, check_same_thread=False)
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS notes ("
+                " doc_id INTEGER PRIMARY KEY,"
+                " modified TEXT NOT NULL,"
+                " has_summary INTEGER NOT NULL,"
+                " updated_at REAL NOT NULL)"
+            )
+            conn.commit()
+            for doc_id, modified, has_summary in conn.execute("SELECT doc_id, modified, has_summary FROM notes"):
+                self._entries[int(doc_id)] = (str(modified), bool(has_summary))
+            self._conn = conn
+        except (sqlite3.Error, OSError) as exc:
+            LOGGER.warning("Notiz-Index nur im Speicher (%s): %s", self.path, exc)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def lookup(self, doc_id: int, modified: str) -> Optional[bool]:
+        """Cached note presence, or None if the notes must be fetched."""
+
+        modified = str(modified or "")
+        with self._lock:
+            entry = self._entries.get(int(doc_id))
+            if entry is None or not modified:
+                self.misses += 1
+                return None
+            cached_modified, has_summary = entry
+            if cached_modified and cached_modified != modified:
+                self.stale += 1
+                self.misses += 1
+                return None
+            if not cached_modified:
+                # Eigene Notiz aus einem früheren Lauf: aktuellen Stand übernehmen.
+                self._put(int(doc_id), modified, has_summary)
+            self.hits += 1
+            return has_summary
+
+    def record(self, doc_id: int, modified: str, has_summary: bool) -> None:
+        """Stores the result of a notes fetch for this `modified`."""
+
+        if not modified:
+            return
+        with self._lock:
+            self._put(int(doc_id), str(modified), bool(has_summary))
+        self._maybe_flush()
+
+    def record_written_note(self, doc_id: int, note: str) -> None:
+        """Marks a summary note written by this run (observer of `add_document_note`)."""
+
+        if not is_ki_summary_note(note):
+            return
+        with self._lock:
+            self._put(int(doc_id), "", True)
+        self._maybe_flush()
+
+    def observe_document(self, document: Dict[str, Any]) -> None:
+        """Moves a known entry to the `modified` of a PATCH response of this run."""
+
+        try:
+            doc_id = int(document["id"])
+        except (KeyError, TypeError, ValueError):
+            return
+        modified = str(document.get("modified") or "")
+        if not modified:
+            return
+        with self._lock:
+            entry = self._entries.get(doc_id)
+            if entry is None or entry[0] == modified:
+                return
+            self._put(doc_id, modified, entry[1])
+        self._maybe_flush()
+
+    def _put(self, doc_id: int, modified: str, has_summary: bool) -> None:
+        self._entries[doc_id] = (modified, has_summary)
+        self._pending[doc_id] = (modified, has_summary)
+        self.recorded += 1
+
+    def _maybe_flush(self) -> None:
+        with self._lock:
+            due = len(self._pending) >= FLUSH_EVERY_PENDING
+        if due:
+            self.flush()
+
+    def flush(self) -> None:
+        """Writes pending entries to SQLite."""
+
+        with self._lock:
+            pending = self._pending
+            self._pending = {}
+            if self._conn is None or not pending:
+                return
+            now = time.time()
+            try:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO notes (doc_id, modified, has_summary, updated_at) VALUES (?, ?, ?, ?)",
+                    [(doc_id, modified, int(has_summary), now) for doc_id, (modified, has_summary) in pending.items()],
+                )
+                self._conn.commit()
+            except sqlite3.Error as exc:
+                LOGGER.warning("Notiz-Index konnte nicht gespeichert werden, nur im Speicher: %s", exc)
+                conn = self._conn
+                self._conn = None
+                try:
+                    conn.close()
+                except sqlite3.Error:
+                    pass
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "stale": self.stale,
+                "recorded": self.recorded,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+    def close(self) -> None:
+        """Flushes and closes the connection (idempotent)."""
+
+        self.flush()
+        with self._lock:
+            conn = self._conn
+            self._conn = None
+        if conn is not None:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
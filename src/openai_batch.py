@@ -0,0 +1,184 @@
+"""OpenAI Batch API client for offline classification backfills.
+
+Purpose:
+- Large, non-urgent backfills can trade latency for roughly half the price
+  and no TPM limits by running through the provider's Batch API.
+- The sorter serializes pending classification requests to a JSONL file,
+  submits it, pauses the run and applies the results after an automatic
+  resume.
+
+Input / Output:
+- Input: `(custom_id, chat-completions body)` pairs, written as JSONL.
+- Output: batch objects (`id`, `status`, `output_file_id`, `error_file_id`,
+  `request_counts`) and per-request results keyed by `custom_id`.
+
+Important invariants:
+- Nothing here touches Paperless or run state; the sorter owns both.
+- Every HTTP failure surfaces as `OpenAiBatchError` with the status code and
+  an optional retry hint, so the caller can pause instead of crashing.
+- `parse_batch_output` never raises on single broken lines; they are skipped
+  and the affected documents fall back to regular requests.
+
+How to debug:
+- Run `python3 -m unittest tests.test_openai_batch` (uses a local stand-in
+  server for `/files` and `/batches`).
+- Inspect the JSONL files in `openai_batch_dir`.
+"""
+
+from __future__ import annotations
+
+import json
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional
+
+import requests
+
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+BATCH_COMPLETION_WINDOW = "24h"
+BATCH_PENDING_STATUSES = {"validating", "in_progress", "finalizing", "cancelling"}
+BATCH_FINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+
+class OpenAiBatchError(Exception):
+    """Batch-API nicht erreichbar oder Antwort unbrauchbar."""
+
+    def __init__(
+        self,
+        message: str,
+        *,
+        status_code: Optional[int] = None,
+        retry_after_seconds: Optional[float] = None,
+    ) -> None:
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after_seconds = retry_after_seconds
+
+
+def write_batch_file(path: Path, requests_by_id: Iterable[tuple[str, Dict[str, Any]]]) -> int:
+    """Writes one Batch-API request per line and returns the line count."""
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    count = 0
+    with path.open("w", encoding="utf-8") as handle:
+        for custom_id, body in requests_by_id:
+            line = {
+                "custom_id": custom_id,
+                "method": "POST",
+                "url": BATCH_ENDPOINT,
+                "body": body,
+            }
+            handle.write(json.dumps(line, ensure_ascii=False) + "\n")
+            count += 1
+    return count
+
+
+def parse_batch_output(text: str) -> Dict[str, Dict[str, Any]]:
+    """Maps `custom_id` to `{"status_code", "body", "error"}` for each line."""
+
+    results: Dict[str, Dict[str, Any]] = {}
+    for raw_line in text.splitlines():
+        raw_line = raw_line.strip()
+        if not raw_line:
+            continue
+        try:
+            payload = json.loads(raw_line)
+        except ValueError:
+            continue
+        if not isinstance(payload, dict) or not payload.get("custom_id"):
+            continue
+        response = payload.get("response") if isinstance(payload.get("response"), dict) else {}
+        results[str(payload["custom_id"])] = {
+            "status_code": int(response.get("status_code") or 0),
+            "body": response.get("body") if isinstance(response.get("body"), dict) else None,
+            "error": payload.get("error"),
+        }
+    return results
+
+
+class OpenAiBatchClient:
+    """Minimal client for the `/files` and `/batches` endpoints."""
+
+    def __init__(self, *, base_url: str, api_key: str, timeout: float) -> None:
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers.update(
+            {
+                "Authorization": f"Bearer {api_key}",
+                "Accept": "application/json",
+                "User-Agent": "paperless-kiplus/0.1",
+            }
+        )
+
+    def _request(self, method: str, path: str, **kwargs: Any) -> requests.Response:
+        try:
+            response = self.session.request(
+                method,
+                f"{self.base_url}{path}",
+                timeout=self.timeout,
+                **kwargs,
+            )
+        except requests.RequestException as exc:
+            raise OpenAiBatchError(f"Batch-API nicht erreichbar: {exc}") from exc
+        if response.status_code >= 400:
+            retry_after: Optional[float] = None
+            try:
+                retry_after = float(response.headers.get("retry-after", ""))
+            except ValueError:
+                retry_after = None
+            raise OpenAiBatchError(
+                f"Batch-API {method} {path} -> HTTP {response.status_code}: {response.text[:300]}",
+                status_code=response.status_code,
+                retry_after_seconds=retry_after,
+            )
+        return response
+
+    def _json(self, response: requests.Response) -> Dict[str, Any]:
+        try:
+            payload = response.json()
+        except ValueError as exc:
+            raise OpenAiBatchError(f"Batch-API lieferte kein JSON: {exc}") from exc
+        if not isinstance(payload, dict):
+            raise OpenAiBatchError("Batch-API lieferte kein JSON-Objekt.")
+        return payload
+
+    def upload_file(self, path: Path) -> str:
+        with path.open("rb") as handle:
+            response = self._request(
+                "POST",
+                "/files",
+                data={"purpose": "batch"},
+                files={"file": (path.name, handle, "application/jsonl")},
+            )
+        file_id = str(self._json(response).get("id") or "")
+        if not file_id:
+            raise OpenAiBatchError("Batch-API: Datei-Upload ohne ID.")
+        return file_id
+
+    def create_batch(self, input_file_id: str, *, metadata: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+        body: Dict[str, Any] = {
+            "input_file_id": input_file_id,
+            "endpoint": BATCH_ENDPOINT,
+            "completion_window": BATCH_COMPLETION_WINDOW,
+        }
+        if metadata:
+            body["metadata"] = metadata
+        batch = self._json(self._request("POST", "/batches", json=body))
+        if not batch.get("id"):
+            raise OpenAiBatchError("Batch-API: Batch ohne ID angelegt.")
+        return batch
+
+    def submit(self, path: Path, *, metadata: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+        """Uploads the JSONL file and creates the batch in one step."""
+
+        return self.create_batch(self.upload_file(path), metadata=metadata)
+
+    def retrieve_batch(self, batch_id: str) -> Dict[str, Any]:
+        return self._json(self._request("GET", f"/batches/{batch_id}"))
+
+    def download_file(self, file_id: str) -> str:
+        return self._request("GET", f"/files/{file_id}/content").text
+
+    def close(self) -> None:
+        self.session.close()
@@ -10,6 +10,7 @@ from __future__ import annotations
 import argparse
 import concurrent.futures
 import datetime as dt
+import hashlib
 import json
 import logging
 import re
@@ -17,20 +18,53 @@ import unicodedata
 from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
 from pathlib import Path
 import sys
+import threading
 import time
 from dataclasses import dataclass
-from typing import Any, Dict, Iterable, List, Optional
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set
+from urllib.parse import urlparse
 
 import requests
 import yaml
 
+from ai_endpoints import PRIMARY_ENDPOINT_NAME, AiEndpoint, AiEndpointPool, AllEndpointsUnavailable
+from ai_hedging import ATTEMPT_HEDGE, ATTEMPT_PRIMARY, RequestHedger
+from ai_pipeline import (
+    APPLY_ORDER_COMPLETION,
+    SUPPORTED_APPLY_ORDERS,
+    BoundedWorkQueue,
+    PagePrefetcher,
+    StagedPipeline,
+    StageSpec,
+    WorkResult,
+)
+from ai_rate_limiter import AiRateLimiter, RateLimitWaitTooLong
+from checksum_index import SCAN_FIELDS as CHECKSUM_SCAN_FIELDS, ChecksumIndex
+from classification_cache import ClassificationCache, build_cache_key
+from content_excerpt import build_excerpt, estimate_message_tokens
+from delta_sync import DeltaSync
 from entity_review import build_ai_prompt_context, load_review_store, review_rules_from_store
+from entity_shortlist import EntityShortlistIndex
+from http_transport import HttpTransport
+from near_duplicate_index import DUPLICATE_METADATA_FIELDS, NearDuplicateIndex
+from neighbor_index import NEIGHBOR_FIELDS, NeighborIndex
+from note_index import NoteIndex, is_ki_summary_note
+from openai_batch import (
+    BATCH_PENDING_STATUSES,
+    OpenAiBatchClient,
+    OpenAiBatchError,
+    parse_batch_output,
+    write_batch_file,
+)
+from rule_classifier import RULE_COUNTER_KEYS, RuleClassifier, RuleMatch
+from tag_mutations import TagMutationBuffer
 from tax_enrichment import (
     TaxEnrichmentError,
     TaxPauseRequested,
     TaxEnrichmentService,
     TaxExportCollector,
     build_tax_tag_labels,
+    parse_cached_prompt_tokens,
 )
 
 
@@ -128,6 +162,84 @@ RUNTIME_EVENT_MARKER = "PAPERLESS_RUNTIME_EVENT "
 RUN_PAUSE_EXIT_CODE = 75
 SHORT_RATE_LIMIT_WAIT_SECONDS = 15.0
 DEFAULT_AUTO_RESUME_WAIT_SECONDS = 300.0
+AI_PIPELINE_MODE_BATCH = "batch"
+AI_PIPELINE_MODE_STREAMING = "streaming"
+AI_PIPELINE_MODE_STAGED = "staged"
+AI_PIPELINE_MODE_OPENAI_BATCH = "openai_batch"
+CONTENT_EXCERPT_MODE_TRUNCATE = "truncate"
+CONTENT_EXCERPT_MODE_SMART = "smart"
+SUPPORTED_CONTENT_EXCERPT_MODES = {CONTENT_EXCERPT_MODE_TRUNCATE, CONTENT_EXCERPT_MODE_SMART}
+# Dubletten-Gate: pro Dokument fragen, aus gestreamten Seiten oder aus einem Start-Scan.
+DUPLICATE_LOOKUP_QUERY = "query"
+DUPLICATE_LOOKUP_STREAM = "stream"
+DUPLICATE_LOOKUP_SCAN = "scan"
+SUPPORTED_DUPLICATE_LOOKUP_MODES = {DUPLICATE_LOOKUP_QUERY, DUPLICATE_LOOKUP_STREAM, DUPLICATE_LOOKUP_SCAN}
+CHECKSUM_SCAN_PAGE_SIZE = 1000
+DOCUMENT_DETAIL_PATH_RE = re.compile(r"^/api/documents/\d+/$")
+# Dokumentliste: vollständige Dokumente oder nur Gate-Felder, Inhalt bei Bedarf nachladen.
+DOCUMENT_LISTING_FULL = "full"
+DOCUMENT_LISTING_PROJECTED = "projected"
+SUPPORTED_DOCUMENT_LISTING_MODES = {DOCUMENT_LISTING_FULL, DOCUMENT_LISTING_PROJECTED}
+DOCUMENT_LISTING_FIELDS = (
+    "id",
+    "title",
+    "tags",
+    "document_type",
+    "correspondent",
+    "storage_path",
+    "checksum",
+    "created",
+    "modified",
+    "original_file_name",
+    "custom_fields",
+)
+# Pausegrund, solange ein übermittelter OpenAI-Batch noch läuft.
+OPENAI_BATCH_PAUSE_REASON = "openai_batch_pending"
+# Zähler der Modell-Kaskade (pro Classifier, im Pool summiert).
+CASCADE_ESCALATION_REASONS = ("low_confidence", "invalid_output", "unknown_entity", "local_error")
+# Regel-Treffer pro Dokumentobjekt; begrenzt, damit lange Läufe nicht wachsen.
+RULE_MEMO_MAX_ENTRIES = 256
+CASCADE_COUNTER_KEYS = (
+    "local_requests",
+    "local_accepted",
+    "local_seconds",
+    "local_prompt_tokens",
+    "local_completion_tokens",
+    "main_requests",
+    "main_seconds",
+    "main_prompt_tokens",
+    "main_completion_tokens",
+    "main_cached_prompt_tokens",
+    *(f"escalated_{reason}" for reason in CASCADE_ESCALATION_REASONS),
+)
+PROMPT_LAYOUT_LEGACY = "legacy"
+PROMPT_LAYOUT_CACHE_FRIENDLY = "cache_friendly"
+SUPPORTED_PROMPT_LAYOUTS = {PROMPT_LAYOUT_LEGACY, PROMPT_LAYOUT_CACHE_FRIENDLY}
+LEGACY_PROMPT_SECTION_ORDER = (
+    "instructions",
+    "custom_fields",
+    "secondbrain_custom_fields",
+    "custom_prompt_instructions",
+    "entity_review_rules",
+    "basis_config",
+    "known_entities",
+)
+# Statisch -> dynamisch: Provider cachen nur identische Präfixe.
+CACHE_FRIENDLY_PROMPT_SECTION_ORDER = (
+    "instructions",
+    "custom_fields",
+    "secondbrain_custom_fields",
+    "custom_prompt_instructions",
+    "basis_config",
+    "entity_review_rules",
+    "known_entities",
+)
+SUPPORTED_AI_PIPELINE_MODES = {
+    AI_PIPELINE_MODE_BATCH,
+    AI_PIPELINE_MODE_STREAMING,
+    AI_PIPELINE_MODE_STAGED,
+    AI_PIPELINE_MODE_OPENAI_BATCH,
+}
 SUPPORTED_CUSTOM_FIELD_TYPES = {
     "string",
     "date",
@@ -710,6 +822,53 @@ def parse_bool(value: Any, default: bool = False) -> bool:
     return default
 
 
+def parse_ai_endpoints(
+    value: Any,
+    *,
+    default_model: str,
+    default_api_key: str,
+) -> List[Dict[str, Any]]:
+    """Parst zusätzliche KI-Endpoints (`ai_endpoints`) für den Failover-Pool.
+
+    Jeder Eintrag braucht `base_url`; `name`, `model`, `api_key` und `weight`
+    sind optional (Standard: Hostname, `ai_model`, `ai_api_key`, 1.0).
+    """
+
+    if value in (None, "", []):
+        return []
+    if not isinstance(value, list):
+        raise ConfigError("ai_endpoints muss eine Liste von Objekten mit base_url sein.")
+    endpoints: List[Dict[str, Any]] = []
+    for index, entry in enumerate(value, start=1):
+        if not isinstance(entry, dict):
+            raise ConfigError(f"ai_endpoints[{index}] muss ein Objekt sein.")
+        base_url = str(entry.get("base_url", "") or "").strip().rstrip("/")
+        if not base_url:
+            raise ConfigError(f"ai_endpoints[{index}] benötigt base_url.")
+        try:
+            weight = float(entry.get("weight", 1.0))
+        except (TypeError, ValueError) as exc:
+            raise ConfigError(f"ai_endpoints[{index}].weight muss eine Zahl sein.") from exc
+        if weight <= 0:
+            raise ConfigError(f"ai_endpoints[{index}].weight muss größer als 0 sein.")
+        name = str(entry.get("name", "") or "").strip() or (urlparse(base_url).hostname or f"endpoint-{index}")
+        endpoints.append(
+            {
+                "name": name,
+                "base_url": base_url,
+                "model": str(entry.get("model", "") or "").strip() or default_model,
+                "api_key": str(entry.get("api_key", "") or "") or default_api_key,
+                "weight": weight,
+            }
+        )
+    names = [PRIMARY_ENDPOINT_NAME, *[endpoint["name"] for endpoint in endpoints]]
+    if len(set(names)) != len(names):
+        raise ConfigError(
+            f"ai_endpoints: Namen müssen eindeutig sein (und nicht {PRIMARY_ENDPOINT_NAME!r}): {names}"
+        )
+    return endpoints
+
+
 def normalize_confidence(value: Any, default: float = 0.0) -> float:
     """Klemmt Confidence-Werte robust auf den Bereich 0.0 bis 1.0."""
 
@@ -734,6 +893,9 @@ class AppConfig:
     create_missing_entities: bool
     confidence_threshold: float
     request_timeout_seconds: int
+    paperless_prefetch_pages: int
+    paperless_http_pool_size: int
+    paperless_http_compression: bool
     log_level: str
     enable_token_precheck: bool
     min_remaining_tokens: int
@@ -748,6 +910,11 @@ class AppConfig:
     metrics_file: str
     input_cost_per_1k_tokens_eur: float
     output_cost_per_1k_tokens_eur: float
+    cached_input_cost_per_1k_tokens_eur: float
+    ai_prompt_layout: str
+    ai_content_excerpt_mode: str
+    ai_content_max_tokens: int
+    tax_content_max_tokens: int
     quarantine_failed_documents: bool
     failed_document_cooldown_hours: int
     failed_documents_file: str
@@ -755,8 +922,15 @@ class AppConfig:
     failed_patch_cache_file: str
     enable_tag_bypass_on_tags_500: bool
     tag_bypass_file: str
+    enable_delta_sync: bool
+    delta_sync_state_file: str
+    document_listing_mode: str
     already_classified_skip: bool
     already_classified_require_ki_tag: bool
+    enable_note_index: bool
+    note_index_file: str
+    enable_tag_mutation_buffer: bool
+    tag_mutation_batch_size: int
     precheck_min_content_chars: int
     precheck_min_word_count: int
     precheck_min_alnum_ratio: float
@@ -764,9 +938,64 @@ class AppConfig:
     precheck_image_only_gate: bool
     precheck_duplicate_hash_gate: bool
     precheck_duplicate_apply_metadata: bool
+    precheck_duplicate_lookup_mode: str
+    precheck_near_duplicate_gate: bool
+    near_duplicate_index_file: str
+    near_duplicate_min_similarity: float
+    near_duplicate_min_number_overlap: float
+    near_duplicate_index_refresh_limit: int
     reprocess_ki_tagged_documents: bool
     enable_parallel_ai: bool
     max_parallel_ai_jobs: int
+    ai_pipeline_mode: str
+    ai_pipeline_apply_order: str
+    ai_pipeline_precheck_workers: int
+    ai_pipeline_stage_queue_size: int
+    ai_multi_document_batch_size: int
+    ai_multi_document_max_chars: int
+    ai_entity_shortlist_top_k: int
+    openai_batch_dir: str
+    openai_batch_poll_seconds: int
+    openai_batch_max_requests: int
+    openai_batch_cost_factor: float
+    enable_classification_cache: bool
+    classification_cache_file: str
+    classification_cache_max_entries: int
+    classification_cache_max_age_days: float
+    enable_ai_rate_limiter: bool
+    ai_tokens_per_minute: int
+    ai_requests_per_minute: int
+    ai_rate_limit_max_wait_seconds: float
+    enable_ai_cascade: bool
+    cascade_ai_model: str
+    cascade_ai_base_url: str
+    cascade_ai_api_key: str
+    cascade_min_confidence: float
+    cascade_escalate_on_unknown_entity: bool
+    cascade_input_cost_per_1k_tokens_eur: float
+    cascade_output_cost_per_1k_tokens_eur: float
+    enable_ai_hedging: bool
+    ai_hedge_percentile: float
+    ai_hedge_min_delay_seconds: float
+    ai_hedge_min_samples: int
+    ai_hedge_max_ratio: float
+    ai_hedge_max_duplicate_tokens: int
+    ai_hedge_base_url: str
+    ai_hedge_api_key: str
+    ai_endpoints: List[Dict[str, Any]]
+    ai_primary_endpoint_weight: float
+    ai_endpoint_failure_threshold: int
+    ai_endpoint_open_seconds: float
+    ai_endpoint_ewma_alpha: float
+    enable_rule_classifier: bool
+    rule_classifier_min_confidence: float
+    enable_neighbor_classifier: bool
+    neighbor_index_file: str
+    neighbor_k: int
+    neighbor_min_similarity: float
+    neighbor_min_neighbors: int
+    neighbor_min_agreement: float
+    neighbor_index_refresh_limit: int
     enable_tax_enrichment: bool
     tax_export_dir: str
     tax_export_years: List[int]
@@ -943,6 +1172,65 @@ def load_config(
     if not isinstance(secondbrain_raw, dict):
         secondbrain_raw = {}
 
+    precheck_duplicate_lookup_mode = str(
+        raw.get("precheck_duplicate_lookup_mode", DUPLICATE_LOOKUP_QUERY) or ""
+    ).strip().lower()
+    if precheck_duplicate_lookup_mode not in SUPPORTED_DUPLICATE_LOOKUP_MODES:
+        raise ConfigError(
+            f"Ungültiger precheck_duplicate_lookup_mode: {precheck_duplicate_lookup_mode!r}. Erlaubt: "
+            + ", ".join(sorted(SUPPORTED_DUPLICATE_LOOKUP_MODES))
+        )
+    document_listing_mode = str(raw.get("document_listing_mode", DOCUMENT_LISTING_FULL) or "").strip().lower()
+    if document_listing_mode not in SUPPORTED_DOCUMENT_LISTING_MODES:
+        raise ConfigError(
+            f"Ungültiger document_listing_mode: {document_listing_mode!r}. Erlaubt: "
+            + ", ".join(sorted(SUPPORTED_DOCUMENT_LISTING_MODES))
+        )
+    ai_pipeline_mode = str(raw.get("ai_pipeline_mode", AI_PIPELINE_MODE_BATCH) or "").strip().lower()
+    if ai_pipeline_mode not in SUPPORTED_AI_PIPELINE_MODES:
+        raise ConfigError(
+            f"Ungültiger ai_pipeline_mode: {ai_pipeline_mode!r}. Erlaubt: "
+            + ", ".join(sorted(SUPPORTED_AI_PIPELINE_MODES))
+        )
+    ai_pipeline_apply_order = str(
+        raw.get("ai_pipeline_apply_order", APPLY_ORDER_COMPLETION) or ""
+    ).strip().lower()
+    if ai_pipeline_apply_order not in SUPPORTED_APPLY_ORDERS:
+        raise ConfigError(
+            f"Ungültige ai_pipeline_apply_order: {ai_pipeline_apply_order!r}. Erlaubt: "
+            + ", ".join(sorted(SUPPORTED_APPLY_ORDERS))
+        )
+
+    ai_prompt_layout = str(raw.get("ai_prompt_layout", PROMPT_LAYOUT_LEGACY) or "").strip().lower()
+    if ai_prompt_layout not in SUPPORTED_PROMPT_LAYOUTS:
+        raise ConfigError(
+            f"Ungültiges ai_prompt_layout: {ai_prompt_layout!r}. Erlaubt: "
+            + ", ".join(sorted(SUPPORTED_PROMPT_LAYOUTS))
+        )
+    ai_content_excerpt_mode = str(
+        raw.get("ai_content_excerpt_mode", CONTENT_EXCERPT_MODE_TRUNCATE) or ""
+    ).strip().lower()
+    if ai_content_excerpt_mode not in SUPPORTED_CONTENT_EXCERPT_MODES:
+        raise ConfigError(
+            f"Ungültiger ai_content_excerpt_mode: {ai_content_excerpt_mode!r}. Erlaubt: "
+            + ", ".join(sorted(SUPPORTED_CONTENT_EXCERPT_MODES))
+        )
+    enable_ai_cascade = parse_bool(raw.get("enable_ai_cascade", False), False)
+    cascade_ai_model = str(raw.get("cascade_ai_model", "") or "").strip()
+    cascade_ai_base_url = str(raw.get("cascade_ai_base_url", "") or "").strip().rstrip("/")
+    if enable_ai_cascade and (not cascade_ai_model or not cascade_ai_base_url):
+        raise ConfigError(
+            "enable_ai_cascade=true benötigt cascade_ai_model und cascade_ai_base_url "
+            "(OpenAI-kompatibler Endpunkt des kleinen Modells)."
+        )
+    # Ohne eigenen Preis für gecachte Prompt-Tokens rechnen wir wie bisher mit
+    # dem normalen Input-Preis; die Kosten ändern sich dann nicht.
+    cached_input_cost_raw = raw.get("cached_input_cost_per_1k_tokens_eur")
+    if cached_input_cost_raw is None or str(cached_input_cost_raw).strip() == "":
+        cached_input_cost_per_1k_tokens_eur = float(raw.get("input_cost_per_1k_tokens_eur", 0.0))
+    else:
+        cached_input_cost_per_1k_tokens_eur = float(cached_input_cost_raw)
+
     return AppConfig(
         paperless_url=str(raw["paperless_url"]).rstrip("/"),
         paperless_token=str(raw["paperless_token"]),
@@ -954,6 +1242,9 @@ def load_config(
         create_missing_entities=parse_bool(raw.get("create_missing_entities", True), True),
         confidence_threshold=float(raw.get("confidence_threshold", 0.70)),
         request_timeout_seconds=int(raw.get("request_timeout_seconds", 30)),
+        paperless_prefetch_pages=min(max(int(raw.get("paperless_prefetch_pages", 0)), 0), 4),
+        paperless_http_pool_size=max(0, int(raw.get("paperless_http_pool_size", 0))),
+        paperless_http_compression=parse_bool(raw.get("paperless_http_compression"), True),
         log_level=str(raw.get("log_level", "INFO")),
         enable_token_precheck=parse_bool(raw.get("enable_token_precheck", False), False),
         min_remaining_tokens=int(raw.get("min_remaining_tokens", 1500)),
@@ -971,6 +1262,11 @@ def load_config(
         metrics_file=str(raw.get("metrics_file", "run_metrics.json")).strip(),
         input_cost_per_1k_tokens_eur=float(raw.get("input_cost_per_1k_tokens_eur", 0.0)),
         output_cost_per_1k_tokens_eur=float(raw.get("output_cost_per_1k_tokens_eur", 0.0)),
+        cached_input_cost_per_1k_tokens_eur=cached_input_cost_per_1k_tokens_eur,
+        ai_prompt_layout=ai_prompt_layout,
+        ai_content_excerpt_mode=ai_content_excerpt_mode,
+        ai_content_max_tokens=max(100, int(raw.get("ai_content_max_tokens", 1500))),
+        tax_content_max_tokens=max(100, int(raw.get("tax_content_max_tokens", 2000))),
         quarantine_failed_documents=parse_bool(raw.get("quarantine_failed_documents", True), True),
         failed_document_cooldown_hours=int(raw.get("failed_document_cooldown_hours", 24)),
         failed_documents_file=str(raw.get("failed_documents_file", "failed_documents.json")).strip(),
@@ -978,8 +1274,16 @@ def load_config(
         failed_patch_cache_file=str(raw.get("failed_patch_cache_file", "failed_patch_cache.json")).strip(),
         enable_tag_bypass_on_tags_500=parse_bool(raw.get("enable_tag_bypass_on_tags_500", True), True),
         tag_bypass_file=str(raw.get("tag_bypass_file", "tag_bypass_documents.json")).strip(),
+        enable_delta_sync=parse_bool(raw.get("enable_delta_sync", False), False),
+        delta_sync_state_file=str(raw.get("delta_sync_state_file", "delta_sync_state.json")).strip()
+        or "delta_sync_state.json",
+        document_listing_mode=document_listing_mode,
         already_classified_skip=parse_bool(raw.get("already_classified_skip", True), True),
         already_classified_require_ki_tag=parse_bool(raw.get("already_classified_require_ki_tag", True), True),
+        enable_note_index=parse_bool(raw.get("enable_note_index", False), False),
+        note_index_file=str(raw.get("note_index_file", "note_index.sqlite3")).strip() or "note_index.sqlite3",
+        enable_tag_mutation_buffer=parse_bool(raw.get("enable_tag_mutation_buffer", False), False),
+        tag_mutation_batch_size=min(max(int(raw.get("tag_mutation_batch_size", 50)), 1), 500),
         precheck_min_content_chars=int(raw.get("precheck_min_content_chars", 120)),
         precheck_min_word_count=int(raw.get("precheck_min_word_count", 20)),
         precheck_min_alnum_ratio=float(raw.get("precheck_min_alnum_ratio", 0.40)),
@@ -990,12 +1294,82 @@ def load_config(
             raw.get("precheck_duplicate_apply_metadata", True),
             True,
         ),
+        precheck_duplicate_lookup_mode=precheck_duplicate_lookup_mode,
+        precheck_near_duplicate_gate=parse_bool(raw.get("precheck_near_duplicate_gate", False), False),
+        near_duplicate_index_file=str(raw.get("near_duplicate_index_file", "near_duplicate_index.sqlite3")).strip()
+        or "near_duplicate_index.sqlite3",
+        near_duplicate_min_similarity=min(1.0, max(0.5, float(raw.get("near_duplicate_min_similarity", 0.8)))),
+        near_duplicate_min_number_overlap=min(
+            1.0, max(0.0, float(raw.get("near_duplicate_min_number_overlap", 0.9)))
+        ),
+        near_duplicate_index_refresh_limit=max(0, int(raw.get("near_duplicate_index_refresh_limit", 2000))),
         reprocess_ki_tagged_documents=parse_bool(
             raw.get("reprocess_ki_tagged_documents", False),
             False,
         ),
         enable_parallel_ai=parse_bool(raw.get("enable_parallel_ai", False), False),
         max_parallel_ai_jobs=max(1, int(raw.get("max_parallel_ai_jobs", 5))),
+        ai_pipeline_mode=ai_pipeline_mode,
+        ai_pipeline_apply_order=ai_pipeline_apply_order,
+        ai_pipeline_precheck_workers=max(1, int(raw.get("ai_pipeline_precheck_workers", 2))),
+        ai_pipeline_stage_queue_size=max(0, int(raw.get("ai_pipeline_stage_queue_size", 0))),
+        ai_multi_document_batch_size=max(1, int(raw.get("ai_multi_document_batch_size", 1))),
+        ai_multi_document_max_chars=max(1, int(raw.get("ai_multi_document_max_chars", 1500))),
+        ai_entity_shortlist_top_k=max(0, int(raw.get("ai_entity_shortlist_top_k", 0))),
+        openai_batch_dir=str(raw.get("openai_batch_dir", "openai_batches")).strip() or "openai_batches",
+        openai_batch_poll_seconds=max(30, int(raw.get("openai_batch_poll_seconds", 300))),
+        openai_batch_max_requests=max(1, min(50000, int(raw.get("openai_batch_max_requests", 1000)))),
+        openai_batch_cost_factor=max(0.0, float(raw.get("openai_batch_cost_factor", 0.5))),
+        enable_classification_cache=parse_bool(raw.get("enable_classification_cache", False), False),
+        classification_cache_file=str(
+            raw.get("classification_cache_file", "classification_cache.sqlite3")
+        ).strip()
+        or "classification_cache.sqlite3",
+        classification_cache_max_entries=max(1, int(raw.get("classification_cache_max_entries", 5000))),
+        classification_cache_max_age_days=max(0.0, float(raw.get("classification_cache_max_age_days", 90))),
+        enable_ai_rate_limiter=parse_bool(raw.get("enable_ai_rate_limiter", False), False),
+        ai_tokens_per_minute=max(0, int(raw.get("ai_tokens_per_minute", 0))),
+        ai_requests_per_minute=max(0, int(raw.get("ai_requests_per_minute", 0))),
+        ai_rate_limit_max_wait_seconds=max(1.0, float(raw.get("ai_rate_limit_max_wait_seconds", 120))),
+        enable_ai_cascade=enable_ai_cascade,
+        cascade_ai_model=cascade_ai_model,
+        cascade_ai_base_url=cascade_ai_base_url,
+        cascade_ai_api_key=str(raw.get("cascade_ai_api_key", raw["ai_api_key"])),
+        cascade_min_confidence=min(1.0, max(0.0, float(raw.get("cascade_min_confidence", 0.8)))),
+        cascade_escalate_on_unknown_entity=parse_bool(
+            raw.get("cascade_escalate_on_unknown_entity", True),
+            True,
+        ),
+        cascade_input_cost_per_1k_tokens_eur=float(raw.get("cascade_input_cost_per_1k_tokens_eur", 0.0)),
+        cascade_output_cost_per_1k_tokens_eur=float(raw.get("cascade_output_cost_per_1k_tokens_eur", 0.0)),
+        enable_ai_hedging=parse_bool(raw.get("enable_ai_hedging", False), False),
+        ai_hedge_percentile=min(0.99, max(0.5, float(raw.get("ai_hedge_percentile", 0.9)))),
+        ai_hedge_min_delay_seconds=max(0.0, float(raw.get("ai_hedge_min_delay_seconds", 2.0))),
+        ai_hedge_min_samples=max(1, int(raw.get("ai_hedge_min_samples", 20))),
+        ai_hedge_max_ratio=min(1.0, max(0.0, float(raw.get("ai_hedge_max_ratio", 0.1)))),
+        ai_hedge_max_duplicate_tokens=max(0, int(raw.get("ai_hedge_max_duplicate_tokens", 0))),
+        # Leer = Duplikat an denselben Endpoint.
+        ai_hedge_base_url=str(raw.get("ai_hedge_base_url", "") or "").strip().rstrip("/"),
+        ai_hedge_api_key=str(raw.get("ai_hedge_api_key", raw["ai_api_key"])),
+        ai_endpoints=parse_ai_endpoints(
+            raw.get("ai_endpoints"),
+            default_model=str(raw["ai_model"]),
+            default_api_key=str(raw["ai_api_key"]),
+        ),
+        ai_primary_endpoint_weight=max(0.01, float(raw.get("ai_primary_endpoint_weight", 1.0))),
+        ai_endpoint_failure_threshold=max(1, int(raw.get("ai_endpoint_failure_threshold", 3))),
+        ai_endpoint_open_seconds=max(0.0, float(raw.get("ai_endpoint_open_seconds", 60))),
+        ai_endpoint_ewma_alpha=min(1.0, max(0.01, float(raw.get("ai_endpoint_ewma_alpha", 0.3)))),
+        enable_rule_classifier=parse_bool(raw.get("enable_rule_classifier", False), False),
+        rule_classifier_min_confidence=min(1.0, max(0.0, float(raw.get("rule_classifier_min_confidence", 0.9)))),
+        enable_neighbor_classifier=parse_bool(raw.get("enable_neighbor_classifier", False), False),
+        neighbor_index_file=str(raw.get("neighbor_index_file", "neighbor_index.sqlite3")).strip()
+        or "neighbor_index.sqlite3",
+        neighbor_k=max(1, int(raw.get("neighbor_k", 5))),
+        neighbor_min_similarity=min(1.0, max(0.0, float(raw.get("neighbor_min_similarity", 0.8)))),
+        neighbor_min_neighbors=max(1, int(raw.get("neighbor_min_neighbors", 2))),
+        neighbor_min_agreement=min(1.0, max(0.5, float(raw.get("neighbor_min_agreement", 0.9)))),
+        neighbor_index_refresh_limit=max(0, int(raw.get("neighbor_index_refresh_limit", 2000))),
         enable_tax_enrichment=parse_bool(raw.get("enable_tax_enrichment", False), False),
         tax_export_dir=str(raw.get("tax_export_dir", "tax_exports")).strip() or "tax_exports",
         tax_export_years=sorted(set(tax_export_years)),
@@ -1061,16 +1435,56 @@ def load_config(
     )
 
 
+def paperless_http_pool_size(config: AppConfig) -> int:
+    """Verbindungen pro Paperless-Host: explizit oder aus der Parallelität abgeleitet."""
+
+    if config.paperless_http_pool_size > 0:
+        return config.paperless_http_pool_size
+    # Hauptthread + Fetch-Thread + Precheck-Worker (+ je ein Vorabruf-Thread).
+    prefetch_threads = 2 if config.paperless_prefetch_pages > 0 else 0
+    return 2 + config.ai_pipeline_precheck_workers + prefetch_threads
+
+
+def build_paperless_transport(config: AppConfig) -> HttpTransport:
+    """Gemeinsamer Verbindungs-Pool für alle PaperlessClients eines Prozesses."""
+
+    return HttpTransport(
+        pool_maxsize=paperless_http_pool_size(config),
+        compression=config.paperless_http_compression,
+    )
+
+
 class PaperlessClient:
     """Minimaler API-Client für Paperless-ngx."""
 
-    def __init__(self, config: AppConfig) -> None:
+    def __init__(self, config: AppConfig, transport: Optional[HttpTransport] = None) -> None:
         self.base_url = config.paperless_url
         self.timeout = config.request_timeout_seconds
-        self.session = requests.Session()
-        self.session.headers.update(
+        self._token = config.paperless_token
+        # Ohne gemeinsamen Transport bekommt der Client einen eigenen Pool.
+        self.transport = transport or HttpTransport()
+        self.session = self._build_session()
+        # Bekommt jede erfolgreiche PATCH-Antwort eines Dokuments (Checksum- und Notiz-Index).
+        self.document_observer: Optional[Callable[[Dict[str, Any]], None]] = None
+        # Bekommt `(document_id, note)` jeder gespeicherten Notiz (z. B. Notiz-Index).
+        self.note_observer: Optional[Callable[[int, str], None]] = None
+        # Seiten, die ein Hintergrund-Thread bei Listen vorlädt (0 = aus).
+        self.prefetch_pages = 0
+        # Bei True endet das Vorladen; die restlichen Seiten lädt der Aufrufer selbst.
+        self.prefetch_stop: Optional[Callable[[], bool]] = None
+        self._prefetch_lock = threading.Lock()
+        self.prefetch_stats: Dict[str, Any] = {
+            "listings": 0,
+            "pages": 0,
+            "waits": 0,
+            "wait_seconds": 0.0,
+            "handoffs": 0,
+        }
+
+    def _build_session(self) -> requests.Session:
+        return self.transport.new_session(
             {
-                "Authorization": f"Token {config.paperless_token}",
+                "Authorization": f"Token {self._token}",
                 "Accept": "application/json",
                 "Content-Type": "application/json",
                 "User-Agent": "paperless-kiplus/0.1",
@@ -1085,6 +1499,7 @@ class PaperlessClient:
         params: Optional[Dict[str, Any]] = None,
         payload: Optional[Dict[str, Any]] = None,
         retries: int = 3,
+        session: Optional[requests.Session] = None,
     ) -> Dict[str, Any]:
         """HTTP-Request mit einfachem Retry für transiente Fehler."""
 
@@ -1094,7 +1509,7 @@ class PaperlessClient:
 
         for attempt in range(1, retries + 1):
             try:
-                response = self.session.request(
+                response = (session or self.session).request(
                     method,
                     url,
                     params=params,
@@ -1130,7 +1545,15 @@ class PaperlessClient:
 
                 if not response.content:
                     return {}
-                return response.json()
+                result = response.json()
+                if (
+                    method == "PATCH"
+                    and self.document_observer is not None
+                    and isinstance(result, dict)
+                    and DOCUMENT_DETAIL_PATH_RE.match(path)
+                ):
+                    self.document_observer(result)
+                return result
             except (requests.RequestException, ValueError, PaperlessApiError) as exc:
                 last_error = exc
                 LOGGER.warning(
@@ -1159,9 +1582,8 @@ class PaperlessClient:
         verarbeitet werden. Die Filterlogik kann später leicht erweitert werden.
         """
 
-        next_url = "/api/documents/"
         page_size = 100 if limit is None else min(limit, 100)
-        params: Optional[Dict[str, Any]] = {
+        params: Dict[str, Any] = {
             "ordering": "-created",
             "page_size": page_size,
         }
@@ -1169,18 +1591,77 @@ class PaperlessClient:
             params.update(extra_params)
         loaded = 0
 
-        while next_url and (limit is None or loaded < limit):
-            page = self._request("GET", next_url, params=params)
-            params = None
-
+        for page in self._paged("/api/documents/", params, max_items=limit):
             for doc in page.get("results", []):
                 yield doc
                 loaded += 1
                 if limit is not None and loaded >= limit:
-                    break
+                    return
+
+    def _iter_pages(
+        self,
+        path: str,
+        params: Optional[Dict[str, Any]],
+        *,
+        max_items: Optional[int] = None,
+        session: Optional[requests.Session] = None,
+    ) -> Iterable[Dict[str, Any]]:
+        """Folgt den `next`-Links einer Paperless-Liste, bis `max_items` Einträge geladen sind."""
 
+        next_url = path
+        loaded = 0
+        while next_url and (max_items is None or loaded < max_items):
+            page = self._request("GET", next_url, params=params, session=session)
+            # Ab der zweiten Seite steckt die Pagination bereits in `next`.
+            params = None
+            loaded += len(page.get("results", []))
+            yield page
             next_url = str(page.get("next") or "")
 
+    def _paged(
+        self,
+        path: str,
+        params: Optional[Dict[str, Any]],
+        *,
+        max_items: Optional[int] = None,
+    ) -> Iterable[Dict[str, Any]]:
+        """Seiten einer Liste; mit `prefetch_pages` lädt ein Hintergrund-Thread vor.
+
+        Der Thread nutzt eine eigene Session, damit er nie mit PATCH-Aufrufen
+        des Hauptthreads um dieselbe Verbindung konkurriert.
+        """
+
+        page_size = int((params or {}).get("page_size") or 0)
+        if self.prefetch_pages <= 0 or (max_items is not None and max_items <= page_size):
+            # Eine Seite reicht: nichts vorzuladen.
+            yield from self._iter_pages(path, params, max_items=max_items)
+            return
+        session = self._build_session()
+        prefetcher = PagePrefetcher(
+            self._iter_pages(path, params, max_items=max_items, session=session),
+            max_ahead=self.prefetch_pages,
+            stop_requested=self.prefetch_stop,
+        )
+        try:
+            yield from prefetcher
+        finally:
+            prefetcher.close()
+            stats = prefetcher.stats()
+            with self._prefetch_lock:
+                self.prefetch_stats["listings"] += 1
+                self.prefetch_stats["pages"] += stats["pages"]
+                self.prefetch_stats["waits"] += stats["waits"]
+                self.prefetch_stats["wait_seconds"] = round(
+                    self.prefetch_stats["wait_seconds"] + stats["wait_seconds"], 6
+                )
+                self.prefetch_stats["handoffs"] += int(bool(stats["handed_off"]))
+            session.close()
+
+    def get_document(self, document_id: int) -> Dict[str, Any]:
+        """Lädt ein einzelnes Dokument vollständig (inkl. OCR-Inhalt)."""
+
+        return self._request("GET", f"/api/documents/{int(document_id)}/")
+
     def count_documents(self, extra_params: Optional[Dict[str, Any]] = None) -> int:
         """Liest die Paperless-Gesamtzahl für die aktuelle Dokumentabfrage.
 
@@ -1216,21 +1697,13 @@ class PaperlessClient:
         """Lädt Name->ID Mapping für Tags/Typen/Korrespondenten/Ablagepfade."""
 
         mapping: Dict[str, int] = {}
-        next_url: str = path
-        params: Optional[Dict[str, Any]] = {"page_size": 100}
-
-        while next_url:
-            page = self._request("GET", next_url, params=params)
-            # Ab der zweiten Seite steckt die Pagination bereits in `next`.
-            params = None
+        for page in self._paged(path, {"page_size": 100}):
             for item in page.get("results", []):
                 # Storage Paths nutzen oft `path` statt `name`.
                 label = str(item.get("name") or item.get("path") or "").strip()
                 if label:
                     mapping[label.lower()] = int(item["id"])
 
-            next_url = str(page.get("next") or "")
-
         return mapping
 
     def list_custom_fields(self) -> Dict[str, Dict[str, Any]]:
@@ -1701,6 +2174,8 @@ class PaperlessClient:
             f"/api/documents/{document_id}/notes/",
             payload={"note": note},
         )
+        if self.note_observer is not None:
+            self.note_observer(int(document_id), note)
         note_id = None
         if isinstance(response, dict):
             note_id = response.get("id")
@@ -1742,9 +2217,7 @@ class PaperlessClient:
             for item in results:
                 if not isinstance(item, dict):
                     continue
-                text = str(item.get("note") or "")
-                text_lower = text.lower()
-                if "[ki-update" in text_lower and "kurz-zusammenfassung:" in text_lower:
+                if is_ki_summary_note(str(item.get("note") or "")):
                     return True
 
             if not next_url:
@@ -1759,7 +2232,12 @@ class PaperlessClient:
 class AiClassifier:
     """Verwendet OpenAI-kompatible Chat-Completions für Klassifizierung."""
 
-    def __init__(self, config: AppConfig) -> None:
+    def __init__(
+        self,
+        config: AppConfig,
+        *,
+        entity_review_prompt_context: Optional[str] = None,
+    ) -> None:
         self.model = config.ai_model
         self.timeout = config.request_timeout_seconds
         self.base_url = config.ai_base_url
@@ -1770,8 +2248,18 @@ class AiClassifier:
         self.include_existing_entities_in_prompt = config.include_existing_entities_in_prompt
         self.enable_custom_field_enrichment = config.enable_custom_field_enrichment
         self.enable_secondbrain_custom_fields = config.enable_secondbrain_custom_fields
+        self.prompt_layout = config.ai_prompt_layout
+        self.content_excerpt_mode = config.ai_content_excerpt_mode
+        self.content_max_tokens = config.ai_content_max_tokens
+        self._excerpt_memo: Optional[tuple[str, str]] = None
+        self.excerpts_built = 0
+        self.excerpts_truncated = 0
+        self.excerpt_chars_omitted = 0
         self.entity_review_prompt_context = ""
-        if config.entity_review_rules_file:
+        if entity_review_prompt_context is not None:
+            # Bereits vom Pool geladen: Review-Store nicht pro Worker neu parsen.
+            self.entity_review_prompt_context = entity_review_prompt_context
+        elif config.entity_review_rules_file:
             review_store = load_review_store(Path(config.entity_review_rules_file))
             self.entity_review_prompt_context = build_ai_prompt_context(
                 review_rules_from_store(review_store)
@@ -1779,15 +2267,81 @@ class AiClassifier:
         self.known_document_types: List[str] = []
         self.known_correspondents: List[str] = []
         self.known_storage_paths: List[str] = []
-        self.session = requests.Session()
-        self.session.headers.update(
+        # 0 = alle bekannten Entitäten im System-Prompt (bisheriges Verhalten).
+        self.entity_shortlist_top_k = config.ai_entity_shortlist_top_k
+        self.entity_shortlists: Dict[str, EntityShortlistIndex] = {}
+        self.entity_shortlist_queries = 0
+        self.entity_shortlist_candidates = 0
+        self._system_prompt_cache: Optional[str] = None
+        self._system_prompt_invalidation_reason = "initial"
+        self.prompt_fingerprint = ""
+        self.prompt_builds = 0
+        self.prompt_cache_hits = 0
+        self.multi_requests = 0
+        self.multi_documents = 0
+        self.multi_fallbacks = 0
+        # Geteilt von Haupt-Classifier, Pool-Workern und ggf. Tax-Extractor.
+        self.rate_limiter: Optional[AiRateLimiter] = None
+        # Kaskade: erst kleines/lokales Modell, Eskalation zum Hauptmodell nur bei Bedarf.
+        self.cascade_enabled = bool(config.enable_ai_cascade)
+        self.cascade_model = config.cascade_ai_model
+        self.cascade_base_url = config.cascade_ai_base_url
+        self.cascade_min_confidence = config.cascade_min_confidence
+        self.cascade_escalate_on_unknown_entity = config.cascade_escalate_on_unknown_entity
+        self.cascade_input_cost_per_1k_tokens_eur = config.cascade_input_cost_per_1k_tokens_eur
+        self.cascade_output_cost_per_1k_tokens_eur = config.cascade_output_cost_per_1k_tokens_eur
+        self.cascade_counters: Dict[str, float] = {key: 0 for key in CASCADE_COUNTER_KEYS}
+        self.known_entity_keys: Dict[str, Set[str]] = {}
+        self.cascade_session: Optional[requests.Session] = None
+        if self.cascade_enabled:
+            self.cascade_session = self._build_session(config.cascade_ai_api_key)
+        # Hedging: geteilter p90-Tracker/Budget, gesetzt in process_documents.
+        self.hedger: Optional[RequestHedger] = None
+        self.hedge_base_url = config.ai_hedge_base_url or self.base_url
+        self._hedge_api_key = config.ai_hedge_api_key
+        # Eigenes Hedge-Ziel: eigener Endpoint samt Limiter (geteilt, Limiter aus
+        # process_documents). Ohne eigenes Ziel läuft das Duplikat wie das Original
+        # über `_post_main`, also Limiter, Endpoint-Pool und Circuit Breaker.
+        self.hedge_endpoint: Optional[AiEndpoint] = None
+        if self.hedge_base_url.rstrip("/") != self.base_url.rstrip("/"):
+            self.hedge_endpoint = AiEndpoint(
+                name=ATTEMPT_HEDGE,
+                base_url=self.hedge_base_url,
+                model=self.model,
+                api_key=self._hedge_api_key,
+            )
+        self._hedge_idle_sessions: List[tuple[requests.Session, Dict[str, requests.Session]]] = []
+        self._hedge_lock = threading.Lock()
+        self._api_key = config.ai_api_key
+        # Endpoint-Pool mit Failover (geteilt, gesetzt in process_documents);
+        # Sessions für Nicht-Primär-Endpoints je Classifier.
+        self.endpoint_pool: Optional[AiEndpointPool] = None
+        self._endpoint_sessions: Dict[str, requests.Session] = {}
+        # Regel-Vorklassifizierung aus basis_config; None = aus oder keine Regeln.
+        self.rule_classifier: Optional[RuleClassifier] = None
+        if config.enable_rule_classifier:
+            rule_classifier = RuleClassifier(
+                self.basis_config,
+                min_confidence=config.rule_classifier_min_confidence,
+            )
+            if rule_classifier.rule_count:
+                self.rule_classifier = rule_classifier
+        self._rule_memo: Dict[int, tuple[Dict[str, Any], RuleMatch]] = {}
+        self.rule_counters: Dict[str, int] = {key: 0 for key in RULE_COUNTER_KEYS}
+        self.session = self._build_session(config.ai_api_key)
+
+    @staticmethod
+    def _build_session(api_key: str) -> requests.Session:
+        session = requests.Session()
+        session.headers.update(
             {
-                "Authorization": f"Bearer {config.ai_api_key}",
+                "Authorization": f"Bearer {api_key}",
                 "Content-Type": "application/json",
                 "Accept": "application/json",
                 "User-Agent": "paperless-kiplus/0.1",
             }
         )
+        return session
 
     def set_known_entities(
         self,
@@ -1801,6 +2355,44 @@ class AiClassifier:
         self.known_document_types = sorted(document_types)
         self.known_correspondents = sorted(correspondents)
         self.known_storage_paths = sorted(storage_paths)
+        self.entity_shortlists = self._build_entity_shortlists()
+        self.known_entity_keys = {
+            "document_type": {name.casefold() for name in self.known_document_types},
+            "correspondent": {name.casefold() for name in self.known_correspondents},
+        }
+        self.invalidate_system_prompt("known_entities")
+
+    def _build_entity_shortlists(self) -> Dict[str, EntityShortlistIndex]:
+        """Index nur für Listen, die länger als `entity_shortlist_top_k` sind.
+
+        Kürzere Listen bleiben vollständig im (gecachten) System-Prompt.
+        """
+
+        top_k = self.entity_shortlist_top_k
+        if top_k <= 0 or not self.include_existing_entities_in_prompt:
+            return {}
+        shortlists: Dict[str, EntityShortlistIndex] = {}
+        for key, names in (
+            ("document_types", self.known_document_types),
+            ("correspondents", self.known_correspondents),
+        ):
+            if len(names) > top_k:
+                shortlists[key] = EntityShortlistIndex(names)
+        return shortlists
+
+    def _entity_candidates(self, document: Dict[str, Any]) -> Dict[str, List[str]]:
+        """Top-k Kandidaten je vorausgewählter Entitätsart für dieses Dokument."""
+
+        if not self.entity_shortlists:
+            return {}
+        query = f"{document.get('title') or ''}\n{self._content_preview(document)}"
+        candidates: Dict[str, List[str]] = {}
+        for key, index in self.entity_shortlists.items():
+            names = index.top_k(query, self.entity_shortlist_top_k)
+            candidates[f"candidate_{key}"] = names
+            self.entity_shortlist_candidates += len(names)
+        self.entity_shortlist_queries += 1
+        return candidates
 
     def preflight_token_budget(self) -> None:
         """Prüft optional verfügbare Token laut RateLimit-Header des Anbieters.
@@ -1827,6 +2419,8 @@ class AiClassifier:
                 timeout=self.timeout,
             )
             response.raise_for_status()
+            if self.rate_limiter is not None:
+                self.rate_limiter.update_from_headers(response.headers)
 
             remaining_raw = response.headers.get("x-ratelimit-remaining-tokens")
             if remaining_raw is None:
@@ -1891,10 +2485,70 @@ class AiClassifier:
             retry_after_seconds=retry_after_seconds or DEFAULT_AUTO_RESUME_WAIT_SECONDS,
         )
 
-    def classify(self, document: Dict[str, Any]) -> Dict[str, Any]:
-        """Sendet Dokumentkontext an KI und erwartet streng JSON als Antwort."""
+    def invalidate_system_prompt(self, reason: str) -> None:
+        """Verwirft den gecachten System-Prompt; er wird beim nächsten Aufruf neu gebaut."""
+
+        self._system_prompt_cache = None
+        self._system_prompt_invalidation_reason = reason
+
+    def set_entity_review_prompt_context(self, context: str) -> None:
+        """Setzt den Review-Regel-Kontext und invalidiert den Prompt-Cache bei Änderung."""
 
-        prompt = (
+        context = str(context or "")
+        if context != self.entity_review_prompt_context:
+            self.entity_review_prompt_context = context
+            self.invalidate_system_prompt("review_rules")
+
+    def system_prompt(self) -> str:
+        """Liefert den System-Prompt aus dem Cache oder baut ihn einmal neu.
+
+        Der Prompt hängt nur von Konfiguration, Review-Regeln und bekannten
+        Entitäten ab – nicht vom Dokument. Bei großen Beständen spart das pro
+        Dokument mehrere `json.dumps` über tausende Einträge.
+        """
+
+        if self._system_prompt_cache is not None:
+            self.prompt_cache_hits += 1
+            return self._system_prompt_cache
+        prompt = self._build_system_prompt()
+        self._system_prompt_cache = prompt
+        self.prompt_builds += 1
+        fingerprint_source = prompt
+        if self.entity_shortlists:
+            # Kandidatenlisten stehen nicht im Prompt, hängen aber vom Bestand ab.
+            fingerprint_source += "".join(
+                f"\n{key}:{index.signature}" for key, index in sorted(self.entity_shortlists.items())
+            )
+        self.prompt_fingerprint = hashlib.sha256(fingerprint_source.encode("utf-8")).hexdigest()[:12]
+        LOGGER.debug(
+            "KI-System-Prompt neu aufgebaut (Grund=%s): Fingerprint=%s | Länge=%s Zeichen",
+            self._system_prompt_invalidation_reason,
+            self.prompt_fingerprint,
+            len(prompt),
+        )
+        return prompt
+
+    def _prompt_json(self, value: Any, **kwargs: Any) -> str:
+        """JSON für den System-Prompt; im Cache-Layout mit fester Schlüsselreihenfolge."""
+
+        return json.dumps(
+            value,
+            ensure_ascii=False,
+            sort_keys=self.prompt_layout == PROMPT_LAYOUT_CACHE_FRIENDLY,
+            **kwargs,
+        )
+
+    def _build_system_prompt(self) -> str:
+        """Baut den vollständigen System-Prompt (ohne Cache).
+
+        Layout `cache_friendly` ordnet die Abschnitte von "ändert sich nie"
+        (Anweisungen, Schemas) zu "ändert sich mit dem Bestand" (Review-Regeln,
+        bekannte Entitäten). So bleibt der vom Provider gecachte Präfix auch
+        über Läufe hinweg möglichst lang identisch.
+        """
+
+        sections: Dict[str, str] = {}
+        sections["instructions"] = (
             "Du bist ein präziser Dokumenten-Klassifizierer für Paperless-ngx. "
             "Antworte ausschließlich als JSON mit den Feldern: "
             "document_type, correspondent, storage_path, tags (Liste), "
@@ -1911,14 +2565,14 @@ class AiClassifier:
                 }
                 for definition in DEFAULT_CUSTOM_FIELD_DEFINITIONS.values()
             ]
-            prompt += (
+            sections["custom_fields"] = (
                 "\n\nOptional darfst du zusätzlich das Feld `custom_fields` liefern. "
                 "Das muss ein JSON-Objekt sein. Nutze nur die unten aufgeführten "
                 "Schlüssel, nur wenn der Wert im Dokument klar erkennbar ist. "
                 "Lasse irrelevante Schlüssel weg. Datumswerte immer als YYYY-MM-DD. "
                 "Monetäre Werte als String im Format EUR12.34."
                 "\nUnterstützte benutzerdefinierte Felder:\n"
-                + json.dumps(custom_field_specs, ensure_ascii=False)
+                + self._prompt_json(custom_field_specs)
             )
         if self.enable_secondbrain_custom_fields:
             secondbrain_specs = [
@@ -1931,7 +2585,7 @@ class AiClassifier:
                 }
                 for definition in SECOND_BRAIN_CUSTOM_FIELD_DEFINITIONS.values()
             ]
-            prompt += (
+            sections["secondbrain_custom_fields"] = (
                 "\n\nOptional darfst du zusätzlich das Feld `secondbrain_custom_fields` liefern. "
                 "Das muss ein JSON-Objekt sein. Jeder Schlüssel muss einem bekannten `sb_`-Feld "
                 "entsprechen und als Wert ein Objekt mit `value`, `confidence` und `reason` haben. "
@@ -1956,46 +2610,277 @@ class AiClassifier:
                 "nutze es nur, wenn SecondBrain daraus sinnvoll einen Kalender- oder "
                 "Reminder-Eintrag erzeugen kann."
                 "\nUnterstützte SecondBrain-Felder:\n"
-                + json.dumps(secondbrain_specs, ensure_ascii=False)
+                + self._prompt_json(secondbrain_specs)
             )
         if self.custom_prompt_instructions:
-            prompt += (
+            sections["custom_prompt_instructions"] = (
                 "\n\nZusätzliche projektspezifische Regeln (hoch priorisiert):\n"
                 f"{self.custom_prompt_instructions}"
             )
         if self.entity_review_prompt_context:
-            prompt += (
+            sections["entity_review_rules"] = (
                 "\n\nGeprüfte Review-Regeln für Dokumenttypen und Korrespondenten "
                 "(hoch priorisiert):\n"
                 f"{self.entity_review_prompt_context}"
             )
         if self.basis_config:
-            prompt += (
+            sections["basis_config"] = (
                 "\n\nStrukturierte Basis-Konfiguration (priorisiert, kompakt):\n"
-                + json.dumps(self.basis_config, ensure_ascii=False, separators=(",", ":"))
+                + self._prompt_json(self.basis_config, separators=(",", ":"))
             )
+            if self.rule_classifier is not None:
+                sections["basis_config"] += (
+                    "\nFelder in `pinned_fields` des Nutzer-Payloads wurden lokal aus diesen "
+                    "Regeln bestimmt. Übernimm sie unverändert."
+                )
         if self.include_existing_entities_in_prompt:
             known = {
                 "known_document_types": self.known_document_types,
                 "known_correspondents": self.known_correspondents,
                 "known_storage_paths": self.known_storage_paths,
             }
-            prompt += (
+            shortlist_note = ""
+            if self.entity_shortlists:
+                for key in self.entity_shortlists:
+                    known.pop(f"known_{key}")
+                shortlist_note = (
+                    "\nStatt "
+                    + " und ".join(f"`known_{key}`" for key in self.entity_shortlists)
+                    + " enthält der Nutzer-Payload "
+                    + " und ".join(f"`candidate_{key}`" for key in self.entity_shortlists)
+                    + ": vorausgewählte passende Werte aus dem Bestand. "
+                    "Bevorzuge diese; neue Werte nur, wenn keiner passt."
+                )
+            sections["known_entities"] = (
                 "\n\nBevorzuge vorhandene Werte aus diesem Bestand und erfinde nichts "
                 "unnötig neu:\n"
-                + json.dumps(known, ensure_ascii=False)
+                + self._prompt_json(known)
+                + shortlist_note
             )
+        if self.prompt_layout == PROMPT_LAYOUT_CACHE_FRIENDLY:
+            order = CACHE_FRIENDLY_PROMPT_SECTION_ORDER
+        else:
+            order = LEGACY_PROMPT_SECTION_ORDER
+        prompt = "".join(sections[name] for name in order if name in sections)
+        return prompt
+
+    def _content_preview(self, document: Dict[str, Any]) -> str:
+        """Dokumenttext für den Prompt: fester Schnitt oder Token-Budget-Auszug."""
+
+        content = str(document.get("content") or "")
+        if self.content_excerpt_mode != CONTENT_EXCERPT_MODE_SMART:
+            # Wir begrenzen den Text bewusst, um Tokenkosten und Latenz zu kontrollieren.
+            return content[:6000]
+        memo = self._excerpt_memo
+        if memo is not None and memo[0] is content:
+            # Cache-Schlüssel und Request nutzen denselben Auszug.
+            return memo[1]
+        excerpt = build_excerpt(content, self.content_max_tokens)
+        self.excerpts_built += 1
+        if excerpt.truncated:
+            self.excerpts_truncated += 1
+            self.excerpt_chars_omitted += excerpt.omitted_chars
+        self._excerpt_memo = (content, excerpt.text)
+        return excerpt.text
+
+    def classification_cache_key(self, document: Dict[str, Any]) -> str:
+        """Cache-Schlüssel: Titel, Text-Vorschau, Prompt-Fingerprint und Modell.
+
+        Aktuelle Tags und Datum fließen bewusst nicht ein, damit ein Backfill
+        bereits KI-getaggter Dokumente den Eintrag des Erstlaufs wiederfindet.
+        """
+
+        self.system_prompt()
+        return build_cache_key(
+            title=str(document.get("title") or ""),
+            content_preview=self._content_preview(document),
+            prompt_fingerprint=self.prompt_fingerprint,
+            model=self.model,
+        )
 
-        # Wir begrenzen den Text bewusst, um Tokenkosten und Latenz zu kontrollieren.
-        content_preview = str(document.get("content") or "")[:6000]
-        user_payload = {
+    def _user_payload(self, document: Dict[str, Any]) -> Dict[str, Any]:
+        payload = {
             "title": document.get("title", ""),
-            "content_preview": content_preview,
+            "content_preview": self._content_preview(document),
             "created": document.get("created"),
             "current_tags": document.get("tags", []),
         }
+        payload.update(self._entity_candidates(document))
+        match = self.rule_match(document)
+        if match is not None and match.fields:
+            payload["pinned_fields"] = dict(match.fields)
+        return payload
 
-        req_body = {
+    def rule_match(self, document: Dict[str, Any]) -> Optional[RuleMatch]:
+        """Ergebnis der Regel-Vorklassifizierung (pro Dokumentobjekt gemerkt)."""
+
+        if self.rule_classifier is None:
+            return None
+        memo = self._rule_memo.get(id(document))
+        if memo is not None and memo[0] is document:
+            return memo[1]
+        match = self.rule_classifier.match(document)
+        self.rule_counters["checked"] += 1
+        if len(self._rule_memo) >= RULE_MEMO_MAX_ENTRIES:
+            self._rule_memo.clear()
+        self._rule_memo[id(document)] = (document, match)
+        return match
+
+    def rule_prediction(self, document: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Vollständig per Regel bestimmtes Ergebnis ohne KI-Aufruf, sonst None."""
+
+        match = self.rule_match(document)
+        if match is None or not match.complete:
+            return None
+        self.rule_counters["bypassed"] += 1
+        return {
+            **match.fields,
+            "tags": [],
+            "document_date": None,
+            "summary": None,
+            "confidence": match.min_confidence,
+            "rationale": "Regel-Vorklassifizierung: " + "; ".join(match.reasons),
+            "_meta_usage": {
+                "prompt_tokens": 0,
+                "completion_tokens": 0,
+                "total_tokens": 0,
+                "cached_prompt_tokens": 0,
+            },
+            "_meta_rule_classifier": {"bypassed": True, "fields": dict(match.confidence)},
+        }
+
+    def apply_rule_pins(self, prediction: Dict[str, Any], document: Dict[str, Any]) -> Dict[str, Any]:
+        """Setzt per Regel bestimmte Felder über die KI-Antwort."""
+
+        match = self.rule_match(document)
+        if match is None or not match.fields:
+            return prediction
+        prediction.update(match.fields)
+        prediction["_meta_rule_classifier"] = {"bypassed": False, "fields": dict(match.confidence)}
+        self.rule_counters["pinned_documents"] += 1
+        self.rule_counters["pinned_fields"] += len(match.fields)
+        return prediction
+
+    def classify(self, document: Dict[str, Any]) -> Dict[str, Any]:
+        """Sendet Dokumentkontext an KI und erwartet streng JSON als Antwort.
+
+        Mit Regel-Vorklassifizierung kommen vollständig per Regel bestimmte
+        Dokumente ohne HTTP-Aufruf zurück; Teilergebnisse werden fixiert.
+        """
+
+        rule_prediction = self.rule_prediction(document)
+        if rule_prediction is not None:
+            return rule_prediction
+        req_body = self.classification_request_body(document)
+        if self.cascade_enabled:
+            prediction = self._classify_cascade(req_body)
+        else:
+            prediction = self._classify_main(req_body)
+        return self.apply_rule_pins(prediction, document)
+
+    def _classify_main(self, req_body: Dict[str, Any]) -> Dict[str, Any]:
+        if self.hedger is not None:
+            raw = self._post_hedged_chat_completion(req_body, self.hedger)
+        else:
+            raw = self._post_main(req_body)
+        parsed = self.parse_classification_response(raw)
+        parsed["_meta_usage"]["estimated_prompt_tokens"] = estimate_message_tokens(req_body["messages"])
+        return parsed
+
+    def _cascade_escalation_reason(self, prediction: Dict[str, Any]) -> str:
+        """Leerer String = Ergebnis des kleinen Modells wird übernommen."""
+
+        if float(prediction.get("confidence") or 0.0) < self.cascade_min_confidence:
+            return "low_confidence"
+        if self.cascade_escalate_on_unknown_entity and self.include_existing_entities_in_prompt:
+            for key in ("document_type", "correspondent"):
+                known = self.known_entity_keys.get(key)
+                value = str(prediction.get(key) or "").strip()
+                if known and value and value.casefold() not in known:
+                    return "unknown_entity"
+        return ""
+
+    def _classify_cascade(self, req_body: Dict[str, Any]) -> Dict[str, Any]:
+        """Kleines Modell zuerst; eskaliert bei niedriger Konfidenz, ungültiger
+        Ausgabe, unbekannter Entität oder Fehler des kleinen Modells.
+
+        Pausen (429/Quota) gibt es nur beim Hauptmodell; Fehler des kleinen
+        Modells führen immer zur Eskalation.
+        """
+
+        counters = self.cascade_counters
+        local_body = dict(req_body, model=self.cascade_model)
+        local_usage: Dict[str, int] = {"prompt_tokens": 0, "completion_tokens": 0}
+        local_prediction: Optional[Dict[str, Any]] = None
+        started = time.perf_counter()
+        try:
+            if self.cascade_session is None:
+                raise ValueError("Kaskade ohne Session")
+            response = self.cascade_session.post(
+                f"{self.cascade_base_url}/chat/completions",
+                data=json.dumps(local_body),
+                timeout=self.timeout,
+            )
+            response.raise_for_status()
+            raw = response.json()
+            if not isinstance(raw, dict):
+                raise ValueError("Antwort ist kein JSON-Objekt")
+            local_usage = self._usage_from_response(raw)
+            local_prediction = self.parse_classification_response(raw)
+            reason = self._cascade_escalation_reason(local_prediction)
+        except AiClassificationError as exc:
+            reason = "invalid_output"
+            LOGGER.debug("Kaskade: kleines Modell lieferte ungültige Ausgabe: %s", exc)
+        except (requests.RequestException, ValueError) as exc:
+            reason = "local_error"
+            LOGGER.debug("Kaskade: kleines Modell nicht erreichbar/fehlerhaft: %s", exc)
+        counters["local_requests"] += 1
+        counters["local_seconds"] += time.perf_counter() - started
+        counters["local_prompt_tokens"] += local_usage["prompt_tokens"]
+        counters["local_completion_tokens"] += local_usage["completion_tokens"]
+        local_cost_eur = (
+            local_usage["prompt_tokens"] / 1000.0 * self.cascade_input_cost_per_1k_tokens_eur
+            + local_usage["completion_tokens"] / 1000.0 * self.cascade_output_cost_per_1k_tokens_eur
+        )
+        cascade_meta: Dict[str, Any] = {
+            "cascade_local_prompt_tokens": local_usage["prompt_tokens"],
+            "cascade_local_completion_tokens": local_usage["completion_tokens"],
+            "cascade_local_cost_eur": local_cost_eur,
+        }
+        if not reason and local_prediction is not None:
+            counters["local_accepted"] += 1
+            # Usage-Felder zählen nur Tokens des Hauptmodells (Kosten/Token-Zeile).
+            local_prediction["_meta_usage"] = {
+                "prompt_tokens": 0,
+                "completion_tokens": 0,
+                "total_tokens": 0,
+                "cached_prompt_tokens": 0,
+                "cascade_tier": "local",
+                **cascade_meta,
+            }
+            return local_prediction
+
+        counters[f"escalated_{reason}"] += 1
+        started = time.perf_counter()
+        try:
+            prediction = self._classify_main(req_body)
+        finally:
+            counters["main_requests"] += 1
+            counters["main_seconds"] += time.perf_counter() - started
+        usage = prediction["_meta_usage"]
+        counters["main_prompt_tokens"] += int(usage.get("prompt_tokens", 0) or 0)
+        counters["main_completion_tokens"] += int(usage.get("completion_tokens", 0) or 0)
+        counters["main_cached_prompt_tokens"] += int(usage.get("cached_prompt_tokens", 0) or 0)
+        usage.update(cascade_meta, cascade_tier="main", cascade_escalation_reason=reason)
+        return prediction
+
+    def classification_request_body(self, document: Dict[str, Any]) -> Dict[str, Any]:
+        """Chat-Completions-Body für ein Dokument (auch für die Batch-API)."""
+
+        prompt = self.system_prompt()
+        user_payload = self._user_payload(document)
+
+        return {
             "model": self.model,
             "response_format": {"type": "json_object"},
             "messages": [
@@ -2011,16 +2896,369 @@ class AiClassifier:
             "temperature": 0.1,
         }
 
-        max_attempts = 3
+    def parse_classification_response(self, raw: Dict[str, Any]) -> Dict[str, Any]:
+        """Liest und validiert die KI-Antwort eines Einzel-Dokument-Requests."""
+
+        try:
+            message = raw["choices"][0]["message"]["content"]
+            parsed = json.loads(message)
+            self._validate_model_output(parsed)
+        except (KeyError, IndexError, TypeError, ValueError) as exc:
+            # Nicht-transiente Fehler (z. B. ungültige Antwortstruktur) direkt zurückgeben.
+            raise AiClassificationError(
+                f"KI-Antwort ungültig oder Request fehlgeschlagen: {exc}"
+            ) from exc
+        parsed["_meta_usage"] = self._usage_from_response(raw)
+        return parsed
+
+    def classify_many(
+        self,
+        documents: List[Dict[str, Any]],
+    ) -> List[tuple[Optional[Dict[str, Any]], Optional[Exception]]]:
+        """Klassifiziert mehrere kleine Dokumente mit einem einzigen KI-Request.
+
+        Warum:
+        - Der System-Prompt wird nur einmal statt pro Dokument übertragen.
+        - Bei vielen kurzen Belegen sinken Prompt-Tokens und Request-Anzahl.
+
+        Die KI liefert `{"results": [...]}` mit `document_ref` pro Eintrag.
+        Jeder Eintrag wird wie ein Einzel-Ergebnis validiert; fehlende oder
+        ungültige Einträge laufen über den Einzel-Dokument-Pfad. Die
+        Token-Usage wird gleichmäßig auf die Dokumente verteilt, damit Kosten
+        pro Dokument weiter aufsummiert werden können.
+
+        Planbare Pausen (`AiTemporaryPauseError`) gelten für alle Dokumente
+        des Requests und werden direkt weitergegeben.
+        """
+
+        if len(documents) <= 1:
+            return [self._classify_with_error(document) for document in documents]
+        if self.rule_classifier is not None:
+            rule_outcome: List[tuple[Optional[Dict[str, Any]], Optional[Exception]]] = []
+            rest_indexes: List[int] = []
+            for index, document in enumerate(documents):
+                rule_prediction = self.rule_prediction(document)
+                rule_outcome.append((rule_prediction, None))
+                if rule_prediction is None:
+                    rest_indexes.append(index)
+            if len(rest_indexes) < len(documents):
+                # Per Regel bestimmte Dokumente fallen aus dem Mehrfach-Request heraus.
+                rest = self.classify_many([documents[index] for index in rest_indexes])
+                for index, result in zip(rest_indexes, rest):
+                    rule_outcome[index] = result
+                return rule_outcome
+
+        prompt = self.system_prompt()
+        entries = []
+        for index, document in enumerate(documents):
+            entry = {"document_ref": str(index + 1)}
+            entry.update(self._user_payload(document))
+            entries.append(entry)
+
+        req_body = {
+            "model": self.model,
+            "response_format": {"type": "json_object"},
+            "messages": [
+                {"role": "system", "content": prompt},
+                {
+                    "role": "user",
+                    "content": (
+                        f"Klassifiziere diese {len(documents)} Dokumente unabhängig voneinander "
+                        "für eine Ablagestruktur.\n"
+                        "Antworte mit einem JSON-Objekt {\"results\": [...]} mit genau einem "
+                        "Eintrag pro Dokument. Jeder Eintrag enthält `document_ref` des "
+                        "Dokuments und dieselben Felder wie bei einem Einzel-Dokument.\n"
+                        + json.dumps(entries, ensure_ascii=False)
+                    ),
+                },
+            ],
+            "temperature": 0.1,
+        }
+
+        self.multi_requests += 1
+        self.multi_documents += len(documents)
+        items_by_ref: Dict[str, Any] = {}
+        usage: Dict[str, int] = {}
+        try:
+            raw = self._post_main(req_body)
+            message = raw["choices"][0]["message"]["content"]
+            parsed = json.loads(message)
+            results = parsed.get("results") if isinstance(parsed, dict) else None
+            if not isinstance(results, list):
+                raise AiClassificationError("KI-Ausgabe: 'results' muss eine Liste sein.")
+            for item in results:
+                if isinstance(item, dict) and item.get("document_ref") is not None:
+                    items_by_ref.setdefault(str(item.get("document_ref")).strip(), item)
+            usage = self._usage_from_response(raw)
+            usage["estimated_prompt_tokens"] = estimate_message_tokens(req_body["messages"])
+        except AiTemporaryPauseError:
+            raise
+        except (AiClassificationError, KeyError, IndexError, TypeError, ValueError) as exc:
+            LOGGER.warning(
+                "Mehrfach-KI-Request für %s Dokument(e) unbrauchbar, nutze Einzel-Requests: %s",
+                len(documents),
+                exc,
+            )
+
+        shares = [self._usage_share(usage, index, len(documents)) for index in range(len(documents))]
+        outcome: List[tuple[Optional[Dict[str, Any]], Optional[Exception]]] = []
+        for index, document in enumerate(documents):
+            item = items_by_ref.get(str(index + 1))
+            if item is not None:
+                prediction = dict(item)
+                prediction.pop("document_ref", None)
+                try:
+                    self._validate_model_output(prediction)
+                except (AiClassificationError, TypeError, ValueError) as exc:
+                    LOGGER.info(
+                        "Mehrfach-KI-Ergebnis für Dokument %s ungültig, Einzel-Request folgt: %s",
+                        document.get("id"),
+                        exc,
+                    )
+                else:
+                    prediction["_meta_usage"] = shares[index]
+                    outcome.append((self.apply_rule_pins(prediction, document), None))
+                    continue
+            self.multi_fallbacks += 1
+            single_prediction, single_exc = self._classify_with_error(document)
+            if single_prediction is not None:
+                # Anteil des Mehrfach-Requests zusätzlich zum Einzel-Request abrechnen.
+                single_usage = single_prediction.get("_meta_usage") or {}
+                single_prediction["_meta_usage"] = {
+                    key: int(single_usage.get(key, 0) or 0) + shares[index][key]
+                    for key in shares[index]
+                }
+            outcome.append((single_prediction, single_exc))
+        return outcome
+
+    def _classify_with_error(
+        self,
+        document: Dict[str, Any],
+    ) -> tuple[Optional[Dict[str, Any]], Optional[Exception]]:
+        try:
+            return self.classify(document), None
+        except AiTemporaryPauseError:
+            raise
+        except Exception as exc:  # noqa: BLE001
+            return None, exc
+
+    @staticmethod
+    def _usage_from_response(raw: Dict[str, Any]) -> Dict[str, int]:
+        usage = raw.get("usage") or {}
+        return {
+            "prompt_tokens": int(usage.get("prompt_tokens", 0) or 0),
+            "completion_tokens": int(usage.get("completion_tokens", 0) or 0),
+            "total_tokens": int(usage.get("total_tokens", 0) or 0),
+            "cached_prompt_tokens": parse_cached_prompt_tokens(usage),
+        }
+
+    @staticmethod
+    def _usage_share(usage: Dict[str, int], index: int, count: int) -> Dict[str, int]:
+        """Verteilt Usage gleichmäßig; der Rest landet beim ersten Dokument."""
+
+        share: Dict[str, int] = {}
+        for key in (
+            "prompt_tokens",
+            "completion_tokens",
+            "total_tokens",
+            "cached_prompt_tokens",
+            "estimated_prompt_tokens",
+        ):
+            total = int(usage.get(key, 0) or 0)
+            share[key] = total // count + (total % count if index == 0 else 0)
+        return share
+
+    def _lease_hedge_sessions(self) -> tuple[requests.Session, Dict[str, requests.Session]]:
+        """Haupt-Session plus Sessions der Pool-Endpoints für ein Duplikat."""
+
+        with self._hedge_lock:
+            if self._hedge_idle_sessions:
+                return self._hedge_idle_sessions.pop()
+        api_key = self._hedge_api_key if self.hedge_endpoint is not None else self._api_key
+        return self._build_session(api_key), {}
+
+    def _release_hedge_sessions(self, sessions: tuple[requests.Session, Dict[str, requests.Session]]) -> None:
+        with self._hedge_lock:
+            self._hedge_idle_sessions.append(sessions)
+
+    def close_hedge_sessions(self) -> None:
+        with self._hedge_lock:
+            leases, self._hedge_idle_sessions = self._hedge_idle_sessions, []
+        for session, endpoint_sessions in leases:
+            session.close()
+            for endpoint_session in endpoint_sessions.values():
+                endpoint_session.close()
+
+    def _post_hedged_chat_completion(self, req_body: Dict[str, Any], hedger: RequestHedger) -> Dict[str, Any]:
+        """Wie `_post_chat_completion`, aber mit Duplikat nach p90-Wartezeit.
+
+        Das Duplikat geht an `hedge_endpoint` (eigener Limiter) oder, ohne eigenes
+        Ziel, wie das Original über `_post_main`. Ein laufender Request lässt sich
+        nicht abbrechen: der Verlierer läuft im Hintergrund zu Ende, seine Tokens
+        zählen als Duplikat-Kosten. Verliert
+        der Primär-Request, bekommt der Classifier eine neue Haupt-Session, damit
+        keine Session von zwei Threads gleichzeitig benutzt wird.
+        """
+
+        primary_session = self.session
+        primary_endpoint_sessions = self._endpoint_sessions
+        primary_state = {"done": False, "orphaned": False}
+        state_lock = threading.Lock()
+
+        def attempt(label: str) -> Dict[str, Any]:
+            if label == ATTEMPT_PRIMARY:
+                try:
+                    return self._post_main(
+                        req_body,
+                        session=primary_session,
+                        endpoint_sessions=primary_endpoint_sessions,
+                    )
+                finally:
+                    with state_lock:
+                        primary_state["done"] = True
+                        orphaned = primary_state["orphaned"]
+                    if orphaned:
+                        primary_session.close()
+                        for session in primary_endpoint_sessions.values():
+                            session.close()
+            hedge_sessions = self._lease_hedge_sessions()
+            hedge_session, hedge_endpoint_sessions = hedge_sessions
+            try:
+                if self.hedge_endpoint is not None:
+                    return self._post_chat_completion(
+                        req_body,
+                        session=hedge_session,
+                        endpoint=self.hedge_endpoint,
+                    )
+                return self._post_main(
+                    req_body,
+                    session=hedge_session,
+                    endpoint_sessions=hedge_endpoint_sessions,
+                )
+            finally:
+                self._release_hedge_sessions(hedge_sessions)
+
+        def discarded(_label: str, raw: Dict[str, Any]) -> None:
+            usage = self._usage_from_response(raw)
+            hedger.record_duplicate_tokens(
+                usage["prompt_tokens"],
+                usage["completion_tokens"],
+                usage["cached_prompt_tokens"],
+            )
+
+        raw = hedger.call(attempt, on_discarded=discarded)
+        with state_lock:
+            if not primary_state["done"]:
+                primary_state["orphaned"] = True
+                self.session = self._build_session(self._api_key)
+                self._endpoint_sessions = {}
+        return raw
+
+    def close_endpoint_sessions(self) -> None:
+        sessions, self._endpoint_sessions = self._endpoint_sessions, {}
+        for session in sessions.values():
+            session.close()
+
+    def _post_main(
+        self,
+        req_body: Dict[str, Any],
+        *,
+        session: Optional[requests.Session] = None,
+        endpoint_sessions: Optional[Dict[str, requests.Session]] = None,
+    ) -> Dict[str, Any]:
+        """Request an das Hauptmodell; mit Endpoint-Pool inkl. Failover.
+
+        Ohne Pool unverändert `_post_chat_completion`. Mit Pool wechselt ein
+        fehlschlagender oder gedrosselter Request sofort zum nächsten gesunden
+        Endpoint; erst der letzte verfügbare bekommt Retries und kann den Lauf
+        pausieren.
+        """
+
+        pool = self.endpoint_pool
+        session = session or self.session
+        if pool is None:
+            return self._post_chat_completion(req_body, session=session)
+        sessions = self._endpoint_sessions if endpoint_sessions is None else endpoint_sessions
+
+        def send(endpoint: AiEndpoint, is_last: bool) -> Dict[str, Any]:
+            if endpoint.name == PRIMARY_ENDPOINT_NAME:
+                endpoint_session = session
+            else:
+                endpoint_session = sessions.get(endpoint.name)
+                if endpoint_session is None:
+                    endpoint_session = self._build_session(endpoint.api_key)
+                    sessions[endpoint.name] = endpoint_session
+            body = req_body if req_body.get("model") == endpoint.model else dict(req_body, model=endpoint.model)
+            return self._post_chat_completion(
+                body,
+                session=endpoint_session,
+                endpoint=endpoint,
+                failover=not is_last,
+            )
+
+        try:
+            return pool.call(send, pause_errors=(AiTemporaryPauseError,))
+        except AllEndpointsUnavailable as exc:
+            raise AiTemporaryPauseError(
+                f"{exc} Lauf wird kontrolliert pausiert.",
+                pause_reason="ai_endpoints_unavailable",
+                retry_after_seconds=exc.retry_after_seconds or DEFAULT_AUTO_RESUME_WAIT_SECONDS,
+            ) from exc
+
+    def _post_chat_completion(
+        self,
+        req_body: Dict[str, Any],
+        *,
+        session: Optional[requests.Session] = None,
+        base_url: Optional[str] = None,
+        endpoint: Optional[AiEndpoint] = None,
+        failover: bool = False,
+    ) -> Dict[str, Any]:
+        """Sendet einen Chat-Completion-Request mit Retry und Pause-Erkennung.
+
+        Mit `failover=True` gibt es keine Retries und keine kurzen 429-Wartezeiten:
+        der Endpoint-Pool versucht stattdessen sofort den nächsten Endpoint.
+        """
+
+        session = session or self.session
+        base_url = base_url or self.base_url
+        limiter = self.rate_limiter
+        if endpoint is not None:
+            base_url = endpoint.base_url
+            limiter = endpoint.rate_limiter
+        estimated_tokens = 0
+        if limiter is not None:
+            estimated_tokens = limiter.estimate_request_tokens(
+                estimate_message_tokens(req_body.get("messages") or []),
+                req_body,
+            )
+        max_attempts = 1 if failover else 3
         last_exc: Optional[Exception] = None
         for attempt in range(1, max_attempts + 1):
+            reserved = False
             try:
-                response = self.session.post(
-                    f"{self.base_url}/chat/completions",
+                if limiter is not None:
+                    try:
+                        limiter.acquire(estimated_tokens)
+                    except RateLimitWaitTooLong as exc:
+                        raise AiTemporaryPauseError(
+                            f"{exc} Lauf wird kontrolliert pausiert.",
+                            pause_reason="rate_limit_wait",
+                            retry_after_seconds=exc.wait_seconds,
+                        ) from exc
+                    reserved = True
+                response = session.post(
+                    f"{base_url}/chat/completions",
                     data=json.dumps(req_body),
                     timeout=self.timeout,
                 )
                 status_code = int(response.status_code)
+                if limiter is not None:
+                    limiter.update_from_headers(response.headers)
+                    if status_code == 429:
+                        limiter.penalize(
+                            extract_retry_after_seconds_from_error(response.text, response.headers)
+                        )
                 if status_code == 429 or status_code >= 500:
                     raise requests.HTTPError(
                         f"HTTP {status_code}: {response.text}",
@@ -2028,23 +3266,23 @@ class AiClassifier:
                     )
                 response.raise_for_status()
                 raw = response.json()
-                message = raw["choices"][0]["message"]["content"]
-                parsed = json.loads(message)
-                self._validate_model_output(parsed)
-                usage = raw.get("usage") or {}
-                parsed["_meta_usage"] = {
-                    "prompt_tokens": int(usage.get("prompt_tokens", 0) or 0),
-                    "completion_tokens": int(usage.get("completion_tokens", 0) or 0),
-                    "total_tokens": int(usage.get("total_tokens", 0) or 0),
-                }
-                return parsed
+                if not isinstance(raw, dict):
+                    raise ValueError("Antwort ist kein JSON-Objekt")
+                if limiter is not None:
+                    usage = raw.get("usage") if isinstance(raw.get("usage"), dict) else {}
+                    limiter.record_usage(estimated_tokens, int(usage.get("total_tokens", 0) or 0))
+                    reserved = False
+                return raw
             except (requests.Timeout, requests.ConnectionError, requests.HTTPError) as exc:
                 last_exc = exc
+                if reserved:
+                    # Fehlversuch ohne Usage: Reservierung zurückgeben, sonst leert jeder Retry den Bucket.
+                    limiter.release(estimated_tokens)
                 if isinstance(exc, requests.HTTPError):
                     pause_exc = self._build_pause_error_from_http_error(exc)
                     if pause_exc is not None:
                         wait_seconds = float(pause_exc.retry_after_seconds or 0.0)
-                        if wait_seconds > 0.0 and wait_seconds <= SHORT_RATE_LIMIT_WAIT_SECONDS:
+                        if not failover and 0.0 < wait_seconds <= SHORT_RATE_LIMIT_WAIT_SECONDS:
                             LOGGER.warning(
                                 "KI-Rate-Limit erreicht (Versuch %s/%s), warte %.2fs und versuche es erneut.",
                                 attempt,
@@ -2066,7 +3304,9 @@ class AiClassifier:
                     time.sleep(wait_seconds)
                     continue
                 break
-            except (requests.RequestException, KeyError, ValueError, json.JSONDecodeError) as exc:
+            except (requests.RequestException, ValueError) as exc:
+                if reserved:
+                    limiter.release(estimated_tokens)
                 # Nicht-transiente Fehler (z. B. ungültige Antwortstruktur) direkt zurückgeben.
                 raise AiClassificationError(
                     f"KI-Antwort ungültig oder Request fehlgeschlagen: {exc}"
@@ -2115,8 +3355,137 @@ class AiClassifier:
             )
 
 
-def normalize_monetary_value(value: Any, *, output_format: str = "paperless") -> Optional[str]:
-    """Normalisiert Geldbeträge entweder für Paperless oder als Dezimalzahl.
+def collect_session_connection_stats(session: requests.Session) -> Dict[str, int]:
+    """Liest Verbindungszähler aus den urllib3-Pools einer requests-Session.
+
+    `connections_opened` zählt neu aufgebaute TCP/TLS-Verbindungen, `requests`
+    alle darüber gesendeten Anfragen. Die Differenz sind wiederverwendete
+    Keep-Alive-Verbindungen.
+    """
+
+    opened = 0
+    sent = 0
+    for adapter in session.adapters.values():
+        pool_manager = getattr(adapter, "poolmanager", None)
+        pools = getattr(pool_manager, "pools", None)
+        if pools is None:
+            continue
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            opened += int(getattr(pool, "num_connections", 0) or 0)
+            sent += int(getattr(pool, "num_requests", 0) or 0)
+    return {
+        "connections_opened": opened,
+        "requests": sent,
+        "connections_reused": max(0, sent - opened),
+    }
+
+
+class AiClassifierPool:
+    """Hält genau einen AiClassifier pro Worker-Thread für den ganzen Lauf.
+
+    Warum:
+    - Eine eigene Session pro Thread vermeidet geteilten Session-Zustand,
+      hält aber Keep-Alive-Verbindungen über viele Dokumente offen.
+    - Der Entity-Review-Kontext wird einmal vom Vorlage-Classifier übernommen
+      statt pro Dokument neu gelesen.
+    """
+
+    def __init__(self, config: AppConfig, template: AiClassifier) -> None:
+        self.config = config
+        self.template = template
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._workers: List[AiClassifier] = []
+        self.hits = 0
+        self.misses = 0
+
+    def get(self) -> AiClassifier:
+        """Liefert den Classifier des aktuellen Threads (legt ihn bei Bedarf an)."""
+
+        worker = getattr(self._local, "classifier", None)
+        if worker is None:
+            worker = AiClassifier(
+                self.config,
+                entity_review_prompt_context=self.template.entity_review_prompt_context,
+            )
+            worker.rate_limiter = self.template.rate_limiter
+            worker.hedger = self.template.hedger
+            worker.hedge_endpoint = self.template.hedge_endpoint
+            worker.endpoint_pool = self.template.endpoint_pool
+            worker.rule_classifier = self.template.rule_classifier
+            self._local.classifier = worker
+            with self._lock:
+                self.misses += 1
+                self._workers.append(worker)
+        else:
+            with self._lock:
+                self.hits += 1
+        # Bekannte Entitäten werden nur gelesen; gleiche Listen teilen genügt.
+        # Neue Listen beim Template invalidieren den Prompt-Cache des Workers.
+        if (
+            worker.known_document_types is not self.template.known_document_types
+            or worker.known_correspondents is not self.template.known_correspondents
+            or worker.known_storage_paths is not self.template.known_storage_paths
+        ):
+            worker.known_document_types = self.template.known_document_types
+            worker.known_correspondents = self.template.known_correspondents
+            worker.known_storage_paths = self.template.known_storage_paths
+            worker.entity_shortlists = self.template.entity_shortlists
+            worker.known_entity_keys = self.template.known_entity_keys
+            worker.invalidate_system_prompt("known_entities")
+        worker.set_entity_review_prompt_context(self.template.entity_review_prompt_context)
+        return worker
+
+    def classify(self, document: Dict[str, Any]) -> Dict[str, Any]:
+        return self.get().classify(document)
+
+    def stats(self) -> Dict[str, int]:
+        """Pool-Treffer und Verbindungswiederverwendung aller Worker-Sessions."""
+
+        with self._lock:
+            workers = list(self._workers)
+            payload = {"hits": self.hits, "misses": self.misses, "workers": len(workers)}
+        payload["prompt_builds"] = sum(worker.prompt_builds for worker in workers)
+        payload["prompt_cache_hits"] = sum(worker.prompt_cache_hits for worker in workers)
+        payload["multi_requests"] = sum(worker.multi_requests for worker in workers)
+        payload["multi_documents"] = sum(worker.multi_documents for worker in workers)
+        payload["multi_fallbacks"] = sum(worker.multi_fallbacks for worker in workers)
+        payload["excerpts_built"] = sum(worker.excerpts_built for worker in workers)
+        payload["excerpts_truncated"] = sum(worker.excerpts_truncated for worker in workers)
+        payload["excerpt_chars_omitted"] = sum(worker.excerpt_chars_omitted for worker in workers)
+        payload["entity_shortlist_queries"] = sum(worker.entity_shortlist_queries for worker in workers)
+        payload["entity_shortlist_candidates"] = sum(worker.entity_shortlist_candidates for worker in workers)
+        for key in CASCADE_COUNTER_KEYS:
+            payload[f"cascade_{key}"] = sum(worker.cascade_counters[key] for worker in workers)
+        for key in RULE_COUNTER_KEYS:
+            payload[f"rule_{key}"] = sum(worker.rule_counters[key] for worker in workers)
+        opened = 0
+        sent = 0
+        for worker in workers:
+            connection_stats = collect_session_connection_stats(worker.session)
+            opened += connection_stats["connections_opened"]
+            sent += connection_stats["requests"]
+        payload["connections_opened"] = opened
+        payload["requests"] = sent
+        payload["connections_reused"] = max(0, sent - opened)
+        return payload
+
+    def close(self) -> None:
+        with self._lock:
+            workers = list(self._workers)
+        for worker in workers:
+            worker.session.close()
+            worker.close_hedge_sessions()
+            worker.close_endpoint_sessions()
+            if worker.cascade_session is not None:
+                worker.cascade_session.close()
+
+
+def normalize_monetary_value(value: Any, *, output_format: str = "paperless") -> Optional[str]:
+    """Normalisiert Geldbeträge entweder für Paperless oder als Dezimalzahl.
 
     Beispiel:
     - `12,34 €` -> `EUR12.34` (Paperless)
@@ -3736,6 +5105,35 @@ def build_document_date_filter_params(
     return params
 
 
+def extract_cached_prompt_tokens(prediction: Dict[str, Any]) -> int:
+    """Gecachte Prompt-Tokens aus internen Metadaten (Teilmenge von prompt_tokens)."""
+
+    usage = prediction.get("_meta_usage") or {}
+    try:
+        cached = int(usage.get("cached_prompt_tokens", 0) or 0)
+        prompt_tokens = int(usage.get("prompt_tokens", 0) or 0)
+    except (TypeError, ValueError):
+        return 0
+    return max(0, min(cached, prompt_tokens))
+
+
+def calculate_usage_cost_eur(
+    config: AppConfig,
+    *,
+    prompt_tokens: int,
+    completion_tokens: int,
+    cached_prompt_tokens: int = 0,
+) -> float:
+    """Kosten eines KI-Aufrufs; gecachte Prompt-Tokens mit eigenem Preis."""
+
+    uncached_prompt_tokens = max(0, prompt_tokens - cached_prompt_tokens)
+    return (
+        (uncached_prompt_tokens / 1000.0) * config.input_cost_per_1k_tokens_eur
+        + (cached_prompt_tokens / 1000.0) * config.cached_input_cost_per_1k_tokens_eur
+        + (completion_tokens / 1000.0) * config.output_cost_per_1k_tokens_eur
+    )
+
+
 def extract_usage(prediction: Dict[str, Any]) -> tuple[int, int, int]:
     """Extrahiert API-Token-Usage aus internen Metadaten."""
 
@@ -4841,6 +6239,121 @@ def collect_document_text(document: Dict[str, Any]) -> str:
     return str(document.get("content") or document.get("content_preview") or "").strip()
 
 
+def neighbor_document_text(document: Dict[str, Any]) -> str:
+    """Text für den Nachbar-Index: Titel und OCR-Inhalt."""
+
+    return f"{document.get('title') or ''}\n{collect_document_text(document)}"
+
+
+def neighbor_document_labels(document: Dict[str, Any]) -> Optional[tuple[int, int, int]]:
+    """Paperless-IDs von Dokumenttyp, Korrespondent und Speicherpfad, None bei Lücken."""
+
+    try:
+        labels = tuple(int(document[field]) for field in NEIGHBOR_FIELDS)
+    except (KeyError, TypeError, ValueError):
+        return None
+    return labels  # type: ignore[return-value]
+
+
+def iter_ki_tagged_documents_since(
+    client: PaperlessClient,
+    *,
+    ki_tag_id: int,
+    watermark: str,
+    limit: Optional[int],
+) -> Iterable[Dict[str, Any]]:
+    """KI-getaggte Dokumente, die nach `watermark` geändert wurden, ältestes zuerst.
+
+    Sortiert nach `modified` aufsteigend; mit `limit` verteilt sich der erste
+    Aufbau eines lokalen Index über mehrere Läufe.
+    """
+
+    params: Dict[str, Any] = {"tags__id__all": int(ki_tag_id), "ordering": "modified"}
+    if watermark:
+        params["modified__gt"] = watermark
+    return client.iter_documents(limit, extra_params=params)
+
+
+def refresh_neighbor_index(
+    client: PaperlessClient,
+    index: NeighborIndex,
+    *,
+    ki_tag_id: int,
+    limit: Optional[int],
+) -> Dict[str, int]:
+    """Übernimmt seit dem letzten Lauf geänderte KI-getaggte Dokumente in den Index.
+
+    Dokumente ohne vollständige Metadaten (z. B. manuell geleert) fliegen heraus.
+    """
+
+    counts = {"fetched": 0, "added": 0, "skipped": 0}
+    for document in iter_ki_tagged_documents_since(
+        client, ki_tag_id=ki_tag_id, watermark=index.watermark, limit=limit
+    ):
+        counts["fetched"] += 1
+        doc_id = document.get("id")
+        if doc_id is None:
+            continue
+        labels = neighbor_document_labels(document)
+        modified = str(document.get("modified") or "")
+        if labels is not None and index.add(int(doc_id), neighbor_document_text(document), labels, modified=modified):
+            counts["added"] += 1
+        else:
+            index.remove(int(doc_id))
+            counts["skipped"] += 1
+        index.set_watermark(modified)
+    index.flush()
+    return counts
+
+
+def near_duplicate_metadata(document: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Metadaten, die eine Beinahe-Dublette übernimmt; None wenn nicht klassifiziert.
+
+    Gleiche Bedingung wie `find_classified_duplicate`: Dokumenttyp und Tags gesetzt.
+    """
+
+    if document.get("document_type") is None or not document.get("tags"):
+        return None
+    metadata = {
+        field: document.get(field)
+        for field in DUPLICATE_METADATA_FIELDS
+        if document.get(field) is not None
+    }
+    metadata["tags"] = sorted(int(tag_id) for tag_id in document.get("tags") or [])
+    return metadata
+
+
+def refresh_near_duplicate_index(
+    client: PaperlessClient,
+    index: NearDuplicateIndex,
+    *,
+    ki_tag_id: int,
+    limit: Optional[int],
+) -> Dict[str, int]:
+    """Übernimmt seit dem letzten Lauf geänderte KI-getaggte Dokumente in den Dubletten-Index."""
+
+    counts = {"fetched": 0, "added": 0, "skipped": 0}
+    for document in iter_ki_tagged_documents_since(
+        client, ki_tag_id=ki_tag_id, watermark=index.watermark, limit=limit
+    ):
+        counts["fetched"] += 1
+        doc_id = document.get("id")
+        if doc_id is None:
+            continue
+        metadata = near_duplicate_metadata(document)
+        modified = str(document.get("modified") or "")
+        if metadata is not None and index.add(
+            int(doc_id), collect_document_text(document), metadata, modified=modified
+        ):
+            counts["added"] += 1
+        else:
+            index.remove(int(doc_id))
+            counts["skipped"] += 1
+        index.set_watermark(modified)
+    index.flush()
+    return counts
+
+
 def calc_alnum_ratio(text: str) -> float:
     """Berechnet den Anteil alphanumerischer Zeichen an allen Nicht-Whitespace-Zeichen."""
 
@@ -5089,8 +6602,89 @@ def process_documents(
 ) -> None:
     """Hauptablauf: Laden, KI-Klassifizieren, validieren, patchen."""
 
-    client = PaperlessClient(config)
+    paperless_transport = build_paperless_transport(config)
+    client = PaperlessClient(config, paperless_transport)
     classifier = AiClassifier(config)
+    rate_limiter: Optional[AiRateLimiter] = None
+    if config.enable_ai_rate_limiter:
+        rate_limiter = AiRateLimiter(
+            tokens_per_minute=config.ai_tokens_per_minute,
+            requests_per_minute=config.ai_requests_per_minute,
+            max_wait_seconds=config.ai_rate_limit_max_wait_seconds,
+        )
+        classifier.rate_limiter = rate_limiter
+        LOGGER.info(
+            "KI-Rate-Limiter aktiv: TPM=%s | RPM=%s | max. Wartezeit=%.0fs (0 = Limit aus Provider-Headern)",
+            config.ai_tokens_per_minute,
+            config.ai_requests_per_minute,
+            config.ai_rate_limit_max_wait_seconds,
+        )
+    endpoint_pool: Optional[AiEndpointPool] = None
+    if config.ai_endpoints:
+        endpoints = [
+            AiEndpoint(
+                name=PRIMARY_ENDPOINT_NAME,
+                base_url=config.ai_base_url.rstrip("/"),
+                model=config.ai_model,
+                api_key=config.ai_api_key,
+                weight=config.ai_primary_endpoint_weight,
+                rate_limiter=rate_limiter,
+            )
+        ]
+        for entry in config.ai_endpoints:
+            endpoints.append(
+                AiEndpoint(
+                    name=entry["name"],
+                    base_url=entry["base_url"],
+                    model=entry["model"],
+                    api_key=entry["api_key"],
+                    weight=entry["weight"],
+                    # Andere Anbieter: eigene Limits, nur aus Provider-Headern.
+                    rate_limiter=(
+                        AiRateLimiter(max_wait_seconds=config.ai_rate_limit_max_wait_seconds)
+                        if rate_limiter is not None
+                        else None
+                    ),
+                )
+            )
+        endpoint_pool = AiEndpointPool(
+            endpoints,
+            ewma_alpha=config.ai_endpoint_ewma_alpha,
+            failure_threshold=config.ai_endpoint_failure_threshold,
+            open_seconds=config.ai_endpoint_open_seconds,
+        )
+        classifier.endpoint_pool = endpoint_pool
+        LOGGER.info(
+            "KI-Endpoint-Pool aktiv: %s | Circuit Breaker nach %s Fehlern für %.0fs",
+            ", ".join(f"{endpoint.name}={endpoint.model}@{endpoint.base_url} (w={endpoint.weight:g})" for endpoint in endpoints),
+            config.ai_endpoint_failure_threshold,
+            config.ai_endpoint_open_seconds,
+        )
+    hedger: Optional[RequestHedger] = None
+    if config.enable_ai_hedging:
+        hedger = RequestHedger(
+            percentile=config.ai_hedge_percentile,
+            min_delay_seconds=config.ai_hedge_min_delay_seconds,
+            min_samples=config.ai_hedge_min_samples,
+            max_ratio=config.ai_hedge_max_ratio,
+            max_duplicate_tokens=config.ai_hedge_max_duplicate_tokens,
+        )
+        classifier.hedger = hedger
+        if classifier.hedge_endpoint is not None and rate_limiter is not None:
+            # Anderer Anbieter: eigene Limits, nur aus Provider-Headern.
+            classifier.hedge_endpoint.rate_limiter = AiRateLimiter(
+                max_wait_seconds=config.ai_rate_limit_max_wait_seconds
+            )
+        LOGGER.info(
+            "KI-Hedging aktiv: Duplikat nach p%.0f-Latenz (min. %.1fs, ab %s Messwerten) an %s | "
+            "max. %.0f %% Duplikate | Token-Budget=%s (0 = unbegrenzt)",
+            config.ai_hedge_percentile * 100.0,
+            config.ai_hedge_min_delay_seconds,
+            config.ai_hedge_min_samples,
+            classifier.hedge_base_url,
+            config.ai_hedge_max_ratio * 100.0,
+            config.ai_hedge_max_duplicate_tokens,
+        )
     tax_service: Optional[TaxEnrichmentService] = None
     tax_export_collector: Optional[TaxExportCollector] = None
     tax_enrichment_errors = 0
@@ -5099,6 +6693,10 @@ def process_documents(
     runtime_base_dir = Path.cwd()
     run_state_path = resolve_runtime_path(run_state_file, runtime_base_dir)
     stop_request_path = resolve_runtime_path(stop_request_file, runtime_base_dir)
+    # Seiten-Vorabruf: Stop-Datei beendet nur das Vorladen, nicht die Liste.
+    client.prefetch_pages = config.paperless_prefetch_pages
+    client.prefetch_stop = lambda: is_stop_requested(stop_request_path)
+    prefetch_clients: List[PaperlessClient] = [client]
     existing_run_state = load_run_state(run_state_path) if resume_run else {}
     if resume_run and existing_run_state:
         LOGGER.info(
@@ -5114,6 +6712,14 @@ def process_documents(
         DEFAULT_CUSTOM_FIELD_DEFINITIONS if generic_custom_field_sync_enabled else {}
     )
     if config.enable_tax_enrichment:
+        tax_rate_limiter = rate_limiter
+        tax_uses_primary_endpoint = (
+            config.tax_ai_base_url.rstrip("/") == config.ai_base_url.rstrip("/")
+            and config.tax_ai_api_key == config.ai_api_key
+        )
+        if rate_limiter is not None and not tax_uses_primary_endpoint:
+            # Anderer Anbieter/Schlüssel: eigene Limits, nur aus Provider-Headern.
+            tax_rate_limiter = AiRateLimiter(max_wait_seconds=config.ai_rate_limit_max_wait_seconds)
         tax_service = TaxEnrichmentService(
             ai_model=config.tax_ai_model,
             ai_api_key=config.tax_ai_api_key,
@@ -5121,6 +6727,15 @@ def process_documents(
             request_timeout_seconds=config.request_timeout_seconds,
             basis_config=config.basis_config,
             personal_context=config.tax_personal_context,
+            prompt_layout=config.ai_prompt_layout,
+            content_max_tokens=(
+                config.tax_content_max_tokens
+                if config.ai_content_excerpt_mode == CONTENT_EXCERPT_MODE_SMART
+                else None
+            ),
+            rate_limiter=tax_rate_limiter,
+            # Failover nur, wenn Tax denselben Primär-Endpoint nutzt.
+            endpoint_pool=endpoint_pool if tax_uses_primary_endpoint else None,
         )
         tax_export_collector = TaxExportCollector(
             basis_config=config.basis_config,
@@ -5177,6 +6792,12 @@ def process_documents(
         correspondents=list(correspondents_map.keys()),
         storage_paths=list(storage_paths_map.keys()),
     )
+    system_prompt_length = len(classifier.system_prompt())
+    LOGGER.info(
+        "KI-System-Prompt: Fingerprint=%s | Länge=%s Zeichen (wird pro Classifier gecacht)",
+        classifier.prompt_fingerprint,
+        system_prompt_length,
+    )
     tag_id_to_label = {entity_id: label for label, entity_id in tags_map.items()}
     doc_type_id_to_label = {entity_id: label for label, entity_id in doc_types_map.items()}
     correspondent_id_to_label = {entity_id: label for label, entity_id in correspondents_map.items()}
@@ -5213,6 +6834,7 @@ def process_documents(
     created_entities: Dict[str, List[str]] = {}
     error_details: List[Dict[str, Any]] = []
     run_prompt_tokens = 0
+    run_cached_prompt_tokens = 0
     run_completion_tokens = 0
     run_total_tokens = 0
     run_cost_eur = 0.0
@@ -5220,6 +6842,10 @@ def process_documents(
     perf_ai_seconds = 0.0
     perf_ai_batches = 0
     perf_ai_docs = 0
+    # Geschätzte vs. tatsächliche Prompt-Tokens (nur Dokumente mit beiden Werten).
+    token_estimate_documents = 0
+    token_estimate_estimated = 0
+    token_estimate_actual = 0
     prefilt_ki_tagged = 0
     prefilt_secondbrain_ready = 0
     completed_document_ids: set[int] = set()
@@ -5338,6 +6964,9 @@ def process_documents(
         prefilt_ki_tagged = int(progress_state.get("prefilt_ki_tagged", prefilt_ki_tagged) or prefilt_ki_tagged)
         budget_used = int(progress_state.get("budget_used", budget_used) or budget_used)
         run_prompt_tokens = int(progress_state.get("run_prompt_tokens", run_prompt_tokens) or run_prompt_tokens)
+        run_cached_prompt_tokens = int(
+            progress_state.get("run_cached_prompt_tokens", run_cached_prompt_tokens) or run_cached_prompt_tokens
+        )
         run_completion_tokens = int(
             progress_state.get("run_completion_tokens", run_completion_tokens) or run_completion_tokens
         )
@@ -5396,6 +7025,41 @@ def process_documents(
         doc_query_params["tags__id"] = only_tag_id
     if date_filter_params:
         LOGGER.info("Datumsfilter aktiv für Paperless-Abfrage: %s", date_filter_params)
+    delta_sync: Optional[DeltaSync] = None
+    delta_sync_path = Path(config.delta_sync_state_file)
+    # Filter ohne Delta-Parameter; gleichzeitig Geltungsbereich des Wasserzeichens.
+    delta_scope_params = dict(doc_query_params)
+    if config.enable_delta_sync:
+        if effective_process_all_documents or date_filter_params:
+            LOGGER.info(
+                "Delta-Sync nicht aktiv: All-Documents-, Backfill- und Datumsläufe listen immer vollständig."
+            )
+        else:
+            delta_sync = DeltaSync(delta_scope_params, load_json_file(delta_sync_path))
+            doc_query_params.update(delta_sync.query_params())
+            if delta_sync.scope_changed:
+                LOGGER.info("Delta-Sync: Filter hat sich geändert, Wasserzeichen wird neu aufgebaut.")
+            LOGGER.info(
+                "Delta-Sync aktiv: Datei=%s | geändert seit=%s | Wiederholungen=%s",
+                delta_sync_path,
+                delta_sync.watermark or "Anfang (vollständige Liste)",
+                len(delta_sync.retry_ids),
+            )
+    # Projektion: Liste nur mit Gate-Feldern, OCR-Inhalt erst vor den Inhalts-Gates.
+    listing_params: Dict[str, Any] = {}
+    listing_stats: Dict[str, Any] = {
+        "mode": config.document_listing_mode,
+        "listed": 0,
+        "hydrated": 0,
+        "hydrated_ahead": 0,
+        "hydrate_errors": 0,
+    }
+    projected_listing = config.document_listing_mode == DOCUMENT_LISTING_PROJECTED
+    if projected_listing:
+        listing_params["fields"] = ",".join(DOCUMENT_LISTING_FIELDS)
+        LOGGER.info(
+            "Dokumentliste ohne Inhalt aktiv: OCR-Text wird nur für Dokumente geladen, die die Inhalts-Gates erreichen."
+        )
 
     pending_ai_documents: List[PendingAiDocument] = []
     parallel_ai_enabled = bool(config.enable_parallel_ai and config.max_parallel_ai_jobs > 1)
@@ -5405,6 +7069,261 @@ def process_documents(
             "Parallele KI-Verarbeitung aktiv: max_parallel_ai_jobs=%s",
             parallel_ai_workers,
         )
+    classifier_pool: Optional[AiClassifierPool] = (
+        AiClassifierPool(config, classifier) if parallel_ai_enabled else None
+    )
+    if config.enable_rule_classifier:
+        if classifier.rule_classifier is None:
+            LOGGER.warning(
+                "Regel-Vorklassifizierung aktiv, aber basis_config enthält keine nutzbaren Regeln."
+            )
+        else:
+            LOGGER.info(
+                "Regel-Vorklassifizierung aktiv: %s Regel(n), Mindest-Konfidenz %.2f.",
+                classifier.rule_classifier.rule_count,
+                config.rule_classifier_min_confidence,
+            )
+    if config.enable_ai_cascade:
+        LOGGER.info(
+            "KI-Kaskade aktiv: zuerst %s (%s), Eskalation zu %s bei Konfidenz < %.2f%s, "
+            "ungültiger Ausgabe oder Fehler.",
+            config.cascade_ai_model,
+            config.cascade_ai_base_url,
+            config.ai_model,
+            config.cascade_min_confidence,
+            " oder unbekannter Entität" if config.cascade_escalate_on_unknown_entity else "",
+        )
+        if config.ai_pipeline_mode == AI_PIPELINE_MODE_OPENAI_BATCH:
+            LOGGER.warning(
+                "KI-Kaskade wird für OpenAI-Batch-Requests nicht genutzt; nur Einzel-Fallbacks laufen über die Kaskade."
+            )
+    multi_document_batch_size = 1
+    if config.ai_multi_document_batch_size > 1 and config.enable_ai_cascade:
+        LOGGER.warning(
+            "ai_multi_document_batch_size=%s wird ignoriert: die KI-Kaskade bewertet jedes Dokument einzeln.",
+            config.ai_multi_document_batch_size,
+        )
+    elif config.ai_multi_document_batch_size > 1:
+        if config.ai_pipeline_mode == AI_PIPELINE_MODE_BATCH:
+            multi_document_batch_size = config.ai_multi_document_batch_size
+            LOGGER.info(
+                "Mehrfach-KI-Requests aktiv: bis zu %s Dokument(e) mit max. %s Zeichen pro Request",
+                multi_document_batch_size,
+                config.ai_multi_document_max_chars,
+            )
+        else:
+            LOGGER.warning(
+                "ai_multi_document_batch_size=%s wird ignoriert: nur im Batch-Modus "
+                "(ai_pipeline_mode=batch) verfügbar.",
+                config.ai_multi_document_batch_size,
+            )
+    # Ein Batch füllt alle Worker mit je einer vollen Mehrfach-Gruppe.
+    ai_batch_flush_size = parallel_ai_workers * multi_document_batch_size
+    openai_batch_enabled = config.ai_pipeline_mode == AI_PIPELINE_MODE_OPENAI_BATCH
+    openai_batch_state: Optional[Dict[str, Any]] = None
+    if isinstance(existing_run_state.get("openai_batch"), dict):
+        openai_batch_state = dict(existing_run_state["openai_batch"])
+    openai_batch_client: Optional[OpenAiBatchClient] = None
+    if openai_batch_enabled or openai_batch_state is not None:
+        # Auch ohne Batch-Modus: ein bereits übermittelter Batch ist bezahlt
+        # und wird beim Resume noch abgeholt.
+        openai_batch_client = OpenAiBatchClient(
+            base_url=config.ai_base_url,
+            api_key=config.ai_api_key,
+            timeout=config.request_timeout_seconds,
+        )
+    openai_batch_stats = {
+        "submitted_batches": 0,
+        "submitted_requests": 0,
+        "applied_batches": 0,
+        "applied_results": 0,
+        "fallbacks": 0,
+    }
+    if openai_batch_enabled:
+        ai_batch_flush_size = config.openai_batch_max_requests
+        LOGGER.info(
+            "OpenAI-Batch-Modus aktiv: bis zu %s Anfrage(n) pro Batch | Prüfintervall=%ss | Verzeichnis=%s",
+            config.openai_batch_max_requests,
+            config.openai_batch_poll_seconds,
+            config.openai_batch_dir,
+        )
+    ai_batch_executor: Optional[concurrent.futures.ThreadPoolExecutor] = None
+    classification_cache: Optional[ClassificationCache] = None
+    if config.enable_classification_cache:
+        classification_cache = ClassificationCache(
+            config.classification_cache_file,
+            max_entries=config.classification_cache_max_entries,
+            max_age_days=config.classification_cache_max_age_days,
+        )
+        LOGGER.info(
+            "Klassifizierungs-Cache aktiv: Datei=%s | Einträge=%s | max. Einträge=%s | max. Alter=%s Tage",
+            config.classification_cache_file,
+            classification_cache.entry_count(),
+            config.classification_cache_max_entries,
+            config.classification_cache_max_age_days,
+        )
+    neighbor_index: Optional[NeighborIndex] = None
+    neighbor_refresh: Dict[str, int] = {}
+    # Dry-Run: Nachbar-Vorhersage pro Dokument, verglichen mit der KI in `_apply_ai_result`.
+    neighbor_shadow_votes: Dict[int, Dict[str, Any]] = {}
+    neighbor_evaluation: Dict[str, int] = {"evaluated": 0, "all_fields": 0, **{field: 0 for field in NEIGHBOR_FIELDS}}
+    if config.enable_neighbor_classifier:
+        neighbor_index = NeighborIndex(config.neighbor_index_file)
+        if ki_tag_id is not None:
+            try:
+                neighbor_refresh = refresh_neighbor_index(
+                    client,
+                    neighbor_index,
+                    ki_tag_id=int(ki_tag_id),
+                    limit=config.neighbor_index_refresh_limit or None,
+                )
+            except PaperlessApiError as exc:
+                LOGGER.warning("Nachbar-Index konnte nicht aktualisiert werden, nutze Bestand: %s", exc)
+        LOGGER.info(
+            "Nachbar-Klassifizierung aktiv%s: Datei=%s | Einträge=%s | neu/aktualisiert=%s | "
+            "k=%s | min. Ähnlichkeit=%.2f | min. Übereinstimmung=%.2f",
+            " (Dry-Run: nur Vergleich mit der KI)" if config.dry_run else "",
+            config.neighbor_index_file,
+            len(neighbor_index),
+            neighbor_refresh.get("added", 0),
+            config.neighbor_k,
+            config.neighbor_min_similarity,
+            config.neighbor_min_agreement,
+        )
+    near_duplicate_index: Optional[NearDuplicateIndex] = None
+    near_duplicate_refresh: Dict[str, int] = {}
+    near_duplicate_counts = {"applied": 0, "skipped": 0}
+    if config.precheck_near_duplicate_gate and not backfill_existing_documents:
+        near_duplicate_index = NearDuplicateIndex(
+            config.near_duplicate_index_file,
+            min_similarity=config.near_duplicate_min_similarity,
+            min_number_overlap=config.near_duplicate_min_number_overlap,
+        )
+        if ki_tag_id is not None:
+            try:
+                near_duplicate_refresh = refresh_near_duplicate_index(
+                    client,
+                    near_duplicate_index,
+                    ki_tag_id=int(ki_tag_id),
+                    limit=config.near_duplicate_index_refresh_limit or None,
+                )
+            except PaperlessApiError as exc:
+                LOGGER.warning("Dubletten-Index konnte nicht aktualisiert werden, nutze Bestand: %s", exc)
+        LOGGER.info(
+            "Beinahe-Dubletten-Gate aktiv: Datei=%s | Einträge=%s | neu/aktualisiert=%s | "
+            "min. Ähnlichkeit=%.2f | min. Zahlen-Übereinstimmung=%.2f",
+            config.near_duplicate_index_file,
+            len(near_duplicate_index),
+            near_duplicate_refresh.get("added", 0),
+            config.near_duplicate_min_similarity,
+            config.near_duplicate_min_number_overlap,
+        )
+    # Empfänger der PATCH-Antworten (Notiz-Index, Checksum-Index).
+    document_observers: List[Callable[[Dict[str, Any]], None]] = []
+    note_index: Optional[NoteIndex] = None
+    if config.enable_note_index and config.already_classified_skip:
+        note_index = NoteIndex(config.note_index_file)
+        # Eigene KI-Notizen sofort eintragen, ohne die Notizen erneut zu laden.
+        client.note_observer = note_index.record_written_note
+        # Eigene PATCHes ändern `modified`, aber nie die Notizen.
+        document_observers.append(note_index.observe_document)
+        LOGGER.info(
+            "Notiz-Index aktiv: Datei=%s | Einträge=%s",
+            config.note_index_file,
+            len(note_index),
+        )
+    tag_mutations: Optional[TagMutationBuffer] = None
+    if config.enable_tag_mutation_buffer and not config.dry_run:
+        tag_mutations = TagMutationBuffer(
+            client,
+            batch_size=config.tag_mutation_batch_size,
+            request_error=PaperlessApiError,
+        )
+        LOGGER.info(
+            "Tag-Markierungen gepuffert: Bulk-Edit modify_tags mit bis zu %s Dokumenten je Request.",
+            config.tag_mutation_batch_size,
+        )
+    checksum_index: Optional[ChecksumIndex] = None
+    checksum_scan: Dict[str, Any] = {}
+    if (
+        config.precheck_duplicate_hash_gate
+        and config.precheck_duplicate_lookup_mode != DUPLICATE_LOOKUP_QUERY
+        and not backfill_existing_documents
+    ):
+        checksum_index = ChecksumIndex()
+        if config.precheck_duplicate_lookup_mode == DUPLICATE_LOOKUP_SCAN:
+            scan_started = time.perf_counter()
+            try:
+                checksum_scan["documents"] = checksum_index.observe_many(
+                    client.iter_documents(
+                        None,
+                        extra_params={
+                            "fields": ",".join(CHECKSUM_SCAN_FIELDS),
+                            "page_size": CHECKSUM_SCAN_PAGE_SIZE,
+                        },
+                    )
+                )
+                checksum_scan["seconds"] = round(time.perf_counter() - scan_started, 3)
+            except PaperlessApiError as exc:
+                LOGGER.warning(
+                    "Checksum-Scan fehlgeschlagen, Dubletten-Gate fragt wieder pro Dokument: %s",
+                    exc,
+                )
+                checksum_index = None
+        if checksum_index is not None:
+            # PATCH-Antworten halten den Index während des Laufs aktuell.
+            document_observers.append(checksum_index.observe)
+            LOGGER.info(
+                "Checksum-Index aktiv: Modus=%s | Dokumente=%s%s",
+                config.precheck_duplicate_lookup_mode,
+                len(checksum_index),
+                f" | Scan={checksum_scan['seconds']:.1f}s" if "seconds" in checksum_scan else "",
+            )
+    # Stufen-Pipeline: Dubletten-Hinweise der Precheck-Worker entstehen vor dem
+    # Hauptthread und sind veraltet, sobald der Lauf ein Dokument mit gleicher
+    # Checksumme geschrieben hat.
+    recheck_stale_duplicates = (
+        config.ai_pipeline_mode == AI_PIPELINE_MODE_STAGED
+        and config.precheck_duplicate_hash_gate
+        and not backfill_existing_documents
+    )
+    listed_checksums: Dict[int, str] = {}
+    patched_checksums: Set[str] = set()
+    duplicate_rechecks = 0
+    if recheck_stale_duplicates:
+
+        def _record_patched_checksum(document: Dict[str, Any]) -> None:
+            try:
+                doc_id = int(document["id"])
+            except (KeyError, TypeError, ValueError):
+                return
+            checksum = str(document.get("checksum") or listed_checksums.get(doc_id) or "").strip()
+            if checksum:
+                patched_checksums.add(checksum)
+
+        document_observers.append(_record_patched_checksum)
+    if document_observers:
+
+        def _notify_document_observers(document: Dict[str, Any]) -> None:
+            for observer in document_observers:
+                observer(document)
+
+        client.document_observer = _notify_document_observers
+    streaming_queue: Optional[BoundedWorkQueue[PendingAiDocument]] = None
+    staged_pipeline: Optional[StagedPipeline] = None
+    if config.ai_pipeline_mode in {AI_PIPELINE_MODE_STREAMING, AI_PIPELINE_MODE_STAGED}:
+        LOGGER.info(
+            "Streaming-KI-Pipeline aktiv: %s dauerhaft belegte Slot(s), Ergebnis-Reihenfolge=%s",
+            parallel_ai_workers if parallel_ai_enabled else 1,
+            config.ai_pipeline_apply_order,
+        )
+    if config.ai_pipeline_mode == AI_PIPELINE_MODE_STAGED:
+        LOGGER.info(
+            "Stufen-Pipeline aktiv: fetch=1 | precheck=%s | classify=%s | apply=1 | Queue-Größe=%s",
+            config.ai_pipeline_precheck_workers,
+            parallel_ai_workers if parallel_ai_enabled else 1,
+            config.ai_pipeline_stage_queue_size or "auto",
+        )
 
     if progress_total_documents <= 0:
         if target_documents is not None:
@@ -5465,6 +7384,7 @@ def process_documents(
                 "skipped_with_neu_still_set": skipped_with_neu_still_set,
                 "budget_used": budget_used,
                 "run_prompt_tokens": run_prompt_tokens,
+                "run_cached_prompt_tokens": run_cached_prompt_tokens,
                 "run_completion_tokens": run_completion_tokens,
                 "run_total_tokens": run_total_tokens,
                 "run_cost_eur": round(run_cost_eur, 6),
@@ -5473,7 +7393,12 @@ def process_documents(
                 "perf_ai_batches": perf_ai_batches,
                 "perf_ai_docs": perf_ai_docs,
             },
-            "completed_document_ids": sorted(completed_document_ids),
+            # Dokumente mit ungeschriebener Tag-Markierung gelten beim Resume als offen.
+            "completed_document_ids": sorted(
+                completed_document_ids - tag_mutations.pending_ids()
+                if tag_mutations is not None
+                else completed_document_ids
+            ),
             "pending_documents": [
                 (
                     item.to_state_dict()
@@ -5486,6 +7411,7 @@ def process_documents(
                 "id": current_document_id,
                 "title": current_document_title,
             },
+            "openai_batch": openai_batch_state,
         }
 
     def _persist_run_state(
@@ -5522,6 +7448,9 @@ def process_documents(
             current_document_title=current_document_title,
             status=status,
         )
+        if endpoint_pool is not None:
+            # Nur live für /api/status; gehört nicht in den Resume-Zustand.
+            payload["ai_endpoints"] = endpoint_pool.stats()
         emit_runtime_event("progress", **payload)
 
     def _mark_completed(
@@ -5555,6 +7484,14 @@ def process_documents(
     ) -> None:
         """Speichert Pause-Zustand und bricht den Lauf kontrolliert ab."""
 
+        if streaming_queue is not None:
+            streaming_queue.close()
+        if staged_pipeline is not None:
+            staged_pipeline.close()
+        _close_ai_workers()
+        if tag_mutations is not None:
+            # Gepufferte Markierungen vor dem Resume-Zustand schreiben.
+            tag_mutations.flush()
         original_pending = list(pending_ai_documents)
         if pending_items is not None:
             pending_ai_documents.clear()
@@ -5589,6 +7526,10 @@ def process_documents(
 
         if not is_stop_requested(stop_request_path):
             return
+        if streaming_queue is not None and len(streaming_queue):
+            # Bereits laufende KI-Slots noch abschließen: Die Antworten sind
+            # bezahlt und sollen nicht beim Resume erneut angefragt werden.
+            _apply_streaming_results(streaming_queue.drain())
         _pause_run(
             pause_reason="manual_stop",
             retry_after_seconds=None,
@@ -5596,6 +7537,56 @@ def process_documents(
             current_document_title=current_document_title,
         )
 
+    def _tag_marking_error(
+        level: int,
+        message: str,
+        doc_id: Any,
+        title: str,
+        *,
+        neu_still_set: bool = False,
+    ) -> Callable[[Exception], None]:
+        """Fehlerbehandlung einer Tag-Markierung, sofort oder erst beim Flush des Puffers."""
+
+        def handle(exc: Exception) -> None:
+            nonlocal skipped_with_neu_still_set
+            if neu_still_set:
+                skipped_with_neu_still_set += 1
+            LOGGER.log(level, message, doc_id, title, exc)
+
+        return handle
+
+    def _write_tag_marking(
+        doc_id: Any,
+        current_tags: Set[int],
+        new_tags: Set[int],
+        *,
+        on_error: Callable[[Exception], None],
+        write: Optional[Callable[[], Any]] = None,
+    ) -> bool:
+        """Setzt eine Status-Markierung: gepuffert per Bulk-Edit oder sofort per PATCH.
+
+        False nur bei einem sofortigen Fehler; Fehler gepufferter Markierungen
+        meldet `on_error` beim Flush.
+        """
+
+        if tag_mutations is not None:
+            tag_mutations.add(int(doc_id), current_tags, new_tags, on_error=on_error)
+            return True
+        try:
+            if write is not None:
+                write()
+            else:
+                client._request(
+                    "PATCH",
+                    f"/api/documents/{int(doc_id)}/",
+                    payload={"tags": sorted(new_tags)},
+                    retries=1,
+                )
+        except PaperlessApiError as exc:
+            on_error(exc)
+            return False
+        return True
+
     if restored_pending_documents:
         LOGGER.info(
             "Resume enthält %s noch nicht abgeschlossene Batch-Dokument(e), die zuerst fortgesetzt werden.",
@@ -5687,16 +7678,82 @@ def process_documents(
 
         if desired_tags == current_tags:
             return
-        try:
-            client.update_document(int(doc_id_local), {"tags": sorted(desired_tags)})
-            document["tags"] = sorted(desired_tags)
-        except PaperlessApiError as tax_tag_exc:
-            LOGGER.warning(
+        if _write_tag_marking(
+            doc_id_local,
+            current_tags,
+            desired_tags,
+            on_error=_tag_marking_error(
+                logging.WARNING,
                 "Tax-Tags konnten fuer Dokument %s (%s) nicht gesetzt werden: %s",
                 doc_id_local,
                 document.get("title", "<ohne Titel>"),
-                tax_tag_exc,
-            )
+            ),
+            write=lambda: client.update_document(int(doc_id_local), {"tags": sorted(desired_tags)}),
+        ):
+            document["tags"] = sorted(desired_tags)
+
+    tax_usage_counted: Dict[str, int] = {}
+    tax_cost_eur = 0.0
+
+    def _collect_tax_usage() -> None:
+        """Übernimmt neue Tax-KI-Usage in die Lauf-Zähler (Tokens und Kosten)."""
+
+        nonlocal run_prompt_tokens, run_cached_prompt_tokens, run_completion_tokens, run_total_tokens
+        nonlocal run_cost_eur, tax_cost_eur
+        if tax_service is None:
+            return
+        totals = tax_service.extractor.usage_totals
+        delta = {key: int(totals.get(key, 0)) - tax_usage_counted.get(key, 0) for key in totals}
+        tax_usage_counted.update({key: int(value) for key, value in totals.items()})
+        if not delta.get("requests"):
+            return
+        prompt_tokens = delta["prompt_tokens"]
+        completion_tokens = delta["completion_tokens"]
+        cached_prompt_tokens = min(delta["cached_prompt_tokens"], prompt_tokens)
+        run_prompt_tokens += prompt_tokens
+        run_cached_prompt_tokens += cached_prompt_tokens
+        run_completion_tokens += completion_tokens
+        run_total_tokens += prompt_tokens + completion_tokens
+        cost_eur = calculate_usage_cost_eur(
+            config,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            cached_prompt_tokens=cached_prompt_tokens,
+        )
+        run_cost_eur += cost_eur
+        tax_cost_eur += cost_eur
+
+    hedge_usage_counted: Dict[str, int] = {}
+    hedge_cost_eur = 0.0
+
+    def _collect_hedge_usage() -> None:
+        """Übernimmt neue Duplikat-Tokens verworfener Hedge-Antworten in die Lauf-Zähler."""
+
+        nonlocal run_prompt_tokens, run_cached_prompt_tokens, run_completion_tokens, run_total_tokens
+        nonlocal run_cost_eur, hedge_cost_eur
+        if hedger is None:
+            return
+        stats = hedger.stats()
+        totals = {
+            key: int(stats[f"duplicate_{key}"])
+            for key in ("prompt_tokens", "cached_prompt_tokens", "completion_tokens")
+        }
+        delta = {key: value - hedge_usage_counted.get(key, 0) for key, value in totals.items()}
+        hedge_usage_counted.update(totals)
+        if not any(delta.values()):
+            return
+        run_prompt_tokens += delta["prompt_tokens"]
+        run_cached_prompt_tokens += delta["cached_prompt_tokens"]
+        run_completion_tokens += delta["completion_tokens"]
+        run_total_tokens += delta["prompt_tokens"] + delta["completion_tokens"]
+        cost_eur = calculate_usage_cost_eur(
+            config,
+            prompt_tokens=delta["prompt_tokens"],
+            completion_tokens=delta["completion_tokens"],
+            cached_prompt_tokens=delta["cached_prompt_tokens"],
+        )
+        run_cost_eur += cost_eur
+        hedge_cost_eur += cost_eur
 
     def _run_tax_only_for_document(
         *,
@@ -5739,6 +7796,8 @@ def process_documents(
         except TaxEnrichmentError as tax_exc:
             tax_enrichment_errors += 1
             failed += 1
+            if delta_sync is not None:
+                delta_sync.mark_failed(doc_id)
             LOGGER.warning(
                 "Tax Enrichment fehlgeschlagen fuer KI-getaggtes Dokument %s (%s): %s",
                 doc_id,
@@ -5746,86 +7805,306 @@ def process_documents(
                 tax_exc,
             )
             return True
+        finally:
+            _collect_tax_usage()
 
-    def _classify_pending_documents(
-        items: List[PendingAiDocument],
-    ) -> List[tuple[PendingAiDocument, Optional[Dict[str, Any]], Optional[Exception]]]:
-        """Klassifiziert gepufferte Dokumente seriell oder parallel.
+    def _classify_single_document(item: PendingAiDocument) -> Dict[str, Any]:
+        """Klassifiziert genau ein Dokument; darf in Worker-Threads laufen.
 
-        Bei Parallelmodus verwenden wir pro Worker einen eigenen AiClassifier,
-        damit Request-Sessions nicht zwischen Threads geteilt werden.
+        Bei Parallelmodus nutzt jeder Worker-Thread seinen eigenen, für den
+        ganzen Lauf wiederverwendeten AiClassifier aus dem Pool. Ohne
+        Parallelmodus gibt es höchstens einen Worker, der den Haupt-Classifier
+        exklusiv nutzt. Mit aktivem Klassifizierungs-Cache wird vorher der
+        Cache gefragt, danach der Nachbar-Index; Treffer kommen ohne
+        HTTP-Aufruf zurück.
         """
 
-        nonlocal perf_ai_seconds, perf_ai_batches, perf_ai_docs
-
-        if not items:
-            return []
-
-        batch_started = time.perf_counter()
-        if not parallel_ai_enabled:
-            result: List[tuple[PendingAiDocument, Optional[Dict[str, Any]], Optional[Exception]]] = []
-            for item in items:
-                try:
-                    result.append((item, classifier.classify(item.document), None))
-                except Exception as exc:  # noqa: BLE001
-                    result.append((item, None, exc))
-            perf_ai_seconds += max(0.0, time.perf_counter() - batch_started)
-            perf_ai_batches += 1
-            perf_ai_docs += len(items)
-            return result
-
-        known_doc_types = list(classifier.known_document_types)
-        known_correspondents = list(classifier.known_correspondents)
-        known_storage_paths = list(classifier.known_storage_paths)
-
-        def _worker_classify(item: PendingAiDocument) -> Dict[str, Any]:
-            worker = AiClassifier(config)
-            worker.set_known_entities(
-                document_types=known_doc_types,
-                correspondents=known_correspondents,
-                storage_paths=known_storage_paths,
-            )
-            return worker.classify(item.document)
-
-        results_map: Dict[int, tuple[Optional[Dict[str, Any]], Optional[Exception]]] = {}
-        with concurrent.futures.ThreadPoolExecutor(max_workers=parallel_ai_workers) as executor:
-            futures = {
-                executor.submit(_worker_classify, item): idx
-                for idx, item in enumerate(items)
+        active = classifier if classifier_pool is None else classifier_pool.get()
+        cache_key, cached = _lookup_classification_cache(active, item.document)
+        if cached is not None:
+            return cached
+        neighbor_prediction = _lookup_neighbor_prediction(item.document)
+        if neighbor_prediction is not None:
+            return neighbor_prediction
+        prediction = active.classify(item.document)
+        _mark_classification_cache_miss(prediction, active, cache_key)
+        return prediction
+
+    def _lookup_classification_cache(
+        active: AiClassifier,
+        document: Dict[str, Any],
+    ) -> tuple[Optional[str], Optional[Dict[str, Any]]]:
+        """Liefert Cache-Schlüssel und ggf. den Treffer (ohne Token-Kosten)."""
+
+        if classification_cache is None:
+            return None, None
+        cache_key = active.classification_cache_key(document)
+        cached = classification_cache.get(cache_key)
+        if cached is not None:
+            # Cache-Treffer: kein KI-Aufruf, daher auch keine Token-Kosten.
+            cached["_meta_usage"] = {
+                "prompt_tokens": 0,
+                "completion_tokens": 0,
+                "total_tokens": 0,
+                "cached_prompt_tokens": 0,
             }
-            for future in concurrent.futures.as_completed(futures):
-                idx = futures[future]
-                try:
-                    results_map[idx] = (future.result(), None)
-                except Exception as exc:  # noqa: BLE001
-                    results_map[idx] = (None, exc)
-
-        ordered: List[tuple[PendingAiDocument, Optional[Dict[str, Any]], Optional[Exception]]] = []
-        for idx, item in enumerate(items):
-            prediction, exc = results_map.get(idx, (None, AiClassificationError("Parallel-Worker lieferte kein Ergebnis")))
-            ordered.append((item, prediction, exc))
-        perf_ai_seconds += max(0.0, time.perf_counter() - batch_started)
-        perf_ai_batches += 1
-        perf_ai_docs += len(items)
-        return ordered
+            cached["_meta_classification_cache"] = {"key": cache_key, "hit": True}
+        return cache_key, cached
 
-    def _flush_pending_batch(items: List[PendingAiDocument]) -> None:
-        """Verarbeitet einen KI-Batch vollständig oder pausiert kontrolliert.
+    def _lookup_neighbor_prediction(document: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Übernimmt die Metadaten übereinstimmender nächster Nachbarn.
 
-        Verhalten:
-        - erfolgreiche Dokumente werden direkt angewendet
-        - Dokumente mit planbarer Pause bleiben als Pending-State erhalten
-        - danach wird der Gesamtlauf mit Resume-Information pausiert
+        Im Dry-Run wird die Vorhersage nur für den Vergleich mit der KI
+        gemerkt; die KI läuft trotzdem.
         """
 
-        if not items:
-            return
-        _check_for_manual_stop(
-            current_document_id=items[0].doc_id,
-            current_document_title=items[0].title,
+        if neighbor_index is None:
+            return None
+        doc_id = document.get("id")
+        vote = neighbor_index.predict(
+            neighbor_document_text(document),
+            k=config.neighbor_k,
+            min_similarity=config.neighbor_min_similarity,
+            min_neighbors=config.neighbor_min_neighbors,
+            min_agreement=config.neighbor_min_agreement,
+            exclude_id=int(doc_id) if doc_id is not None else None,
         )
-        batch_results = _classify_pending_documents(items)
-        pause_items: List[PendingAiDocument] = []
+        if vote is None:
+            return None
+        label_maps = (doc_type_id_to_label, correspondent_id_to_label, storage_path_id_to_label)
+        labels = {
+            field: id_to_label.get(entity_id)
+            for field, id_to_label, entity_id in zip(NEIGHBOR_FIELDS, label_maps, vote.labels)
+        }
+        if any(label is None for label in labels.values()):
+            # Entität inzwischen gelöscht: lieber die KI fragen.
+            return None
+        meta = {
+            **labels,
+            "neighbor_ids": vote.neighbor_ids,
+            "similarity": vote.similarity,
+            "agreement": vote.agreement,
+        }
+        if config.dry_run:
+            if doc_id is not None:
+                neighbor_shadow_votes[int(doc_id)] = meta
+            return None
+        return {
+            **labels,
+            "tags": [],
+            "document_date": None,
+            "summary": None,
+            "confidence": vote.agreement,
+            "rationale": (
+                f"Übernommen von ähnlichen Dokumenten {', '.join(str(neighbor) for neighbor in vote.neighbor_ids)} "
+                f"(Ähnlichkeit {vote.similarity:.2f}, Übereinstimmung {vote.agreement:.0%})."
+            ),
+            "_meta_usage": {
+                "prompt_tokens": 0,
+                "completion_tokens": 0,
+                "total_tokens": 0,
+                "cached_prompt_tokens": 0,
+            },
+            "_meta_neighbor": meta,
+        }
+
+    def _mark_classification_cache_miss(
+        prediction: Dict[str, Any],
+        active: AiClassifier,
+        cache_key: Optional[str],
+    ) -> None:
+        """Merkt den Schlüssel vor; gespeichert wird erst nach der Bereinigung."""
+
+        if (
+            cache_key is None
+            or (prediction.get("_meta_rule_classifier") or {}).get("bypassed")
+            or "_meta_neighbor" in prediction
+            or (prediction.get("_meta_usage") or {}).get("cascade_tier") == "local"
+        ):
+            # Regel-Ergebnisse kosten nichts und werden nicht gecacht. Antworten des
+            # kleinen Kaskaden-Modells auch nicht: der Schlüssel gilt für `ai_model`,
+            # ein Treffer würde später die Eskalation überspringen.
+            return
+        prediction["_meta_classification_cache"] = {
+            "key": cache_key,
+            "hit": False,
+            "prompt_fingerprint": active.prompt_fingerprint,
+        }
+
+    def _classify_multi_documents(
+        items: List[PendingAiDocument],
+    ) -> List[tuple[Optional[Dict[str, Any]], Optional[Exception]]]:
+        """Klassifiziert mehrere kleine Dokumente mit einem KI-Request.
+
+        Cache- und Nachbar-Treffer werden vorher herausgenommen; nur der Rest
+        geht gemeinsam an `AiClassifier.classify_many`.
+        """
+
+        active = classifier if classifier_pool is None else classifier_pool.get()
+        outcome: List[tuple[Optional[Dict[str, Any]], Optional[Exception]]] = [(None, None)] * len(items)
+        miss_indexes: List[int] = []
+        miss_keys: List[Optional[str]] = []
+        for index, item in enumerate(items):
+            cache_key, cached = _lookup_classification_cache(active, item.document)
+            if cached is not None:
+                outcome[index] = (cached, None)
+                continue
+            neighbor_prediction = _lookup_neighbor_prediction(item.document)
+            if neighbor_prediction is not None:
+                outcome[index] = (neighbor_prediction, None)
+                continue
+            miss_indexes.append(index)
+            miss_keys.append(cache_key)
+        if miss_indexes:
+            results = active.classify_many([items[index].document for index in miss_indexes])
+            for index, cache_key, (prediction, exc) in zip(miss_indexes, miss_keys, results):
+                if prediction is not None:
+                    _mark_classification_cache_miss(prediction, active, cache_key)
+                outcome[index] = (prediction, exc)
+        return outcome
+
+    def _classify_document_group(
+        items: List[PendingAiDocument],
+    ) -> List[tuple[Optional[Dict[str, Any]], Optional[Exception]]]:
+        """Klassifiziert eine Gruppe; Fehler landen pro Dokument im Ergebnis.
+
+        Eine planbare Pause im Mehrfach-Request gilt für alle Dokumente der
+        Gruppe, damit sie gemeinsam als Pending erhalten bleiben.
+        """
+
+        if len(items) == 1:
+            try:
+                return [(_classify_single_document(items[0]), None)]
+            except Exception as exc:  # noqa: BLE001
+                return [(None, exc)]
+        try:
+            return _classify_multi_documents(items)
+        except Exception as exc:  # noqa: BLE001
+            return [(None, exc) for _item in items]
+
+    def _group_pending_documents(items: List[PendingAiDocument]) -> List[List[int]]:
+        """Bildet Gruppen aus Listen-Indizes: kleine Dokumente gebündelt, große einzeln."""
+
+        if multi_document_batch_size <= 1:
+            return [[index] for index in range(len(items))]
+        groups: List[List[int]] = []
+        small: List[int] = []
+        for index, item in enumerate(items):
+            content_length = len(str(item.document.get("content") or ""))
+            if content_length > config.ai_multi_document_max_chars:
+                groups.append([index])
+                continue
+            small.append(index)
+            if len(small) >= multi_document_batch_size:
+                groups.append(small)
+                small = []
+        if small:
+            groups.append(small)
+        return groups
+
+    def _batch_executor() -> concurrent.futures.ThreadPoolExecutor:
+        """Thread-Pool für den Batch-Modus, einmal pro Lauf angelegt.
+
+        Dauerhafte Threads sind nötig, damit die thread-lokalen Classifier
+        (und ihre Keep-Alive-Verbindungen) zwischen Batches erhalten bleiben.
+        """
+
+        nonlocal ai_batch_executor
+
+        if ai_batch_executor is None:
+            ai_batch_executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=parallel_ai_workers,
+                thread_name_prefix="paperless-ai-batch",
+            )
+        return ai_batch_executor
+
+    def _close_ai_workers() -> None:
+        """Beendet Batch-Threads und schließt Worker-Sessions."""
+
+        nonlocal ai_batch_executor
+
+        if ai_batch_executor is not None:
+            ai_batch_executor.shutdown(wait=False, cancel_futures=True)
+            ai_batch_executor = None
+        if classifier_pool is not None:
+            classifier_pool.close()
+        if classifier.cascade_session is not None:
+            classifier.cascade_session.close()
+        classifier.close_hedge_sessions()
+        classifier.close_endpoint_sessions()
+        if tax_service is not None:
+            tax_service.extractor.close()
+        if classification_cache is not None:
+            classification_cache.close()
+        if neighbor_index is not None:
+            neighbor_index.close()
+        if near_duplicate_index is not None:
+            near_duplicate_index.close()
+        if note_index is not None:
+            note_index.close()
+        if openai_batch_client is not None:
+            openai_batch_client.close()
+
+    def _classify_pending_documents(
+        items: List[PendingAiDocument],
+    ) -> List[tuple[PendingAiDocument, Optional[Dict[str, Any]], Optional[Exception]]]:
+        """Klassifiziert gepufferte Dokumente seriell oder parallel.
+
+        Bei Parallelmodus nutzt jeder Worker-Thread seinen eigenen AiClassifier
+        aus dem Pool, damit Request-Sessions nicht zwischen Threads geteilt werden.
+        """
+
+        nonlocal perf_ai_seconds, perf_ai_batches, perf_ai_docs
+
+        if not items:
+            return []
+
+        batch_started = time.perf_counter()
+        groups = _group_pending_documents(items)
+        results_map: Dict[int, tuple[Optional[Dict[str, Any]], Optional[Exception]]] = {}
+        if not parallel_ai_enabled:
+            for group in groups:
+                group_results = _classify_document_group([items[idx] for idx in group])
+                results_map.update(zip(group, group_results))
+        else:
+            executor = _batch_executor()
+            futures = {
+                executor.submit(_classify_document_group, [items[idx] for idx in group]): group
+                for group in groups
+            }
+            for future in concurrent.futures.as_completed(futures):
+                group = futures[future]
+                try:
+                    results_map.update(zip(group, future.result()))
+                except Exception as exc:  # noqa: BLE001
+                    results_map.update((idx, (None, exc)) for idx in group)
+
+        ordered: List[tuple[PendingAiDocument, Optional[Dict[str, Any]], Optional[Exception]]] = []
+        for idx, item in enumerate(items):
+            prediction, exc = results_map.get(idx, (None, AiClassificationError("Parallel-Worker lieferte kein Ergebnis")))
+            ordered.append((item, prediction, exc))
+        perf_ai_seconds += max(0.0, time.perf_counter() - batch_started)
+        perf_ai_batches += 1
+        perf_ai_docs += len(items)
+        return ordered
+
+    def _flush_pending_batch(items: List[PendingAiDocument]) -> None:
+        """Verarbeitet einen KI-Batch vollständig oder pausiert kontrolliert.
+
+        Verhalten:
+        - erfolgreiche Dokumente werden direkt angewendet
+        - Dokumente mit planbarer Pause bleiben als Pending-State erhalten
+        - danach wird der Gesamtlauf mit Resume-Information pausiert
+        """
+
+        if not items:
+            return
+        _check_for_manual_stop(
+            current_document_id=items[0].doc_id,
+            current_document_title=items[0].title,
+        )
+        batch_results = _classify_pending_documents(items)
+        pause_items: List[PendingAiDocument] = []
         pause_exc: Optional[AiTemporaryPauseError] = None
         for pending, prediction, pred_exc in batch_results:
             if isinstance(pred_exc, AiTemporaryPauseError):
@@ -5843,6 +8122,282 @@ def process_documents(
                 pending_items=pause_items,
             )
 
+    def _dispatch_pending_batch(items: List[PendingAiDocument]) -> None:
+        """Gibt gesammelte Dokumente an die KI: direkt oder als OpenAI-Batch."""
+
+        if openai_batch_enabled:
+            _submit_openai_batch(items)
+        else:
+            _flush_pending_batch(items)
+
+    def _submit_openai_batch(items: List[PendingAiDocument]) -> None:
+        """Übermittelt Dokumente als OpenAI-Batch und pausiert den Lauf.
+
+        Ablauf:
+        - Regel-, Cache- und Nachbar-Treffer werden sofort angewendet, nur der Rest geht in den Batch
+        - Requests werden als JSONL in `openai_batch_dir` geschrieben und hochgeladen
+        - Batch-ID und Zuordnung `custom_id -> Dokument` landen im Run-State
+        - Pause mit `retry_after_seconds = openai_batch_poll_seconds`; der Worker
+          setzt danach automatisch fort und `_resume_openai_batch` holt ab
+        """
+
+        nonlocal openai_batch_state
+
+        if not items or openai_batch_client is None:
+            return
+        batch_items: List[PendingAiDocument] = []
+        batch_requests: List[Dict[str, Any]] = []
+        for item in items:
+            rule_prediction = classifier.rule_prediction(item.document)
+            if rule_prediction is not None:
+                _apply_ai_result(item, rule_prediction, None)
+                continue
+            cache_key, cached = _lookup_classification_cache(classifier, item.document)
+            if cached is not None:
+                _apply_ai_result(item, cached, None)
+                continue
+            neighbor_prediction = _lookup_neighbor_prediction(item.document)
+            if neighbor_prediction is not None:
+                _apply_ai_result(item, neighbor_prediction, None)
+                continue
+            custom_id = f"doc-{item.doc_id}-{len(batch_items) + 1}"
+            batch_items.append(item)
+            batch_requests.append(
+                {
+                    "custom_id": custom_id,
+                    "doc_id": item.doc_id,
+                    "cache_key": cache_key,
+                }
+            )
+        if not batch_items:
+            return
+
+        submitted_at = dt.datetime.now(dt.timezone.utc)
+        batch_path = Path(config.openai_batch_dir) / f"batch-{submitted_at.strftime('%Y%m%dT%H%M%S')}.jsonl"
+        write_batch_file(
+            batch_path,
+            (
+                (entry["custom_id"], classifier.classification_request_body(item.document))
+                for entry, item in zip(batch_requests, batch_items)
+            ),
+        )
+        try:
+            batch = openai_batch_client.submit(batch_path, metadata={"source": "paperless-kiplus"})
+        except OpenAiBatchError as exc:
+            LOGGER.warning("OpenAI-Batch konnte nicht übermittelt werden: %s", exc)
+            _pause_run(
+                pause_reason="openai_batch_unavailable",
+                retry_after_seconds=exc.retry_after_seconds or float(config.openai_batch_poll_seconds),
+                current_document_id=batch_items[0].doc_id,
+                current_document_title=batch_items[0].title,
+                pending_items=batch_items,
+            )
+            return
+        openai_batch_state = {
+            "batch_id": str(batch["id"]),
+            "input_file_id": str(batch.get("input_file_id") or ""),
+            "input_path": str(batch_path),
+            "submitted_at": submitted_at.isoformat(),
+            "prompt_fingerprint": classifier.prompt_fingerprint,
+            "requests": batch_requests,
+        }
+        openai_batch_stats["submitted_batches"] += 1
+        openai_batch_stats["submitted_requests"] += len(batch_items)
+        LOGGER.info(
+            "OpenAI-Batch übermittelt: ID=%s | Anfragen=%s | Datei=%s | nächste Prüfung in %ss",
+            openai_batch_state["batch_id"],
+            len(batch_items),
+            batch_path,
+            config.openai_batch_poll_seconds,
+        )
+        _pause_run(
+            pause_reason=OPENAI_BATCH_PAUSE_REASON,
+            retry_after_seconds=float(config.openai_batch_poll_seconds),
+            current_document_id=batch_items[0].doc_id,
+            current_document_title=batch_items[0].title,
+            pending_items=batch_items,
+        )
+
+    def _resume_openai_batch(items: List[PendingAiDocument]) -> None:
+        """Fragt einen übermittelten Batch ab und wendet fertige Ergebnisse an.
+
+        Läuft der Batch noch, pausiert der Lauf erneut. Fehlende oder ungültige
+        Ergebnisse (z. B. abgelaufener Batch) werden über den normalen
+        Einzel-Request-Pfad nachgeholt.
+        """
+
+        nonlocal openai_batch_state, perf_ai_docs
+
+        if openai_batch_state is None or openai_batch_client is None:
+            return
+        state = openai_batch_state
+        batch_id = str(state.get("batch_id") or "")
+        counts: Dict[str, Any] = {}
+        try:
+            batch = openai_batch_client.retrieve_batch(batch_id)
+            status = str(batch.get("status") or "")
+            counts = batch.get("request_counts") or {}
+            outputs: Dict[str, Dict[str, Any]] = {}
+            if status not in BATCH_PENDING_STATUSES:
+                for file_key in ("error_file_id", "output_file_id"):
+                    file_id = batch.get(file_key)
+                    if file_id:
+                        outputs.update(parse_batch_output(openai_batch_client.download_file(str(file_id))))
+        except OpenAiBatchError as exc:
+            LOGGER.warning("OpenAI-Batch %s konnte nicht abgefragt werden: %s", batch_id, exc)
+            status = "unreachable"
+        if status in BATCH_PENDING_STATUSES or status == "unreachable":
+            LOGGER.info(
+                "OpenAI-Batch %s noch nicht fertig: Status=%s | erledigt=%s/%s | nächste Prüfung in %ss",
+                batch_id,
+                status,
+                counts.get("completed", 0),
+                counts.get("total", len(items)),
+                config.openai_batch_poll_seconds,
+            )
+            _pause_run(
+                pause_reason=OPENAI_BATCH_PAUSE_REASON,
+                retry_after_seconds=float(config.openai_batch_poll_seconds),
+                current_document_id=items[0].doc_id if items else None,
+                current_document_title=items[0].title if items else "",
+                pending_items=items,
+            )
+            return
+
+        LOGGER.info(
+            "OpenAI-Batch %s abgeschlossen: Status=%s | Ergebnisse=%s | Dokumente=%s",
+            batch_id,
+            status,
+            len(outputs),
+            len(items),
+        )
+        requests_by_doc = {
+            entry.get("doc_id"): entry
+            for entry in (state.get("requests") or [])
+            if isinstance(entry, dict)
+        }
+        pending_ai_documents[:] = items
+        fallback_items: List[PendingAiDocument] = []
+        for item in items:
+            if item.doc_id is not None and item.doc_id in completed_document_ids:
+                continue
+            entry = requests_by_doc.get(item.doc_id) or {}
+            output = outputs.get(str(entry.get("custom_id") or "")) or {}
+            prediction: Optional[Dict[str, Any]] = None
+            if output.get("status_code") == 200 and output.get("body"):
+                try:
+                    prediction = classifier.apply_rule_pins(
+                        classifier.parse_classification_response(output["body"]),
+                        item.document,
+                    )
+                except AiClassificationError as exc:
+                    LOGGER.info("OpenAI-Batch-Ergebnis für Dokument %s ungültig: %s", item.doc_id, exc)
+            if prediction is None:
+                fallback_items.append(item)
+                continue
+            prediction["_meta_usage"]["cost_factor"] = config.openai_batch_cost_factor
+            if entry.get("cache_key"):
+                prediction["_meta_classification_cache"] = {
+                    "key": entry["cache_key"],
+                    "hit": False,
+                    "prompt_fingerprint": state.get("prompt_fingerprint") or "",
+                }
+            perf_ai_docs += 1
+            openai_batch_stats["applied_results"] += 1
+            _remove_pending_document(item)
+            _apply_ai_result(item, prediction, None)
+        openai_batch_stats["applied_batches"] += 1
+        openai_batch_state = None
+        if fallback_items:
+            openai_batch_stats["fallbacks"] += len(fallback_items)
+            LOGGER.warning(
+                "OpenAI-Batch %s: %s Dokument(e) ohne gültiges Ergebnis, klassifiziere einzeln.",
+                batch_id,
+                len(fallback_items),
+            )
+            _flush_pending_batch(fallback_items)
+        pending_ai_documents.clear()
+
+    def _remove_pending_document(item: PendingAiDocument) -> None:
+        """Entfernt genau dieses Pending-Objekt (Identität, nicht Gleichheit)."""
+
+        for index, candidate in enumerate(pending_ai_documents):
+            if candidate is item:
+                del pending_ai_documents[index]
+                return
+
+    def _apply_streaming_results(results: List[WorkResult[PendingAiDocument]]) -> None:
+        """Wendet fertige Streaming-Ergebnisse an oder pausiert kontrolliert.
+
+        Verhalten wie beim Batch-Flush, nur ohne Barriere:
+        - erfolgreiche Dokumente werden sofort angewendet
+        - bei einer planbaren Pause werden alle noch laufenden Slots
+          abgewartet und angewendet; pausierte Dokumente bleiben Pending
+        """
+
+        nonlocal perf_ai_seconds, perf_ai_docs
+
+        if streaming_queue is None:
+            return
+        pause_items: List[PendingAiDocument] = []
+        pause_exc: Optional[AiTemporaryPauseError] = None
+        queue_results = list(results)
+        while queue_results:
+            work = queue_results.pop(0)
+            perf_ai_docs += 1
+            perf_ai_seconds += work.duration_seconds
+            if isinstance(work.error, AiTemporaryPauseError):
+                if pause_exc is None:
+                    pause_exc = work.error
+                    # Keine neuen Slots mehr starten, laufende aber abschließen.
+                    queue_results.extend(streaming_queue.drain())
+                pause_items.append(work.item)
+                continue
+            _remove_pending_document(work.item)
+            _apply_ai_result(work.item, work.result, work.error)
+        if pause_exc is not None:
+            _pause_run(
+                pause_reason=pause_exc.pause_reason,
+                retry_after_seconds=pause_exc.retry_after_seconds,
+                current_document_id=pause_items[0].doc_id if pause_items else None,
+                current_document_title=pause_items[0].title if pause_items else "",
+                pending_items=pause_items,
+            )
+
+    def _submit_streaming_document(item: PendingAiDocument) -> None:
+        """Startet ein Dokument, sobald ein KI-Slot frei ist.
+
+        Während wir auf einen freien Slot warten, werden fertige Ergebnisse
+        direkt angewendet. So bleibt der Pool dauerhaft gefüllt.
+        """
+
+        if streaming_queue is None:
+            return
+        while not streaming_queue.has_capacity():
+            _apply_streaming_results(streaming_queue.collect(block=True))
+        pending_ai_documents.append(item)
+        streaming_queue.submit(item)
+        _apply_streaming_results(streaming_queue.collect())
+
+    def _record_neighbor_shadow(doc_id: int, shadow: Dict[str, Any], prediction: Dict[str, Any]) -> None:
+        """Dry-Run: vergleicht die Nachbar-Vorhersage mit der KI-Entscheidung."""
+
+        neighbor_evaluation["evaluated"] += 1
+        matches = 0
+        for field in NEIGHBOR_FIELDS:
+            if str(prediction.get(field) or "").strip().lower() == shadow[field]:
+                neighbor_evaluation[field] += 1
+                matches += 1
+        if matches == len(NEIGHBOR_FIELDS):
+            neighbor_evaluation["all_fields"] += 1
+        else:
+            LOGGER.info(
+                "Nachbar-Vergleich Dokument %s: Nachbarn=%s | KI=%s",
+                doc_id,
+                "/".join(str(shadow[field]) for field in NEIGHBOR_FIELDS),
+                "/".join(str(prediction.get(field) or "-") for field in NEIGHBOR_FIELDS),
+            )
+
     def _apply_ai_result(
         pending: PendingAiDocument,
         prediction: Optional[Dict[str, Any]],
@@ -5852,6 +8407,8 @@ def process_documents(
 
         nonlocal updated, skipped, failed, bypassed
         nonlocal run_prompt_tokens, run_completion_tokens, run_total_tokens, run_cost_eur
+        nonlocal run_cached_prompt_tokens
+        nonlocal token_estimate_documents, token_estimate_estimated, token_estimate_actual
         nonlocal perf_apply_seconds
         nonlocal skipped_with_neu_still_set
         nonlocal tax_enrichment_errors
@@ -5874,19 +8431,55 @@ def process_documents(
             if prediction is None:
                 raise AiClassificationError("KI lieferte kein Ergebnis.")
 
+            cache_meta = prediction.get("_meta_classification_cache")
             prediction = sanitize_prediction(
                 prediction,
                 storage_paths_map,
                 custom_field_definitions if generic_custom_field_sync_enabled else None,
             )
+            prediction.pop("_meta_classification_cache", None)
+            neighbor_shadow = neighbor_shadow_votes.pop(int(doc_id), None) if doc_id is not None else None
+            if neighbor_shadow is not None:
+                _record_neighbor_shadow(int(doc_id), neighbor_shadow, prediction)
             prompt_tokens, completion_tokens, total_tokens = extract_usage(prediction)
+            estimated_prompt_tokens = int(
+                (prediction.get("_meta_usage") or {}).get("estimated_prompt_tokens", 0) or 0
+            )
+            if estimated_prompt_tokens > 0 and prompt_tokens > 0:
+                token_estimate_documents += 1
+                token_estimate_estimated += estimated_prompt_tokens
+                token_estimate_actual += prompt_tokens
+                LOGGER.debug(
+                    "Prompt-Tokens Dokument %s: geschätzt=%s | tatsächlich=%s",
+                    doc_id,
+                    estimated_prompt_tokens,
+                    prompt_tokens,
+                )
+            if classification_cache is not None and isinstance(cache_meta, dict) and not cache_meta.get("hit"):
+                classification_cache.put(
+                    str(cache_meta.get("key") or ""),
+                    prediction,
+                    model=config.ai_model,
+                    prompt_fingerprint=str(cache_meta.get("prompt_fingerprint") or ""),
+                    prompt_tokens=prompt_tokens,
+                    completion_tokens=completion_tokens,
+                )
+            cached_prompt_tokens = extract_cached_prompt_tokens(prediction)
             run_prompt_tokens += prompt_tokens
+            run_cached_prompt_tokens += cached_prompt_tokens
             run_completion_tokens += completion_tokens
             run_total_tokens += total_tokens
-            run_cost_eur += (
-                (prompt_tokens / 1000.0) * config.input_cost_per_1k_tokens_eur
-                + (completion_tokens / 1000.0) * config.output_cost_per_1k_tokens_eur
+            # Batch-API-Ergebnisse werden vom Provider rabattiert abgerechnet.
+            cost_factor = float((prediction.get("_meta_usage") or {}).get("cost_factor", 1.0) or 0.0)
+            run_cost_eur += cost_factor * calculate_usage_cost_eur(
+                config,
+                prompt_tokens=prompt_tokens,
+                completion_tokens=completion_tokens,
+                cached_prompt_tokens=cached_prompt_tokens,
             )
+            # Kaskade: Kosten des kleinen Modells (Tokens zählen nicht zum Hauptmodell).
+            run_cost_eur += float((prediction.get("_meta_usage") or {}).get("cascade_local_cost_eur", 0.0) or 0.0)
+            _collect_hedge_usage()
             if tax_service is not None and tax_export_collector is not None:
                 try:
                     tax_enrichment_result = tax_service.enrich(
@@ -5910,6 +8503,8 @@ def process_documents(
                         title,
                         tax_exc,
                     )
+                finally:
+                    _collect_tax_usage()
             confidence = float(prediction["confidence"])
             if confidence < config.confidence_threshold and not pending.enrichment_only:
                 if not config.dry_run and doc_id is not None:
@@ -5922,20 +8517,17 @@ def process_documents(
                     if ki_tag_id is not None:
                         new_tags.add(int(ki_tag_id))
                     if new_tags != current_tags:
-                        try:
-                            client._request(
-                                "PATCH",
-                                f"/api/documents/{int(doc_id)}/",
-                                payload={"tags": sorted(new_tags)},
-                                retries=1,
-                            )
-                        except PaperlessApiError as skip_tag_exc:
-                            LOGGER.error(
+                        _write_tag_marking(
+                            doc_id,
+                            current_tags,
+                            new_tags,
+                            on_error=_tag_marking_error(
+                                logging.ERROR,
                                 "KI_SKIP-Tag konnte für Dokument %s (%s) nicht gesetzt werden: %s",
                                 doc_id,
                                 title,
-                                skip_tag_exc,
-                            )
+                            ),
+                        )
                     try:
                         client.add_document_note(
                             int(doc_id),
@@ -6091,6 +8683,15 @@ def process_documents(
                         )
                 LOGGER.info("Aktualisiert Dokument %s (%s)", doc_id, title)
                 perf_apply_seconds += max(0.0, time.perf_counter() - apply_started)
+                if neighbor_index is not None and not pending.enrichment_only:
+                    # Sofort lernen, damit wiederkehrende Dokumente im selben Lauf profitieren.
+                    applied_labels = neighbor_document_labels({**document, **patch_payload})
+                    if applied_labels is not None:
+                        neighbor_index.add(int(doc_id), neighbor_document_text(document), applied_labels)
+                if near_duplicate_index is not None and not pending.enrichment_only:
+                    applied_metadata = near_duplicate_metadata({**document, **patch_payload})
+                    if applied_metadata is not None:
+                        near_duplicate_index.add(int(doc_id), collect_document_text(document), applied_metadata)
 
             if config.quarantine_failed_documents and doc_key is not None:
                 failed_patch_cache.pop(doc_key, None)
@@ -6157,6 +8758,8 @@ def process_documents(
                 return
 
             failed += 1
+            if delta_sync is not None:
+                delta_sync.mark_failed(doc_id)
             if (
                 config.quarantine_failed_documents
                 and doc_key is not None
@@ -6199,20 +8802,17 @@ def process_documents(
                 if ki_tag_id is not None:
                     new_tags.add(int(ki_tag_id))
                 if new_tags != current_tags:
-                    try:
-                        client._request(
-                            "PATCH",
-                            f"/api/documents/{int(doc_id)}/",
-                            payload={"tags": sorted(new_tags)},
-                            retries=1,
-                        )
-                    except PaperlessApiError as mark_tag_exc:
-                        LOGGER.error(
+                    _write_tag_marking(
+                        doc_id,
+                        current_tags,
+                        new_tags,
+                        on_error=_tag_marking_error(
+                            logging.ERROR,
                             "Fehler-Tag konnte für Dokument %s (%s) nicht gesetzt werden: %s",
                             doc_id,
                             title,
-                            mark_tag_exc,
-                        )
+                        ),
+                    )
                 try:
                     client.add_document_note(
                         int(doc_id),
@@ -6245,320 +8845,549 @@ def process_documents(
                     document_title=title,
                 )
 
-    if restored_pending_documents:
-        pending_ai_documents = list(restored_pending_documents)
-        _flush_pending_batch(pending_ai_documents)
-        pending_ai_documents.clear()
+    precheck_clients = threading.local()
+
+    def _has_ki_summary_note(lookup_client: PaperlessClient, document: Dict[str, Any]) -> bool:
+        """KI-Notiz-Prüfung über den Notiz-Index; nur bei geändertem Dokument per Abfrage."""
+
+        doc_id = int(document["id"])
+        modified = str(document.get("modified") or "")
+        if note_index is not None:
+            cached = note_index.lookup(doc_id, modified)
+            if cached is not None:
+                return cached
+        has_note = lookup_client.has_ki_summary_note(doc_id)
+        if note_index is not None:
+            note_index.record(doc_id, modified, has_note)
+        return has_note
+
+    def _find_checksum_duplicate(
+        lookup_client: PaperlessClient,
+        doc_id: int,
+        checksum: str,
+    ) -> Optional[Dict[str, Any]]:
+        """Dubletten-Suche über den Checksum-Index oder wie bisher per Paperless-Abfrage."""
+
+        if checksum_index is not None:
+            duplicate = checksum_index.find(current_document_id=doc_id, checksum=checksum)
+            if duplicate is not None or config.precheck_duplicate_lookup_mode != DUPLICATE_LOOKUP_STREAM:
+                return duplicate
+            # Stream-Index kennt nur bereits gelistete Dokumente; das ältere Original
+            # fehlt meist (Tag-/Delta-Filter, -created). Fehlt es, fragt Paperless.
+            duplicate = lookup_client.find_classified_duplicate(current_document_id=doc_id, checksum=checksum)
+            checksum_index.record_query_fallback(duplicate)
+            return duplicate
+        return lookup_client.find_classified_duplicate(current_document_id=doc_id, checksum=checksum)
+
+    def _lookup_precheck_hints(document: Dict[str, Any]) -> Dict[str, Any]:
+        """Lädt Paperless-Lesezugriffe der Precheck-Gates vorab (Stufen-Pipeline).
+
+        Läuft in Precheck-Worker-Threads mit eigenem PaperlessClient je Thread.
+        Es werden nur Lesezugriffe ausgeführt; alle Entscheidungen, Zähler und
+        Schreibzugriffe bleiben im Hauptthread. Fehlende Schlüssel bedeuten
+        "nicht vorab geladen" – die Gates fragen dann wie bisher direkt an.
+        """
 
-    for document in client.iter_documents(fetch_limit, extra_params=doc_query_params):
+        hints: Dict[str, Any] = {}
         doc_id = document.get("id")
-        doc_key = str(doc_id) if doc_id is not None else None
-        title = document.get("title", "<ohne Titel>")
+        if doc_id is None or int(doc_id) in completed_document_ids:
+            return hints
+        lookup_client = getattr(precheck_clients, "client", None)
+        if lookup_client is None:
+            lookup_client = PaperlessClient(config, paperless_transport)
+            precheck_clients.client = lookup_client
         doc_tags = {int(tag_id) for tag_id in document.get("tags", [])}
-        patch_payload_for_error: Optional[Dict[str, Any]] = None
         has_ki_tag = bool(ki_tag_id is not None and int(ki_tag_id) in doc_tags)
-        _check_for_manual_stop(
-            current_document_id=int(doc_id) if doc_id is not None else None,
-            current_document_title=title,
-        )
-        if doc_id is not None and int(doc_id) in completed_document_ids:
-            continue
-
-        if (
-            backfill_existing_documents
-            and secondbrain_sync_enabled
-            and not force_secondbrain_backfill
-        ):
-            existing_secondbrain_fields = collect_populated_secondbrain_fields(
-                document,
-                custom_fields_map,
-            )
-            if existing_secondbrain_fields:
-                prefilt_secondbrain_ready += 1
-                if not config.dry_run and doc_id is not None and secondbrain_ready_tag_id is not None:
-                    desired_tags = set(doc_tags)
-                    desired_tags.add(int(secondbrain_ready_tag_id))
-                    if desired_tags != doc_tags:
-                        try:
-                            client.update_document(
-                                int(doc_id),
-                                {"tags": sorted(desired_tags)},
-                            )
-                            doc_tags = set(desired_tags)
-                            LOGGER.info(
-                                "Backfill-Dokument %s (%s) als SecondBrain-vorbereitet markiert: SB-Tag gesetzt.",
-                                doc_id,
-                                title,
-                            )
-                        except PaperlessApiError as secondbrain_tag_exc:
-                            LOGGER.warning(
-                                "SB-Tag konnte für bereits vorbereitete Backfill-Datei %s (%s) nicht gesetzt werden: %s",
-                                doc_id,
-                                title,
-                                secondbrain_tag_exc,
-                            )
-                LOGGER.info(
-                    "Skip Dokument %s (%s): Backfill secondbrain_ready_prefilter (%s)",
-                    doc_id,
-                    title,
-                    ", ".join(existing_secondbrain_fields[:6])
-                    + (" ..." if len(existing_secondbrain_fields) > 6 else ""),
-                )
-                _mark_completed(
-                    document_id=int(doc_id) if doc_id is not None else None,
-                    document_title=title,
-                )
-                continue
-
-        # Harte Vorfilter-Regel: Dokumente mit KI-Tag werden gar nicht angefasst,
-        # außer Reprocessing wurde explizit aktiviert.
         if (
             has_ki_tag
             and not backfill_existing_documents
             and not config.reprocess_ki_tagged_documents
             and not (config.enable_tax_enrichment and config.tax_process_ki_tagged_documents)
         ):
-            prefilt_ki_tagged += 1
-            _mark_completed(
-                document_id=int(doc_id) if doc_id is not None else None,
-                document_title=title,
+            # Wird ohnehin vom KI-Tag-Vorfilter übersprungen.
+            return hints
+        if (
+            config.already_classified_skip
+            and not effective_process_all_documents
+            and not backfill_existing_documents
+            and document.get("document_type") is not None
+            and doc_tags
+            and has_ki_tag
+        ):
+            try:
+                hints["ki_summary_note"] = _has_ki_summary_note(lookup_client, document)
+            except PaperlessApiError as notes_exc:
+                hints["ki_summary_note"] = notes_exc
+        checksum = str(document.get("checksum") or "").strip()
+        if config.precheck_duplicate_hash_gate and checksum and not backfill_existing_documents:
+            hints["duplicate"] = _find_checksum_duplicate(lookup_client, int(doc_id), checksum)
+        if projected_listing and "content" not in document:
+            # Inhalt vorab laden, außer das Dokument wird voraussichtlich ohnehin übersprungen.
+            likely_skipped = hints.get("ki_summary_note") is True or (
+                not effective_process_all_documents
+                and only_tag_id is None
+                and not should_process_document(document)
             )
-            continue
+            if not likely_skipped:
+                try:
+                    hints["document"] = lookup_client.get_document(int(doc_id))
+                except PaperlessApiError as hydrate_exc:
+                    hints["document"] = hydrate_exc
+        return hints
+
+    def _resolve_precheck_hint(
+        hints: Optional[Dict[str, Any]],
+        key: str,
+        fallback: Any,
+    ) -> Any:
+        """Nutzt ein vorab geladenes Precheck-Ergebnis oder fragt direkt an."""
+
+        if hints is not None and key in hints:
+            value = hints[key]
+            if isinstance(value, BaseException):
+                raise value
+            return value
+        return fallback()
+
+    def _apply_duplicate_precheck(
+        document: Dict[str, Any],
+        *,
+        doc_tags: Set[int],
+        title: str,
+        duplicate_doc: Dict[str, Any],
+        reason: str,
+        applied_details: str,
+        skipped_details: str,
+    ) -> bool:
+        """Übernimmt die Metadaten einer Dublette oder markiert das Dokument als übersprungen.
 
-        scanned += 1
-        _emit_progress(
-            current_document_id=int(doc_id) if doc_id is not None else None,
-            current_document_title=title,
-            status="running",
-        )
+        Gemeinsamer Pfad für `duplicate_hash_gate` (gleiche checksum) und
+        `near_duplicate_gate` (gleicher Text). True, wenn Metadaten übernommen wurden.
+        """
 
-        if config.enable_tag_bypass_on_tags_500 and doc_key is not None and doc_key in tag_bypass_docs:
-            # Bypass-Dokumente sollen keine KI-Tokens verbrauchen.
-            # Zusätzlich versuchen wir bei jedem Lauf, die gewünschte
-            # Tag-Markierung herzustellen: #NEU entfernen, KI_SKIP setzen.
-            # Wenn das gelingt, kann der Bypass-Eintrag entfernt werden.
-            if not config.dry_run and doc_id is not None:
-                current_tags = {int(tag_id) for tag_id in document.get("tags", [])}
-                desired_tags = set(current_tags)
-                if remove_neu_tag_id is not None:
-                    desired_tags.discard(int(remove_neu_tag_id))
-                if skip_tag_id is not None:
-                    desired_tags.add(int(skip_tag_id))
-                if desired_tags != current_tags:
-                    try:
-                        client.update_document(
-                            int(doc_id),
-                            {"tags": sorted(desired_tags)},
-                        )
-                        tag_bypass_docs.pop(doc_key, None)
-                        doc_tags = set(desired_tags)
-                        LOGGER.info(
-                            "Bypass-Dokument %s (%s) markiert: #NEU entfernt, KI_SKIP gesetzt. "
-                            "Bypass-Eintrag wurde entfernt.",
-                            doc_id,
-                            title,
-                        )
-                    except PaperlessApiError as bypass_mark_exc:
-                        skipped_with_neu_still_set += 1
-                        LOGGER.warning(
-                            "Bypass-Dokument %s (%s) konnte nicht auf KI_SKIP/#NEU aktualisiert werden: %s",
-                            doc_id,
-                            title,
-                            bypass_mark_exc,
-                        )
-            LOGGER.info(
-                "Skip Dokument %s (%s): Tag-Bypass aktiv (tags-only 500).",
-                doc_id,
-                title,
+        doc_id = int(document["id"])
+        duplicate_id = int(duplicate_doc.get("id"))
+        if config.precheck_duplicate_apply_metadata and not config.dry_run:
+            duplicate_patch: Dict[str, Any] = {}
+            for field in ("document_type", "correspondent", "storage_path", "created"):
+                value = duplicate_doc.get(field)
+                if value is not None:
+                    duplicate_patch[field] = value
+            duplicate_tags = duplicate_doc.get("tags") or []
+            if duplicate_tags:
+                duplicate_patch["tags"] = [int(tag_id) for tag_id in duplicate_tags]
+            apply_forced_tag_rules(
+                patch_payload=duplicate_patch,
+                current_tag_ids=doc_tags,
+                ki_tag_id=ki_tag_id,
+                remove_neu_tag_id=remove_neu_tag_id,
             )
-            bypass_skipped += 1
-            skipped += 1
-            _mark_completed(
-                document_id=int(doc_id) if doc_id is not None else None,
-                document_title=title,
+            if skip_precheck_tag_id is not None:
+                merged_tags = set(int(tag_id) for tag_id in duplicate_patch.get("tags", []))
+                merged_tags.add(int(skip_precheck_tag_id))
+                duplicate_patch["tags"] = sorted(merged_tags)
+            duplicate_patch = filter_unchanged_patch_fields(
+                document=document,
+                patch_payload=duplicate_patch,
             )
-            continue
-
-        if config.quarantine_failed_documents and doc_key is not None and doc_key in failed_patch_cache:
-            retry_payload = failed_patch_cache.get(doc_key) or {}
-            if config.dry_run:
-                LOGGER.info(
-                    "Dry-Run Retry ohne KI für Dokument %s (%s): %s",
+            if duplicate_patch:
+                client.update_document(doc_id, duplicate_patch)
+            try:
+                client.add_document_note(
+                    doc_id,
+                    build_precheck_skip_note_entry(reason=reason, details=applied_details),
+                )
+            except PaperlessApiError as precheck_note_exc:
+                LOGGER.error(
+                    "Precheck-Notiz konnte für Dokument %s (%s) nicht gespeichert werden: %s",
                     doc_id,
                     title,
-                    retry_payload,
+                    precheck_note_exc,
                 )
-                skipped += 1
-                _mark_completed(
-                    document_id=int(doc_id) if doc_id is not None else None,
-                    document_title=title,
+            LOGGER.info(
+                "Aktualisiert Dokument %s (%s) via Precheck %s (Quelle=%s)",
+                doc_id,
+                title,
+                reason,
+                duplicate_id,
+            )
+            return True
+
+        if not config.dry_run:
+            current_tags = {int(tag_id) for tag_id in document.get("tags", [])}
+            new_tags = set(current_tags)
+            if remove_neu_tag_id is not None:
+                new_tags.discard(int(remove_neu_tag_id))
+            if skip_precheck_tag_id is not None:
+                new_tags.add(int(skip_precheck_tag_id))
+            if new_tags != current_tags:
+                _write_tag_marking(
+                    doc_id,
+                    current_tags,
+                    new_tags,
+                    on_error=_tag_marking_error(
+                        logging.ERROR,
+                        "KI_SKIP_PRECHECK-Tag konnte für Dokument %s (%s) nicht gesetzt werden: %s",
+                        doc_id,
+                        title,
+                    ),
                 )
-                continue
             try:
-                client.update_document(int(doc_id), retry_payload)
-                failed_patch_cache.pop(doc_key, None)
-                failed_docs_until.pop(doc_key, None)
-                LOGGER.info("Aktualisiert Dokument %s (%s) via Retry ohne KI", doc_id, title)
-                updated += 1
-                _mark_completed(
-                    document_id=int(doc_id) if doc_id is not None else None,
-                    document_title=title,
-                )
-                continue
-            except PaperlessApiError as retry_exc:
-                failed += 1
-                retry_after_ts = (
-                    dt.datetime.now(dt.timezone.utc).timestamp()
-                    + max(failed_docs_cooldown_seconds, failed_tags_only_cooldown_seconds)
+                client.add_document_note(
+                    doc_id,
+                    build_precheck_skip_note_entry(reason=reason, details=skipped_details),
                 )
-                failed_docs_until[doc_key] = retry_after_ts
-                retry_after_text = dt.datetime.fromtimestamp(
-                    retry_after_ts, tz=dt.timezone.utc
-                ).isoformat()
-                LOGGER.warning(
-                    "Retry ohne KI fehlgeschlagen für Dokument %s (%s), Quarantäne bis %s (UTC): %s",
+            except PaperlessApiError as precheck_note_exc:
+                LOGGER.error(
+                    "Precheck-Notiz konnte für Dokument %s (%s) nicht gespeichert werden: %s",
                     doc_id,
                     title,
-                    retry_after_text,
-                    retry_exc,
+                    precheck_note_exc,
                 )
-                error_details.append(
-                    {
-                        "id": doc_id,
-                        "title": title,
-                        "error_type": type(retry_exc).__name__,
-                        "message": f"Retry ohne KI fehlgeschlagen: {retry_exc}",
-                        "patch_payload": retry_payload,
-                    }
+        LOGGER.info(
+            "Skip Dokument %s (%s): Precheck %s (Quelle=%s)",
+            doc_id,
+            title,
+            reason,
+            duplicate_id,
+        )
+        return False
+
+    def _observe_streamed(documents: Iterable[Dict[str, Any]]) -> Iterable[Dict[str, Any]]:
+        """Füllt im Modus `stream` den Checksum-Index aus den ohnehin geladenen Seiten."""
+
+        observe = checksum_index is not None and config.precheck_duplicate_lookup_mode == DUPLICATE_LOOKUP_STREAM
+        for document in documents:
+            if observe:
+                checksum_index.observe(document)
+            yield document
+
+    def _list_documents(listing_client: PaperlessClient) -> Iterable[Dict[str, Any]]:
+        """Dokumentliste des Laufs; im Delta-Modus zuerst offene Fehler per ID."""
+
+        if delta_sync is not None:
+            scope_params = {**delta_scope_params, **listing_params}
+            for id_chunk in delta_sync.retry_id_chunks():
+                yield from listing_client.iter_documents(None, extra_params={**scope_params, "id__in": id_chunk})
+            yield from delta_sync.iter_changed(listing_client.iter_documents, scope_params, fetch_limit)
+            return
+        yield from listing_client.iter_documents(fetch_limit, extra_params={**doc_query_params, **listing_params})
+
+    def _open_document_stream() -> Iterable[tuple[Dict[str, Any], Optional[Dict[str, Any]]]]:
+        """Liefert `(document, precheck_hints)` in Paperless-Reihenfolge.
+
+        Im Stufen-Modus laufen Seitenabruf und Precheck-Lesezugriffe in
+        eigenen Threads mit begrenzten Queues vor dem Hauptthread her.
+        """
+
+        nonlocal staged_pipeline
+
+        if config.ai_pipeline_mode != AI_PIPELINE_MODE_STAGED:
+            return (
+                (document, None)
+                for document in _observe_streamed(_list_documents(client))
+            )
+        fetch_client = PaperlessClient(config, paperless_transport)
+        fetch_client.prefetch_pages = client.prefetch_pages
+        fetch_client.prefetch_stop = client.prefetch_stop
+        prefetch_clients.append(fetch_client)
+        staged_pipeline = StagedPipeline(
+            _observe_streamed(_list_documents(fetch_client)),
+            [
+                StageSpec(
+                    name="precheck",
+                    func=_lookup_precheck_hints,
+                    workers=config.ai_pipeline_precheck_workers,
+                    queue_size=config.ai_pipeline_stage_queue_size,
                 )
+            ],
+            source_name="fetch",
+            sink_name="apply",
+            sink_queue_size=config.ai_pipeline_stage_queue_size,
+        )
+        return (
+            (work.item, work.result if work.error is None else None)
+            for work in staged_pipeline
+        )
+
+    if config.ai_pipeline_mode in {AI_PIPELINE_MODE_STREAMING, AI_PIPELINE_MODE_STAGED}:
+        streaming_queue = BoundedWorkQueue(
+            _classify_single_document,
+            max_in_flight=parallel_ai_workers if parallel_ai_enabled else 1,
+            apply_order=config.ai_pipeline_apply_order,
+        )
+
+    # Gepufferte Tag-Markierungen auch bei Abbruch durch eine Exception schreiben.
+    try:
+        if openai_batch_state is not None:
+            _resume_openai_batch(list(restored_pending_documents))
+        elif restored_pending_documents and openai_batch_enabled:
+            _submit_openai_batch(list(restored_pending_documents))
+        elif restored_pending_documents and streaming_queue is not None:
+            for restored_item in restored_pending_documents:
+                _submit_streaming_document(restored_item)
+        elif restored_pending_documents:
+            pending_ai_documents = list(restored_pending_documents)
+            _flush_pending_batch(pending_ai_documents)
+            pending_ai_documents.clear()
+
+        for document, precheck_hints in _open_document_stream():
+            doc_id = document.get("id")
+            doc_key = str(doc_id) if doc_id is not None else None
+            title = document.get("title", "<ohne Titel>")
+            doc_tags = {int(tag_id) for tag_id in document.get("tags", [])}
+            patch_payload_for_error: Optional[Dict[str, Any]] = None
+            has_ki_tag = bool(ki_tag_id is not None and int(ki_tag_id) in doc_tags)
+            _check_for_manual_stop(
+                current_document_id=int(doc_id) if doc_id is not None else None,
+                current_document_title=title,
+            )
+            if delta_sync is not None:
+                delta_sync.observe(document)
+            listing_stats["listed"] += 1
+            if doc_id is not None and int(doc_id) in completed_document_ids:
+                continue
+            if recheck_stale_duplicates and doc_id is not None and document.get("checksum"):
+                listed_checksums[int(doc_id)] = str(document["checksum"]).strip()
+
+            if (
+                backfill_existing_documents
+                and secondbrain_sync_enabled
+                and not force_secondbrain_backfill
+            ):
+                existing_secondbrain_fields = collect_populated_secondbrain_fields(
+                    document,
+                    custom_fields_map,
+                )
+                if existing_secondbrain_fields:
+                    prefilt_secondbrain_ready += 1
+                    if not config.dry_run and doc_id is not None and secondbrain_ready_tag_id is not None:
+                        desired_tags = set(doc_tags)
+                        desired_tags.add(int(secondbrain_ready_tag_id))
+                        if desired_tags != doc_tags:
+                            try:
+                                client.update_document(
+                                    int(doc_id),
+                                    {"tags": sorted(desired_tags)},
+                                )
+                                doc_tags = set(desired_tags)
+                                LOGGER.info(
+                                    "Backfill-Dokument %s (%s) als SecondBrain-vorbereitet markiert: SB-Tag gesetzt.",
+                                    doc_id,
+                                    title,
+                                )
+                            except PaperlessApiError as secondbrain_tag_exc:
+                                LOGGER.warning(
+                                    "SB-Tag konnte für bereits vorbereitete Backfill-Datei %s (%s) nicht gesetzt werden: %s",
+                                    doc_id,
+                                    title,
+                                    secondbrain_tag_exc,
+                                )
+                    LOGGER.info(
+                        "Skip Dokument %s (%s): Backfill secondbrain_ready_prefilter (%s)",
+                        doc_id,
+                        title,
+                        ", ".join(existing_secondbrain_fields[:6])
+                        + (" ..." if len(existing_secondbrain_fields) > 6 else ""),
+                    )
+                    _mark_completed(
+                        document_id=int(doc_id) if doc_id is not None else None,
+                        document_title=title,
+                    )
+                    continue
+
+            # Harte Vorfilter-Regel: Dokumente mit KI-Tag werden gar nicht angefasst,
+            # außer Reprocessing wurde explizit aktiviert.
+            if (
+                has_ki_tag
+                and not backfill_existing_documents
+                and not config.reprocess_ki_tagged_documents
+                and not (config.enable_tax_enrichment and config.tax_process_ki_tagged_documents)
+            ):
+                prefilt_ki_tagged += 1
                 _mark_completed(
                     document_id=int(doc_id) if doc_id is not None else None,
                     document_title=title,
                 )
                 continue
 
-        if config.quarantine_failed_documents and doc_key is not None:
-            retry_after_ts = float(failed_docs_until.get(doc_key, 0.0) or 0.0)
-            now_ts = dt.datetime.now(dt.timezone.utc).timestamp()
-            if retry_after_ts > now_ts:
+            scanned += 1
+            _emit_progress(
+                current_document_id=int(doc_id) if doc_id is not None else None,
+                current_document_title=title,
+                status="running",
+            )
+
+            if config.enable_tag_bypass_on_tags_500 and doc_key is not None and doc_key in tag_bypass_docs:
+                # Bypass-Dokumente sollen keine KI-Tokens verbrauchen.
+                # Zusätzlich versuchen wir bei jedem Lauf, die gewünschte
+                # Tag-Markierung herzustellen: #NEU entfernen, KI_SKIP setzen.
+                # Wenn das gelingt, kann der Bypass-Eintrag entfernt werden.
                 if not config.dry_run and doc_id is not None:
                     current_tags = {int(tag_id) for tag_id in document.get("tags", [])}
                     desired_tags = set(current_tags)
                     if remove_neu_tag_id is not None:
                         desired_tags.discard(int(remove_neu_tag_id))
-                    if error_tag_id is not None:
-                        desired_tags.add(int(error_tag_id))
+                    if skip_tag_id is not None:
+                        desired_tags.add(int(skip_tag_id))
                     if desired_tags != current_tags:
                         try:
                             client.update_document(
                                 int(doc_id),
                                 {"tags": sorted(desired_tags)},
                             )
+                            tag_bypass_docs.pop(doc_key, None)
                             doc_tags = set(desired_tags)
                             LOGGER.info(
-                                "Quarantäne-Dokument %s (%s) markiert: #NEU entfernt, KI_FEHLER gesetzt.",
+                                "Bypass-Dokument %s (%s) markiert: #NEU entfernt, KI_SKIP gesetzt. "
+                                "Bypass-Eintrag wurde entfernt.",
                                 doc_id,
                                 title,
                             )
-                        except PaperlessApiError as quarantine_mark_exc:
+                        except PaperlessApiError as bypass_mark_exc:
                             skipped_with_neu_still_set += 1
                             LOGGER.warning(
-                                "Quarantäne-Dokument %s (%s) konnte nicht auf KI_FEHLER/#NEU aktualisiert werden: %s",
+                                "Bypass-Dokument %s (%s) konnte nicht auf KI_SKIP/#NEU aktualisiert werden: %s",
                                 doc_id,
                                 title,
-                                quarantine_mark_exc,
+                                bypass_mark_exc,
                             )
-                retry_after_text = dt.datetime.fromtimestamp(
-                    retry_after_ts, tz=dt.timezone.utc
-                ).isoformat()
                 LOGGER.info(
-                    "Skip Dokument %s (%s): Fehler-Quarantäne bis %s (UTC)",
+                    "Skip Dokument %s (%s): Tag-Bypass aktiv (tags-only 500).",
                     doc_id,
                     title,
-                    retry_after_text,
                 )
+                bypass_skipped += 1
                 skipped += 1
                 _mark_completed(
                     document_id=int(doc_id) if doc_id is not None else None,
                     document_title=title,
                 )
                 continue
-            if doc_key in failed_docs_until:
-                failed_docs_until.pop(doc_key, None)
 
-        # Defensive Prüfung bleibt aktiv, falls API-Filter je nach Version anders reagiert.
-        if not effective_process_all_documents and only_tag_id is not None and only_tag_id not in doc_tags:
-            skipped += 1
-            _mark_completed(
-                document_id=int(doc_id) if doc_id is not None else None,
-                document_title=title,
-            )
-            continue
-
-        if (
-            not effective_process_all_documents
-            and only_tag_id is None
-            and not should_process_document(document)
-        ):
-            LOGGER.debug("Skip Dokument %s (%s): bereits klassifiziert", doc_id, title)
-            skipped += 1
-            _mark_completed(
-                document_id=int(doc_id) if doc_id is not None else None,
-                document_title=title,
-            )
-            continue
-
-        # ---------- Precheck-Gates vor KI ----------
-
-        if (
-            config.already_classified_skip
-            and not effective_process_all_documents
-            and not backfill_existing_documents
-        ):
-            has_type = document.get("document_type") is not None
-            has_tags = bool(document.get("tags"))
-            # Regel für already_classified_skip:
-            # Nur skippen, wenn KI-Tag vorhanden UND bereits eine KI-Notiz mit
-            # Kurz-Zusammenfassung existiert.
-            has_ki_summary_note = False
-            if has_type and has_tags and has_ki_tag and doc_id is not None:
+            if config.quarantine_failed_documents and doc_key is not None and doc_key in failed_patch_cache:
+                retry_payload = failed_patch_cache.get(doc_key) or {}
+                if config.dry_run:
+                    LOGGER.info(
+                        "Dry-Run Retry ohne KI für Dokument %s (%s): %s",
+                        doc_id,
+                        title,
+                        retry_payload,
+                    )
+                    skipped += 1
+                    _mark_completed(
+                        document_id=int(doc_id) if doc_id is not None else None,
+                        document_title=title,
+                    )
+                    continue
                 try:
-                    has_ki_summary_note = client.has_ki_summary_note(int(doc_id))
-                except PaperlessApiError as notes_exc:
+                    client.update_document(int(doc_id), retry_payload)
+                    failed_patch_cache.pop(doc_key, None)
+                    failed_docs_until.pop(doc_key, None)
+                    LOGGER.info("Aktualisiert Dokument %s (%s) via Retry ohne KI", doc_id, title)
+                    updated += 1
+                    _mark_completed(
+                        document_id=int(doc_id) if doc_id is not None else None,
+                        document_title=title,
+                    )
+                    continue
+                except PaperlessApiError as retry_exc:
+                    failed += 1
+                    if delta_sync is not None:
+                        delta_sync.mark_failed(doc_id)
+                    retry_after_ts = (
+                        dt.datetime.now(dt.timezone.utc).timestamp()
+                        + max(failed_docs_cooldown_seconds, failed_tags_only_cooldown_seconds)
+                    )
+                    failed_docs_until[doc_key] = retry_after_ts
+                    retry_after_text = dt.datetime.fromtimestamp(
+                        retry_after_ts, tz=dt.timezone.utc
+                    ).isoformat()
                     LOGGER.warning(
-                        "Precheck already_classified_skip: Notizen für Dokument %s (%s) konnten nicht geprüft werden: %s",
+                        "Retry ohne KI fehlgeschlagen für Dokument %s (%s), Quarantäne bis %s (UTC): %s",
                         doc_id,
                         title,
-                        notes_exc,
+                        retry_after_text,
+                        retry_exc,
+                    )
+                    error_details.append(
+                        {
+                            "id": doc_id,
+                            "title": title,
+                            "error_type": type(retry_exc).__name__,
+                            "message": f"Retry ohne KI fehlgeschlagen: {retry_exc}",
+                            "patch_payload": retry_payload,
+                        }
                     )
+                    _mark_completed(
+                        document_id=int(doc_id) if doc_id is not None else None,
+                        document_title=title,
+                    )
+                    continue
 
-            if has_type and has_tags and has_ki_tag and has_ki_summary_note:
-                if not config.dry_run and doc_id is not None:
-                    current_tags = {int(tag_id) for tag_id in document.get("tags", [])}
-                    new_tags = set(current_tags)
-                    if remove_neu_tag_id is not None:
-                        new_tags.discard(int(remove_neu_tag_id))
-                    if new_tags != current_tags:
-                        try:
-                            client._request(
-                                "PATCH",
-                                f"/api/documents/{int(doc_id)}/",
-                                payload={"tags": sorted(new_tags)},
-                                retries=1,
-                            )
-                        except PaperlessApiError as remove_neu_exc:
-                            skipped_with_neu_still_set += 1
-                            LOGGER.warning(
-                                "Precheck already_classified_skip: #NEU konnte für Dokument %s (%s) nicht entfernt werden: %s",
+            if config.quarantine_failed_documents and doc_key is not None:
+                retry_after_ts = float(failed_docs_until.get(doc_key, 0.0) or 0.0)
+                now_ts = dt.datetime.now(dt.timezone.utc).timestamp()
+                if retry_after_ts > now_ts:
+                    if not config.dry_run and doc_id is not None:
+                        current_tags = {int(tag_id) for tag_id in document.get("tags", [])}
+                        desired_tags = set(current_tags)
+                        if remove_neu_tag_id is not None:
+                            desired_tags.discard(int(remove_neu_tag_id))
+                        if error_tag_id is not None:
+                            desired_tags.add(int(error_tag_id))
+                        if desired_tags != current_tags and _write_tag_marking(
+                            doc_id,
+                            current_tags,
+                            desired_tags,
+                            on_error=_tag_marking_error(
+                                logging.WARNING,
+                                "Quarantäne-Dokument %s (%s) konnte nicht auf KI_FEHLER/#NEU aktualisiert werden: %s",
+                                doc_id,
+                                title,
+                                neu_still_set=True,
+                            ),
+                            write=lambda: client.update_document(int(doc_id), {"tags": sorted(desired_tags)}),
+                        ):
+                            doc_tags = set(desired_tags)
+                            LOGGER.info(
+                                "Quarantäne-Dokument %s (%s) markiert: #NEU entfernt, KI_FEHLER gesetzt.",
                                 doc_id,
                                 title,
-                                remove_neu_exc,
                             )
-                LOGGER.info(
-                    "Skip Dokument %s (%s): Precheck already_classified_skip (KI-Tag + Kurz-Zusammenfassung vorhanden)",
-                    doc_id,
-                    title,
+                    retry_after_text = dt.datetime.fromtimestamp(
+                        retry_after_ts, tz=dt.timezone.utc
+                    ).isoformat()
+                    LOGGER.info(
+                        "Skip Dokument %s (%s): Fehler-Quarantäne bis %s (UTC)",
+                        doc_id,
+                        title,
+                        retry_after_text,
+                    )
+                    skipped += 1
+                    _mark_completed(
+                        document_id=int(doc_id) if doc_id is not None else None,
+                        document_title=title,
+                    )
+                    continue
+                if doc_key in failed_docs_until:
+                    failed_docs_until.pop(doc_key, None)
+
+            # Defensive Prüfung bleibt aktiv, falls API-Filter je nach Version anders reagiert.
+            if not effective_process_all_documents and only_tag_id is not None and only_tag_id not in doc_tags:
+                skipped += 1
+                _mark_completed(
+                    document_id=int(doc_id) if doc_id is not None else None,
+                    document_title=title,
                 )
+                continue
+
+            if (
+                not effective_process_all_documents
+                and only_tag_id is None
+                and not should_process_document(document)
+            ):
+                LOGGER.debug("Skip Dokument %s (%s): bereits klassifiziert", doc_id, title)
                 skipped += 1
                 _mark_completed(
                     document_id=int(doc_id) if doc_id is not None else None,
@@ -6566,143 +9395,177 @@ def process_documents(
                 )
                 continue
 
-        names_lower = [name.lower() for name in collect_document_names(document)]
-        matched_pattern = None
-        if not backfill_existing_documents:
-            for pattern in config.precheck_blocked_filename_patterns:
-                pattern_lower = str(pattern).strip().lower()
-                if not pattern_lower:
-                    continue
-                if any(pattern_lower in name for name in names_lower):
-                    matched_pattern = pattern
-                    break
-        if matched_pattern:
-            if not config.dry_run and doc_id is not None:
-                current_tags = {int(tag_id) for tag_id in document.get("tags", [])}
-                new_tags = set(current_tags)
-                if remove_neu_tag_id is not None:
-                    new_tags.discard(int(remove_neu_tag_id))
-                if skip_precheck_tag_id is not None:
-                    new_tags.add(int(skip_precheck_tag_id))
-                if new_tags != current_tags:
+            # ---------- Precheck-Gates vor KI ----------
+
+            if (
+                config.already_classified_skip
+                and not effective_process_all_documents
+                and not backfill_existing_documents
+            ):
+                has_type = document.get("document_type") is not None
+                has_tags = bool(document.get("tags"))
+                # Regel für already_classified_skip:
+                # Nur skippen, wenn KI-Tag vorhanden UND bereits eine KI-Notiz mit
+                # Kurz-Zusammenfassung existiert.
+                has_ki_summary_note = False
+                if has_type and has_tags and has_ki_tag and doc_id is not None:
                     try:
-                        client._request(
-                            "PATCH",
-                            f"/api/documents/{int(doc_id)}/",
-                            payload={"tags": sorted(new_tags)},
-                            retries=1,
+                        has_ki_summary_note = _resolve_precheck_hint(
+                            precheck_hints,
+                            "ki_summary_note",
+                            lambda: _has_ki_summary_note(client, document),
                         )
-                    except PaperlessApiError as precheck_tag_exc:
-                        LOGGER.error(
-                            "KI_SKIP_PRECHECK-Tag konnte für Dokument %s (%s) nicht gesetzt werden: %s",
+                    except PaperlessApiError as notes_exc:
+                        LOGGER.warning(
+                            "Precheck already_classified_skip: Notizen für Dokument %s (%s) konnten nicht geprüft werden: %s",
                             doc_id,
                             title,
-                            precheck_tag_exc,
+                            notes_exc,
                         )
-                try:
-                    client.add_document_note(
-                        int(doc_id),
-                        build_precheck_skip_note_entry(
-                            reason="mime_filename_gate",
-                            details=f"Dateiname-Muster getroffen: {matched_pattern}",
-                        ),
-                    )
-                except PaperlessApiError as precheck_note_exc:
-                    LOGGER.error(
-                        "Precheck-Notiz konnte für Dokument %s (%s) nicht gespeichert werden: %s",
+
+                if has_type and has_tags and has_ki_tag and has_ki_summary_note:
+                    if not config.dry_run and doc_id is not None:
+                        current_tags = {int(tag_id) for tag_id in document.get("tags", [])}
+                        new_tags = set(current_tags)
+                        if remove_neu_tag_id is not None:
+                            new_tags.discard(int(remove_neu_tag_id))
+                        if new_tags != current_tags:
+                            _write_tag_marking(
+                                doc_id,
+                                current_tags,
+                                new_tags,
+                                on_error=_tag_marking_error(
+                                    logging.WARNING,
+                                    "Precheck already_classified_skip: #NEU konnte für Dokument %s (%s) nicht entfernt werden: %s",
+                                    doc_id,
+                                    title,
+                                    neu_still_set=True,
+                                ),
+                            )
+                    LOGGER.info(
+                        "Skip Dokument %s (%s): Precheck already_classified_skip (KI-Tag + Kurz-Zusammenfassung vorhanden)",
                         doc_id,
                         title,
-                        precheck_note_exc,
                     )
-            LOGGER.info(
-                "Skip Dokument %s (%s): Precheck mime_filename_gate (%s)",
-                doc_id,
-                title,
-                matched_pattern,
-            )
-            skipped += 1
-            _mark_completed(
-                document_id=int(doc_id) if doc_id is not None else None,
-                document_title=title,
-            )
-            continue
+                    skipped += 1
+                    _mark_completed(
+                        document_id=int(doc_id) if doc_id is not None else None,
+                        document_title=title,
+                    )
+                    continue
 
-        doc_text = collect_document_text(document)
-        word_count = len(re.findall(r"\b\w+\b", doc_text))
-        alnum_ratio = calc_alnum_ratio(doc_text)
-        precheck_reasons: List[str] = []
-        if not backfill_existing_documents:
-            if len(doc_text) < max(0, int(config.precheck_min_content_chars)):
-                precheck_reasons.append(
-                    f"content_len={len(doc_text)} < min_content_chars={int(config.precheck_min_content_chars)}"
-                )
-            if word_count < max(0, int(config.precheck_min_word_count)):
-                precheck_reasons.append(
-                    f"word_count={word_count} < min_word_count={int(config.precheck_min_word_count)}"
-                )
-            if alnum_ratio < max(0.0, float(config.precheck_min_alnum_ratio)):
-                precheck_reasons.append(
-                    f"alnum_ratio={alnum_ratio:.2f} < min_alnum_ratio={float(config.precheck_min_alnum_ratio):.2f}"
-                )
-        if precheck_reasons:
-            if not config.dry_run and doc_id is not None:
-                current_tags = {int(tag_id) for tag_id in document.get("tags", [])}
-                new_tags = set(current_tags)
-                if remove_neu_tag_id is not None:
-                    new_tags.discard(int(remove_neu_tag_id))
-                if skip_precheck_tag_id is not None:
-                    new_tags.add(int(skip_precheck_tag_id))
-                if new_tags != current_tags:
+            names_lower = [name.lower() for name in collect_document_names(document)]
+            matched_pattern = None
+            if not backfill_existing_documents:
+                for pattern in config.precheck_blocked_filename_patterns:
+                    pattern_lower = str(pattern).strip().lower()
+                    if not pattern_lower:
+                        continue
+                    if any(pattern_lower in name for name in names_lower):
+                        matched_pattern = pattern
+                        break
+            if matched_pattern:
+                if not config.dry_run and doc_id is not None:
+                    current_tags = {int(tag_id) for tag_id in document.get("tags", [])}
+                    new_tags = set(current_tags)
+                    if remove_neu_tag_id is not None:
+                        new_tags.discard(int(remove_neu_tag_id))
+                    if skip_precheck_tag_id is not None:
+                        new_tags.add(int(skip_precheck_tag_id))
+                    if new_tags != current_tags:
+                        _write_tag_marking(
+                            doc_id,
+                            current_tags,
+                            new_tags,
+                            on_error=_tag_marking_error(
+                                logging.ERROR,
+                                "KI_SKIP_PRECHECK-Tag konnte für Dokument %s (%s) nicht gesetzt werden: %s",
+                                doc_id,
+                                title,
+                            ),
+                        )
                     try:
-                        client._request(
-                            "PATCH",
-                            f"/api/documents/{int(doc_id)}/",
-                            payload={"tags": sorted(new_tags)},
-                            retries=1,
+                        client.add_document_note(
+                            int(doc_id),
+                            build_precheck_skip_note_entry(
+                                reason="mime_filename_gate",
+                                details=f"Dateiname-Muster getroffen: {matched_pattern}",
+                            ),
                         )
-                    except PaperlessApiError as precheck_tag_exc:
+                    except PaperlessApiError as precheck_note_exc:
                         LOGGER.error(
-                            "KI_SKIP_PRECHECK-Tag konnte für Dokument %s (%s) nicht gesetzt werden: %s",
+                            "Precheck-Notiz konnte für Dokument %s (%s) nicht gespeichert werden: %s",
                             doc_id,
                             title,
-                            precheck_tag_exc,
+                            precheck_note_exc,
                         )
+                LOGGER.info(
+                    "Skip Dokument %s (%s): Precheck mime_filename_gate (%s)",
+                    doc_id,
+                    title,
+                    matched_pattern,
+                )
+                skipped += 1
+                _mark_completed(
+                    document_id=int(doc_id) if doc_id is not None else None,
+                    document_title=title,
+                )
+                continue
+
+            if projected_listing and "content" not in document and doc_id is not None:
+                if precheck_hints is not None and isinstance(precheck_hints.get("document"), dict):
+                    listing_stats["hydrated_ahead"] += 1
                 try:
-                    client.add_document_note(
-                        int(doc_id),
-                        build_precheck_skip_note_entry(
-                            reason="content_quality_gate",
-                            details="; ".join(precheck_reasons),
-                        ),
+                    full_document = _resolve_precheck_hint(
+                        precheck_hints,
+                        "document",
+                        lambda: client.get_document(int(doc_id)),
                     )
-                except PaperlessApiError as precheck_note_exc:
-                    LOGGER.error(
-                        "Precheck-Notiz konnte für Dokument %s (%s) nicht gespeichert werden: %s",
+                except PaperlessApiError as hydrate_exc:
+                    listing_stats["hydrate_errors"] += 1
+                    failed += 1
+                    if delta_sync is not None:
+                        delta_sync.mark_failed(doc_id)
+                    LOGGER.warning(
+                        "Inhalt für Dokument %s (%s) konnte nicht geladen werden: %s",
                         doc_id,
                         title,
-                        precheck_note_exc,
+                        hydrate_exc,
                     )
-            LOGGER.info(
-                "Skip Dokument %s (%s): Precheck content_quality_gate (%s)",
-                doc_id,
-                title,
-                "; ".join(precheck_reasons),
-            )
-            skipped += 1
-            _mark_completed(
-                document_id=int(doc_id) if doc_id is not None else None,
-                document_title=title,
-            )
-            continue
-
-        if config.precheck_image_only_gate and not backfill_existing_documents:
-            mime_type = str(document.get("mime_type") or document.get("media_type") or "").lower()
-            has_image_or_pdf_type = ("pdf" in mime_type) or mime_type.startswith("image/")
-            image_like_name = any(
-                any(name.endswith(ext) for ext in (".pdf", ".png", ".jpg", ".jpeg", ".tif", ".tiff"))
-                for name in names_lower
-            )
-            if (has_image_or_pdf_type or image_like_name) and len(doc_text.strip()) < 30:
+                    error_details.append(
+                        {
+                            "id": doc_id,
+                            "title": title,
+                            "error_type": type(hydrate_exc).__name__,
+                            "message": f"Inhalt konnte nicht geladen werden: {hydrate_exc}",
+                        }
+                    )
+                    _mark_completed(
+                        document_id=int(doc_id),
+                        document_title=title,
+                    )
+                    continue
+                listing_stats["hydrated"] += 1
+                document = {**document, **full_document}
+
+            doc_text = collect_document_text(document)
+            word_count = len(re.findall(r"\b\w+\b", doc_text))
+            alnum_ratio = calc_alnum_ratio(doc_text)
+            precheck_reasons: List[str] = []
+            if not backfill_existing_documents:
+                if len(doc_text) < max(0, int(config.precheck_min_content_chars)):
+                    precheck_reasons.append(
+                        f"content_len={len(doc_text)} < min_content_chars={int(config.precheck_min_content_chars)}"
+                    )
+                if word_count < max(0, int(config.precheck_min_word_count)):
+                    precheck_reasons.append(
+                        f"word_count={word_count} < min_word_count={int(config.precheck_min_word_count)}"
+                    )
+                if alnum_ratio < max(0.0, float(config.precheck_min_alnum_ratio)):
+                    precheck_reasons.append(
+                        f"alnum_ratio={alnum_ratio:.2f} < min_alnum_ratio={float(config.precheck_min_alnum_ratio):.2f}"
+                    )
+            if precheck_reasons:
                 if not config.dry_run and doc_id is not None:
                     current_tags = {int(tag_id) for tag_id in document.get("tags", [])}
                     new_tags = set(current_tags)
@@ -6711,26 +9574,23 @@ def process_documents(
                     if skip_precheck_tag_id is not None:
                         new_tags.add(int(skip_precheck_tag_id))
                     if new_tags != current_tags:
-                        try:
-                            client._request(
-                                "PATCH",
-                                f"/api/documents/{int(doc_id)}/",
-                                payload={"tags": sorted(new_tags)},
-                                retries=1,
-                            )
-                        except PaperlessApiError as precheck_tag_exc:
-                            LOGGER.error(
+                        _write_tag_marking(
+                            doc_id,
+                            current_tags,
+                            new_tags,
+                            on_error=_tag_marking_error(
+                                logging.ERROR,
                                 "KI_SKIP_PRECHECK-Tag konnte für Dokument %s (%s) nicht gesetzt werden: %s",
                                 doc_id,
                                 title,
-                                precheck_tag_exc,
-                            )
+                            ),
+                        )
                     try:
                         client.add_document_note(
                             int(doc_id),
                             build_precheck_skip_note_entry(
-                                reason="image_only_gate",
-                                details="Kein verwertbarer Text im OCR-Inhalt erkannt.",
+                                reason="content_quality_gate",
+                                details="; ".join(precheck_reasons),
                             ),
                         )
                     except PaperlessApiError as precheck_note_exc:
@@ -6741,9 +9601,10 @@ def process_documents(
                             precheck_note_exc,
                         )
                 LOGGER.info(
-                    "Skip Dokument %s (%s): Precheck image_only_gate (kein verwertbarer Text)",
+                    "Skip Dokument %s (%s): Precheck content_quality_gate (%s)",
                     doc_id,
                     title,
+                    "; ".join(precheck_reasons),
                 )
                 skipped += 1
                 _mark_completed(
@@ -6752,71 +9613,14 @@ def process_documents(
                 )
                 continue
 
-        if config.precheck_duplicate_hash_gate and doc_id is not None and not backfill_existing_documents:
-            checksum = str(document.get("checksum") or "").strip()
-            if checksum:
-                duplicate_doc = client.find_classified_duplicate(
-                    current_document_id=int(doc_id),
-                    checksum=checksum,
+            if config.precheck_image_only_gate and not backfill_existing_documents:
+                mime_type = str(document.get("mime_type") or document.get("media_type") or "").lower()
+                has_image_or_pdf_type = ("pdf" in mime_type) or mime_type.startswith("image/")
+                image_like_name = any(
+                    any(name.endswith(ext) for ext in (".pdf", ".png", ".jpg", ".jpeg", ".tif", ".tiff"))
+                    for name in names_lower
                 )
-                if duplicate_doc is not None:
-                    duplicate_id = int(duplicate_doc.get("id"))
-                    if config.precheck_duplicate_apply_metadata and not config.dry_run:
-                        duplicate_patch: Dict[str, Any] = {}
-                        for field in ("document_type", "correspondent", "storage_path", "created"):
-                            value = duplicate_doc.get(field)
-                            if value is not None:
-                                duplicate_patch[field] = value
-                        duplicate_tags = duplicate_doc.get("tags") or []
-                        if duplicate_tags:
-                            duplicate_patch["tags"] = [int(tag_id) for tag_id in duplicate_tags]
-                        apply_forced_tag_rules(
-                            patch_payload=duplicate_patch,
-                            current_tag_ids=doc_tags,
-                            ki_tag_id=ki_tag_id,
-                            remove_neu_tag_id=remove_neu_tag_id,
-                        )
-                        if skip_precheck_tag_id is not None:
-                            merged_tags = set(int(tag_id) for tag_id in duplicate_patch.get("tags", []))
-                            merged_tags.add(int(skip_precheck_tag_id))
-                            duplicate_patch["tags"] = sorted(merged_tags)
-                        duplicate_patch = filter_unchanged_patch_fields(
-                            document=document,
-                            patch_payload=duplicate_patch,
-                        )
-                        if duplicate_patch:
-                            client.update_document(int(doc_id), duplicate_patch)
-                        try:
-                            client.add_document_note(
-                                int(doc_id),
-                                build_precheck_skip_note_entry(
-                                    reason="duplicate_hash_gate",
-                                    details=(
-                                        f"Dublette erkannt via checksum. Metadaten von Dokument "
-                                        f"{duplicate_id} übernommen."
-                                    ),
-                                ),
-                            )
-                        except PaperlessApiError as precheck_note_exc:
-                            LOGGER.error(
-                                "Precheck-Notiz konnte für Dokument %s (%s) nicht gespeichert werden: %s",
-                                doc_id,
-                                title,
-                                precheck_note_exc,
-                            )
-                        LOGGER.info(
-                            "Aktualisiert Dokument %s (%s) via Precheck duplicate_hash_gate (Quelle=%s)",
-                            doc_id,
-                            title,
-                            duplicate_id,
-                        )
-                        updated += 1
-                        _mark_completed(
-                            document_id=int(doc_id) if doc_id is not None else None,
-                            document_title=title,
-                        )
-                        continue
-
+                if (has_image_or_pdf_type or image_like_name) and len(doc_text.strip()) < 30:
                     if not config.dry_run and doc_id is not None:
                         current_tags = {int(tag_id) for tag_id in document.get("tags", [])}
                         new_tags = set(current_tags)
@@ -6825,26 +9629,23 @@ def process_documents(
                         if skip_precheck_tag_id is not None:
                             new_tags.add(int(skip_precheck_tag_id))
                         if new_tags != current_tags:
-                            try:
-                                client._request(
-                                    "PATCH",
-                                    f"/api/documents/{int(doc_id)}/",
-                                    payload={"tags": sorted(new_tags)},
-                                    retries=1,
-                                )
-                            except PaperlessApiError as precheck_tag_exc:
-                                LOGGER.error(
+                            _write_tag_marking(
+                                doc_id,
+                                current_tags,
+                                new_tags,
+                                on_error=_tag_marking_error(
+                                    logging.ERROR,
                                     "KI_SKIP_PRECHECK-Tag konnte für Dokument %s (%s) nicht gesetzt werden: %s",
                                     doc_id,
                                     title,
-                                    precheck_tag_exc,
-                                )
+                                ),
+                            )
                         try:
                             client.add_document_note(
                                 int(doc_id),
                                 build_precheck_skip_note_entry(
-                                    reason="duplicate_hash_gate",
-                                    details=f"Dublette erkannt via checksum (Referenzdokument {duplicate_id}).",
+                                    reason="image_only_gate",
+                                    details="Kein verwertbarer Text im OCR-Inhalt erkannt.",
                                 ),
                             )
                         except PaperlessApiError as precheck_note_exc:
@@ -6855,10 +9656,9 @@ def process_documents(
                                 precheck_note_exc,
                             )
                     LOGGER.info(
-                        "Skip Dokument %s (%s): Precheck duplicate_hash_gate (Quelle=%s)",
+                        "Skip Dokument %s (%s): Precheck image_only_gate (kein verwertbarer Text)",
                         doc_id,
                         title,
-                        duplicate_id,
                     )
                     skipped += 1
                     _mark_completed(
@@ -6867,43 +9667,114 @@ def process_documents(
                     )
                     continue
 
-        if config.quarantine_failed_documents and doc_key is not None:
-            # Bei neuem Versuch zunächst entsperren; bei erneutem Fehler wird der
-            # Eintrag bei Fehlerbehandlung wieder gesetzt.
-            failed_docs_until.pop(doc_key, None)
+            if config.precheck_duplicate_hash_gate and doc_id is not None and not backfill_existing_documents:
+                checksum = str(document.get("checksum") or "").strip()
+                if checksum:
+                    duplicate_doc = _resolve_precheck_hint(
+                        precheck_hints,
+                        "duplicate",
+                        lambda: _find_checksum_duplicate(client, int(doc_id), checksum),
+                    )
+                    if (
+                        duplicate_doc is None
+                        and precheck_hints is not None
+                        and "duplicate" in precheck_hints
+                        and checksum in patched_checksums
+                    ):
+                        # Vorab-Ergebnis stammt von vor dem PATCH des Schwester-Dokuments: erneut prüfen.
+                        duplicate_rechecks += 1
+                        duplicate_doc = _find_checksum_duplicate(client, int(doc_id), checksum)
+                    if duplicate_doc is not None:
+                        duplicate_id = int(duplicate_doc.get("id"))
+                        if _apply_duplicate_precheck(
+                            document,
+                            doc_tags=doc_tags,
+                            title=title,
+                            duplicate_doc=duplicate_doc,
+                            reason="duplicate_hash_gate",
+                            applied_details=(
+                                f"Dublette erkannt via checksum. Metadaten von Dokument {duplicate_id} übernommen."
+                            ),
+                            skipped_details=f"Dublette erkannt via checksum (Referenzdokument {duplicate_id}).",
+                        ):
+                            updated += 1
+                        else:
+                            skipped += 1
+                        _mark_completed(
+                            document_id=int(doc_id) if doc_id is not None else None,
+                            document_title=title,
+                        )
+                        continue
 
-        if (
-            has_ki_tag
-            and not backfill_existing_documents
-            and not config.reprocess_ki_tagged_documents
-            and config.enable_tax_enrichment
-            and config.tax_process_ki_tagged_documents
-        ):
+            if near_duplicate_index is not None and doc_id is not None:
+                near_match = near_duplicate_index.find(collect_document_text(document), exclude_id=int(doc_id))
+                if near_match is not None:
+                    match_details = (
+                        f"Ähnlichkeit {near_match.similarity:.0%}, "
+                        f"Zahlen-Übereinstimmung {near_match.number_overlap:.0%}"
+                    )
+                    if _apply_duplicate_precheck(
+                        document,
+                        doc_tags=doc_tags,
+                        title=title,
+                        duplicate_doc={"id": near_match.doc_id, **near_match.metadata},
+                        reason="near_duplicate_gate",
+                        applied_details=(
+                            f"Beinahe-Dublette erkannt via Textvergleich ({match_details}). "
+                            f"Metadaten von Dokument {near_match.doc_id} übernommen."
+                        ),
+                        skipped_details=(
+                            f"Beinahe-Dublette erkannt via Textvergleich ({match_details}, "
+                            f"Referenzdokument {near_match.doc_id})."
+                        ),
+                    ):
+                        updated += 1
+                        near_duplicate_counts["applied"] += 1
+                    else:
+                        skipped += 1
+                        near_duplicate_counts["skipped"] += 1
+                    _mark_completed(
+                        document_id=int(doc_id),
+                        document_title=title,
+                    )
+                    continue
+
+            if config.quarantine_failed_documents and doc_key is not None:
+                # Bei neuem Versuch zunächst entsperren; bei erneutem Fehler wird der
+                # Eintrag bei Fehlerbehandlung wieder gesetzt.
+                failed_docs_until.pop(doc_key, None)
+
+            if (
+                has_ki_tag
+                and not backfill_existing_documents
+                and not config.reprocess_ki_tagged_documents
+                and config.enable_tax_enrichment
+                and config.tax_process_ki_tagged_documents
+            ):
+                if target_documents is not None and budget_used >= target_documents:
+                    break
+                budget_used += 1
+                try:
+                    _run_tax_only_for_document(document=document, doc_id=doc_id, title=title)
+                except AiTemporaryPauseError as pause_exc:
+                    _pause_run(
+                        pause_reason=pause_exc.pause_reason,
+                        retry_after_seconds=pause_exc.retry_after_seconds,
+                        current_document_id=int(doc_id) if doc_id is not None else None,
+                        current_document_title=title,
+                    )
+                _mark_completed(
+                    document_id=int(doc_id) if doc_id is not None else None,
+                    document_title=title,
+                )
+                continue
+
+            # Budget zählt nur für Dokumente, die die Skip-Gates passiert haben.
             if target_documents is not None and budget_used >= target_documents:
                 break
             budget_used += 1
-            try:
-                _run_tax_only_for_document(document=document, doc_id=doc_id, title=title)
-            except AiTemporaryPauseError as pause_exc:
-                _pause_run(
-                    pause_reason=pause_exc.pause_reason,
-                    retry_after_seconds=pause_exc.retry_after_seconds,
-                    current_document_id=int(doc_id) if doc_id is not None else None,
-                    current_document_title=title,
-                )
-            _mark_completed(
-                document_id=int(doc_id) if doc_id is not None else None,
-                document_title=title,
-            )
-            continue
 
-        # Budget zählt nur für Dokumente, die die Skip-Gates passiert haben.
-        if target_documents is not None and budget_used >= target_documents:
-            break
-        budget_used += 1
-
-        pending_ai_documents.append(
-            PendingAiDocument(
+            pending_item = PendingAiDocument(
                 document=document,
                 doc_id=int(doc_id) if doc_id is not None else None,
                 doc_key=doc_key,
@@ -6911,14 +9782,441 @@ def process_documents(
                 doc_tags=set(doc_tags),
                 enrichment_only=bool(backfill_existing_documents and has_ki_tag),
             )
-        )
-        if len(pending_ai_documents) >= parallel_ai_workers:
-            _flush_pending_batch(list(pending_ai_documents))
+            if streaming_queue is not None:
+                _submit_streaming_document(pending_item)
+                continue
+            pending_ai_documents.append(pending_item)
+            if len(pending_ai_documents) >= ai_batch_flush_size:
+                _dispatch_pending_batch(list(pending_ai_documents))
+                pending_ai_documents.clear()
+        else:
+            if delta_sync is not None:
+                # Ohne Budget-Abbruch gilt auch das letzte Dokument als verarbeitet.
+                delta_sync.finish()
+
+        pipeline_metrics: Dict[str, Any] = {"mode": config.ai_pipeline_mode}
+        if staged_pipeline is not None:
+            # Nach `break` (Budget erreicht) laufen Fetch/Precheck evtl. noch voraus.
+            staged_pipeline.close()
+        if streaming_queue is not None:
+            _apply_streaming_results(streaming_queue.drain())
+            streaming_queue.close()
+            streaming_stats = streaming_queue.stats()
+            LOGGER.info(
+                "Streaming-Pipeline: Slots=%s | gestartet=%s | max. gleichzeitig=%s | "
+                "Wartezeit auf freie Slots=%.2fs",
+                streaming_stats["max_in_flight"],
+                streaming_stats["submitted"],
+                streaming_stats["peak_in_flight"],
+                streaming_stats["caller_wait_seconds"],
+            )
+            pipeline_metrics["classify"] = streaming_stats
+        if staged_pipeline is not None:
+            staged_stats = staged_pipeline.stats()
+            staged_stats["apply"]["busy_seconds"] = round(perf_apply_seconds, 6)
+            staged_stats["precheck"]["duplicate_rechecks"] = duplicate_rechecks
+            pipeline_metrics["stages"] = staged_stats
+            for stage_name, stage_stats in staged_stats.items():
+                LOGGER.info(
+                    "Stufe %s: Worker=%s | verarbeitet=%s | max. Queue=%s | Ø Queue=%.2f | "
+                    "Leerlauf=%.2fs | Stau=%.2fs",
+                    stage_name,
+                    stage_stats["workers"],
+                    stage_stats["processed"],
+                    stage_stats["max_queue_depth"],
+                    stage_stats["avg_queue_depth"],
+                    stage_stats["input_wait_seconds"],
+                    stage_stats["output_stall_seconds"],
+                )
+        if pending_ai_documents:
+            _dispatch_pending_batch(list(pending_ai_documents))
             pending_ai_documents.clear()
-
-    if pending_ai_documents:
-        _flush_pending_batch(list(pending_ai_documents))
-        pending_ai_documents.clear()
+    finally:
+        if tag_mutations is not None:
+            tag_mutations.flush()
+    if tag_mutations is not None:
+        tag_mutation_stats = tag_mutations.stats()
+        LOGGER.info(
+            "Tag-Markierungen: gepuffert=%s | Bulk-Edits=%s (Dokumente=%s) | "
+            "Bulk-Fehler=%s | Einzel-PATCH=%s | fehlgeschlagen=%s",
+            tag_mutation_stats["enqueued"],
+            tag_mutation_stats["bulk_requests"],
+            tag_mutation_stats["bulk_documents"],
+            tag_mutation_stats["bulk_failures"],
+            tag_mutation_stats["fallback_patches"],
+            tag_mutation_stats["failed"],
+        )
+        pipeline_metrics["tag_mutations"] = tag_mutation_stats
+    if openai_batch_stats["submitted_batches"] or openai_batch_stats["applied_batches"]:
+        LOGGER.info(
+            "OpenAI-Batch: übermittelt=%s | abgeholt=%s | Ergebnisse=%s | Einzel-Fallbacks=%s",
+            openai_batch_stats["submitted_batches"],
+            openai_batch_stats["applied_batches"],
+            openai_batch_stats["applied_results"],
+            openai_batch_stats["fallbacks"],
+        )
+        pipeline_metrics["openai_batch"] = dict(openai_batch_stats)
+    if classifier_pool is not None:
+        pool_stats = classifier_pool.stats()
+        LOGGER.info(
+            "KI-Classifier-Pool: Worker=%s | Treffer=%s | Neu angelegt=%s | "
+            "Verbindungen neu=%s | wiederverwendet=%s",
+            pool_stats["workers"],
+            pool_stats["hits"],
+            pool_stats["misses"],
+            pool_stats["connections_opened"],
+            pool_stats["connections_reused"],
+        )
+        pipeline_metrics["classifier_pool"] = pool_stats
+    prompt_builds = classifier.prompt_builds + int(pipeline_metrics.get("classifier_pool", {}).get("prompt_builds", 0))
+    prompt_cache_hits = classifier.prompt_cache_hits + int(
+        pipeline_metrics.get("classifier_pool", {}).get("prompt_cache_hits", 0)
+    )
+    LOGGER.info(
+        "KI-System-Prompt-Cache: Fingerprint=%s | Neuaufbauten=%s | Cache-Treffer=%s",
+        classifier.prompt_fingerprint,
+        prompt_builds,
+        prompt_cache_hits,
+    )
+    pipeline_metrics["system_prompt"] = {
+        "fingerprint": classifier.prompt_fingerprint,
+        "builds": prompt_builds,
+        "cache_hits": prompt_cache_hits,
+    }
+    pool_payload = pipeline_metrics.get("classifier_pool", {})
+    if token_estimate_documents > 0 or config.ai_content_excerpt_mode == CONTENT_EXCERPT_MODE_SMART:
+        excerpt_stats = {
+            "mode": config.ai_content_excerpt_mode,
+            "max_tokens": config.ai_content_max_tokens,
+            "excerpts_built": classifier.excerpts_built + int(pool_payload.get("excerpts_built", 0)),
+            "excerpts_truncated": classifier.excerpts_truncated + int(pool_payload.get("excerpts_truncated", 0)),
+            "chars_omitted": classifier.excerpt_chars_omitted + int(pool_payload.get("excerpt_chars_omitted", 0)),
+            "documents": token_estimate_documents,
+            "estimated_prompt_tokens": token_estimate_estimated,
+            "actual_prompt_tokens": token_estimate_actual,
+            "actual_to_estimated_ratio": (
+                round(token_estimate_actual / token_estimate_estimated, 4) if token_estimate_estimated else 0.0
+            ),
+        }
+        LOGGER.info(
+            "Text-Auszug (%s): gekürzt=%s/%s | ausgelassene Zeichen=%s | Prompt-Tokens geschätzt=%s | "
+            "tatsächlich=%s | Faktor=%.2f",
+            excerpt_stats["mode"],
+            excerpt_stats["excerpts_truncated"],
+            excerpt_stats["excerpts_built"],
+            excerpt_stats["chars_omitted"],
+            excerpt_stats["estimated_prompt_tokens"],
+            excerpt_stats["actual_prompt_tokens"],
+            excerpt_stats["actual_to_estimated_ratio"],
+        )
+        pipeline_metrics["content_excerpt"] = excerpt_stats
+    if multi_document_batch_size > 1:
+        multi_stats = {
+            "batch_size": multi_document_batch_size,
+            "requests": classifier.multi_requests + int(pool_payload.get("multi_requests", 0)),
+            "documents": classifier.multi_documents + int(pool_payload.get("multi_documents", 0)),
+            "fallbacks": classifier.multi_fallbacks + int(pool_payload.get("multi_fallbacks", 0)),
+        }
+        LOGGER.info(
+            "Mehrfach-KI-Requests: Requests=%s | Dokumente=%s | Einzel-Fallbacks=%s",
+            multi_stats["requests"],
+            multi_stats["documents"],
+            multi_stats["fallbacks"],
+        )
+        pipeline_metrics["multi_document"] = multi_stats
+    if classification_cache is not None:
+        cache_stats = classification_cache.stats()
+        LOGGER.info(
+            "Klassifizierungs-Cache: Treffer=%s | Fehlschläge=%s | Trefferquote=%.1f %% | "
+            "neu gespeichert=%s | verdrängt=%s | Einträge=%s | eingesparte Tokens=%s",
+            cache_stats["hits"],
+            cache_stats["misses"],
+            cache_stats["hit_rate"] * 100.0,
+            cache_stats["stores"],
+            cache_stats["evictions"],
+            cache_stats["entries"],
+            cache_stats["saved_prompt_tokens"] + cache_stats["saved_completion_tokens"],
+        )
+        pipeline_metrics["classification_cache"] = cache_stats
+    if classifier.entity_shortlists:
+        shortlist_queries = classifier.entity_shortlist_queries + int(pool_payload.get("entity_shortlist_queries", 0))
+        shortlist_candidates = classifier.entity_shortlist_candidates + int(
+            pool_payload.get("entity_shortlist_candidates", 0)
+        )
+        shortlist_stats = {
+            "top_k": classifier.entity_shortlist_top_k,
+            "kinds": {key: len(index) for key, index in sorted(classifier.entity_shortlists.items())},
+            "documents": shortlist_queries,
+            "avg_candidates": round(shortlist_candidates / shortlist_queries, 2) if shortlist_queries else 0.0,
+        }
+        LOGGER.info(
+            "Entitäten-Vorauswahl: top_k=%s | Bestand=%s | Dokumente=%s | Ø Kandidaten=%.1f",
+            shortlist_stats["top_k"],
+            ", ".join(f"{key}={count}" for key, count in shortlist_stats["kinds"].items()),
+            shortlist_stats["documents"],
+            shortlist_stats["avg_candidates"],
+        )
+        pipeline_metrics["entity_shortlist"] = shortlist_stats
+    if classifier.rule_classifier is not None:
+        rule_totals = {
+            key: classifier.rule_counters[key] + int(pool_payload.get(f"rule_{key}", 0))
+            for key in RULE_COUNTER_KEYS
+        }
+        rule_stats = {
+            "rules": classifier.rule_classifier.rule_count,
+            "min_confidence": classifier.rule_classifier.min_confidence,
+            **rule_totals,
+            "bypass_rate": (
+                round(rule_totals["bypassed"] / rule_totals["checked"], 4) if rule_totals["checked"] else 0.0
+            ),
+        }
+        LOGGER.info(
+            "Regel-Vorklassifizierung: %s/%s Dokument(e) ohne KI (Bypass-Rate %.1f %%) | "
+            "fixierte Felder=%s in %s Dokument(en)",
+            rule_stats["bypassed"],
+            rule_stats["checked"],
+            rule_stats["bypass_rate"] * 100.0,
+            rule_stats["pinned_fields"],
+            rule_stats["pinned_documents"],
+        )
+        pipeline_metrics["rule_classifier"] = rule_stats
+    if neighbor_index is not None:
+        neighbor_stats: Dict[str, Any] = {**neighbor_index.stats(), "refresh": neighbor_refresh}
+        neighbor_stats["bypassed"] = 0 if config.dry_run else neighbor_stats["confident"]
+        LOGGER.info(
+            "Nachbar-Klassifizierung: Einträge=%s | Anfragen=%s | übereinstimmend=%s (%.1f %%) | ohne KI=%s",
+            neighbor_stats["entries"],
+            neighbor_stats["queries"],
+            neighbor_stats["confident"],
+            neighbor_stats["confident_rate"] * 100.0,
+            neighbor_stats["bypassed"],
+        )
+        evaluated = neighbor_evaluation["evaluated"]
+        if evaluated:
+            neighbor_stats["evaluation"] = {
+                "evaluated": evaluated,
+                "precision": {
+                    key: round(neighbor_evaluation[key] / evaluated, 4)
+                    for key in (*NEIGHBOR_FIELDS, "all_fields")
+                },
+            }
+            LOGGER.info(
+                "Nachbar-Klassifizierung (Dry-Run): Präzision gegen KI bei %s Dokument(en): alle Felder=%.1f %% | %s",
+                evaluated,
+                neighbor_stats["evaluation"]["precision"]["all_fields"] * 100.0,
+                " | ".join(
+                    f"{key}={neighbor_stats['evaluation']['precision'][key] * 100.0:.1f} %" for key in NEIGHBOR_FIELDS
+                ),
+            )
+        pipeline_metrics["neighbor_classifier"] = neighbor_stats
+    if near_duplicate_index is not None:
+        near_duplicate_stats: Dict[str, Any] = {
+            **near_duplicate_index.stats(),
+            "refresh": near_duplicate_refresh,
+            **near_duplicate_counts,
+        }
+        LOGGER.info(
+            "Beinahe-Dubletten-Gate: Einträge=%s | geprüft=%s | Treffer=%s (%.1f %%) | übernommen=%s | übersprungen=%s",
+            near_duplicate_stats["entries"],
+            near_duplicate_stats["lookups"],
+            near_duplicate_stats["hits"],
+            near_duplicate_stats["hit_rate"] * 100.0,
+            near_duplicate_stats["applied"],
+            near_duplicate_stats["skipped"],
+        )
+        pipeline_metrics["near_duplicate_gate"] = near_duplicate_stats
+    if note_index is not None:
+        note_stats = note_index.stats()
+        LOGGER.info(
+            "Notiz-Index: Einträge=%s | ohne Notiz-Abfrage=%s | abgefragt=%s (davon geändert=%s) | Trefferquote=%.1f %%",
+            note_stats["entries"],
+            note_stats["hits"],
+            note_stats["misses"],
+            note_stats["stale"],
+            float(note_stats["hit_rate"]) * 100.0,
+        )
+        pipeline_metrics["note_index"] = note_stats
+    if projected_listing:
+        LOGGER.info(
+            "Dokumentliste ohne Inhalt: gelistet=%s | Inhalt nachgeladen=%s (davon vorab=%s) | Fehler=%s",
+            listing_stats["listed"],
+            listing_stats["hydrated"],
+            listing_stats["hydrated_ahead"],
+            listing_stats["hydrate_errors"],
+        )
+        pipeline_metrics["document_listing"] = listing_stats
+    if config.paperless_prefetch_pages > 0:
+        prefetch_stats: Dict[str, Any] = {"pages_ahead": config.paperless_prefetch_pages}
+        for prefetch_client in prefetch_clients:
+            for key, value in prefetch_client.prefetch_stats.items():
+                prefetch_stats[key] = prefetch_stats.get(key, 0) + value
+        prefetch_stats["wait_seconds"] = round(float(prefetch_stats.get("wait_seconds", 0.0)), 3)
+        LOGGER.info(
+            "Seiten-Vorabruf: Listen=%s | Seiten=%s | davon abgewartet=%s (%.2f s) | Übergaben nach Stop=%s",
+            prefetch_stats["listings"],
+            prefetch_stats["pages"],
+            prefetch_stats["waits"],
+            prefetch_stats["wait_seconds"],
+            prefetch_stats["handoffs"],
+        )
+        pipeline_metrics["page_prefetch"] = prefetch_stats
+    transport_stats = paperless_transport.stats()
+    LOGGER.info(
+        "Paperless-HTTP: Requests=%s | neue Verbindungen=%s | wiederverwendet=%s | Fehler=%s | Pool=%s",
+        transport_stats["requests"],
+        transport_stats["opened"],
+        transport_stats["reused"],
+        transport_stats["failed"],
+        transport_stats["pool_maxsize"],
+    )
+    pipeline_metrics["http_transport"] = transport_stats
+    if delta_sync is not None:
+        delta_stats = delta_sync.stats()
+        LOGGER.info(
+            "Delta-Sync: gelistet=%s | Grenz-Dubletten=%s | Wiederholungen=%s | neue Fehler=%s | Wasserzeichen=%s",
+            delta_stats["listed"],
+            delta_stats["boundary_skipped"],
+            delta_stats["retry_ids"],
+            delta_stats["failed"],
+            delta_stats["watermark_after"] or "-",
+        )
+        pipeline_metrics["delta_sync"] = delta_stats
+    if checksum_index is not None:
+        checksum_stats: Dict[str, Any] = {
+            "mode": config.precheck_duplicate_lookup_mode,
+            **checksum_index.stats(),
+            "scan": checksum_scan,
+        }
+        LOGGER.info(
+            "Checksum-Index: Modus=%s | Einträge=%s | lokale Dubletten-Prüfungen=%s | Treffer=%s | "
+            "Paperless-Abfragen bei Fehlschlag=%s",
+            checksum_stats["mode"],
+            checksum_stats["entries"],
+            checksum_stats["lookups"],
+            checksum_stats["hits"],
+            checksum_stats["query_fallbacks"],
+        )
+        pipeline_metrics["checksum_index"] = checksum_stats
+    if config.enable_ai_cascade:
+        cascade_totals = {
+            key: classifier.cascade_counters[key] + pool_payload.get(f"cascade_{key}", 0)
+            for key in CASCADE_COUNTER_KEYS
+        }
+        local_requests = int(cascade_totals["local_requests"])
+        main_requests = int(cascade_totals["main_requests"])
+        local_cost_eur = (
+            cascade_totals["local_prompt_tokens"] / 1000.0 * config.cascade_input_cost_per_1k_tokens_eur
+            + cascade_totals["local_completion_tokens"] / 1000.0 * config.cascade_output_cost_per_1k_tokens_eur
+        )
+        main_cost_eur = calculate_usage_cost_eur(
+            config,
+            prompt_tokens=int(cascade_totals["main_prompt_tokens"]),
+            completion_tokens=int(cascade_totals["main_completion_tokens"]),
+            cached_prompt_tokens=int(cascade_totals["main_cached_prompt_tokens"]),
+        )
+        cascade_stats = {
+            "local": {
+                "model": config.cascade_ai_model,
+                "requests": local_requests,
+                "accepted": int(cascade_totals["local_accepted"]),
+                "hit_rate": round(cascade_totals["local_accepted"] / local_requests, 4) if local_requests else 0.0,
+                "avg_latency_seconds": (
+                    round(cascade_totals["local_seconds"] / local_requests, 3) if local_requests else 0.0
+                ),
+                "prompt_tokens": int(cascade_totals["local_prompt_tokens"]),
+                "completion_tokens": int(cascade_totals["local_completion_tokens"]),
+                "cost_eur": round(local_cost_eur, 6),
+            },
+            "main": {
+                "model": config.ai_model,
+                "requests": main_requests,
+                "avg_latency_seconds": (
+                    round(cascade_totals["main_seconds"] / main_requests, 3) if main_requests else 0.0
+                ),
+                "prompt_tokens": int(cascade_totals["main_prompt_tokens"]),
+                "completion_tokens": int(cascade_totals["main_completion_tokens"]),
+                "cost_eur": round(main_cost_eur, 6),
+            },
+            "escalations": {
+                reason: int(cascade_totals[f"escalated_{reason}"]) for reason in CASCADE_ESCALATION_REASONS
+            },
+        }
+        LOGGER.info(
+            "KI-Kaskade: klein=%s/%s übernommen (%.1f %%, Ø %.2fs, %.4f EUR) | Hauptmodell=%s (Ø %.2fs, %.4f EUR) | "
+            "Eskalationen=%s",
+            cascade_stats["local"]["accepted"],
+            local_requests,
+            cascade_stats["local"]["hit_rate"] * 100.0,
+            cascade_stats["local"]["avg_latency_seconds"],
+            local_cost_eur,
+            main_requests,
+            cascade_stats["main"]["avg_latency_seconds"],
+            main_cost_eur,
+            ", ".join(f"{reason}={count}" for reason, count in cascade_stats["escalations"].items()),
+        )
+        pipeline_metrics["cascade"] = cascade_stats
+    if rate_limiter is not None:
+        limiter_stats = rate_limiter.stats()
+        LOGGER.info(
+            "KI-Rate-Limiter: Requests=%s | gebremst=%s | Wartezeit=%.1fs | Header-Updates=%s | "
+            "HTTP 429=%s | TPM=%s | RPM=%s",
+            limiter_stats["requests"],
+            limiter_stats["throttled_requests"],
+            limiter_stats["wait_seconds"],
+            limiter_stats["header_updates"],
+            limiter_stats["provider_429"],
+            limiter_stats["tokens_per_minute"],
+            limiter_stats["requests_per_minute"],
+        )
+        pipeline_metrics["rate_limiter"] = limiter_stats
+    if hedger is not None:
+        # Noch laufende Verlierer kurz abwarten, damit ihre Tokens in Lauf-Kosten und Metriken landen.
+        pending_discards = hedger.wait_for_discarded()
+        if pending_discards:
+            LOGGER.warning(
+                "KI-Hedging: %s verworfene Anfrage(n) nach Wartezeit noch offen; ihre Tokens fehlen in den Laufkosten.",
+                pending_discards,
+            )
+        _collect_hedge_usage()
+        hedge_stats = hedger.stats()
+        # Wie in den Lauf-Tokens und -Kosten gezählt.
+        hedge_stats.update({f"duplicate_{key}": value for key, value in hedge_usage_counted.items()})
+        hedge_stats["duplicate_cost_eur"] = round(hedge_cost_eur, 6)
+        LOGGER.info(
+            "KI-Hedging: Requests=%s | Duplikate=%s (%.1f %%) | Duplikat gewann=%s | Original gewann=%s | "
+            "Budget-Stopps=%s | Verzögerung=%ss | Duplikat-Tokens=%s/%s (%.4f EUR)",
+            hedge_stats["requests"],
+            hedge_stats["fired"],
+            hedge_stats["fire_rate"] * 100.0,
+            hedge_stats["hedge_wins"],
+            hedge_stats["primary_wins_after_fire"],
+            hedge_stats["budget_skips"],
+            hedge_stats["hedge_delay_seconds"],
+            hedge_stats["duplicate_prompt_tokens"],
+            hedge_stats["duplicate_completion_tokens"],
+            hedge_stats["duplicate_cost_eur"],
+        )
+        pipeline_metrics["hedging"] = hedge_stats
+    if endpoint_pool is not None:
+        endpoint_stats = endpoint_pool.stats()
+        for endpoint_entry in endpoint_stats["endpoints"]:
+            LOGGER.info(
+                "KI-Endpoint %s (%s): Requests=%s | ok=%s | Fehler=%s (429/Quota=%s) | Failover=%s | "
+                "Circuit=%s (%sx geöffnet) | Ø Latenz=%ss | Fehlerquote=%.1f %%",
+                endpoint_entry["name"],
+                endpoint_entry["model"],
+                endpoint_entry["requests"],
+                endpoint_entry["successes"],
+                endpoint_entry["failures"],
+                endpoint_entry["pause_errors"],
+                endpoint_entry["failovers"],
+                endpoint_entry["state"],
+                endpoint_entry["circuit_opens"],
+                endpoint_entry["latency_ewma_seconds"],
+                endpoint_entry["error_rate_ewma"] * 100.0,
+            )
+        pipeline_metrics["ai_endpoints"] = endpoint_stats
+    _close_ai_workers()
 
     if prefilt_ki_tagged > 0:
         LOGGER.info(
@@ -6932,7 +10230,7 @@ def process_documents(
             "SecondBrain-Feldern wurden ohne neuen KI-Aufruf ausgeschlossen.",
             prefilt_secondbrain_ready,
         )
-    if perf_ai_batches > 0:
+    if perf_ai_docs > 0:
         LOGGER.info(
             "Performance: KI-Batches=%s | KI-Dokumente=%s | KI-Zeit=%.2fs | "
             "Ø KI-Zeit/Dokument=%.3fs | Apply-Zeit=%.2fs",
@@ -6960,6 +10258,16 @@ def process_documents(
                 "Tax Enrichment aktiv, aber keine Exportdateien geschrieben "
                 "(keine Dokumente fuer die konfigurierten Steuerjahre gefunden)."
             )
+        _collect_tax_usage()
+        if tax_usage_counted.get("requests", 0) > 0:
+            LOGGER.info(
+                "Tax-KI Tokens: Anfragen=%s | Prompt=%s (davon gecacht=%s) | Antwort=%s | Kosten=%.6f EUR",
+                tax_usage_counted["requests"],
+                tax_usage_counted["prompt_tokens"],
+                tax_usage_counted["cached_prompt_tokens"],
+                tax_usage_counted["completion_tokens"],
+                tax_cost_eur,
+            )
         if tax_enrichment_errors > 0:
             LOGGER.warning(
                 "Tax Enrichment: %s Dokument(e) konnten nicht angereichert werden.",
@@ -6971,6 +10279,7 @@ def process_documents(
     existing_metrics = load_metrics(metrics_path)
     totals = existing_metrics.get("totals") or {}
     new_totals_prompt = int(totals.get("prompt_tokens", 0) or 0) + run_prompt_tokens
+    new_totals_cached_prompt = int(totals.get("cached_prompt_tokens", 0) or 0) + run_cached_prompt_tokens
     new_totals_completion = int(totals.get("completion_tokens", 0) or 0) + run_completion_tokens
     new_totals_tokens = int(totals.get("total_tokens", 0) or 0) + run_total_tokens
     new_totals_cost = float(totals.get("cost_eur", 0.0) or 0.0) + run_cost_eur
@@ -6980,15 +10289,23 @@ def process_documents(
     metrics_payload = {
         "last_run": {
             "prompt_tokens": run_prompt_tokens,
+            "cached_prompt_tokens": run_cached_prompt_tokens,
             "completion_tokens": run_completion_tokens,
             "total_tokens": run_total_tokens,
             "cost_eur": round(run_cost_eur, 6),
             "bypass_skipped": bypass_skipped,
             "finished_at": dt.datetime.now(dt.timezone.utc).isoformat(),
             "model": config.ai_model,
+            "performance": {
+                "ai_documents": perf_ai_docs,
+                "ai_seconds": round(perf_ai_seconds, 6),
+                "apply_seconds": round(perf_apply_seconds, 6),
+                "pipeline": pipeline_metrics,
+            },
         },
         "totals": {
             "prompt_tokens": new_totals_prompt,
+            "cached_prompt_tokens": new_totals_cached_prompt,
             "completion_tokens": new_totals_completion,
             "total_tokens": new_totals_tokens,
             "cost_eur": round(new_totals_cost, 6),
@@ -6996,6 +10313,12 @@ def process_documents(
             "runs": new_totals_runs,
         },
     }
+    if tax_usage_counted.get("requests", 0) > 0:
+        # Anteil der Tax-KI; bereits in den Lauf-Tokens und -Kosten enthalten.
+        metrics_payload["last_run"]["tax_enrichment"] = {
+            **tax_usage_counted,
+            "cost_eur": round(tax_cost_eur, 6),
+        }
     save_metrics(metrics_path, metrics_payload)
     LOGGER.info(
         "Kosten/Token: Letzter Lauf=%s Tokens, %.6f EUR | Gesamt=%s Tokens, %.6f EUR",
@@ -7004,6 +10327,14 @@ def process_documents(
         new_totals_tokens,
         new_totals_cost,
     )
+    if run_prompt_tokens > 0:
+        LOGGER.info(
+            "Prompt-Cache: %s von %s Prompt-Tokens vom Provider gecacht (%.1f %%, Layout=%s)",
+            run_cached_prompt_tokens,
+            run_prompt_tokens,
+            100.0 * run_cached_prompt_tokens / run_prompt_tokens,
+            config.ai_prompt_layout,
+        )
     LOGGER.info(
         "Fertig. Gescannt=%s, Aktualisiert=%s, Übersprungen=%s, Fehler=%s, Bypass=%s, BypassSkip=%s",
         scanned,
@@ -7029,6 +10360,9 @@ def process_documents(
         "progress",
         **_progress_payload(status="success"),
     )
+    if delta_sync is not None and not config.dry_run:
+        # Nur nach erfolgreichem Lauf: pausierte Läufe setzen beim alten Stand fort.
+        save_json_file(delta_sync_path, delta_sync.to_state(quarantined_ids=failed_docs_until.keys()))
     delete_runtime_file(run_state_path)
     delete_runtime_file(stop_request_path)
 
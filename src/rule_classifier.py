@@ -0,0 +1,260 @@
+"""Local deterministic pre-classifier compiled from `basis_config` rules.
+
+Purpose:
+- `basis_config.classification_rules` and `identifiers.meters` used to be
+  pasted into the prompt only, so the model re-derived the same fields for
+  every document.
+- The rules are compiled once into plain substring matchers. A document
+  whose document type, correspondent and storage path are all resolved with
+  high confidence skips the AI call; partially resolved fields are pinned
+  (sent as `pinned_fields` and enforced on the AI answer).
+
+Input / Output:
+- Input: `basis_config` once, then title + content per document.
+- Output: `RuleMatch` with the confident fields, their confidence, the rules
+  that fired and whether the match is complete.
+
+Compiled rules:
+- `classification_rules.document_type.legal_documents_force_type`
+  (`type`, `trigger_terms`): one term gives 0.75, two different terms 0.95.
+- `classification_rules.correspondent.normalize[]`
+  (`if_contains_any`, `set_to`): a term in the title or two different terms
+  give 0.9, a single term in the content 0.8.
+- `identifiers.meters[]` (`number` plus optional `correspondent`,
+  `document_type`, `storage_path`): number found in the text gives 0.97.
+- `classification_rules.storage_path.mappings[]` (`set_to` plus at least
+  one of `if_contains_any`, `if_document_type`, `if_correspondent`): the
+  lowest confidence of its conditions; field conditions compare against the
+  values resolved above.
+
+Important invariants:
+- Matching is case- and umlaut-insensitive (`entity_shortlist.normalize_text`)
+  and deterministic; nothing here talks to the AI provider.
+- Rules that disagree on a field cancel each other out: an ambiguous field
+  is neither pinned nor used for a bypass.
+- Only fields with confidence >= `min_confidence` are returned.
+
+How to debug:
+- Run `python3 -m unittest tests.test_rule_classifier`.
+- Check `last_run.performance.pipeline.rule_classifier` in `run_metrics.json`
+  and `_meta_rule_classifier` on single predictions.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+import re
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from entity_shortlist import normalize_text
+
+
+RULE_FIELDS = ("document_type", "correspondent", "storage_path")
+RULE_COUNTER_KEYS = ("checked", "bypassed", "pinned_documents", "pinned_fields")
+MIN_METER_NUMBER_LENGTH = 5
+_COMPACT_RE = re.compile(r"\s+")
+
+
+@dataclass
+class RuleMatch:
+    """Confident fields of one document and the rules behind them."""
+
+    fields: Dict[str, str] = field(default_factory=dict)
+    confidence: Dict[str, float] = field(default_factory=dict)
+    reasons: List[str] = field(default_factory=list)
+
+    @property
+    def complete(self) -> bool:
+        return all(key in self.fields for key in RULE_FIELDS)
+
+    @property
+    def min_confidence(self) -> float:
+        return min(self.confidence.values()) if self.confidence else 0.0
+
+
+@dataclass
+class _TermRule:
+    target: str
+    value: str
+    terms: Tuple[str, ...]
+    name: str
+
+
+@dataclass
+class _StorageMapping:
+    value: str
+    terms: Tuple[str, ...]
+    document_types: Tuple[str, ...]
+    correspondents: Tuple[str, ...]
+    name: str
+
+
+def _as_list(value: Any) -> List[str]:
+    if isinstance(value, str):
+        value = [value]
+    if not isinstance(value, (list, tuple)):
+        return []
+    return [str(item).strip() for item in value if str(item or "").strip()]
+
+
+def _terms(value: Any) -> Tuple[str, ...]:
+    normalized = {normalize_text(term) for term in _as_list(value)}
+    return tuple(sorted(term for term in normalized if term))
+
+
+def _casefold_all(value: Any) -> Tuple[str, ...]:
+    return tuple(sorted({item.casefold() for item in _as_list(value)}))
+
+
+class RuleClassifier:
+    """Compiled `basis_config` rules; immutable and safe to share across threads."""
+
+    def __init__(self, basis_config: Dict[str, Any], *, min_confidence: float = 0.9) -> None:
+        self.min_confidence = min(1.0, max(0.0, float(min_confidence)))
+        rules = basis_config.get("classification_rules") if isinstance(basis_config, dict) else None
+        rules = rules if isinstance(rules, dict) else {}
+        self.term_rules: List[_TermRule] = []
+        self.meters: List[Tuple[str, Dict[str, str], str]] = []
+        self.storage_mappings: List[_StorageMapping] = []
+
+        document_type_rules = rules.get("document_type") if isinstance(rules.get("document_type"), dict) else {}
+        legal = document_type_rules.get("legal_documents_force_type")
+        if isinstance(legal, dict) and str(legal.get("type") or "").strip():
+            terms = _terms(legal.get("trigger_terms"))
+            if terms:
+                self.term_rules.append(
+                    _TermRule("document_type", str(legal["type"]).strip(), terms, "legal_documents_force_type")
+                )
+
+        correspondent_rules = rules.get("correspondent") if isinstance(rules.get("correspondent"), dict) else {}
+        for index, entry in enumerate(correspondent_rules.get("normalize") or []):
+            if not isinstance(entry, dict) or not str(entry.get("set_to") or "").strip():
+                continue
+            terms = _terms(entry.get("if_contains_any"))
+            if terms:
+                self.term_rules.append(
+                    _TermRule("correspondent", str(entry["set_to"]).strip(), terms, f"correspondent.normalize[{index}]")
+                )
+
+        identifiers = basis_config.get("identifiers") if isinstance(basis_config, dict) else None
+        meters = identifiers.get("meters") if isinstance(identifiers, dict) else None
+        for index, entry in enumerate(meters or []):
+            if not isinstance(entry, dict):
+                continue
+            number = self._compact(normalize_text(str(entry.get("number") or "")))
+            targets = {key: str(entry[key]).strip() for key in RULE_FIELDS if str(entry.get(key) or "").strip()}
+            if len(number) >= MIN_METER_NUMBER_LENGTH and targets:
+                self.meters.append((number, targets, f"identifiers.meters[{index}]"))
+
+        storage_rules = rules.get("storage_path") if isinstance(rules.get("storage_path"), dict) else {}
+        for index, entry in enumerate(storage_rules.get("mappings") or []):
+            if not isinstance(entry, dict) or not str(entry.get("set_to") or "").strip():
+                continue
+            mapping = _StorageMapping(
+                value=str(entry["set_to"]).strip(),
+                terms=_terms(entry.get("if_contains_any")),
+                document_types=_casefold_all(entry.get("if_document_type")),
+                correspondents=_casefold_all(entry.get("if_correspondent")),
+                name=f"storage_path.mappings[{index}]",
+            )
+            if mapping.terms or mapping.document_types or mapping.correspondents:
+                self.storage_mappings.append(mapping)
+
+    @property
+    def rule_count(self) -> int:
+        return len(self.term_rules) + len(self.meters) + len(self.storage_mappings)
+
+    @staticmethod
+    def _compact(normalized: str) -> str:
+        return _COMPACT_RE.sub("", normalized)
+
+    @staticmethod
+    def _hits(terms: Iterable[str], text: str) -> List[str]:
+        # Teilwort-Treffer sind gewollt: "gericht" trifft auch "Amtsgericht".
+        return [term for term in terms if term in text]
+
+    def _term_confidence(self, rule: _TermRule, title: str, text: str) -> Tuple[float, List[str]]:
+        hits = self._hits(rule.terms, text)
+        if not hits:
+            return 0.0, []
+        if rule.target == "document_type":
+            return (0.95 if len(hits) >= 2 else 0.75), hits
+        title_hit = bool(self._hits(rule.terms, title))
+        return (0.9 if title_hit or len(hits) >= 2 else 0.8), hits
+
+    def match(self, document: Dict[str, Any]) -> RuleMatch:
+        """Runs all compiled rules against title and full content."""
+
+        title = f" {normalize_text(str(document.get('title') or ''))} "
+        content = normalize_text(str(document.get("content") or ""))
+        text = f"{title}{content} "
+        candidates: Dict[str, List[Tuple[str, float, str]]] = {key: [] for key in RULE_FIELDS}
+
+        for rule in self.term_rules:
+            confidence, hits = self._term_confidence(rule, title, text)
+            if confidence:
+                candidates[rule.target].append((rule.value, confidence, f"{rule.name}: {', '.join(hits)}"))
+
+        if self.meters:
+            compact = self._compact(text)
+            for number, targets, name in self.meters:
+                if number in compact:
+                    for key, value in targets.items():
+                        candidates[key].append((value, 0.97, f"{name}: {number}"))
+
+        result = RuleMatch()
+        resolved: Dict[str, Tuple[str, float]] = {}
+        for key in ("document_type", "correspondent"):
+            self._resolve(key, candidates[key], resolved, result)
+        for mapping in self.storage_mappings:
+            confidence = self._mapping_confidence(mapping, title, text, resolved)
+            if confidence:
+                candidates["storage_path"].append((mapping.value, confidence, mapping.name))
+        self._resolve("storage_path", candidates["storage_path"], resolved, result)
+
+        for key, (value, confidence) in resolved.items():
+            if confidence >= self.min_confidence:
+                result.fields[key] = value
+                result.confidence[key] = confidence
+        return result
+
+    @staticmethod
+    def _resolve(
+        key: str,
+        candidates: List[Tuple[str, float, str]],
+        resolved: Dict[str, Tuple[str, float]],
+        result: RuleMatch,
+    ) -> None:
+        if not candidates:
+            return
+        values = {value.casefold() for value, _confidence, _reason in candidates}
+        if len(values) > 1:
+            result.reasons.append(f"{key}: widersprüchliche Regeln ({', '.join(sorted(values))})")
+            return
+        best = max(candidates, key=lambda candidate: candidate[1])
+        resolved[key] = (best[0], best[1])
+        result.reasons.extend(f"{key}={value} <- {reason}" for value, _confidence, reason in candidates)
+
+    def _mapping_confidence(
+        self,
+        mapping: _StorageMapping,
+        title: str,
+        text: str,
+        resolved: Dict[str, Tuple[str, float]],
+    ) -> float:
+        confidences: List[float] = []
+        if mapping.terms:
+            confidence, _hits = self._term_confidence(
+                _TermRule("storage_path", mapping.value, mapping.terms, mapping.name), title, text
+            )
+            if not confidence:
+                return 0.0
+            confidences.append(confidence)
+        for key, allowed in (("document_type", mapping.document_types), ("correspondent", mapping.correspondents)):
+            if not allowed:
+                continue
+            value: Optional[Tuple[str, float]] = resolved.get(key)
+            if value is None or value[0].casefold() not in allowed:
+                return 0.0
+            confidences.append(value[1])
+        return min(confidences)
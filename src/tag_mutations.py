@@ -0,0 +1,203 @@
+"""Write-behind buffer for tag markings via Paperless `bulk_edit`.
+
+Purpose:
+- Status markings (`KI_SKIP`, `KI_SKIP_PRECHECK`, `KI_FEHLER`, removing
+  `#NEU`, quarantine, tax tags) cost one `PATCH /api/documents/{id}/` per
+  document. Maintenance runs that skip most documents spend a large part
+  of their Paperless time on these PATCHes.
+- The buffer collects markings and writes documents that share the same
+  change (tags to add, tags to remove) with one
+  `POST /api/documents/bulk_edit/` (`modify_tags`) per chunk.
+
+Input / Output:
+- Input: `add(document_id, current_tags, new_tags, on_error=...)` with the
+  tag ids as listed and as they should be; `flush()` writes everything.
+  A group is written as soon as it holds `batch_size` documents, all groups
+  once `MAX_PENDING_BATCHES * batch_size` documents are pending.
+- Output: bulk edits (or per-document PATCHes as fallback) and `stats()`.
+
+Important invariants:
+- `modify_tags` adds and removes relative to the current server state; the
+  fallback PATCH writes the full tag list computed at `add` time, exactly
+  like the unbuffered markings did.
+- A second marking of the same document before a flush is merged into the
+  first one (as two relative edits), so the later marking wins for tags
+  both touch.
+- When a bulk edit fails, every document of the chunk is retried with its
+  own PATCH; only if that fails too the `on_error` callback runs.
+- `pending_ids()` lists documents whose marking is not written yet; the run
+  state must not report them as completed before the next flush.
+
+How to debug:
+- Run `python3 -m unittest tests.test_tag_mutations`.
+- Check `last_run.performance.pipeline.tag_mutations` in `run_metrics.json`.
+"""
+
+from __future__ import annotations
+
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+
+LOGGER = logging.getLogger("paperless_ai_sorter")
+
+BULK_EDIT_PATH = "/api/documents/bulk_edit/"
+DEFAULT_BATCH_SIZE = 50
+# Obergrenze gepufferter Dokumente über alle Gruppen, in Vielfachen von `batch_size`.
+MAX_PENDING_BATCHES = 4
+
+ErrorCallback = Callable[[Exception], None]
+
+
+@dataclass
+class _Mutation:
+    document_id: int
+    add: Set[int]
+    remove: Set[int]
+    # Vollständige Tag-Liste für den PATCH-Fallback.
+    fallback_tags: List[int]
+    on_error: List[ErrorCallback] = field(default_factory=list)
+
+    def key(self) -> Tuple[FrozenSet[int], FrozenSet[int]]:
+        return frozenset(self.add), frozenset(self.remove)
+
+
+class TagMutationBuffer:
+    """Groups tag markings by change and writes them in `modify_tags` chunks."""
+
+    def __init__(
+        self,
+        client: Any,
+        *,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        request_error: type = Exception,
+    ) -> None:
+        self.client = client
+        self.batch_size = max(1, int(batch_size))
+        # Fehlertyp, den `client._request` wirft (PaperlessApiError).
+        self.request_error = request_error
+        self._pending: Dict[int, _Mutation] = {}
+        self.enqueued = 0
+        self.merged = 0
+        self.bulk_requests = 0
+        self.bulk_documents = 0
+        self.bulk_failures = 0
+        self.fallback_patches = 0
+        self.failed = 0
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def pending_ids(self) -> Set[int]:
+        return set(self._pending)
+
+    def add(
+        self,
+        document_id: int,
+        current_tags: Iterable[int],
+        new_tags: Iterable[int],
+        *,
+        on_error: Optional[ErrorCallback] = None,
+    ) -> None:
+        """Buffers the change from `current_tags` to `new_tags`; flushes at `batch_size`."""
+
+        current = {int(tag_id) for tag_id in current_tags}
+        desired = {int(tag_id) for tag_id in new_tags}
+        doc_id = int(document_id)
+        self.enqueued += 1
+        existing = self._pending.get(doc_id)
+        if existing is not None:
+            self.merged += 1
+            add, remove = desired - current, current - desired
+            existing.add = (existing.add - remove) | add
+            existing.remove = (existing.remove - add) | remove
+            existing.fallback_tags = sorted((set(existing.fallback_tags) - remove) | add)
+            if on_error is not None:
+                existing.on_error.append(on_error)
+            if not existing.add and not existing.remove:
+                del self._pending[doc_id]
+            return
+        if desired == current:
+            return
+        self._pending[doc_id] = _Mutation(
+            document_id=doc_id,
+            add=desired - current,
+            remove=current - desired,
+            fallback_tags=sorted(desired),
+            on_error=[on_error] if on_error is not None else [],
+        )
+        key = self._pending[doc_id].key()
+        group = [mutation for mutation in self._pending.values() if mutation.key() == key]
+        if len(group) >= self.batch_size:
+            self._flush_group(group)
+        elif len(self._pending) >= self.batch_size * MAX_PENDING_BATCHES:
+            self.flush()
+
+    def flush(self) -> None:
+        """Writes all buffered markings; never raises for Paperless errors."""
+
+        groups: Dict[Tuple[FrozenSet[int], FrozenSet[int]], List[_Mutation]] = {}
+        for mutation in self._pending.values():
+            groups.setdefault(mutation.key(), []).append(mutation)
+        for mutations in groups.values():
+            self._flush_group(mutations)
+
+    def _flush_group(self, mutations: List[_Mutation]) -> None:
+        for mutation in mutations:
+            self._pending.pop(mutation.document_id, None)
+        add, remove = mutations[0].key()
+        for start in range(0, len(mutations), self.batch_size):
+            self._write_chunk(sorted(add), sorted(remove), mutations[start : start + self.batch_size])
+
+    def _write_chunk(self, add: List[int], remove: List[int], mutations: List[_Mutation]) -> None:
+        document_ids = [mutation.document_id for mutation in mutations]
+        try:
+            self.client._request(
+                "POST",
+                BULK_EDIT_PATH,
+                payload={
+                    "documents": document_ids,
+                    "method": "modify_tags",
+                    "parameters": {"add_tags": add, "remove_tags": remove},
+                },
+                retries=2,
+            )
+            self.bulk_requests += 1
+            self.bulk_documents += len(document_ids)
+            return
+        except self.request_error as exc:
+            self.bulk_failures += 1
+            LOGGER.warning(
+                "Bulk-Edit modify_tags für %s Dokumente fehlgeschlagen, schreibe einzeln per PATCH: %s",
+                len(document_ids),
+                exc,
+            )
+        for mutation in mutations:
+            try:
+                self.client._request(
+                    "PATCH",
+                    f"/api/documents/{mutation.document_id}/",
+                    payload={"tags": mutation.fallback_tags},
+                    retries=1,
+                )
+                self.fallback_patches += 1
+            except self.request_error as exc:
+                self.failed += 1
+                for callback in mutation.on_error:
+                    callback(exc)
+
+    def stats(self) -> Dict[str, Any]:
+        requests_sent = self.bulk_requests + self.bulk_failures + self.fallback_patches + self.failed
+        return {
+            "enqueued": self.enqueued,
+            "merged": self.merged,
+            "pending": len(self._pending),
+            "bulk_requests": self.bulk_requests,
+            "bulk_documents": self.bulk_documents,
+            "bulk_failures": self.bulk_failures,
+            "fallback_patches": self.fallback_patches,
+            "failed": self.failed,
+            "patches_saved": max(0, self.bulk_documents - self.bulk_requests),
+            "requests": requests_sent,
+        }
@@ -38,11 +38,17 @@ from typing import Any, Dict, Iterable, List, Optional
 
 import requests
 
+from ai_endpoints import PRIMARY_ENDPOINT_NAME, AiEndpoint, AiEndpointPool, AllEndpointsUnavailable
+from ai_rate_limiter import AiRateLimiter, RateLimitWaitTooLong
+from content_excerpt import build_excerpt, estimate_message_tokens
+
 
 LOGGER = logging.getLogger("paperless_ai_sorter")
 RETRY_AFTER_SECONDS_PATTERN = re.compile(r"Please try again in\s+([0-9]+(?:\.[0-9]+)?)s", re.IGNORECASE)
 SHORT_RATE_LIMIT_WAIT_SECONDS = 15.0
 DEFAULT_AUTO_RESUME_WAIT_SECONDS = 300.0
+PROMPT_LAYOUT_LEGACY = "legacy"
+PROMPT_LAYOUT_CACHE_FRIENDLY = "cache_friendly"
 
 TAX_ENRICHMENT_SCHEMA_VERSION = "tax_enrichment.v1"
 
@@ -279,6 +285,23 @@ def extract_retry_after_seconds(message: str, headers: Optional[Dict[str, Any]]
         return None
 
 
+def parse_cached_prompt_tokens(usage: Any) -> int:
+    """Reads provider-cached prompt tokens (OpenAI or DeepSeek usage format)."""
+
+    if not isinstance(usage, dict):
+        return 0
+    details = usage.get("prompt_tokens_details")
+    cached: Any = None
+    if isinstance(details, dict):
+        cached = details.get("cached_tokens")
+    if cached is None:
+        cached = usage.get("prompt_cache_hit_tokens")
+    try:
+        return max(0, int(cached or 0))
+    except (TypeError, ValueError):
+        return 0
+
+
 def normalize_iso_date(value: Any) -> Optional[str]:
     """Normalizes dates to YYYY-MM-DD or returns None."""
 
@@ -829,38 +852,78 @@ class TaxEnrichmentAiExtractor:
         request_timeout_seconds: int,
         basis_config: Optional[Dict[str, Any]] = None,
         personal_context: str = "",
+        prompt_layout: str = PROMPT_LAYOUT_LEGACY,
+        content_max_tokens: Optional[int] = None,
+        rate_limiter: Optional[AiRateLimiter] = None,
+        endpoint_pool: Optional[AiEndpointPool] = None,
     ) -> None:
         self.ai_model = ai_model
         self.ai_base_url = ai_base_url.rstrip("/")
         self.request_timeout_seconds = request_timeout_seconds
         self.basis_config = basis_config or {}
         self.personal_context = str(personal_context or "").strip()
+        self.prompt_layout = prompt_layout
+        # None keeps the fixed 8000-character cut; a number switches to a
+        # token-budget excerpt (head, keyword windows, tail).
+        self.content_max_tokens = content_max_tokens
+        self.rate_limiter = rate_limiter
+        # Shared with the classifier when the tax endpoint is the primary one;
+        # the primary endpoint keeps `ai_model`, others use their own model.
+        self.endpoint_pool = endpoint_pool
+        self._endpoint_sessions: Dict[str, requests.Session] = {}
         self.context = extract_household_context(self.basis_config)
-        self.session = requests.Session()
-        self.session.headers.update(
+        self._system_prompt: Optional[str] = None
+        # Token usage of all tax calls in this run. The sorter folds it into
+        # the run tokens and cost and reports it under `last_run.tax_enrichment`.
+        self.usage_totals: Dict[str, int] = {
+            "requests": 0,
+            "prompt_tokens": 0,
+            "cached_prompt_tokens": 0,
+            "completion_tokens": 0,
+            "estimated_prompt_tokens": 0,
+        }
+        self.session = self._build_session(ai_api_key)
+
+    @staticmethod
+    def _build_session(api_key: str) -> requests.Session:
+        session = requests.Session()
+        session.headers.update(
             {
-                "Authorization": f"Bearer {ai_api_key}",
+                "Authorization": f"Bearer {api_key}",
                 "Content-Type": "application/json",
                 "Accept": "application/json",
                 "User-Agent": "paperless-kiplus-tax/1.0",
             }
         )
+        return session
 
-    def extract(
-        self,
-        *,
-        document: Dict[str, Any],
-        classification_prediction: Dict[str, Any],
-    ) -> Dict[str, Any]:
-        """Calls an OpenAI-compatible endpoint for tax enrichment extraction."""
+    def close(self) -> None:
+        self.session.close()
+        sessions, self._endpoint_sessions = self._endpoint_sessions, {}
+        for session in sessions.values():
+            session.close()
+
+    def system_prompt(self) -> str:
+        """Returns the static system prompt, built once per extractor.
 
+        The prompt only depends on configuration. In `cache_friendly` layout
+        the taxonomy JSON uses sorted keys so the prefix stays byte-identical
+        across runs and processes.
+        """
+
+        if self._system_prompt is None:
+            self._system_prompt = self._build_system_prompt()
+        return self._system_prompt
+
+    def _build_system_prompt(self) -> str:
+        sort_keys = self.prompt_layout == PROMPT_LAYOUT_CACHE_FRIENDLY
         prompt = (
             "Du extrahierst steuerrelevante Hinweise fuer private deutsche Einkommensteuerfaelle. "
             "Antworte ausschliesslich als JSON. Keine Rechtsentscheidung, nur vorsichtige Vorschlaege "
             "mit Begruendung und Confidence. Nutze nur diese tax_category-Werte: "
             + ", ".join(TAXONOMY.keys())
             + ". Nutze nur bekannte tax_subcategory-Werte aus dieser Taxonomie: "
-            + json.dumps(TAXONOMY, ensure_ascii=False)
+            + json.dumps(TAXONOMY, ensure_ascii=False, sort_keys=sort_keys)
             + ". Verwende fuer evidence_type nur: "
             + ", ".join(sorted(VALID_EVIDENCE_TYPES))
             + ". Verwende fuer payment_method nur: "
@@ -880,11 +943,38 @@ class TaxEnrichmentAiExtractor:
                 + self.context["taxpayer_name"]
             )
         if self.context["children"]:
-            prompt += "\nBekannte Kinder/Hinweise: " + json.dumps(self.context["children"], ensure_ascii=False)
+            prompt += "\nBekannte Kinder/Hinweise: " + json.dumps(
+                self.context["children"],
+                ensure_ascii=False,
+                sort_keys=sort_keys,
+            )
         if self.personal_context:
             prompt += "\nZusätzlicher privater Steuerkontext (hoch priorisiert):\n" + self.personal_context
+        return prompt
 
-        content_preview = str(document.get("content") or "")[:8000]
+    def extract(
+        self,
+        *,
+        document: Dict[str, Any],
+        classification_prediction: Dict[str, Any],
+    ) -> Dict[str, Any]:
+        """Calls an OpenAI-compatible endpoint for tax enrichment extraction."""
+
+        prompt = self.system_prompt()
+        cache_friendly = self.prompt_layout == PROMPT_LAYOUT_CACHE_FRIENDLY
+        if cache_friendly:
+            # Internal keys such as `_meta_usage` change on every call and carry
+            # no information for the tax model.
+            classification_prediction = {
+                key: value
+                for key, value in classification_prediction.items()
+                if not str(key).startswith("_")
+            }
+        content = str(document.get("content") or "")
+        if self.content_max_tokens is None:
+            content_preview = content[:8000]
+        else:
+            content_preview = build_excerpt(content, self.content_max_tokens).text
         user_payload = {
             "title": document.get("title"),
             "created": document.get("created"),
@@ -896,28 +986,110 @@ class TaxEnrichmentAiExtractor:
             "response_format": {"type": "json_object"},
             "messages": [
                 {"role": "system", "content": prompt},
-                {"role": "user", "content": json.dumps(user_payload, ensure_ascii=False)},
+                {
+                    "role": "user",
+                    "content": json.dumps(user_payload, ensure_ascii=False, sort_keys=cache_friendly),
+                },
             ],
             "temperature": 0.1,
         }
+        estimated_prompt_tokens = estimate_message_tokens(req_body["messages"])
+        pool = self.endpoint_pool
+        if pool is None:
+            return self._post_extraction(
+                req_body,
+                estimated_prompt_tokens,
+                base_url=self.ai_base_url,
+                session=self.session,
+                limiter=self.rate_limiter,
+            )
 
-        max_attempts = 3
+        def send(endpoint: AiEndpoint, is_last: bool) -> Dict[str, Any]:
+            if endpoint.name == PRIMARY_ENDPOINT_NAME:
+                return self._post_extraction(
+                    req_body,
+                    estimated_prompt_tokens,
+                    base_url=self.ai_base_url,
+                    session=self.session,
+                    limiter=endpoint.rate_limiter,
+                    failover=not is_last,
+                )
+            session = self._endpoint_sessions.get(endpoint.name)
+            if session is None:
+                session = self._build_session(endpoint.api_key)
+                self._endpoint_sessions[endpoint.name] = session
+            return self._post_extraction(
+                dict(req_body, model=endpoint.model),
+                estimated_prompt_tokens,
+                base_url=endpoint.base_url,
+                session=session,
+                limiter=endpoint.rate_limiter,
+                failover=not is_last,
+            )
+
+        try:
+            return pool.call(send, pause_errors=(TaxPauseRequested,))
+        except AllEndpointsUnavailable as exc:
+            raise TaxPauseRequested(
+                f"Tax-KI: {exc}",
+                pause_reason="ai_endpoints_unavailable",
+                retry_after_seconds=exc.retry_after_seconds or DEFAULT_AUTO_RESUME_WAIT_SECONDS,
+            ) from exc
+
+    def _post_extraction(
+        self,
+        req_body: Dict[str, Any],
+        estimated_prompt_tokens: int,
+        *,
+        base_url: str,
+        session: requests.Session,
+        limiter: Optional[AiRateLimiter],
+        failover: bool = False,
+    ) -> Dict[str, Any]:
+        """Sends one extraction request with retries and pause detection.
+
+        With `failover=True` there are no retries and no short 429 waits; the
+        endpoint pool moves on to the next endpoint instead.
+        """
+
+        estimated_request_tokens = (
+            limiter.estimate_request_tokens(estimated_prompt_tokens, req_body) if limiter is not None else 0
+        )
+        max_attempts = 1 if failover else 3
         last_exc: Optional[Exception] = None
         for attempt in range(1, max_attempts + 1):
+            reserved = False
             try:
-                response = self.session.post(
-                    f"{self.ai_base_url}/chat/completions",
+                if limiter is not None:
+                    try:
+                        limiter.acquire(estimated_request_tokens)
+                    except RateLimitWaitTooLong as exc:
+                        raise TaxPauseRequested(
+                            f"Tax-KI: {exc}",
+                            pause_reason="rate_limit_wait",
+                            retry_after_seconds=exc.wait_seconds,
+                        ) from exc
+                    reserved = True
+                response = session.post(
+                    f"{base_url}/chat/completions",
                     data=json.dumps(req_body),
                     timeout=self.request_timeout_seconds,
                 )
+                if limiter is not None:
+                    limiter.update_from_headers(getattr(response, "headers", None))
                 if int(response.status_code) == 429:
                     response_text = response.text or ""
                     retry_after_seconds = extract_retry_after_seconds(
                         response_text,
                         getattr(response, "headers", None),
                     )
+                    if limiter is not None:
+                        limiter.penalize(retry_after_seconds)
+                    if reserved:
+                        limiter.release(estimated_request_tokens)
+                        reserved = False
                     normalized_text = response_text.lower()
-                    if retry_after_seconds and retry_after_seconds <= SHORT_RATE_LIMIT_WAIT_SECONDS:
+                    if not failover and retry_after_seconds and retry_after_seconds <= SHORT_RATE_LIMIT_WAIT_SECONDS:
                         LOGGER.warning(
                             "Tax-KI Rate Limit erreicht (Versuch %s/%s), warte %.2fs und versuche es erneut.",
                             attempt,
@@ -939,6 +1111,16 @@ class TaxEnrichmentAiExtractor:
                     )
                 response.raise_for_status()
                 payload = response.json()
+                usage = payload.get("usage") or {}
+                if isinstance(usage, dict):
+                    self.usage_totals["requests"] += 1
+                    self.usage_totals["prompt_tokens"] += int(usage.get("prompt_tokens", 0) or 0)
+                    self.usage_totals["completion_tokens"] += int(usage.get("completion_tokens", 0) or 0)
+                    self.usage_totals["cached_prompt_tokens"] += parse_cached_prompt_tokens(usage)
+                    self.usage_totals["estimated_prompt_tokens"] += estimated_prompt_tokens
+                    if limiter is not None:
+                        limiter.record_usage(estimated_request_tokens, int(usage.get("total_tokens", 0) or 0))
+                        reserved = False
                 content = payload["choices"][0]["message"]["content"]
                 parsed = json.loads(content)
                 if not isinstance(parsed, dict):
@@ -948,6 +1130,9 @@ class TaxEnrichmentAiExtractor:
                 raise
             except (requests.RequestException, KeyError, ValueError, json.JSONDecodeError) as exc:
                 last_exc = exc
+                if reserved:
+                    # Fehlversuch ohne Usage: Reservierung zurückgeben, sonst leert jeder Retry den geteilten Bucket.
+                    limiter.release(estimated_request_tokens)
                 if attempt < max_attempts and isinstance(exc, requests.RequestException):
                     wait_seconds = 0.7 * (2 ** (attempt - 1))
                     LOGGER.warning(
@@ -977,6 +1162,10 @@ class TaxEnrichmentService:
         request_timeout_seconds: int,
         basis_config: Optional[Dict[str, Any]] = None,
         personal_context: str = "",
+        prompt_layout: str = PROMPT_LAYOUT_LEGACY,
+        content_max_tokens: Optional[int] = None,
+        rate_limiter: Optional[AiRateLimiter] = None,
+        endpoint_pool: Optional[AiEndpointPool] = None,
     ) -> None:
         self.extractor = TaxEnrichmentAiExtractor(
             ai_model=ai_model,
@@ -985,6 +1174,10 @@ class TaxEnrichmentService:
             request_timeout_seconds=request_timeout_seconds,
             basis_config=basis_config,
             personal_context=personal_context,
+            prompt_layout=prompt_layout,
+            content_max_tokens=content_max_tokens,
+            rate_limiter=rate_limiter,
+            endpoint_pool=endpoint_pool,
         )
         self.processor = TaxEnrichmentProcessor(basis_config=basis_config)
 
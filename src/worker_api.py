@@ -55,6 +55,7 @@ from entity_review import (
     review_rules_from_store,
     upsert_review_rule,
 )
+from http_transport import HttpTransport
 from paperless_ai_sorter import (
     RUN_PAUSE_EXIT_CODE,
     RUN_STATE_FILE_DEFAULT,
@@ -62,7 +63,9 @@ from paperless_ai_sorter import (
     ConfigError,
     PaperlessApiError,
     PaperlessClient,
+    build_paperless_transport,
     load_config,
+    paperless_http_pool_size,
 )
 
 LOGGER = logging.getLogger("paperless_worker")
@@ -1097,6 +1100,8 @@ class WorkerManager:
         self.force_stop_timer: threading.Timer | None = None
         self.log_lines: list[str] = []
         self.latest_runtime_payload: dict[str, Any] = {}
+        # Ein Verbindungs-Pool für alle Review-/Merge-Aufrufe (Keep-Alive über Requests hinweg).
+        self.paperless_transport: HttpTransport | None = None
 
         self.running = False
         self.stop_requested = False
@@ -1123,6 +1128,8 @@ class WorkerManager:
         self.last_run_total_tokens = 0
         self.last_run_cost_eur = 0.0
         self.last_run_bypass_skipped = 0
+        # Endpoint-Pool: live aus Progress-Events, sonst aus dem letzten Lauf.
+        self.ai_endpoints: dict[str, Any] | None = None
         self.total_tokens = 0
         self.total_cost_eur = 0.0
         self.total_bypass_skipped = 0
@@ -1228,6 +1235,8 @@ class WorkerManager:
 
     def _apply_runtime_payload(self, payload: dict[str, Any]) -> None:
         self.latest_runtime_payload = dict(payload)
+        if isinstance(payload.get("ai_endpoints"), dict):
+            self.ai_endpoints = payload["ai_endpoints"]
         self.progress_total_documents = self._safe_int(payload.get("progress_total_documents") or payload.get("progress", {}).get("total_documents"))
         self.progress_completed_documents = self._safe_int(payload.get("progress_completed_documents") or payload.get("progress", {}).get("completed_documents"))
         self.progress_percent = self._safe_float(payload.get("progress_percent") or payload.get("progress", {}).get("percent"))
@@ -1379,6 +1388,9 @@ class WorkerManager:
         self.last_run_total_tokens = self._safe_int(last.get("total_tokens"))
         self.last_run_cost_eur = self._safe_float(last.get("cost_eur"))
         self.last_run_bypass_skipped = self._safe_int(last.get("bypass_skipped"))
+        pipeline = (last.get("performance") or {}).get("pipeline") or {}
+        endpoints = pipeline.get("ai_endpoints") if isinstance(pipeline, dict) else None
+        self.ai_endpoints = endpoints if isinstance(endpoints, dict) else None
         self.total_tokens = self._safe_int(totals.get("total_tokens"))
         self.total_cost_eur = self._safe_float(totals.get("cost_eur"))
         self.total_bypass_skipped = self._safe_int(totals.get("bypass_skipped"))
@@ -1529,6 +1541,7 @@ class WorkerManager:
             return
         payload = dict(source_payload)
         payload.pop("kind", None)
+        payload.pop("ai_endpoints", None)
         payload["status"] = "paused"
         payload["pause_reason"] = "force_stop"
         payload["retry_after_seconds"] = None
@@ -1854,7 +1867,17 @@ class WorkerManager:
         if not self.config_validation_ok:
             raise ValueError(self.config_validation_message)
         config = load_config(str(self.paths.config_file), False)
-        return PaperlessClient(config)
+        with self.lock:
+            transport = self.paperless_transport
+            if transport is None or not transport.matches(
+                pool_maxsize=paperless_http_pool_size(config),
+                compression=config.paperless_http_compression,
+            ):
+                # Alten Pool nicht schließen: laufende Review-/Merge-Threads können ihn noch nutzen.
+                # Er wird freigegeben, sobald der letzte Client ihn nicht mehr referenziert.
+                transport = build_paperless_transport(config)
+                self.paperless_transport = transport
+        return PaperlessClient(config, transport)
 
     def _list_entity_records(
         self,
@@ -2136,6 +2159,8 @@ class WorkerManager:
             "last_run_total_tokens": self.last_run_total_tokens,
             "last_run_cost_eur": round(self.last_run_cost_eur, 6),
             "last_run_bypass_skipped": self.last_run_bypass_skipped,
+            "ai_endpoints": self.ai_endpoints,
+            "paperless_http": self.paperless_transport.stats() if self.paperless_transport else None,
             "total_tokens": self.total_tokens,
             "total_cost_eur": round(self.total_cost_eur, 6),
             "total_bypass_skipped": self.total_bypass_skipped,
@@ -0,0 +1,234 @@
+"""Tests for the multi-provider AI endpoint pool.
+
+Purpose:
+- Ensure routing follows configured weights and moves away from slow or
+  failing endpoints.
+- Verify circuit breaker transitions (open, half-open trial, closed).
+- Protect the failover contract: a failing request moves to the next
+  endpoint, and only when all are open the run pauses.
+
+How to run:
+- `python3 -m unittest discover -s tests`
+"""
+
+from __future__ import annotations
+
+import sys
+import types
+import unittest
+from pathlib import Path
+
+
+ROOT = Path(__file__).resolve().parents[1]
+SRC_DIR = ROOT / "src"
+if str(SRC_DIR) not in sys.path:
+    sys.path.insert(0, str(SRC_DIR))
+
+try:
+    import yaml  # noqa: F401
+except ImportError:
+    sys.modules["yaml"] = types.SimpleNamespace(safe_load=lambda *_args, **_kwargs: {})
+
+from ai_endpoints import (  # noqa: E402
+    CIRCUIT_CLOSED,
+    CIRCUIT_HALF_OPEN,
+    CIRCUIT_OPEN,
+    PRIMARY_ENDPOINT_NAME,
+    AiEndpoint,
+    AiEndpointPool,
+    AllEndpointsUnavailable,
+)
+from paperless_ai_sorter import (  # noqa: E402
+    AiClassifier,
+    AiTemporaryPauseError,
+    ConfigError,
+    parse_ai_endpoints,
+)
+from test_ai_pipeline import _classifier_config  # noqa: E402
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 100.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _endpoint(name: str, weight: float = 1.0) -> AiEndpoint:
+    return AiEndpoint(name=name, base_url=f"http://{name}.invalid/v1", model=f"{name}-model", api_key="k", weight=weight)
+
+
+class PauseError(Exception):
+    def __init__(self, retry_after_seconds: float) -> None:
+        super().__init__("429")
+        self.retry_after_seconds = retry_after_seconds
+
+
+class AiEndpointPoolTests(unittest.TestCase):
+    """Gewichtetes Routing, Circuit Breaker und Failover."""
+
+    def _pool(self, *endpoints: AiEndpoint, clock: FakeClock | None = None, **kwargs) -> AiEndpointPool:
+        return AiEndpointPool(endpoints, clock=clock or FakeClock(), **kwargs)
+
+    def test_routing_follows_weights(self) -> None:
+        pool = self._pool(_endpoint("a", 3.0), _endpoint("b", 1.0))
+        picks = [pool.choose()[0].name for _ in range(8)]
+        self.assertEqual(picks.count("a"), 6)
+        self.assertEqual(picks.count("b"), 2)
+
+    def test_slow_endpoint_gets_less_traffic(self) -> None:
+        fast, slow = _endpoint("fast"), _endpoint("slow")
+        pool = self._pool(fast, slow)
+        pool.record_success(fast, 0.5)
+        pool.record_success(slow, 2.0)
+        picks = [pool.choose()[0].name for _ in range(10)]
+        self.assertEqual(picks.count("fast"), 8)
+
+    def test_circuit_opens_after_threshold_and_half_open_trial_closes_it(self) -> None:
+        clock = FakeClock()
+        endpoint = _endpoint("a")
+        pool = self._pool(endpoint, clock=clock, failure_threshold=2, open_seconds=30)
+        pool.record_failure(endpoint)
+        self.assertEqual(endpoint.state, CIRCUIT_CLOSED)
+        pool.record_failure(endpoint)
+        self.assertEqual(endpoint.state, CIRCUIT_OPEN)
+        self.assertEqual(pool.choose(), (None, 0))
+        self.assertEqual(pool.seconds_until_available(), 30.0)
+
+        clock.now += 30
+        chosen, _ = pool.choose()
+        self.assertIs(chosen, endpoint)
+        self.assertEqual(endpoint.state, CIRCUIT_HALF_OPEN)
+        # Nur ein Probe-Request gleichzeitig.
+        self.assertEqual(pool.choose(), (None, 0))
+        pool.record_success(endpoint, 0.2)
+        self.assertEqual(endpoint.state, CIRCUIT_CLOSED)
+
+    def test_failed_half_open_trial_reopens_immediately(self) -> None:
+        clock = FakeClock()
+        endpoint = _endpoint("a")
+        pool = self._pool(endpoint, clock=clock, failure_threshold=5, open_seconds=10)
+        pool.record_failure(endpoint, pause=True, retry_after_seconds=20)
+        self.assertEqual(pool.seconds_until_available(), 20.0)
+        clock.now += 20
+        pool.choose()
+        pool.record_failure(endpoint)
+        self.assertEqual(endpoint.state, CIRCUIT_OPEN)
+        self.assertEqual(endpoint.counters["circuit_opens"], 2)
+
+    def test_call_fails_over_and_tells_last_candidate(self) -> None:
+        pool = self._pool(_endpoint("a", 10.0), _endpoint("b"))
+        calls = []
+
+        def send(endpoint: AiEndpoint, is_last: bool) -> str:
+            calls.append((endpoint.name, is_last))
+            if endpoint.name == "a":
+                raise PauseError(120)
+            return "ok"
+
+        self.assertEqual(pool.call(send, pause_errors=(PauseError,)), "ok")
+        self.assertEqual(calls, [("a", False), ("b", True)])
+        stats = pool.stats()
+        self.assertEqual(stats["failovers"], 1)
+        self.assertEqual(stats["endpoints"][0]["state"], CIRCUIT_OPEN)
+        self.assertEqual(stats["endpoints"][0]["failovers"], 1)
+        # Geöffneter Circuit: nächster Request geht direkt an b.
+        calls.clear()
+        pool.call(send, pause_errors=(PauseError,))
+        self.assertEqual(calls, [("b", True)])
+
+    def test_all_paused_reraises_pause_with_earliest_reopen(self) -> None:
+        pool = self._pool(_endpoint("a"), _endpoint("b"), open_seconds=10)
+
+        def send(endpoint: AiEndpoint, is_last: bool) -> str:
+            raise PauseError(60 if endpoint.name == "a" else 300)
+
+        with self.assertRaises(PauseError) as ctx:
+            pool.call(send, pause_errors=(PauseError,))
+        self.assertEqual(ctx.exception.retry_after_seconds, 60.0)
+        self.assertEqual(pool.stats()["exhausted"], 1)
+
+    def test_request_error_with_healthy_endpoints_is_not_a_pause(self) -> None:
+        pool = self._pool(_endpoint("a"), _endpoint("b"))
+
+        def send(endpoint: AiEndpoint, is_last: bool) -> str:
+            raise ValueError(f"kaputt {endpoint.name}")
+
+        with self.assertRaisesRegex(ValueError, "kaputt"):
+            pool.call(send)
+
+    def test_all_circuits_open_raise_unavailable(self) -> None:
+        pool = self._pool(_endpoint("a"), failure_threshold=1, open_seconds=45)
+
+        def send(endpoint: AiEndpoint, is_last: bool) -> str:
+            raise ValueError("down")
+
+        with self.assertRaises(AllEndpointsUnavailable) as ctx:
+            pool.call(send)
+        self.assertEqual(ctx.exception.retry_after_seconds, 45.0)
+
+
+class EndpointConfigTests(unittest.TestCase):
+    def test_parse_fills_defaults_and_validates(self) -> None:
+        endpoints = parse_ai_endpoints(
+            [{"base_url": "https://backup.example/v1/"}, {"name": "local", "base_url": "http://llm:8080/v1", "model": "m", "weight": 2}],
+            default_model="gpt",
+            default_api_key="key",
+        )
+        self.assertEqual(
+            endpoints[0],
+            {"name": "backup.example", "base_url": "https://backup.example/v1", "model": "gpt", "api_key": "key", "weight": 1.0},
+        )
+        self.assertEqual((endpoints[1]["name"], endpoints[1]["model"], endpoints[1]["weight"]), ("local", "m", 2.0))
+        self.assertEqual(parse_ai_endpoints(None, default_model="gpt", default_api_key="key"), [])
+        for invalid in ([{"name": "x"}], [{"base_url": "http://a", "weight": 0}], [{"name": PRIMARY_ENDPOINT_NAME, "base_url": "http://a"}], "http://a"):
+            with self.assertRaises(ConfigError):
+                parse_ai_endpoints(invalid, default_model="gpt", default_api_key="key")
+
+
+class ClassifierFailoverTests(unittest.TestCase):
+    """Integration in `AiClassifier._post_main`."""
+
+    def test_primary_429_fails_over_to_secondary_model(self) -> None:
+        classifier = AiClassifier(_classifier_config())
+        self.addCleanup(classifier.close_endpoint_sessions)
+        self.addCleanup(classifier.session.close)
+        primary = AiEndpoint(name=PRIMARY_ENDPOINT_NAME, base_url="http://primary.invalid", model="test-model", api_key="test")
+        backup = _endpoint("backup")
+        classifier.endpoint_pool = AiEndpointPool([primary, backup], clock=FakeClock())
+        calls = []
+
+        def fake_post(req_body, *, session=None, base_url=None, endpoint=None, failover=False):
+            calls.append((endpoint.name, req_body["model"], failover, session is classifier.session))
+            if endpoint.name == PRIMARY_ENDPOINT_NAME:
+                raise AiTemporaryPauseError("429", pause_reason="rate_limit_wait", retry_after_seconds=30)
+            return {"ok": True}
+
+        classifier._post_chat_completion = fake_post  # type: ignore[method-assign]
+        for _ in range(2):
+            self.assertEqual(classifier._post_main({"model": "test-model", "messages": []}), {"ok": True})
+        self.assertEqual(calls[0], (PRIMARY_ENDPOINT_NAME, "test-model", True, True))
+        self.assertEqual(calls[1], ("backup", "backup-model", False, False))
+        # Zweiter Request: Primär-Circuit offen, direkt zum Backup.
+        self.assertEqual(calls[2][0], "backup")
+        self.assertEqual(len(calls), 3)
+
+    def test_all_endpoints_open_pause_the_run(self) -> None:
+        classifier = AiClassifier(_classifier_config())
+        self.addCleanup(classifier.session.close)
+        primary = AiEndpoint(name=PRIMARY_ENDPOINT_NAME, base_url="http://primary.invalid", model="test-model", api_key="test")
+        classifier.endpoint_pool = AiEndpointPool([primary], failure_threshold=1, open_seconds=90, clock=FakeClock())
+
+        def fake_post(req_body, **_kwargs):
+            raise ValueError("HTTP 503")
+
+        classifier._post_chat_completion = fake_post  # type: ignore[method-assign]
+        with self.assertRaises(AiTemporaryPauseError) as ctx:
+            classifier._post_main({"model": "test-model", "messages": []})
+        self.assertEqual(ctx.exception.pause_reason, "ai_endpoints_unavailable")
+        self.assertEqual(ctx.exception.retry_after_seconds, 90.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,247 @@
+"""Tests for hedged AI requests.
+
+Purpose:
+- Ensure a slow primary request gets a duplicate after the observed latency
+  percentile and the first answer wins.
+- Verify the duplicate budget and that discarded answers count as spend.
+- Protect the classifier contract: the duplicate goes to its own hedge
+  endpoint (own limiter) or through the endpoint pool, and a still running
+  loser never shares a session with the next request.
+
+How to run:
+- `python3 -m unittest discover -s tests`
+"""
+
+from __future__ import annotations
+
+import sys
+import threading
+import types
+import unittest
+from pathlib import Path
+
+
+ROOT = Path(__file__).resolve().parents[1]
+SRC_DIR = ROOT / "src"
+if str(SRC_DIR) not in sys.path:
+    sys.path.insert(0, str(SRC_DIR))
+
+try:
+    import yaml  # noqa: F401
+except ImportError:
+    sys.modules["yaml"] = types.SimpleNamespace(safe_load=lambda *_args, **_kwargs: {})
+
+from ai_endpoints import PRIMARY_ENDPOINT_NAME, AiEndpoint, AiEndpointPool  # noqa: E402
+from ai_hedging import ATTEMPT_HEDGE, ATTEMPT_PRIMARY, RequestHedger  # noqa: E402
+from paperless_ai_sorter import AiClassifier  # noqa: E402
+from test_ai_pipeline import _classifier_config  # noqa: E402
+
+
+def _armed_hedger(**kwargs) -> RequestHedger:
+    """Hedger with a full window of fast samples, so the next call is already armed."""
+
+    options = {"min_delay_seconds": 0.01, "min_samples": 1, "max_ratio": 1.0}
+    options.update(kwargs)
+    hedger = RequestHedger(**options)
+    for _ in range(100):
+        hedger.record_latency(0.001)
+    return hedger
+
+
+class RequestHedgerTests(unittest.TestCase):
+    """Duplikat nach p90-Wartezeit, erstes Ergebnis gewinnt."""
+
+    def test_warmup_runs_unhedged_in_calling_thread(self) -> None:
+        hedger = RequestHedger(min_samples=3)
+        threads = []
+
+        def attempt(label: str) -> str:
+            threads.append((label, threading.current_thread()))
+            return label
+
+        for _ in range(3):
+            self.assertEqual(hedger.call(attempt), ATTEMPT_PRIMARY)
+        self.assertEqual(threads, [(ATTEMPT_PRIMARY, threading.current_thread())] * 3)
+        self.assertIsNotNone(hedger.hedge_delay())
+        self.assertEqual(hedger.stats()["armed"], 0)
+
+    def test_slow_primary_is_hedged_and_loser_tokens_are_counted(self) -> None:
+        hedger = _armed_hedger()
+        release_primary = threading.Event()
+        discarded = threading.Event()
+        discarded_labels = []
+
+        def attempt(label: str) -> str:
+            if label == ATTEMPT_PRIMARY:
+                release_primary.wait(5)
+            return label
+
+        def on_discarded(label: str, result: str) -> None:
+            discarded_labels.append((label, result))
+            hedger.record_duplicate_tokens(100, 20)
+            discarded.set()
+
+        self.assertEqual(hedger.call(attempt, on_discarded=on_discarded), ATTEMPT_HEDGE)
+        release_primary.set()
+        self.assertTrue(discarded.wait(5))
+        self.assertEqual(discarded_labels, [(ATTEMPT_PRIMARY, ATTEMPT_PRIMARY)])
+        stats = hedger.stats()
+        self.assertEqual((stats["fired"], stats["hedge_wins"]), (1, 1))
+        self.assertEqual((stats["duplicate_prompt_tokens"], stats["duplicate_completion_tokens"]), (100, 20))
+
+    def test_wait_for_discarded_collects_late_losers(self) -> None:
+        hedger = _armed_hedger()
+        release_primary = threading.Event()
+
+        def attempt(label: str) -> str:
+            if label == ATTEMPT_PRIMARY:
+                release_primary.wait(5)
+            return label
+
+        def on_discarded(label: str, result: str) -> None:
+            hedger.record_duplicate_tokens(100, 20)
+
+        self.assertEqual(hedger.call(attempt, on_discarded=on_discarded), ATTEMPT_HEDGE)
+        self.assertEqual(hedger.wait_for_discarded(timeout=0.05), 1)
+        self.assertEqual(hedger.stats()["pending_discards"], 1)
+        threading.Timer(0.05, release_primary.set).start()
+        self.assertEqual(hedger.wait_for_discarded(timeout=5), 0)
+        stats = hedger.stats()
+        self.assertEqual((stats["duplicate_prompt_tokens"], stats["pending_discards"]), (100, 0))
+
+    def test_cached_duplicate_tokens_never_exceed_prompt_tokens(self) -> None:
+        hedger = RequestHedger()
+        hedger.record_duplicate_tokens(100, 20, 60)
+        hedger.record_duplicate_tokens(10, 0, 50)
+        self.assertEqual(hedger.stats()["duplicate_cached_prompt_tokens"], 70)
+
+    def test_fast_primary_does_not_fire(self) -> None:
+        hedger = _armed_hedger(min_delay_seconds=5.0)
+        self.assertEqual(hedger.call(lambda label: label), ATTEMPT_PRIMARY)
+        stats = hedger.stats()
+        self.assertEqual((stats["armed"], stats["fired"]), (1, 0))
+
+    def test_ratio_budget_stops_duplicates(self) -> None:
+        hedger = _armed_hedger(max_ratio=0.5)
+        release = threading.Event()
+
+        def attempt(label: str) -> str:
+            if label == ATTEMPT_PRIMARY:
+                release.wait(0.05)
+            return label
+
+        # Budget 0.5: Duplikat erst ab dem 2. Request, danach jeder zweite.
+        results = [hedger.call(attempt) for _ in range(4)]
+        release.set()
+        stats = hedger.stats()
+        self.assertEqual(stats["fired"], 2)
+        self.assertEqual(stats["budget_skips"], 2)
+        self.assertEqual(results, [ATTEMPT_PRIMARY, ATTEMPT_HEDGE, ATTEMPT_PRIMARY, ATTEMPT_HEDGE])
+
+    def test_token_budget_stops_duplicates(self) -> None:
+        hedger = _armed_hedger(max_duplicate_tokens=50)
+        hedger.record_duplicate_tokens(40, 10)
+
+        def attempt(label: str) -> str:
+            threading.Event().wait(0.05)
+            return label
+
+        self.assertEqual(hedger.call(attempt), ATTEMPT_PRIMARY)
+        self.assertEqual(hedger.stats()["budget_skips"], 1)
+
+    def test_failed_first_answer_waits_for_the_other(self) -> None:
+        hedger = _armed_hedger()
+        release_primary = threading.Event()
+
+        def attempt(label: str) -> str:
+            if label == ATTEMPT_HEDGE:
+                raise RuntimeError("hedge kaputt")
+            release_primary.wait(0.2)
+            return label
+
+        self.assertEqual(hedger.call(attempt), ATTEMPT_PRIMARY)
+        self.assertEqual(hedger.stats()["primary_wins_after_fire"], 1)
+
+    def test_both_failing_raise_primary_error(self) -> None:
+        hedger = _armed_hedger()
+
+        def attempt(label: str) -> str:
+            threading.Event().wait(0.05 if label == ATTEMPT_PRIMARY else 0.0)
+            raise RuntimeError(label)
+
+        with self.assertRaisesRegex(RuntimeError, ATTEMPT_PRIMARY):
+            hedger.call(attempt)
+
+
+CLASSIFICATION_CONTENT = (
+    '{"title": "Rechnung", "document_type": "Rechnung", "correspondent": "Telekom", '
+    '"storage_path": "Finanzen", "tags": [], "confidence": 0.9}'
+)
+
+
+class ClassifierHedgingTests(unittest.TestCase):
+    """Integration in `AiClassifier._classify_main`."""
+
+    def _hedged_classifier(self, **overrides) -> AiClassifier:
+        classifier = AiClassifier(_classifier_config(**overrides))
+        classifier.hedger = _armed_hedger()
+        self.addCleanup(classifier.close_hedge_sessions)
+        self.addCleanup(lambda: classifier.session.close())
+        return classifier
+
+    def _classify_with_slow_primary(self, classifier: AiClassifier) -> list:
+        """Erster Request hängt bis nach dem Duplikat; liefert (Session, URL, Endpoint) je Request."""
+
+        release_primary = threading.Event()
+        calls = []
+
+        def fake_post(req_body, *, session=None, base_url=None, endpoint=None, failover=False):
+            calls.append((session, endpoint.base_url if endpoint is not None else base_url, endpoint))
+            if len(calls) == 1:
+                release_primary.wait(5)
+            return {
+                "choices": [{"message": {"content": CLASSIFICATION_CONTENT}}],
+                "usage": {"prompt_tokens": 10, "completion_tokens": 2, "total_tokens": 12},
+            }
+
+        classifier._post_chat_completion = fake_post  # type: ignore[method-assign]
+        result = classifier.classify({"id": 1, "title": "Rechnung", "content": "Telekom"})
+        release_primary.set()
+        self.assertEqual(result["document_type"], "Rechnung")
+        self.assertEqual(classifier.hedger.stats()["hedge_wins"], 1)
+        return calls
+
+    def test_duplicate_goes_to_hedge_endpoint_and_main_session_is_replaced(self) -> None:
+        classifier = self._hedged_classifier(ai_hedge_base_url="http://hedge.invalid/v1")
+        original_session = classifier.session
+
+        calls = self._classify_with_slow_primary(classifier)
+
+        self.assertEqual(calls[0], (original_session, None, None))
+        self.assertEqual(calls[1][1], "http://hedge.invalid/v1")
+        # Eigener Endpoint: eigener Limiter statt des Limiters des Hauptanbieters.
+        self.assertIs(calls[1][2], classifier.hedge_endpoint)
+        self.assertIsNot(calls[1][0], original_session)
+        self.assertIsNot(classifier.session, original_session)
+
+    def test_duplicate_without_own_target_goes_through_endpoint_pool(self) -> None:
+        classifier = self._hedged_classifier()
+        primary = AiEndpoint(
+            name=PRIMARY_ENDPOINT_NAME,
+            base_url=classifier.base_url,
+            model=classifier.model,
+            api_key="k",
+        )
+        classifier.endpoint_pool = AiEndpointPool([primary])
+        original_session = classifier.session
+
+        calls = self._classify_with_slow_primary(classifier)
+
+        self.assertIsNone(classifier.hedge_endpoint)
+        self.assertEqual([call[2] for call in calls], [primary, primary])
+        self.assertIsNot(calls[1][0], original_session)
+        self.assertEqual(classifier.endpoint_pool.stats()["endpoints"][0]["requests"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
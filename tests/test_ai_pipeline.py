@@ -0,0 +1,649 @@
+"""Tests for the bounded AI work queue and the staged document pipeline.
+
+Purpose:
+- Ensure free slots are refilled immediately instead of waiting for a batch.
+- Verify completion vs. submission order and that errors reach the caller.
+- Protect the pause contract: every in-flight item is visible until collected.
+- Ensure the staged pipeline keeps source order and reports per-stage metrics.
+- Verify the page prefetcher stays bounded, hands off on a stop request and
+  passes page errors to the caller.
+- Verify the classifier pool reuses one classifier per worker thread.
+- Ensure the cached system prompt is rebuilt only after explicit invalidation.
+- Verify the cache-friendly prompt layout and cached-token cost accounting.
+- Ensure multi-document requests validate per item and fall back per document.
+- Ensure chat-completion retries do not drain the rate limiter per attempt.
+- Verify the model cascade escalates only on low confidence, bad output,
+  unknown entities or small-model errors.
+
+How to run:
+- `python3 -m unittest discover -s tests`
+"""
+
+from __future__ import annotations
+
+import json
+import sys
+import threading
+import time
+import types
+import unittest
+from pathlib import Path
+from unittest import mock
+
+
+ROOT = Path(__file__).resolve().parents[1]
+SRC_DIR = ROOT / "src"
+if str(SRC_DIR) not in sys.path:
+    sys.path.insert(0, str(SRC_DIR))
+
+try:
+    import yaml  # noqa: F401
+except ImportError:
+    sys.modules["yaml"] = types.SimpleNamespace(safe_load=lambda *_args, **_kwargs: {})
+
+from ai_pipeline import (  # noqa: E402
+    APPLY_ORDER_COMPLETION,
+    APPLY_ORDER_SUBMISSION,
+    BoundedWorkQueue,
+    PagePrefetcher,
+    StagedPipeline,
+    StageSpec,
+)
+from ai_rate_limiter import AiRateLimiter  # noqa: E402
+import paperless_ai_sorter  # noqa: E402
+from paperless_ai_sorter import (  # noqa: E402
+    AiClassifier,
+    AiClassifierPool,
+    calculate_usage_cost_eur,
+    extract_cached_prompt_tokens,
+    parse_cached_prompt_tokens,
+)
+
+
+def _classifier_config(**overrides):
+    values = {
+        "ai_model": "test-model",
+        "request_timeout_seconds": 5,
+        "ai_base_url": "http://127.0.0.1:9",
+        "ai_api_key": "test",
+        "enable_token_precheck": False,
+        "min_remaining_tokens": 0,
+        "custom_prompt_instructions": "",
+        "basis_config": {},
+        "include_existing_entities_in_prompt": True,
+        "enable_custom_field_enrichment": False,
+        "enable_secondbrain_custom_fields": False,
+        "entity_review_rules_file": "",
+        "ai_prompt_layout": "legacy",
+        "ai_content_excerpt_mode": "truncate",
+        "ai_content_max_tokens": 1500,
+        "ai_entity_shortlist_top_k": 0,
+        "enable_ai_cascade": False,
+        "cascade_ai_model": "",
+        "cascade_ai_base_url": "",
+        "cascade_ai_api_key": "test",
+        "cascade_min_confidence": 0.8,
+        "cascade_escalate_on_unknown_entity": True,
+        "cascade_input_cost_per_1k_tokens_eur": 0.0,
+        "cascade_output_cost_per_1k_tokens_eur": 0.0,
+        "ai_hedge_base_url": "",
+        "ai_hedge_api_key": "test",
+        "enable_rule_classifier": False,
+        "rule_classifier_min_confidence": 0.9,
+    }
+    values.update(overrides)
+    return types.SimpleNamespace(**values)
+
+
+class BoundedWorkQueueTests(unittest.TestCase):
+    """Verhalten der Work-Queue ohne echte KI-Aufrufe."""
+
+    def test_completion_order_returns_fast_items_before_slow_item(self) -> None:
+        release_slow = threading.Event()
+
+        def worker(item: str) -> str:
+            if item == "slow":
+                release_slow.wait(timeout=5)
+            return item.upper()
+
+        queue = BoundedWorkQueue(worker, max_in_flight=3, apply_order=APPLY_ORDER_COMPLETION)
+        try:
+            for item in ("slow", "a", "b"):
+                queue.submit(item)
+            first = queue.collect(block=True)
+            self.assertTrue(first)
+            self.assertNotIn("slow", [result.item for result in first])
+            release_slow.set()
+            rest = queue.drain()
+        finally:
+            queue.close()
+
+        items = [result.item for result in first + rest]
+        self.assertEqual(sorted(items), ["a", "b", "slow"])
+        self.assertEqual(len(queue), 0)
+
+    def test_submission_order_waits_for_oldest_item(self) -> None:
+        release_slow = threading.Event()
+
+        def worker(item: str) -> str:
+            if item == "slow":
+                release_slow.wait(timeout=5)
+            return item
+
+        queue = BoundedWorkQueue(worker, max_in_flight=3, apply_order=APPLY_ORDER_SUBMISSION)
+        try:
+            for item in ("slow", "a", "b"):
+                queue.submit(item)
+            time.sleep(0.05)
+            self.assertEqual(queue.collect(), [])
+            release_slow.set()
+            results = queue.drain()
+        finally:
+            queue.close()
+
+        self.assertEqual([result.item for result in results], ["slow", "a", "b"])
+
+    def test_capacity_and_in_flight_items_track_running_work(self) -> None:
+        release = threading.Event()
+        queue = BoundedWorkQueue(lambda item: release.wait(timeout=5), max_in_flight=2)
+        try:
+            queue.submit(1)
+            self.assertTrue(queue.has_capacity())
+            queue.submit(2)
+            self.assertFalse(queue.has_capacity())
+            self.assertEqual(queue.in_flight_items(), [1, 2])
+            release.set()
+            queue.drain()
+            self.assertTrue(queue.has_capacity())
+            self.assertEqual(queue.in_flight_items(), [])
+        finally:
+            queue.close()
+
+        stats = queue.stats()
+        self.assertEqual(stats["submitted"], 2)
+        self.assertEqual(stats["completed"], 2)
+        self.assertEqual(stats["peak_in_flight"], 2)
+
+    def test_worker_errors_are_returned_instead_of_raised(self) -> None:
+        def worker(item: int) -> int:
+            if item == 2:
+                raise RuntimeError("kaputt")
+            return item * 10
+
+        queue = BoundedWorkQueue(worker, max_in_flight=2)
+        try:
+            queue.submit(1)
+            queue.submit(2)
+            results = {result.item: result for result in queue.drain()}
+        finally:
+            queue.close()
+
+        self.assertEqual(results[1].result, 10)
+        self.assertIsNone(results[1].error)
+        self.assertIsInstance(results[2].error, RuntimeError)
+
+    def test_rejects_unknown_apply_order_and_closed_submit(self) -> None:
+        with self.assertRaises(ValueError):
+            BoundedWorkQueue(lambda item: item, max_in_flight=1, apply_order="random")
+        queue = BoundedWorkQueue(lambda item: item, max_in_flight=1)
+        queue.close()
+        with self.assertRaises(RuntimeError):
+            queue.submit(1)
+
+
+class StagedPipelineTests(unittest.TestCase):
+    """Reihenfolge, Fehlerweitergabe und Kennzahlen der Stufen-Pipeline."""
+
+    def test_yields_in_source_order_with_parallel_stage_workers(self) -> None:
+        def slow_for_even(item: int) -> int:
+            if item % 2 == 0:
+                time.sleep(0.02)
+            return item * 2
+
+        pipeline = StagedPipeline(
+            range(20),
+            [StageSpec(name="precheck", func=slow_for_even, workers=4, queue_size=3)],
+        )
+        try:
+            results = list(pipeline)
+        finally:
+            pipeline.close()
+
+        self.assertEqual([work.item for work in results], list(range(20)))
+        self.assertEqual([work.result for work in results], [item * 2 for item in range(20)])
+        stats = pipeline.stats()
+        self.assertEqual(list(stats), ["fetch", "precheck", "apply"])
+        self.assertEqual(stats["precheck"]["processed"], 20)
+        self.assertEqual(stats["precheck"]["workers"], 4)
+        self.assertLessEqual(stats["precheck"]["max_queue_depth"], 3)
+        self.assertEqual(stats["apply"]["processed"], 20)
+
+    def test_stage_errors_are_attached_to_the_item(self) -> None:
+        def lookup(item: int) -> int:
+            if item == 1:
+                raise ValueError("kaputt")
+            return item
+
+        pipeline = StagedPipeline([0, 1, 2], [StageSpec(name="precheck", func=lookup)])
+        try:
+            results = list(pipeline)
+        finally:
+            pipeline.close()
+
+        self.assertEqual([work.item for work in results], [0, 1, 2])
+        self.assertIsInstance(results[1].error, ValueError)
+        self.assertIsNone(results[2].error)
+        self.assertEqual(pipeline.stats()["precheck"]["errors"], 1)
+
+    def test_source_error_is_raised_after_previous_items(self) -> None:
+        def source():
+            yield 1
+            yield 2
+            raise RuntimeError("Seite fehlgeschlagen")
+
+        pipeline = StagedPipeline(source(), [StageSpec(name="precheck", func=lambda item: item)])
+        seen = []
+        try:
+            with self.assertRaises(RuntimeError):
+                for work in pipeline:
+                    seen.append(work.item)
+        finally:
+            pipeline.close()
+        self.assertEqual(seen, [1, 2])
+
+    def test_close_stops_a_long_source_early(self) -> None:
+        consumed = []
+
+        def source():
+            for item in range(10_000):
+                consumed.append(item)
+                yield item
+
+        pipeline = StagedPipeline(
+            source(),
+            [StageSpec(name="precheck", func=lambda item: item, workers=2, queue_size=2)],
+            sink_queue_size=2,
+        )
+        for work in pipeline:
+            if work.item == 3:
+                break
+        pipeline.close()
+        self.assertLess(len(consumed), 100)
+
+
+class PagePrefetcherTests(unittest.TestCase):
+    """Vorladen von Listen-Seiten im Hintergrund."""
+
+    def test_yields_pages_in_order_and_reads_at_most_max_ahead(self) -> None:
+        fetched = []
+
+        def pages():
+            for page in range(50):
+                fetched.append(page)
+                yield page
+
+        prefetcher = PagePrefetcher(pages(), max_ahead=2)
+        seen = []
+        for page in prefetcher:
+            seen.append(page)
+            if page == 0:
+                time.sleep(0.1)
+                # Eine Seite beim Aufrufer, zwei in der Queue, eine wartet auf Platz.
+                self.assertLessEqual(len(fetched), 4)
+        self.assertEqual(seen, list(range(50)))
+        stats = prefetcher.stats()
+        self.assertEqual(stats["pages"], 50)
+        self.assertGreaterEqual(stats["waits"], 1)
+        self.assertFalse(stats["handed_off"])
+
+    def test_stop_request_hands_remaining_pages_to_the_caller(self) -> None:
+        stop = threading.Event()
+        fetch_threads = []
+
+        def pages():
+            for page in range(6):
+                fetch_threads.append(threading.current_thread().name)
+                yield page
+
+        prefetcher = PagePrefetcher(pages(), max_ahead=1, stop_requested=stop.is_set)
+        seen = []
+        for page in prefetcher:
+            seen.append(page)
+            if page == 1:
+                stop.set()
+        self.assertEqual(seen, list(range(6)))
+        self.assertTrue(prefetcher.stats()["handed_off"])
+        # Nach dem Stop lädt der aufrufende Thread selbst.
+        self.assertEqual(fetch_threads[-1], threading.current_thread().name)
+
+    def test_page_error_is_raised_after_previous_pages(self) -> None:
+        def pages():
+            yield 1
+            raise RuntimeError("Seite fehlgeschlagen")
+
+        seen = []
+        with self.assertRaises(RuntimeError):
+            for page in PagePrefetcher(pages()):
+                seen.append(page)
+        self.assertEqual(seen, [1])
+
+    def test_early_exit_stops_the_background_thread(self) -> None:
+        def pages():
+            for page in range(10_000):
+                yield page
+
+        prefetcher = PagePrefetcher(pages(), max_ahead=2)
+        for page in prefetcher:
+            if page == 2:
+                break
+        prefetcher.close()
+        self.assertFalse(prefetcher._thread.is_alive())
+
+
+class AiClassifierPoolTests(unittest.TestCase):
+    """Thread-lokale Wiederverwendung der KI-Classifier."""
+
+    def test_reuses_one_classifier_per_thread(self) -> None:
+        template = AiClassifier(_classifier_config())
+        template.set_known_entities(document_types=["Rechnung"], correspondents=[], storage_paths=[])
+        pool = AiClassifierPool(_classifier_config(), template)
+        seen = {}
+
+        def worker(name: str) -> None:
+            first = pool.get()
+            second = pool.get()
+            seen[name] = (first, second)
+
+        threads = [threading.Thread(target=worker, args=(f"t{index}",)) for index in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        for first, second in seen.values():
+            self.assertIs(first, second)
+            self.assertEqual(first.known_document_types, ["Rechnung"])
+        self.assertEqual(len({id(first) for first, _second in seen.values()}), 3)
+        stats = pool.stats()
+        self.assertEqual(stats["misses"], 3)
+        self.assertEqual(stats["hits"], 3)
+        self.assertEqual(stats["workers"], 3)
+        self.assertEqual(stats["connections_opened"], 0)
+        pool.close()
+
+    def test_review_store_is_loaded_only_once(self) -> None:
+        config = _classifier_config(entity_review_rules_file="rules.json")
+        with mock.patch.object(paperless_ai_sorter, "load_review_store", return_value={}) as load_store, \
+                mock.patch.object(paperless_ai_sorter, "build_ai_prompt_context", return_value="REGELN"):
+            template = AiClassifier(config)
+            pool = AiClassifierPool(config, template)
+            worker = pool.get()
+
+        self.assertEqual(load_store.call_count, 1)
+        self.assertEqual(worker.entity_review_prompt_context, "REGELN")
+        pool.close()
+
+
+class SystemPromptCacheTests(unittest.TestCase):
+    """Gecachter System-Prompt und seine Invalidierung."""
+
+    def test_prompt_is_built_once_until_entities_change(self) -> None:
+        classifier = AiClassifier(_classifier_config())
+        classifier.set_known_entities(document_types=["Rechnung"], correspondents=[], storage_paths=[])
+        with mock.patch.object(classifier, "_build_system_prompt", wraps=classifier._build_system_prompt) as build:
+            first = classifier.system_prompt()
+            second = classifier.system_prompt()
+            self.assertIs(first, second)
+            self.assertEqual(build.call_count, 1)
+            fingerprint = classifier.prompt_fingerprint
+
+            classifier.set_known_entities(
+                document_types=["Rechnung", "Vertrag"],
+                correspondents=[],
+                storage_paths=[],
+            )
+            third = classifier.system_prompt()
+
+        self.assertEqual(build.call_count, 2)
+        self.assertIn("Vertrag", third)
+        self.assertNotEqual(classifier.prompt_fingerprint, fingerprint)
+        self.assertEqual(classifier.prompt_cache_hits, 1)
+
+    def test_review_context_change_invalidates_prompt(self) -> None:
+        classifier = AiClassifier(_classifier_config())
+        before = classifier.system_prompt()
+        classifier.set_entity_review_prompt_context(classifier.entity_review_prompt_context)
+        self.assertIs(classifier.system_prompt(), before)
+
+        classifier.set_entity_review_prompt_context("Stadtwerke ist Korrespondent")
+        self.assertIn("Stadtwerke ist Korrespondent", classifier.system_prompt())
+
+
+class PromptCacheLayoutTests(unittest.TestCase):
+    """Cache-freundliches Prompt-Layout und Abrechnung gecachter Tokens."""
+
+    def test_cache_friendly_layout_puts_stable_sections_first(self) -> None:
+        basis = {"zeta": 1, "alpha": 2}
+        legacy = AiClassifier(_classifier_config(basis_config=basis))
+        cached = AiClassifier(_classifier_config(basis_config=basis, ai_prompt_layout="cache_friendly"))
+        for classifier in (legacy, cached):
+            classifier.set_entity_review_prompt_context("REGELN")
+            classifier.set_known_entities(document_types=["Rechnung"], correspondents=[], storage_paths=[])
+
+        legacy_prompt = legacy.system_prompt()
+        cached_prompt = cached.system_prompt()
+        self.assertLess(legacy_prompt.index("REGELN"), legacy_prompt.index('"zeta"'))
+        self.assertLess(cached_prompt.index('"alpha"'), cached_prompt.index('"zeta"'))
+        self.assertLess(cached_prompt.index('"zeta"'), cached_prompt.index("REGELN"))
+        self.assertLess(cached_prompt.index("REGELN"), cached_prompt.index("Rechnung"))
+
+    def test_parses_openai_and_deepseek_cached_tokens(self) -> None:
+        self.assertEqual(parse_cached_prompt_tokens({"prompt_tokens_details": {"cached_tokens": 512}}), 512)
+        self.assertEqual(parse_cached_prompt_tokens({"prompt_cache_hit_tokens": 256}), 256)
+        self.assertEqual(parse_cached_prompt_tokens({"prompt_tokens": 100}), 0)
+        self.assertEqual(parse_cached_prompt_tokens(None), 0)
+
+    def test_cached_tokens_are_capped_and_priced_separately(self) -> None:
+        prediction = {"_meta_usage": {"prompt_tokens": 1000, "cached_prompt_tokens": 5000}}
+        self.assertEqual(extract_cached_prompt_tokens(prediction), 1000)
+
+        config = types.SimpleNamespace(
+            input_cost_per_1k_tokens_eur=1.0,
+            cached_input_cost_per_1k_tokens_eur=0.5,
+            output_cost_per_1k_tokens_eur=2.0,
+        )
+        cost = calculate_usage_cost_eur(
+            config,
+            prompt_tokens=1000,
+            completion_tokens=500,
+            cached_prompt_tokens=600,
+        )
+        self.assertAlmostEqual(cost, 0.4 + 0.3 + 1.0)
+
+
+def _chat_response(content, prompt_tokens=900, completion_tokens=90):
+    return {
+        "choices": [{"message": {"content": json.dumps(content)}}],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        },
+    }
+
+
+def _prediction(**overrides):
+    values = {
+        "document_type": "Rechnung",
+        "correspondent": "Stadtwerke",
+        "storage_path": "Privat",
+        "tags": ["Strom"],
+        "confidence": 0.9,
+    }
+    values.update(overrides)
+    return values
+
+
+class MultiDocumentClassifyTests(unittest.TestCase):
+    """Mehrere kleine Dokumente in einem KI-Request."""
+
+    def test_splits_results_and_usage_across_documents(self) -> None:
+        classifier = AiClassifier(_classifier_config())
+        response = _chat_response(
+            {
+                "results": [
+                    _prediction(document_ref="2", document_type="Vertrag"),
+                    _prediction(document_ref="1"),
+                    _prediction(document_ref="3"),
+                ]
+            }
+        )
+        documents = [{"id": 1, "title": "a"}, {"id": 2, "title": "b"}, {"id": 3, "title": "c"}]
+        with mock.patch.object(classifier, "_post_chat_completion", return_value=response) as post:
+            results = classifier.classify_many(documents)
+
+        self.assertEqual(post.call_count, 1)
+        user_message = post.call_args.args[0]["messages"][1]["content"]
+        self.assertIn('"document_ref": "3"', user_message)
+        self.assertEqual([prediction["document_type"] for prediction, _exc in results], ["Rechnung", "Vertrag", "Rechnung"])
+        self.assertNotIn("document_ref", results[0][0])
+        self.assertEqual([prediction["_meta_usage"]["prompt_tokens"] for prediction, _exc in results], [300, 300, 300])
+        self.assertEqual(classifier.multi_fallbacks, 0)
+
+    def test_invalid_or_missing_item_falls_back_to_single_request(self) -> None:
+        classifier = AiClassifier(_classifier_config())
+        multi = _chat_response(
+            {"results": [_prediction(document_ref="1"), _prediction(document_ref="2", confidence=7)]},
+            prompt_tokens=1000,
+        )
+        single = _chat_response(_prediction(document_type="Kontoauszug"), prompt_tokens=400)
+        documents = [{"id": 1}, {"id": 2}, {"id": 3}]
+        with mock.patch.object(classifier, "_post_chat_completion", side_effect=[multi, single, single]) as post:
+            results = classifier.classify_many(documents)
+
+        self.assertEqual(post.call_count, 3)
+        self.assertEqual(results[0][0]["document_type"], "Rechnung")
+        self.assertEqual(results[1][0]["document_type"], "Kontoauszug")
+        self.assertEqual(results[2][0]["document_type"], "Kontoauszug")
+        self.assertEqual(results[0][0]["_meta_usage"]["prompt_tokens"], 334)
+        self.assertEqual(results[1][0]["_meta_usage"]["prompt_tokens"], 400 + 333)
+        self.assertEqual(classifier.multi_fallbacks, 2)
+
+    def test_pause_error_is_raised_for_the_whole_request(self) -> None:
+        classifier = AiClassifier(_classifier_config())
+        pause = paperless_ai_sorter.AiTemporaryPauseError(
+            "Rate-Limit",
+            pause_reason="rate_limit",
+            retry_after_seconds=120.0,
+        )
+        with mock.patch.object(classifier, "_post_chat_completion", side_effect=pause):
+            with self.assertRaises(paperless_ai_sorter.AiTemporaryPauseError):
+                classifier.classify_many([{"id": 1}, {"id": 2}])
+
+
+def _http_response(status_code, payload=None):
+    response = mock.Mock(status_code=status_code, headers={}, text=json.dumps(payload or {}))
+    response.json.return_value = payload
+    return response
+
+
+class ChatCompletionRetryTests(unittest.TestCase):
+    """Retries geben die Token-Reservierung fehlgeschlagener Versuche zurück."""
+
+    def test_failed_attempts_release_their_reservation(self) -> None:
+        classifier = AiClassifier(_classifier_config())
+        self.addCleanup(classifier.session.close)
+        classifier.rate_limiter = AiRateLimiter(tokens_per_minute=100_000)
+        success = _chat_response(_prediction(), prompt_tokens=300, completion_tokens=50)
+        responses = [_http_response(503), _http_response(502), _http_response(200, success)]
+        req_body = {"messages": [{"role": "user", "content": "x" * 400}], "max_tokens": 100}
+
+        with mock.patch.object(classifier.session, "post", side_effect=responses), mock.patch.object(
+            paperless_ai_sorter.time, "sleep"
+        ):
+            raw = classifier._post_chat_completion(req_body)
+
+        self.assertEqual(raw, success)
+        stats = classifier.rate_limiter.stats()
+        self.assertEqual(stats["requests"], 3)
+        self.assertEqual(stats["released_tokens"], 2 * (stats["estimated_tokens"] // 3))
+        self.assertEqual(stats["actual_tokens"], 350)
+        # Nur der erfolgreiche Versuch belastet den Bucket, und zwar mit der echten Usage.
+        self.assertAlmostEqual(classifier.rate_limiter._tokens.level, 100_000 - 350, delta=5)
+
+
+class ModelCascadeTests(unittest.TestCase):
+    """Kleines Modell zuerst, Hauptmodell nur bei Eskalation."""
+
+    def _classifier(self) -> AiClassifier:
+        classifier = AiClassifier(
+            _classifier_config(
+                enable_ai_cascade=True,
+                cascade_ai_model="qwen-small",
+                cascade_ai_base_url="http://127.0.0.1:9/v1",
+                cascade_min_confidence=0.8,
+                cascade_input_cost_per_1k_tokens_eur=0.001,
+            )
+        )
+        classifier.set_known_entities(
+            document_types=["Rechnung", "Vertrag"],
+            correspondents=["Stadtwerke"],
+            storage_paths=["Privat"],
+        )
+        self.addCleanup(classifier.session.close)
+        self.addCleanup(classifier.cascade_session.close)
+        return classifier
+
+    @staticmethod
+    def _local_response(content):
+        response = mock.Mock()
+        response.raise_for_status.return_value = None
+        response.json.return_value = _chat_response(content, prompt_tokens=1000, completion_tokens=50)
+        return response
+
+    def test_confident_known_result_stays_on_small_model(self) -> None:
+        classifier = self._classifier()
+        local = self._local_response(_prediction(confidence=0.95))
+        with mock.patch.object(classifier.cascade_session, "post", return_value=local) as local_post:
+            with mock.patch.object(classifier, "_post_chat_completion") as main_post:
+                prediction = classifier.classify({"id": 1, "title": "Strom"})
+
+        main_post.assert_not_called()
+        self.assertEqual(json.loads(local_post.call_args.kwargs["data"])["model"], "qwen-small")
+        self.assertEqual(prediction["_meta_usage"]["cascade_tier"], "local")
+        self.assertEqual(prediction["_meta_usage"]["prompt_tokens"], 0)
+        self.assertAlmostEqual(prediction["_meta_usage"]["cascade_local_cost_eur"], 0.001)
+        self.assertEqual(classifier.cascade_counters["local_accepted"], 1)
+
+    def test_escalates_on_low_confidence_invalid_output_unknown_entity_and_error(self) -> None:
+        cases = [
+            ("low_confidence", self._local_response(_prediction(confidence=0.5))),
+            ("invalid_output", self._local_response({"document_type": "Rechnung"})),
+            ("unknown_entity", self._local_response(_prediction(correspondent="Unbekannte GmbH"))),
+            ("local_error", paperless_ai_sorter.requests.ConnectionError("down")),
+        ]
+        for reason, local in cases:
+            with self.subTest(reason=reason):
+                classifier = self._classifier()
+                main = _chat_response(_prediction(document_type="Vertrag"), prompt_tokens=700)
+                side_effect = local if isinstance(local, Exception) else None
+                with mock.patch.object(
+                    classifier.cascade_session,
+                    "post",
+                    return_value=None if side_effect else local,
+                    side_effect=side_effect,
+                ):
+                    with mock.patch.object(classifier, "_post_chat_completion", return_value=main) as main_post:
+                        prediction = classifier.classify({"id": 1, "title": "Strom"})
+
+                self.assertEqual(main_post.call_args.args[0]["model"], "test-model")
+                self.assertEqual(prediction["document_type"], "Vertrag")
+                self.assertEqual(prediction["_meta_usage"]["cascade_tier"], "main")
+                self.assertEqual(prediction["_meta_usage"]["cascade_escalation_reason"], reason)
+                self.assertEqual(prediction["_meta_usage"]["prompt_tokens"], 700)
+                self.assertEqual(classifier.cascade_counters[f"escalated_{reason}"], 1)
+                self.assertEqual(classifier.cascade_counters["main_prompt_tokens"], 700)
+
+
+if __name__ == "__main__":
+    unittest.main()
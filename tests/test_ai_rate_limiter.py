@@ -0,0 +1,138 @@
+"""Tests for the client-side AI rate limiter.
+
+Purpose:
+- Ensure configured TPM/RPM budgets hold requests back before a 429.
+- Verify provider `x-ratelimit-*` headers and 429 answers lower the budget.
+- Protect the pause contract: too long waits raise instead of sleeping.
+- Ensure failed attempts hand their token reservation back.
+
+How to run:
+- `python3 -m unittest discover -s tests`
+"""
+
+from __future__ import annotations
+
+import sys
+import unittest
+from pathlib import Path
+
+
+ROOT = Path(__file__).resolve().parents[1]
+SRC_DIR = ROOT / "src"
+if str(SRC_DIR) not in sys.path:
+    sys.path.insert(0, str(SRC_DIR))
+
+from ai_rate_limiter import (  # noqa: E402
+    DEFAULT_COMPLETION_TOKENS_ESTIMATE,
+    AiRateLimiter,
+    RateLimitWaitTooLong,
+    parse_reset_duration,
+)
+
+
+class FakeClock:
+    """Monotonic clock that only advances when the limiter sleeps."""
+
+    def __init__(self) -> None:
+        self.now = 1000.0
+        self.sleeps: list[float] = []
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def _limiter(clock: FakeClock, **kwargs) -> AiRateLimiter:
+    return AiRateLimiter(clock=clock, sleep=clock.sleep, **kwargs)
+
+
+class AiRateLimiterTests(unittest.TestCase):
+    """Token-Bucket für Tokens und Requests pro Minute."""
+
+    def test_parse_reset_duration_formats(self) -> None:
+        self.assertEqual(parse_reset_duration("1s"), 1.0)
+        self.assertEqual(parse_reset_duration("6m0s"), 360.0)
+        self.assertAlmostEqual(parse_reset_duration("20ms"), 0.02)
+        self.assertEqual(parse_reset_duration("1h2m3.5s"), 3723.5)
+        self.assertEqual(parse_reset_duration("2.5"), 2.5)
+        self.assertIsNone(parse_reset_duration("bald"))
+        self.assertIsNone(parse_reset_duration(None))
+
+    def test_without_known_limits_never_waits(self) -> None:
+        clock = FakeClock()
+        limiter = _limiter(clock)
+        for _ in range(100):
+            self.assertEqual(limiter.acquire(50_000), 0.0)
+        self.assertEqual(clock.sleeps, [])
+
+    def test_request_budget_spaces_requests_after_burst(self) -> None:
+        clock = FakeClock()
+        limiter = _limiter(clock, requests_per_minute=60)
+        for _ in range(60):
+            limiter.acquire(10)
+        self.assertEqual(clock.sleeps, [])
+        self.assertAlmostEqual(limiter.acquire(10), 1.0)
+        self.assertEqual(limiter.stats()["throttled_requests"], 1)
+
+    def test_token_budget_waits_and_usage_correction_refunds(self) -> None:
+        clock = FakeClock()
+        limiter = _limiter(clock, tokens_per_minute=6000)
+        self.assertEqual(limiter.acquire(5000), 0.0)
+        # Tatsächlich nur 1000 Tokens verbraucht: 4000 fließen zurück.
+        limiter.record_usage(5000, 1000)
+        self.assertEqual(limiter.acquire(4000), 0.0)
+        self.assertAlmostEqual(limiter.acquire(2000), 10.0)
+
+    def test_release_returns_tokens_but_keeps_request_slot(self) -> None:
+        clock = FakeClock()
+        limiter = _limiter(clock, tokens_per_minute=6000, requests_per_minute=2)
+        limiter.acquire(5000)
+        # Fehlversuch ohne Usage: die 5000 Tokens gehen zurück, der Request zählt weiter.
+        limiter.release(5000)
+        self.assertEqual(limiter.acquire(5000), 0.0)
+        self.assertAlmostEqual(limiter.acquire(10), 30.0)
+        self.assertEqual(limiter.stats()["released_tokens"], 5000)
+
+    def test_headers_lower_budget_and_fill_in_unknown_limits(self) -> None:
+        clock = FakeClock()
+        limiter = _limiter(clock)
+        limiter.update_from_headers(
+            {
+                "x-ratelimit-limit-tokens": "600",
+                "x-ratelimit-remaining-tokens": "0",
+                "x-ratelimit-reset-tokens": "6s",
+            }
+        )
+        self.assertEqual(limiter.stats()["tokens_per_minute"], 600)
+        self.assertAlmostEqual(limiter.acquire(100), 10.0)
+
+    def test_penalize_after_429_blocks_all_callers(self) -> None:
+        clock = FakeClock()
+        limiter = _limiter(clock)
+        limiter.penalize(3.0)
+        self.assertAlmostEqual(limiter.acquire(10), 3.0)
+        self.assertEqual(limiter.acquire(10), 0.0)
+        self.assertEqual(limiter.stats()["provider_429"], 1)
+
+    def test_too_long_wait_raises_instead_of_sleeping(self) -> None:
+        clock = FakeClock()
+        limiter = _limiter(clock, tokens_per_minute=600, max_wait_seconds=5)
+        limiter.acquire(600)
+        with self.assertRaises(RateLimitWaitTooLong) as ctx:
+            limiter.acquire(600)
+        self.assertAlmostEqual(ctx.exception.wait_seconds, 60.0)
+        self.assertEqual(clock.sleeps, [])
+
+    def test_request_estimate_includes_completion_budget(self) -> None:
+        self.assertEqual(AiRateLimiter.estimate_request_tokens(100, {"max_tokens": 50}), 150)
+        self.assertEqual(
+            AiRateLimiter.estimate_request_tokens(100, {}),
+            100 + DEFAULT_COMPLETION_TOKENS_ESTIMATE,
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
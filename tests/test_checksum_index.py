@@ -0,0 +1,116 @@
+"""Tests for the run-wide checksum index of the duplicate gate.
+
+Purpose:
+- Ensure the index answers like `find_classified_duplicate` (other document,
+  classified, newest `created` first).
+- Verify that projected pages and PATCH responses keep entries current.
+- Ensure originals found by a fallback query are indexed for later lookups.
+
+How to run:
+- `python3 -m unittest discover -s tests`
+"""
+
+from __future__ import annotations
+
+import json
+import sys
+import types
+import unittest
+from pathlib import Path
+
+
+ROOT = Path(__file__).resolve().parents[1]
+SRC_DIR = ROOT / "src"
+if str(SRC_DIR) not in sys.path:
+    sys.path.insert(0, str(SRC_DIR))
+
+try:
+    import yaml  # noqa: F401
+except ImportError:
+    sys.modules["yaml"] = types.SimpleNamespace(safe_load=lambda *_args, **_kwargs: {})
+
+from checksum_index import ChecksumIndex  # noqa: E402
+from paperless_ai_sorter import PaperlessClient  # noqa: E402
+
+
+def _doc(doc_id: int, checksum: str, **fields) -> dict:
+    return {"id": doc_id, "checksum": checksum, "document_type": None, "tags": [], "created": "2025-01-01", **fields}
+
+
+class ChecksumIndexTests(unittest.TestCase):
+    """Lokale Dubletten-Suche über die checksum."""
+
+    def test_find_returns_newest_other_classified_document(self) -> None:
+        index = ChecksumIndex()
+        index.observe_many(
+            [
+                _doc(1, "abc", document_type=3, tags=[7], created="2024-01-01"),
+                _doc(2, "abc", document_type=4, tags=[7], created="2025-01-01", content="nicht gespeichert"),
+                _doc(3, "abc"),
+                _doc(4, "xyz", document_type=3, tags=[]),
+            ]
+        )
+        duplicate = index.find(current_document_id=3, checksum="abc")
+        self.assertEqual((duplicate["id"], duplicate["document_type"]), (2, 4))
+        self.assertNotIn("content", duplicate)
+        self.assertEqual(index.find(current_document_id=2, checksum="abc")["id"], 1)
+        # Ohne Tags gilt ein Dokument nicht als klassifiziert.
+        self.assertIsNone(index.find(current_document_id=9, checksum="xyz"))
+        self.assertIsNone(index.find(current_document_id=9, checksum=""))
+        self.assertEqual(index.stats()["hits"], 2)
+        self.assertEqual(index.stats()["lookups"], 4)
+
+    def test_partial_updates_keep_checksum_and_changed_checksum_moves(self) -> None:
+        index = ChecksumIndex()
+        index.observe(_doc(1, "abc"))
+        self.assertIsNone(index.find(current_document_id=2, checksum="abc"))
+        index.observe({"id": 1, "document_type": 3, "tags": [7]})
+        self.assertEqual(index.find(current_document_id=2, checksum="abc")["document_type"], 3)
+        index.observe({"id": 1, "checksum": "neu"})
+        self.assertIsNone(index.find(current_document_id=2, checksum="abc"))
+        self.assertEqual(index.find(current_document_id=2, checksum="neu")["tags"], [7])
+        index.observe({"checksum": "ohne-id"})
+        self.assertEqual(len(index), 1)
+
+    def test_query_fallback_indexes_the_found_original(self) -> None:
+        index = ChecksumIndex()
+        index.record_query_fallback(None)
+        index.record_query_fallback(_doc(1, "abc", document_type=3, tags=[7]))
+        self.assertEqual(index.find(current_document_id=2, checksum="abc")["id"], 1)
+        self.assertEqual(index.stats()["query_fallbacks"], 2)
+
+
+class _FakeResponse:
+    def __init__(self, payload: dict) -> None:
+        self.status_code = 200
+        self.content = json.dumps(payload).encode("utf-8")
+        self.text = self.content.decode("utf-8")
+        self._payload = payload
+
+    def json(self) -> dict:
+        return self._payload
+
+
+class DocumentObserverTests(unittest.TestCase):
+    """PATCH-Antworten halten den Index aktuell."""
+
+    def test_patch_response_reaches_observer(self) -> None:
+        config = types.SimpleNamespace(paperless_url="http://paperless.invalid", request_timeout_seconds=5, paperless_token="t")
+        client = PaperlessClient(config)  # type: ignore[arg-type]
+        self.addCleanup(client.session.close)
+        index = ChecksumIndex()
+        index.observe(_doc(5, "abc"))
+        client.document_observer = index.observe
+        client.session.request = lambda method, url, **_kwargs: _FakeResponse(  # type: ignore[method-assign]
+            {"id": 5, "document_type": 3, "tags": [7]} if method == "PATCH" else {"results": []}
+        )
+
+        client._request("GET", "/api/documents/", params={"page_size": 1})
+        client._request("PATCH", "/api/documents/5/notes/", payload={})
+        self.assertIsNone(index.find(current_document_id=6, checksum="abc"))
+        client.update_document(5, {"document_type": 3, "tags": [7]})
+        self.assertEqual(index.find(current_document_id=6, checksum="abc")["id"], 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,121 @@
+"""Tests for the persistent SQLite classification cache.
+
+Purpose:
+- Ensure stored predictions are returned without internal `_meta*` keys.
+- Verify that prompt fingerprint and model are part of the cache key.
+- Protect age- and size-based eviction and the hit-rate metrics.
+
+How to run:
+- `python3 -m unittest discover -s tests`
+"""
+
+from __future__ import annotations
+
+import sys
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+
+ROOT = Path(__file__).resolve().parents[1]
+SRC_DIR = ROOT / "src"
+if str(SRC_DIR) not in sys.path:
+    sys.path.insert(0, str(SRC_DIR))
+
+import classification_cache  # noqa: E402
+from classification_cache import ClassificationCache, build_cache_key  # noqa: E402
+
+
+def _key(**overrides: str) -> str:
+    values = {
+        "title": "Stromrechnung",
+        "content_preview": "Stadtwerke Rechnung 12,34 EUR",
+        "prompt_fingerprint": "abc123",
+        "model": "gpt-test",
+    }
+    values.update(overrides)
+    return build_cache_key(**values)
+
+
+class ClassificationCacheTests(unittest.TestCase):
+    """Speichern, Wiederfinden und Verdrängen von KI-Ergebnissen."""
+
+    def setUp(self) -> None:
+        self._tmp = tempfile.TemporaryDirectory()
+        self.path = Path(self._tmp.name) / "cache" / "classification_cache.sqlite3"
+
+    def tearDown(self) -> None:
+        self._tmp.cleanup()
+
+    def test_key_changes_with_prompt_fingerprint_and_model(self) -> None:
+        base = _key()
+        self.assertEqual(base, _key())
+        self.assertNotEqual(base, _key(prompt_fingerprint="def456"))
+        self.assertNotEqual(base, _key(model="gpt-other"))
+        self.assertNotEqual(base, _key(content_preview="anderer Text"))
+
+    def test_roundtrip_survives_reopen_and_drops_meta_keys(self) -> None:
+        cache = ClassificationCache(self.path)
+        cache.put(
+            _key(),
+            {"document_type": "Rechnung", "tags": ["Strom"], "_meta_usage": {"prompt_tokens": 900}},
+            model="gpt-test",
+            prompt_fingerprint="abc123",
+            prompt_tokens=900,
+            completion_tokens=40,
+        )
+        cache.close()
+
+        reopened = ClassificationCache(self.path)
+        self.assertIsNone(reopened.get(_key(prompt_fingerprint="other")))
+        cached = reopened.get(_key())
+        self.assertEqual(cached, {"document_type": "Rechnung", "tags": ["Strom"]})
+
+        stats = reopened.stats()
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["hit_rate"], 0.5)
+        self.assertEqual(stats["saved_prompt_tokens"], 900)
+        self.assertEqual(stats["saved_completion_tokens"], 40)
+        reopened.close()
+
+    def test_expired_entries_are_misses_and_get_deleted(self) -> None:
+        cache = ClassificationCache(self.path, max_age_days=1)
+        with mock.patch.object(classification_cache.time, "time", return_value=time.time() - 3 * 86400):
+            cache.put(_key(), {"document_type": "Rechnung"}, model="gpt-test", prompt_fingerprint="abc123")
+
+        self.assertIsNone(cache.get(_key()))
+        self.assertEqual(cache.entry_count(), 0)
+        self.assertEqual(cache.stats()["evictions"], 1)
+        cache.close()
+
+    def test_evicts_least_recently_used_entries_above_limit(self) -> None:
+        cache = ClassificationCache(self.path, max_entries=2)
+        now = time.time()
+        for offset, name in enumerate(("alt", "mittel", "neu")):
+            with mock.patch.object(classification_cache.time, "time", return_value=now + offset):
+                cache.put(_key(title=name), {"title": name}, model="gpt-test", prompt_fingerprint="abc123")
+        with mock.patch.object(classification_cache.time, "time", return_value=now + 10):
+            self.assertIsNotNone(cache.get(_key(title="alt")))
+
+        self.assertEqual(cache.evict(), 1)
+        self.assertIsNotNone(cache.get(_key(title="alt")))
+        self.assertIsNone(cache.get(_key(title="mittel")))
+        self.assertIsNotNone(cache.get(_key(title="neu")))
+        cache.close()
+
+    def test_unusable_path_disables_cache_instead_of_raising(self) -> None:
+        blocker = Path(self._tmp.name) / "blocker"
+        blocker.write_text("x", encoding="utf-8")
+        cache = ClassificationCache(blocker / "cache.sqlite3")
+        self.assertFalse(cache.enabled)
+        self.assertIsNone(cache.get(_key()))
+        cache.put(_key(), {"document_type": "Rechnung"}, model="gpt-test", prompt_fingerprint="abc123")
+        self.assertFalse(cache.stats()["enabled"])
+        cache.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
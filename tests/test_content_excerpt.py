@@ -0,0 +1,113 @@
+"""Tests for token-aware content excerpts.
+
+Purpose:
+- Ensure short texts reach the prompt unchanged.
+- Verify long texts keep head, tail and keyword windows (IBAN, file numbers)
+  within the token budget.
+- Protect the classifier switch between fixed truncation and smart excerpts.
+
+How to run:
+- `python3 -m unittest discover -s tests`
+"""
+
+from __future__ import annotations
+
+import sys
+import types
+import unittest
+from pathlib import Path
+
+
+ROOT = Path(__file__).resolve().parents[1]
+SRC_DIR = ROOT / "src"
+if str(SRC_DIR) not in sys.path:
+    sys.path.insert(0, str(SRC_DIR))
+
+try:
+    import yaml  # noqa: F401
+except ImportError:
+    sys.modules["yaml"] = types.SimpleNamespace(safe_load=lambda *_args, **_kwargs: {})
+
+from content_excerpt import (  # noqa: E402
+    EXCERPT_GAP_MARKER,
+    MESSAGE_OVERHEAD_TOKENS,
+    build_excerpt,
+    estimate_message_tokens,
+    estimate_tokens,
+)
+from paperless_ai_sorter import AiClassifier  # noqa: E402
+from test_ai_pipeline import _classifier_config  # noqa: E402
+
+
+def _long_contract() -> str:
+    filler = "Die Vertragsparteien vereinbaren die folgenden allgemeinen Bedingungen ausführlich.\n"
+    return (
+        "Stadtwerke Musterstadt GmbH\nVersorgungsvertrag Strom\n"
+        + filler * 200
+        + "Aktenzeichen: SW-2024-99812\n"
+        + filler * 200
+        + "Bitte überweisen Sie auf IBAN DE89 3704 0044 0532 0130 00\n"
+        + filler * 200
+        + "Mit freundlichen Grüßen\nIhr Kundenservice Ende"
+    )
+
+
+class ContentExcerptTests(unittest.TestCase):
+    """Auszug aus Kopf, Schlüsselwort-Fenstern und Ende."""
+
+    def test_short_text_is_returned_unchanged(self) -> None:
+        text = "Rechnung Nr. 42 vom 01.02.2024 über 12,34 EUR"
+        excerpt = build_excerpt(text, 500)
+        self.assertEqual(excerpt.text, text)
+        self.assertFalse(excerpt.truncated)
+        self.assertEqual(excerpt.omitted_chars, 0)
+
+    def test_long_text_keeps_head_tail_and_keywords_within_budget(self) -> None:
+        text = _long_contract()
+        excerpt = build_excerpt(text, 600)
+
+        self.assertTrue(excerpt.truncated)
+        self.assertLessEqual(excerpt.estimated_tokens, 600)
+        self.assertEqual(excerpt.estimated_tokens, estimate_tokens(excerpt.text))
+        self.assertTrue(excerpt.text.startswith("Stadtwerke Musterstadt GmbH"))
+        self.assertTrue(excerpt.text.endswith("Ihr Kundenservice Ende"))
+        self.assertIn("SW-2024-99812", excerpt.text)
+        self.assertIn("DE89 3704 0044 0532 0130 00", excerpt.text)
+        self.assertIn(EXCERPT_GAP_MARKER, excerpt.text)
+        self.assertEqual(excerpt.omitted_chars, len(text) - len(excerpt.text))
+
+    def test_message_estimate_adds_per_message_overhead(self) -> None:
+        messages = [{"role": "system", "content": "abcd"}, {"role": "user", "content": "12345"}]
+        self.assertEqual(estimate_message_tokens(messages), 2 * MESSAGE_OVERHEAD_TOKENS + 1 + 2)
+
+
+class ClassifierExcerptModeTests(unittest.TestCase):
+    """Umschalten zwischen festem Schnitt und Token-Budget im Klassifizierer."""
+
+    def _classifier(self, mode: str) -> AiClassifier:
+        config = _classifier_config(ai_content_excerpt_mode=mode, ai_content_max_tokens=600)
+        classifier = AiClassifier(config)
+        self.addCleanup(classifier.session.close)
+        return classifier
+
+    def test_truncate_mode_keeps_fixed_character_cut(self) -> None:
+        document = {"content": _long_contract()}
+        preview = self._classifier("truncate")._content_preview(document)
+        self.assertEqual(preview, document["content"][:6000])
+
+    def test_smart_mode_builds_excerpt_once_per_document(self) -> None:
+        classifier = self._classifier("smart")
+        document = {"content": _long_contract()}
+
+        first = classifier._content_preview(document)
+        second = classifier._content_preview(document)
+
+        self.assertIs(first, second)
+        self.assertIn("DE89 3704 0044 0532 0130 00", first)
+        self.assertEqual(classifier.excerpts_built, 1)
+        self.assertEqual(classifier.excerpts_truncated, 1)
+        self.assertGreater(classifier.excerpt_chars_omitted, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,132 @@
+"""Tests for the incremental delta sync.
+
+Purpose:
+- Ensure the cursor listing sees every changed document exactly once, even
+  when the run updates documents or many share one `modified` timestamp.
+- Verify the persisted watermark, boundary ids and retry ids.
+
+How to run:
+- `python3 -m unittest discover -s tests`
+"""
+
+from __future__ import annotations
+
+import sys
+import unittest
+from pathlib import Path
+
+
+ROOT = Path(__file__).resolve().parents[1]
+SRC_DIR = ROOT / "src"
+if str(SRC_DIR) not in sys.path:
+    sys.path.insert(0, str(SRC_DIR))
+
+from delta_sync import DeltaSync, parse_modified  # noqa: E402
+
+
+class FakePaperless:
+    """Kleine Dokumentliste mit den Filtern, die der Delta-Sync nutzt."""
+
+    def __init__(self, modified_by_id: dict) -> None:
+        self.docs = {doc_id: {"id": doc_id, "modified": modified} for doc_id, modified in modified_by_id.items()}
+        self.requests: list = []
+
+    def iter_documents(self, limit, extra_params=None):
+        params = dict(extra_params or {})
+        self.requests.append(params)
+        docs = list(self.docs.values())
+        for key, check in (
+            ("modified__gt", lambda value, bound: value > bound),
+            ("modified__gte", lambda value, bound: value >= bound),
+            ("modified__lte", lambda value, bound: value <= bound),
+        ):
+            if key in params:
+                docs = [doc for doc in docs if check(parse_modified(doc["modified"]), parse_modified(params[key]))]
+        descending = str(params.get("ordering", "")).startswith("-")
+        docs.sort(key=lambda doc: (parse_modified(doc["modified"]), doc["id"]), reverse=descending)
+        return [dict(doc) for doc in docs[:limit]]
+
+
+def _ts(second: int) -> str:
+    return f"2025-02-01T10:{second // 60:02d}:{second % 60:02d}Z"
+
+
+def _run(delta: DeltaSync, paperless: FakePaperless, limit=None, *, patch=True, page_size=3) -> list:
+    """Verbraucht die Liste wie die Hauptschleife und „patcht“ jedes Dokument."""
+
+    seen = []
+    for document in delta.iter_changed(paperless.iter_documents, {}, limit, page_size=page_size):
+        delta.observe(document)
+        seen.append(document["id"])
+        if patch:
+            paperless.docs[document["id"]]["modified"] = "2025-03-01T00:00:00Z"
+    delta.finish()
+    return seen
+
+
+class DeltaSyncTests(unittest.TestCase):
+    """Wasserzeichen über `modified`."""
+
+    def test_cursor_listing_survives_own_updates_and_skips_them(self) -> None:
+        paperless = FakePaperless({doc_id: _ts(doc_id) for doc_id in range(1, 11)})
+        delta = DeltaSync({"tags__id": 1})
+        self.assertEqual(_run(delta, paperless), list(range(1, 11)))
+        state = delta.to_state()
+        self.assertEqual((state["watermark"], state["boundary_ids"]), (_ts(10), [10]))
+        self.assertTrue(state["boundary_complete"])
+        # Eigene Updates liegen über der Obergrenze des ersten Laufs und kommen einmal wieder.
+        second = DeltaSync({"tags__id": 1}, state)
+        self.assertEqual(second.query_params(), {"modified__gte": _ts(10)})
+        self.assertEqual(_run(second, paperless, patch=False), list(range(1, 11)))
+        third = DeltaSync({"tags__id": 1}, second.to_state())
+        self.assertEqual(_run(third, paperless), [])
+        self.assertEqual(third.to_state()["watermark"], "2025-03-01T00:00:00Z")
+
+    def test_tie_group_larger_than_a_page_is_listed_once(self) -> None:
+        paperless = FakePaperless({**{doc_id: _ts(5) for doc_id in range(1, 9)}, 9: _ts(6)})
+        delta = DeltaSync({}, {"version": 1, "scope": {}, "watermark": _ts(5), "boundary_ids": [1, 2, 3]})
+        self.assertEqual(_run(delta, paperless, page_size=3), [4, 5, 6, 7, 8, 9])
+        self.assertGreaterEqual(delta.stats()["boundary_skipped"], 3)
+
+    def test_budget_break_keeps_current_document_for_next_run(self) -> None:
+        paperless = FakePaperless({1: _ts(1), 2: _ts(2), 3: _ts(2), 4: _ts(3)})
+        delta = DeltaSync({})
+        for document in delta.iter_changed(paperless.iter_documents, {}, None):
+            delta.observe(document)
+            if document["id"] == 3:
+                break
+        state = delta.to_state()
+        self.assertEqual((state["watermark"], state["boundary_ids"], state["boundary_complete"]), (_ts(2), [2], False))
+        self.assertEqual(_run(DeltaSync({}, state), paperless), [3, 4])
+
+    def test_failed_documents_become_retry_ids_and_leave_the_listing(self) -> None:
+        paperless = FakePaperless({1: _ts(1), 2: _ts(2), 3: _ts(3)})
+        delta = DeltaSync({})
+        for document in delta.iter_changed(paperless.iter_documents, {}, None):
+            delta.observe(document)
+            if document["id"] == 2:
+                delta.mark_failed(2)
+        delta.finish()
+        state = delta.to_state(quarantined_ids=["7", "x"])
+        self.assertEqual((state["watermark"], state["retry_ids"]), (_ts(3), [2, 7]))
+        paperless.docs[2]["modified"] = _ts(9)
+        retry = DeltaSync({}, state)
+        self.assertEqual(retry.retry_id_chunks(), ["2,7"])
+        self.assertEqual(_run(retry, paperless), [])
+        self.assertEqual(retry.to_state()["retry_ids"], [])
+
+    def test_changed_scope_or_version_discards_watermark(self) -> None:
+        state = DeltaSync({"tags__id": 1}, {"version": 1, "scope": {"tags__id": "1"}, "watermark": _ts(1)}).to_state()
+        self.assertEqual(state["watermark"], _ts(1))
+        other = DeltaSync({"tags__id": 2}, state)
+        self.assertTrue(other.scope_changed)
+        self.assertEqual(other.query_params(), {})
+        self.assertEqual(DeltaSync({"tags__id": 1}, {**state, "version": 0}).watermark, "")
+
+    def test_parse_modified_compares_across_offsets(self) -> None:
+        self.assertEqual(parse_modified("2025-10-26T02:30:00+02:00"), parse_modified("2025-10-26T00:30:00Z"))
+        self.assertIsNone(parse_modified("gestern"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,130 @@
+"""Tests for the Paperless document listing.
+
+Purpose:
+- Ensure the projected listing (`document_listing_mode: projected`) carries
+  every field the gates read before the content is loaded.
+- Verify the `fields=` request and the single-document reload.
+- Ensure prefetched listings (`paperless_prefetch_pages`) return the same
+  documents and never fetch pages past the limit.
+
+How to run:
+- `python3 -m unittest discover -s tests`
+"""
+
+from __future__ import annotations
+
+import json
+import sys
+import types
+import unittest
+from pathlib import Path
+
+
+ROOT = Path(__file__).resolve().parents[1]
+SRC_DIR = ROOT / "src"
+if str(SRC_DIR) not in sys.path:
+    sys.path.insert(0, str(SRC_DIR))
+
+try:
+    import yaml  # noqa: F401
+except ImportError:
+    sys.modules["yaml"] = types.SimpleNamespace(safe_load=lambda *_args, **_kwargs: {})
+
+from checksum_index import SCAN_FIELDS  # noqa: E402
+from paperless_ai_sorter import (  # noqa: E402
+    DOCUMENT_LISTING_FIELDS,
+    PaperlessClient,
+    collect_document_names,
+    should_process_document,
+)
+
+
+class _FakeResponse:
+    def __init__(self, payload: dict) -> None:
+        self.status_code = 200
+        self.content = json.dumps(payload).encode("utf-8")
+        self.text = self.content.decode("utf-8")
+        self._payload = payload
+
+    def json(self) -> dict:
+        return self._payload
+
+
+def _client(test: unittest.TestCase, responses: dict, calls: list) -> PaperlessClient:
+    config = types.SimpleNamespace(paperless_url="http://paperless.invalid", request_timeout_seconds=5, paperless_token="t")
+    client = PaperlessClient(config)  # type: ignore[arg-type]
+    test.addCleanup(client.session.close)
+
+    def fake_request(method, url, **kwargs):
+        path = url.replace("http://paperless.invalid", "")
+        calls.append((method, path, kwargs.get("params")))
+        return _FakeResponse(responses[path])
+
+    client.session.request = fake_request  # type: ignore[method-assign]
+    return client
+
+
+class ProjectedListingTests(unittest.TestCase):
+    """Liste ohne OCR-Inhalt, Inhalt pro Dokument nachladen."""
+
+    def test_projection_covers_gate_fields(self) -> None:
+        self.assertNotIn("content", DOCUMENT_LISTING_FIELDS)
+        # Checksum-Index im Modus `stream` und Delta-Sync lesen die gelisteten Seiten.
+        self.assertTrue(set(SCAN_FIELDS) <= set(DOCUMENT_LISTING_FIELDS))
+        self.assertTrue({"modified", "custom_fields"} <= set(DOCUMENT_LISTING_FIELDS))
+        projected = {field: None for field in DOCUMENT_LISTING_FIELDS}
+        projected.update(id=1, title="Scan", original_file_name="scan.pdf", tags=[3], document_type=2)
+        self.assertFalse(should_process_document(projected))
+        self.assertEqual(collect_document_names(projected), ["scan.pdf", "Scan"])
+
+    def test_fields_param_and_single_document_reload(self) -> None:
+        calls: list = []
+        client = _client(
+            self,
+            {
+                "/api/documents/": {"next": None, "results": [{"id": 4, "title": "Scan"}]},
+                "/api/documents/4/": {"id": 4, "title": "Scan", "content": "Rechnung"},
+            },
+            calls,
+        )
+        listed = list(client.iter_documents(10, extra_params={"fields": ",".join(DOCUMENT_LISTING_FIELDS)}))
+        self.assertEqual(listed, [{"id": 4, "title": "Scan"}])
+        self.assertEqual(calls[0][2]["fields"], ",".join(DOCUMENT_LISTING_FIELDS))
+        self.assertEqual(client.get_document(4)["content"], "Rechnung")
+        self.assertEqual(calls[1][:2], ("GET", "/api/documents/4/"))
+
+
+class PrefetchedListingTests(unittest.TestCase):
+    """Seiten-Vorabruf in `iter_documents` und `list_named_entities`."""
+
+    def _paged_client(self, pages: int, calls: list) -> PaperlessClient:
+        responses = {}
+        for number in range(1, pages + 1):
+            path = "/api/documents/" if number == 1 else f"/api/documents/?page={number}"
+            next_url = f"http://paperless.invalid/api/documents/?page={number + 1}" if number < pages else None
+            responses[path] = {"next": next_url, "results": [{"id": number * 10 + offset} for offset in range(2)]}
+        responses["/api/tags/"] = {"next": None, "results": [{"id": 1, "name": "Rechnung"}]}
+        client = _client(self, responses, calls)
+        client.prefetch_pages = 2
+        # Der Vorabruf nutzt eine eigene Session mit demselben Fake.
+        client._build_session = lambda: types.SimpleNamespace(request=client.session.request, close=lambda: None)  # type: ignore[method-assign]
+        return client
+
+    def test_prefetched_pages_match_and_stop_at_limit(self) -> None:
+        calls: list = []
+        client = self._paged_client(5, calls)
+        documents = list(client.iter_documents(None, extra_params={"page_size": 2}))
+        self.assertEqual([doc["id"] for doc in documents], [10, 11, 20, 21, 30, 31, 40, 41, 50, 51])
+
+        calls.clear()
+        documents = list(client.iter_documents(5, extra_params={"page_size": 2}))
+        self.assertEqual([doc["id"] for doc in documents], [10, 11, 20, 21, 30])
+        # Nach fünf Einträgen keine weitere Seite vorladen.
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(client.list_named_entities("/api/tags/"), {"rechnung": 1})
+        self.assertEqual(client.prefetch_stats["listings"], 3)
+        self.assertEqual(client.prefetch_stats["pages"], 9)
+
+
+if __name__ == "__main__":
+    unittest.main()
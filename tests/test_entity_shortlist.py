@@ -0,0 +1,132 @@
+"""Tests for the per-document entity shortlist.
+
+Purpose:
+- Ensure names found in the document rank first, independent of umlaut
+  spelling and punctuation.
+- Verify recall@k measurement used by the benchmark CLI.
+- Protect the prompt contract: long lists move from the system prompt to
+  per-document candidates, short lists stay where they were.
+
+How to run:
+- `python3 -m unittest discover -s tests`
+"""
+
+from __future__ import annotations
+
+import json
+import sys
+import types
+import unittest
+from pathlib import Path
+
+
+ROOT = Path(__file__).resolve().parents[1]
+SRC_DIR = ROOT / "src"
+if str(SRC_DIR) not in sys.path:
+    sys.path.insert(0, str(SRC_DIR))
+
+try:
+    import yaml  # noqa: F401
+except ImportError:
+    sys.modules["yaml"] = types.SimpleNamespace(safe_load=lambda *_args, **_kwargs: {})
+
+from entity_shortlist import EntityShortlistIndex, benchmark_recall, normalize_text  # noqa: E402
+from paperless_ai_sorter import AiClassifier  # noqa: E402
+from test_ai_pipeline import _classifier_config  # noqa: E402
+
+
+CORRESPONDENTS = [
+    "Stadtwerke Musterstadt GmbH",
+    "Zahnarztpraxis Dr. Müller",
+    "Allianz Versicherungs-AG",
+    "Finanzamt Musterstadt",
+    "Deutsche Telekom AG",
+    "Techniker Krankenkasse",
+]
+
+
+class EntityShortlistIndexTests(unittest.TestCase):
+    """Rangfolge bekannter Namen anhand des Dokumenttexts."""
+
+    def test_normalization_spells_out_umlauts(self) -> None:
+        self.assertEqual(normalize_text("Zahnarztpraxis Dr. MÜLLER-Lüdenscheidt"), "zahnarztpraxis dr mueller luedenscheidt")
+
+    def test_name_mentioned_in_text_ranks_first(self) -> None:
+        index = EntityShortlistIndex(CORRESPONDENTS)
+        text = "Rechnung\nZahnarztpraxis Dr. Mueller, Hauptstr. 1\nBehandlung vom 03.02.2024"
+        ranked = index.rank(text, 3)
+
+        self.assertEqual(ranked[0][0], "Zahnarztpraxis Dr. Müller")
+        self.assertGreater(ranked[0][1], 0.9)
+        self.assertLessEqual(len(ranked), 3)
+
+    def test_ranking_is_deterministic_and_skips_unrelated_names(self) -> None:
+        index = EntityShortlistIndex(reversed(CORRESPONDENTS))
+        self.assertEqual(index.names, sorted(CORRESPONDENTS))
+        self.assertEqual(index.top_k("xyz", 5), [])
+        first = index.top_k("Telekom Rechnung Januar", 4)
+        self.assertEqual(first, index.top_k("Telekom Rechnung Januar", 4))
+        self.assertEqual(first[0], "Deutsche Telekom AG")
+
+    def test_benchmark_recall_per_k(self) -> None:
+        index = EntityShortlistIndex(CORRESPONDENTS)
+        samples = [
+            ("Ihre Stromrechnung der Stadtwerke Musterstadt GmbH", "Stadtwerke Musterstadt GmbH"),
+            ("Beitragsbescheid der Techniker Krankenkasse", "Techniker Krankenkasse"),
+            ("Kein Hinweis auf den Absender", "Allianz Versicherungs-AG"),
+        ]
+        recall = benchmark_recall(index, samples, [1, 3])
+        self.assertEqual(recall, {1: 0.6667, 3: 1.0})
+
+
+class ClassifierShortlistPromptTests(unittest.TestCase):
+    """Kandidaten statt vollständiger Listen im Prompt."""
+
+    def _classifier(self, top_k: int) -> AiClassifier:
+        config = _classifier_config(ai_entity_shortlist_top_k=top_k)
+        classifier = AiClassifier(config)
+        self.addCleanup(classifier.session.close)
+        classifier.set_known_entities(
+            document_types=["Rechnung", "Vertrag"],
+            correspondents=CORRESPONDENTS,
+            storage_paths=["Finanzen"],
+        )
+        return classifier
+
+    def test_long_lists_become_per_document_candidates(self) -> None:
+        classifier = self._classifier(top_k=2)
+        document = {"title": "Telekom Rechnung", "content": "Deutsche Telekom AG, Mobilfunk Januar"}
+
+        body = classifier.classification_request_body(document)
+        system_prompt = body["messages"][0]["content"]
+        user_payload = json.loads(body["messages"][1]["content"].split("\n", 1)[1])
+
+        self.assertNotIn("Stadtwerke Musterstadt GmbH", system_prompt)
+        self.assertIn('"known_document_types"', system_prompt)
+        self.assertIn("candidate_correspondents", system_prompt)
+        self.assertEqual(user_payload["candidate_correspondents"][0], "Deutsche Telekom AG")
+        self.assertLessEqual(len(user_payload["candidate_correspondents"]), 2)
+        self.assertNotIn("candidate_document_types", user_payload)
+        self.assertEqual(classifier.entity_shortlist_queries, 1)
+
+    def test_disabled_shortlist_keeps_full_lists(self) -> None:
+        classifier = self._classifier(top_k=0)
+        body = classifier.classification_request_body({"title": "x", "content": "y"})
+        self.assertIn("Stadtwerke Musterstadt GmbH", body["messages"][0]["content"])
+        self.assertNotIn("candidate_", body["messages"][1]["content"])
+
+    def test_fingerprint_follows_shortlisted_entities(self) -> None:
+        classifier = self._classifier(top_k=2)
+        classifier.system_prompt()
+        before = classifier.prompt_fingerprint
+        classifier.set_known_entities(
+            document_types=["Rechnung", "Vertrag"],
+            correspondents=[*CORRESPONDENTS, "Neuer Absender GmbH"],
+            storage_paths=["Finanzen"],
+        )
+        classifier.system_prompt()
+        self.assertNotEqual(before, classifier.prompt_fingerprint)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,105 @@
+"""Tests for the shared Paperless HTTP transport.
+
+Purpose:
+- Ensure sessions created through one transport share keep-alive
+  connections and that `reused`, `opened` and `failed` are counted per host.
+- Verify that closing a single session keeps the shared pool alive and that
+  compression can be switched off.
+
+How to run:
+- `python3 -m unittest discover -s tests`
+"""
+
+from __future__ import annotations
+
+import socket
+import sys
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import requests
+
+
+ROOT = Path(__file__).resolve().parents[1]
+SRC_DIR = ROOT / "src"
+if str(SRC_DIR) not in sys.path:
+    sys.path.insert(0, str(SRC_DIR))
+
+from http_transport import HttpTransport  # noqa: E402
+
+
+class _KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    seen_encodings: list = []
+
+    def do_GET(self) -> None:  # noqa: N802 - Name vorgegeben von BaseHTTPRequestHandler.
+        type(self).seen_encodings.append(self.headers.get("Accept-Encoding"))
+        body = b'{"ok": true}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *_args) -> None:
+        return
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return int(sock.getsockname()[1])
+
+
+class HttpTransportTests(unittest.TestCase):
+    """Gemeinsamer Verbindungs-Pool über mehrere Sessions."""
+
+    def setUp(self) -> None:
+        _KeepAliveHandler.seen_encodings = []
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _KeepAliveHandler)
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(thread.join, 5)
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        host, port = self.server.server_address
+        self.url = f"http://{host}:{port}/api/"
+        self.host_key = f"{host}:{port}"
+
+    def test_sessions_share_keep_alive_connections(self) -> None:
+        transport = HttpTransport(pool_maxsize=2)
+        self.addCleanup(transport.close)
+        first = transport.new_session({"Authorization": "Token a"})
+        second = transport.new_session({"Authorization": "Token b"})
+        for session in (first, second, first):
+            self.assertEqual(session.get(self.url, timeout=5).json(), {"ok": True})
+        # Schließen einer Session lässt den Pool für die anderen offen.
+        first.close()
+        second.get(self.url, timeout=5)
+
+        stats = transport.stats()
+        self.assertEqual(stats["hosts"][self.host_key], {"requests": 4, "opened": 1, "reused": 3, "failed": 0})
+        self.assertEqual((stats["requests"], stats["pool_maxsize"]), (4, 2))
+        self.assertEqual(second.headers["Authorization"], "Token b")
+        self.assertIn("gzip", _KeepAliveHandler.seen_encodings[0])
+
+    def test_failed_connections_and_disabled_compression(self) -> None:
+        transport = HttpTransport(compression=False)
+        self.addCleanup(transport.close)
+        session = transport.new_session()
+        session.get(self.url, timeout=5)
+        self.assertEqual(_KeepAliveHandler.seen_encodings, ["identity"])
+
+        port = _free_port()
+        with self.assertRaises(requests.ConnectionError):
+            session.get(f"http://127.0.0.1:{port}/api/", timeout=2)
+        failed = transport.stats()["hosts"][f"127.0.0.1:{port}"]
+        self.assertEqual((failed["requests"], failed["failed"]), (1, 1))
+        self.assertTrue(transport.matches(pool_maxsize=10, compression=False))
+        self.assertFalse(transport.matches(pool_maxsize=10, compression=True))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,149 @@
+"""Tests for the near-duplicate MinHash index.
+
+Purpose:
+- Ensure rescans with a few OCR errors are found, unrelated texts are not.
+- Verify the number guard: same template with other amounts/dates is no
+  duplicate.
+- Protect persistence and the incremental `modified` watermark refresh.
+
+How to run:
+- `python3 -m unittest discover -s tests`
+"""
+
+from __future__ import annotations
+
+import random
+import sys
+import tempfile
+import types
+import unittest
+from pathlib import Path
+
+
+ROOT = Path(__file__).resolve().parents[1]
+SRC_DIR = ROOT / "src"
+if str(SRC_DIR) not in sys.path:
+    sys.path.insert(0, str(SRC_DIR))
+
+try:
+    import yaml  # noqa: F401
+except ImportError:
+    sys.modules["yaml"] = types.SimpleNamespace(safe_load=lambda *_args, **_kwargs: {})
+
+from near_duplicate_index import NearDuplicateIndex, estimated_similarity, signature  # noqa: E402
+from paperless_ai_sorter import near_duplicate_metadata, refresh_near_duplicate_index  # noqa: E402
+
+
+METADATA = {"document_type": 1, "correspondent": 2, "storage_path": 3, "created": "2025-01-01", "tags": [5]}
+
+
+def _page(seed: int, *, numbers: str = "Vertrag 4711 vom 01.02.2025", ocr_errors: int = 0) -> str:
+    rnd = random.Random(seed)
+    words = ["".join(rnd.choice("abcdefghij") for _ in range(6)) for _ in range(200)]
+    noise = random.Random(seed + 1000)
+    for _ in range(ocr_errors):
+        words[noise.randrange(len(words))] = "ocrfehler"
+    return f"{' '.join(words)} {numbers}"
+
+
+class NearDuplicateIndexTests(unittest.TestCase):
+    """Beinahe-Dubletten über MinHash-Signaturen."""
+
+    def _index(self, **kwargs) -> NearDuplicateIndex:
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        index = NearDuplicateIndex(Path(tmp.name) / "near.sqlite3", **kwargs)
+        self.addCleanup(index.close)
+        return index
+
+    def test_signature_estimates_similarity_and_ignores_short_texts(self) -> None:
+        original = signature(_page(1))
+        self.assertEqual(estimated_similarity(original[0], signature(_page(1))[0]), 1.0)
+        self.assertGreater(estimated_similarity(original[0], signature(_page(1, ocr_errors=4))[0]), 0.8)
+        self.assertLess(estimated_similarity(original[0], signature(_page(2))[0]), 0.2)
+        self.assertEqual(original[1], frozenset({"4711", "01", "02", "2025"}))
+        self.assertIsNone(signature("Kurzer Brief 123"))
+
+    def test_rescan_finds_original_metadata(self) -> None:
+        index = self._index()
+        self.assertTrue(index.add(10, _page(1), METADATA))
+        index.add(11, _page(2), {**METADATA, "document_type": 9})
+        match = index.find(_page(1, ocr_errors=4), exclude_id=20)
+        self.assertIsNotNone(match)
+        self.assertEqual((match.doc_id, match.metadata), (10, METADATA))
+        self.assertGreaterEqual(match.similarity, 0.8)
+        self.assertIsNone(index.find(_page(3)))
+        # Das Dokument selbst ist keine Dublette.
+        self.assertIsNone(index.find(_page(1), exclude_id=10))
+        self.assertEqual(index.stats()["hits"], 1)
+        self.assertEqual(index.stats()["lookups"], 3)
+
+    def test_other_numbers_are_not_a_duplicate(self) -> None:
+        index = self._index()
+        index.add(10, _page(1), METADATA)
+        self.assertIsNone(index.find(_page(1, numbers="Vertrag 4712 vom 01.03.2025")))
+        lenient = self._index(min_number_overlap=0.0)
+        lenient.add(10, _page(1), METADATA)
+        self.assertIsNotNone(lenient.find(_page(1, numbers="Vertrag 4712 vom 01.03.2025")))
+
+    def test_persists_entries_and_watermark(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "near.sqlite3"
+            index = NearDuplicateIndex(path)
+            index.add(10, _page(1), METADATA, modified="2025-01-01T00:00:00Z")
+            index.add(11, _page(2), METADATA)
+            index.remove(11)
+            index.set_watermark("2025-01-01T00:00:00Z")
+            index.close()
+
+            reopened = NearDuplicateIndex(path)
+            try:
+                self.assertEqual(len(reopened), 1)
+                self.assertEqual(reopened.watermark, "2025-01-01T00:00:00Z")
+                self.assertEqual(reopened.find(_page(1, ocr_errors=2)).metadata, METADATA)
+            finally:
+                reopened.close()
+
+
+class RefreshNearDuplicateIndexTests(unittest.TestCase):
+    """Abgleich mit Paperless und Metadaten-Snapshot."""
+
+    def test_metadata_requires_document_type_and_tags(self) -> None:
+        document = {"document_type": 1, "correspondent": None, "storage_path": 3, "created": "2025-01-01", "tags": [7, 2]}
+        self.assertEqual(
+            near_duplicate_metadata(document),
+            {"document_type": 1, "storage_path": 3, "created": "2025-01-01", "tags": [2, 7]},
+        )
+        self.assertIsNone(near_duplicate_metadata({**document, "tags": []}))
+        self.assertIsNone(near_duplicate_metadata({**document, "document_type": None}))
+
+    def test_refresh_uses_watermark_and_drops_unclassified_documents(self) -> None:
+        calls: list = []
+        documents = [
+            {"id": 1, "content": _page(1), "modified": "2025-01-01T00:00:00Z", **METADATA},
+            {"id": 2, "content": _page(2), "modified": "2025-01-02T00:00:00Z", **METADATA, "tags": []},
+        ]
+
+        class FakeClient:
+            def iter_documents(self, limit=None, extra_params=None):
+                calls.append(dict(extra_params or {}))
+                return iter(documents)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            index = NearDuplicateIndex(Path(tmp) / "near.sqlite3")
+            try:
+                index.set_watermark("2024-12-31T00:00:00Z")
+                counts = refresh_near_duplicate_index(FakeClient(), index, ki_tag_id=5, limit=100)
+                self.assertEqual(counts, {"fetched": 2, "added": 1, "skipped": 1})
+                self.assertEqual(
+                    calls[0],
+                    {"tags__id__all": 5, "ordering": "modified", "modified__gt": "2024-12-31T00:00:00Z"},
+                )
+                self.assertEqual(index.watermark, "2025-01-02T00:00:00Z")
+                self.assertEqual(len(index), 1)
+            finally:
+                index.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
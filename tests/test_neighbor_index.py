@@ -0,0 +1,150 @@
+"""Tests for the nearest-neighbour classifier index.
+
+Purpose:
+- Ensure recurring documents find each other while changing numbers and
+  amounts do not matter.
+- Verify the vote rules (similarity, neighbour count, agreement).
+- Protect persistence and the incremental `modified` watermark refresh.
+
+How to run:
+- `python3 -m unittest discover -s tests`
+"""
+
+from __future__ import annotations
+
+import sys
+import tempfile
+import types
+import unittest
+from pathlib import Path
+
+
+ROOT = Path(__file__).resolve().parents[1]
+SRC_DIR = ROOT / "src"
+if str(SRC_DIR) not in sys.path:
+    sys.path.insert(0, str(SRC_DIR))
+
+try:
+    import yaml  # noqa: F401
+except ImportError:
+    sys.modules["yaml"] = types.SimpleNamespace(safe_load=lambda *_args, **_kwargs: {})
+
+from neighbor_index import NeighborIndex, term_counts  # noqa: E402
+from paperless_ai_sorter import neighbor_document_labels, refresh_neighbor_index  # noqa: E402
+
+
+STROM = "Stadtwerke Musterstadt Stromrechnung Abschlag Verbrauch Zähler Kilowattstunden Monat {n} Betrag {n},99 EUR"
+GEHALT = "Gehaltsabrechnung Arbeitgeber Lohnsteuer Sozialversicherung Nettobezug Auszahlung Monat {n}"
+
+
+class FakeClient:
+    def __init__(self, documents: list) -> None:
+        self.documents = documents
+        self.calls: list = []
+
+    def iter_documents(self, limit=None, extra_params=None):
+        self.calls.append((limit, dict(extra_params or {})))
+        watermark = (extra_params or {}).get("modified__gt", "")
+        matching = sorted((doc for doc in self.documents if doc["modified"] > watermark), key=lambda doc: doc["modified"])
+        return iter(matching[:limit] if limit else matching)
+
+
+class NeighborIndexTests(unittest.TestCase):
+    """Suche und Abstimmung über ähnliche Dokumente."""
+
+    def _index(self) -> NeighborIndex:
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        index = NeighborIndex(Path(tmp.name) / "neighbors.sqlite3")
+        self.addCleanup(index.close)
+        return index
+
+    def test_term_counts_ignore_digits_and_short_tokens(self) -> None:
+        self.assertEqual(term_counts("Rechnung Nr 4711 vom 01.02.2025, Rechnung ab"), {"rechnung": 2, "vom": 1})
+
+    def test_recurring_documents_agree_and_others_do_not_match(self) -> None:
+        index = self._index()
+        for n in range(1, 4):
+            index.add(n, STROM.format(n=n), (1, 2, 3))
+            index.add(10 + n, GEHALT.format(n=n), (4, 5, 6))
+        vote = index.predict(STROM.format(n=12))
+        self.assertIsNotNone(vote)
+        self.assertEqual(vote.labels, (1, 2, 3))
+        self.assertEqual(vote.agreement, 1.0)
+        self.assertEqual(sorted(vote.neighbor_ids), [1, 2, 3])
+        self.assertIsNone(index.predict("Urlaubsfoto vom Strand am Meer"))
+        self.assertEqual(index.stats()["queries"], 2)
+        self.assertEqual(index.stats()["confident"], 1)
+
+    def test_disagreeing_or_too_few_neighbors_give_no_vote(self) -> None:
+        index = self._index()
+        index.add(1, STROM.format(n=1), (1, 2, 3))
+        self.assertIsNone(index.predict(STROM.format(n=2)))
+        self.assertIsNotNone(index.predict(STROM.format(n=2), min_neighbors=1))
+        index.add(2, STROM.format(n=2), (1, 2, 9))
+        self.assertIsNone(index.predict(STROM.format(n=3)))
+        self.assertIsNotNone(index.predict(STROM.format(n=3), min_agreement=0.5))
+        # Das Dokument selbst zählt nicht als eigener Nachbar.
+        self.assertEqual([doc_id for doc_id, _ in index.neighbors(STROM.format(n=1), exclude_id=1)], [2])
+
+    def test_remove_and_empty_text_drop_documents(self) -> None:
+        index = self._index()
+        index.add(1, STROM.format(n=1), (1, 2, 3))
+        index.add(2, GEHALT.format(n=1), (4, 5, 6))
+        index.remove(1)
+        self.assertFalse(index.add(2, "1234 56", (4, 5, 6)))
+        self.assertEqual(len(index), 0)
+
+    def test_persists_entries_and_watermark(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "neighbors.sqlite3"
+            index = NeighborIndex(path)
+            index.add(1, STROM.format(n=1), (1, 2, 3), modified="2025-01-01T00:00:00Z")
+            index.add(2, STROM.format(n=2), (1, 2, 3))
+            index.set_watermark("2025-01-01T00:00:00Z")
+            index.set_watermark("2024-12-01T00:00:00Z")
+            index.close()
+
+            reopened = NeighborIndex(path)
+            try:
+                self.assertEqual(len(reopened), 2)
+                self.assertEqual(reopened.watermark, "2025-01-01T00:00:00Z")
+                self.assertEqual(reopened.labels_of(2), (1, 2, 3))
+            finally:
+                reopened.close()
+
+
+class RefreshNeighborIndexTests(unittest.TestCase):
+    """Inkrementeller Abgleich mit Paperless über das `modified`-Wasserzeichen."""
+
+    def test_refresh_is_incremental_and_skips_incomplete_documents(self) -> None:
+        documents = [
+            {"id": 1, "title": "Strom", "content": STROM.format(n=1), "document_type": 1, "correspondent": 2,
+             "storage_path": 3, "modified": "2025-01-01T00:00:00Z"},
+            {"id": 2, "title": "Strom", "content": STROM.format(n=2), "document_type": 1, "correspondent": None,
+             "storage_path": 3, "modified": "2025-01-02T00:00:00Z"},
+        ]
+        client = FakeClient(documents)
+        with tempfile.TemporaryDirectory() as tmp:
+            index = NeighborIndex(Path(tmp) / "neighbors.sqlite3")
+            try:
+                counts = refresh_neighbor_index(client, index, ki_tag_id=7, limit=None)
+                self.assertEqual(counts, {"fetched": 2, "added": 1, "skipped": 1})
+                self.assertEqual(client.calls[0][1], {"tags__id__all": 7, "ordering": "modified"})
+                self.assertEqual(index.watermark, "2025-01-02T00:00:00Z")
+
+                documents[1].update(correspondent=2, modified="2025-01-03T00:00:00Z")
+                counts = refresh_neighbor_index(client, index, ki_tag_id=7, limit=None)
+                self.assertEqual(counts, {"fetched": 1, "added": 1, "skipped": 0})
+                self.assertEqual(client.calls[1][1]["modified__gt"], "2025-01-02T00:00:00Z")
+                self.assertEqual(len(index), 2)
+            finally:
+                index.close()
+
+    def test_labels_need_all_three_ids(self) -> None:
+        self.assertEqual(neighbor_document_labels({"document_type": 1, "correspondent": "2", "storage_path": 3}), (1, 2, 3))
+        self.assertIsNone(neighbor_document_labels({"document_type": 1, "correspondent": 2}))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,125 @@
+"""Tests for the persisted note-presence index.
+
+Purpose:
+- Ensure cached note presence is only used while `modified` is unchanged.
+- Verify that notes and PATCHes of this run keep entries valid and that the
+  index survives a reopen.
+
+How to run:
+- `python3 -m unittest discover -s tests`
+"""
+
+from __future__ import annotations
+
+import json
+import sys
+import tempfile
+import types
+import unittest
+from pathlib import Path
+
+
+ROOT = Path(__file__).resolve().parents[1]
+SRC_DIR = ROOT / "src"
+if str(SRC_DIR) not in sys.path:
+    sys.path.insert(0, str(SRC_DIR))
+
+try:
+    import yaml  # noqa: F401
+except ImportError:
+    sys.modules["yaml"] = types.SimpleNamespace(safe_load=lambda *_args, **_kwargs: {})
+
+from note_index import NoteIndex, is_ki_summary_note  # noqa: E402
+from paperless_ai_sorter import PaperlessClient  # noqa: E402
+
+
+SUMMARY_NOTE = "[KI-Update 2025-01-01]\nKurz-Zusammenfassung: Stromrechnung"
+
+
+class NoteIndexTests(unittest.TestCase):
+    """Notiz-Status pro Dokument und `modified`."""
+
+    def setUp(self) -> None:
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = Path(tmp.name) / "notes.sqlite3"
+
+    def _index(self) -> NoteIndex:
+        index = NoteIndex(self.path)
+        self.addCleanup(index.close)
+        return index
+
+    def test_summary_note_detection(self) -> None:
+        self.assertTrue(is_ki_summary_note(SUMMARY_NOTE))
+        self.assertFalse(is_ki_summary_note("[KI-Update] nur Felder geändert"))
+        self.assertFalse(is_ki_summary_note(None))  # type: ignore[arg-type]
+
+    def test_lookup_hit_and_stale_after_modified_change(self) -> None:
+        index = self._index()
+        self.assertIsNone(index.lookup(1, "2025-01-01T00:00:00Z"))
+        index.record(1, "2025-01-01T00:00:00Z", True)
+        index.record(2, "2025-01-01T00:00:00Z", False)
+        index.record(3, "", True)
+        self.assertTrue(index.lookup(1, "2025-01-01T00:00:00Z"))
+        self.assertFalse(index.lookup(2, "2025-01-01T00:00:00Z"))
+        self.assertIsNone(index.lookup(1, "2025-02-01T00:00:00Z"))
+        self.assertIsNone(index.lookup(3, "2025-01-01T00:00:00Z"))
+        stats = index.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["stale"], stats["entries"]), (2, 3, 1, 2))
+
+    def test_written_note_adopts_next_modified(self) -> None:
+        index = self._index()
+        index.record_written_note(4, "Bearbeitet ohne Zusammenfassung")
+        self.assertEqual(len(index), 0)
+        index.record_written_note(4, SUMMARY_NOTE)
+        self.assertTrue(index.lookup(4, "2025-03-01T00:00:00Z"))
+        # Ab jetzt gilt der übernommene Stand.
+        self.assertIsNone(index.lookup(4, "2025-04-01T00:00:00Z"))
+
+    def test_own_patch_moves_entry_to_new_modified(self) -> None:
+        index = self._index()
+        index.record(5, "2025-01-01T00:00:00Z", True)
+        index.observe_document({"id": 5, "modified": "2025-03-01T00:00:00Z", "tags": [2]})
+        index.observe_document({"id": 6, "modified": "2025-03-01T00:00:00Z"})
+        index.observe_document({"modified": "2025-03-01T00:00:00Z"})
+        self.assertTrue(index.lookup(5, "2025-03-01T00:00:00Z"))
+        self.assertIsNone(index.lookup(6, "2025-03-01T00:00:00Z"))
+
+    def test_entries_survive_reopen(self) -> None:
+        first = NoteIndex(self.path)
+        first.record(7, "2025-01-01T00:00:00Z", True)
+        first.close()
+        first.close()
+        second = self._index()
+        self.assertEqual(len(second), 1)
+        self.assertTrue(second.lookup(7, "2025-01-01T00:00:00Z"))
+
+
+class _FakeResponse:
+    def __init__(self, payload: dict) -> None:
+        self.status_code = 200
+        self.content = json.dumps(payload).encode("utf-8")
+        self.text = self.content.decode("utf-8")
+        self._payload = payload
+
+    def json(self) -> dict:
+        return self._payload
+
+
+class NoteObserverTests(unittest.TestCase):
+    """Gespeicherte Notizen erreichen den Index ohne erneuten Abruf."""
+
+    def test_add_document_note_reaches_observer(self) -> None:
+        config = types.SimpleNamespace(paperless_url="http://paperless.invalid", request_timeout_seconds=5, paperless_token="t")
+        client = PaperlessClient(config)  # type: ignore[arg-type]
+        self.addCleanup(client.session.close)
+        seen: list = []
+        client.note_observer = lambda doc_id, note: seen.append((doc_id, note))
+        client.session.request = lambda method, url, **_kwargs: _FakeResponse({"id": 11})  # type: ignore[method-assign]
+
+        client.add_document_note(9, SUMMARY_NOTE)
+        self.assertEqual(seen, [(9, SUMMARY_NOTE)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,195 @@
+"""Tests for the OpenAI Batch API client against a local stand-in server.
+
+Purpose:
+- Ensure the JSONL request file matches the Batch API line format.
+- Verify upload, batch creation, polling and result download end to end.
+- Protect error handling: HTTP errors become `OpenAiBatchError` with hints.
+
+How to run:
+- `python3 -m unittest discover -s tests`
+"""
+
+from __future__ import annotations
+
+import json
+import re
+import sys
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+
+ROOT = Path(__file__).resolve().parents[1]
+SRC_DIR = ROOT / "src"
+if str(SRC_DIR) not in sys.path:
+    sys.path.insert(0, str(SRC_DIR))
+
+from openai_batch import (  # noqa: E402
+    BATCH_ENDPOINT,
+    OpenAiBatchClient,
+    OpenAiBatchError,
+    parse_batch_output,
+    write_batch_file,
+)
+
+
+class BatchStandInServer:
+    """Minimal `/files` + `/batches` server; batches finish after `polls_until_done` polls."""
+
+    def __init__(self, *, polls_until_done: int = 1) -> None:
+        self.files: dict[str, str] = {}
+        self.batches: dict[str, dict] = {}
+        self.polls_until_done = polls_until_done
+        self.fail_create_with: int | None = None
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *_args) -> None:
+                pass
+
+            def _send(self, payload, status: int = 200, *, raw: str | None = None) -> None:
+                body = (raw if raw is not None else json.dumps(payload)).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                if status == 429:
+                    self.send_header("retry-after", "42")
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self) -> None:  # noqa: N802
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length)
+                if self.path == "/v1/files":
+                    match = re.search(rb'name="file"; filename="[^"]*"\r\n(?:[^\r\n]+\r\n)*\r\n(.*?)\r\n--', body, re.S)
+                    file_id = f"file-{len(stand_in.files) + 1}"
+                    stand_in.files[file_id] = match.group(1).decode("utf-8") if match else ""
+                    return self._send({"id": file_id, "purpose": "batch"})
+                if self.path == "/v1/batches":
+                    if stand_in.fail_create_with:
+                        return self._send({"error": {"message": "limit"}}, stand_in.fail_create_with)
+                    payload = json.loads(body)
+                    batch_id = f"batch-{len(stand_in.batches) + 1}"
+                    stand_in.batches[batch_id] = {
+                        "id": batch_id,
+                        "input_file_id": payload["input_file_id"],
+                        "endpoint": payload["endpoint"],
+                        "status": "validating",
+                        "polls": 0,
+                    }
+                    return self._send(stand_in.batches[batch_id])
+                return self._send({"error": "not found"}, 404)
+
+            def do_GET(self) -> None:  # noqa: N802
+                match = re.match(r"^/v1/batches/([\w-]+)$", self.path)
+                if match and match.group(1) in stand_in.batches:
+                    return self._send(stand_in.poll(match.group(1)))
+                match = re.match(r"^/v1/files/([\w-]+)/content$", self.path)
+                if match and match.group(1) in stand_in.files:
+                    return self._send(None, raw=stand_in.files[match.group(1)])
+                return self._send({"error": "not found"}, 404)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}/v1"
+
+    def poll(self, batch_id: str) -> dict:
+        batch = self.batches[batch_id]
+        batch["polls"] += 1
+        if batch["status"] != "completed" and batch["polls"] > self.polls_until_done:
+            lines = [json.loads(line) for line in self.files[batch["input_file_id"]].splitlines() if line]
+            output = []
+            for line in lines:
+                content = {"document_type": "Rechnung", "echo": line["body"]["model"]}
+                output.append(
+                    {
+                        "id": f"req-{line['custom_id']}",
+                        "custom_id": line["custom_id"],
+                        "response": {
+                            "status_code": 200,
+                            "body": {"choices": [{"message": {"content": json.dumps(content)}}]},
+                        },
+                        "error": None,
+                    }
+                )
+            output_id = f"file-{len(self.files) + 1}"
+            self.files[output_id] = "\n".join(json.dumps(item) for item in output) + "\n"
+            batch.update(status="completed", output_file_id=output_id)
+        elif batch["status"] == "validating":
+            batch["status"] = "in_progress"
+        batch["request_counts"] = {"total": 1, "completed": 0, "failed": 0}
+        return dict(batch)
+
+    def close(self) -> None:
+        self.server.shutdown()
+
+
+class OpenAiBatchTests(unittest.TestCase):
+    """JSONL-Format, Übermittlung und Abholung von Batch-Ergebnissen."""
+
+    def setUp(self) -> None:
+        self._tmp = tempfile.TemporaryDirectory()
+        self.server = BatchStandInServer(polls_until_done=1)
+        self.client = OpenAiBatchClient(base_url=self.server.base_url, api_key="test", timeout=5)
+
+    def tearDown(self) -> None:
+        self.client.close()
+        self.server.close()
+        self._tmp.cleanup()
+
+    def test_batch_file_uses_batch_api_line_format(self) -> None:
+        path = Path(self._tmp.name) / "nested" / "batch.jsonl"
+        count = write_batch_file(path, [("doc-1-1", {"model": "m"}), ("doc-2-2", {"model": "m"})])
+
+        lines = [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+        self.assertEqual(count, 2)
+        self.assertEqual(lines[0], {"custom_id": "doc-1-1", "method": "POST", "url": BATCH_ENDPOINT, "body": {"model": "m"}})
+
+    def test_submit_poll_and_download_results(self) -> None:
+        path = Path(self._tmp.name) / "batch.jsonl"
+        write_batch_file(path, [("doc-7-1", {"model": "gpt-test"}), ("doc-8-2", {"model": "gpt-test"})])
+
+        batch = self.client.submit(path, metadata={"source": "test"})
+        self.assertEqual(self.server.batches[batch["id"]]["endpoint"], BATCH_ENDPOINT)
+        self.assertEqual(self.client.retrieve_batch(batch["id"])["status"], "in_progress")
+
+        done = self.client.retrieve_batch(batch["id"])
+        self.assertEqual(done["status"], "completed")
+        results = parse_batch_output(self.client.download_file(done["output_file_id"]))
+        self.assertEqual(sorted(results), ["doc-7-1", "doc-8-2"])
+        self.assertEqual(results["doc-7-1"]["status_code"], 200)
+        content = json.loads(results["doc-8-2"]["body"]["choices"][0]["message"]["content"])
+        self.assertEqual(content["echo"], "gpt-test")
+
+    def test_http_errors_carry_status_and_retry_hint(self) -> None:
+        path = Path(self._tmp.name) / "batch.jsonl"
+        write_batch_file(path, [("doc-1-1", {"model": "m"})])
+        self.server.fail_create_with = 429
+
+        with self.assertRaises(OpenAiBatchError) as ctx:
+            self.client.submit(path)
+        self.assertEqual(ctx.exception.status_code, 429)
+        self.assertEqual(ctx.exception.retry_after_seconds, 42.0)
+        with self.assertRaises(OpenAiBatchError):
+            self.client.retrieve_batch("batch-unknown")
+
+    def test_parse_output_skips_broken_lines_and_keeps_errors(self) -> None:
+        text = "\n".join(
+            [
+                "kein json",
+                json.dumps({"custom_id": "a", "response": {"status_code": 200, "body": {"ok": True}}}),
+                json.dumps({"custom_id": "b", "response": None, "error": {"code": "expired"}}),
+                json.dumps({"response": {"status_code": 200}}),
+            ]
+        )
+        results = parse_batch_output(text)
+        self.assertEqual(sorted(results), ["a", "b"])
+        self.assertEqual(results["a"]["body"], {"ok": True})
+        self.assertEqual(results["b"]["status_code"], 0)
+        self.assertEqual(results["b"]["error"], {"code": "expired"})
+
+
+if __name__ == "__main__":
+    unittest.main()
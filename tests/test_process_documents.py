@@ -0,0 +1,515 @@
+"""End-to-end tests for `process_documents` against an in-memory Paperless.
+
+Purpose:
+- Run the real main loop with a fake Paperless API (HTTP level) and a fake
+  AI classifier, so run-level behaviour is covered, not only helpers.
+- Ensure the staged pipeline re-checks stale duplicate hints instead of
+  paying for a second AI call, and that a streamed checksum index falls back
+  to a Paperless query for originals outside the listing.
+- Ensure answers of the small cascade model are never stored in the
+  classification cache.
+- Ensure tax-enrichment and discarded hedge-duplicate token usage is priced
+  into the run cost and metrics.
+- Verify buffered tag markings are written on manual stop, on errors and at
+  the end of a run, and that the resume state never claims unwritten ones.
+
+How to run:
+- `python3 -m unittest discover -s tests`
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+import types
+import unittest
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+from unittest import mock
+from urllib.parse import parse_qs, urlsplit
+
+
+ROOT = Path(__file__).resolve().parents[1]
+SRC_DIR = ROOT / "src"
+if str(SRC_DIR) not in sys.path:
+    sys.path.insert(0, str(SRC_DIR))
+
+try:
+    import yaml  # noqa: F401
+except ImportError:
+    sys.modules["yaml"] = types.SimpleNamespace(safe_load=lambda *_args, **_kwargs: {})
+
+import paperless_ai_sorter  # noqa: E402
+from paperless_ai_sorter import AiClassifier, PaperlessClient, load_config, process_documents  # noqa: E402
+
+
+PAPERLESS_URL = "http://paperless.test"
+DOCUMENT_PATH_RE = re.compile(r"^/api/documents/(\d+)/$")
+NOTES_PATH_RE = re.compile(r"^/api/documents/(\d+)/notes/$")
+NEU_TAG_ID = 7
+KI_TAG_ID = 8
+ENTITY_PATHS = ("/api/tags/", "/api/document_types/", "/api/correspondents/", "/api/storage_paths/")
+
+
+class FakeResponse:
+    def __init__(self, status_code: int, payload: Any) -> None:
+        self.status_code = status_code
+        self._payload = payload
+        self.text = json.dumps(payload)
+        self.content = self.text.encode("utf-8")
+        self.headers: Dict[str, str] = {}
+
+    def json(self) -> Any:
+        return self._payload
+
+
+class FakePaperless:
+    """Minimal Paperless-API im Speicher; zeichnet alle Schreibzugriffe auf."""
+
+    def __init__(self, documents: List[Dict[str, Any]], tags: Dict[str, int]) -> None:
+        self._lock = threading.Condition()
+        self.documents = {int(document["id"]): dict(document) for document in documents}
+        self.entities: Dict[str, Dict[str, int]] = {path: {} for path in ENTITY_PATHS}
+        self.entities["/api/tags/"] = dict(tags)
+        self.notes: Dict[int, List[Dict[str, Any]]] = {}
+        self.writes: List[tuple] = []
+        self.checksum_queries: List[str] = []
+        # Antwortet für diese `(method, path)` mit HTTP 500.
+        self.failing: set = set()
+        # Wird nach jedem Schreibzugriff mit `(method, path, payload)` aufgerufen.
+        self.on_write: Optional[Any] = None
+
+    def wait_for_checksum_queries(self, count: int, timeout: float = 5.0) -> None:
+        with self._lock:
+            self._lock.wait_for(lambda: len(self.checksum_queries) >= count, timeout)
+
+    def session(self) -> "FakeSession":
+        return FakeSession(self)
+
+    def handle(self, method: str, url: str, params: Optional[Dict[str, Any]], data: Optional[str]) -> FakeResponse:
+        parts = urlsplit(url)
+        path = parts.path
+        query = {key: values[0] for key, values in parse_qs(parts.query).items()}
+        query.update({key: value for key, value in (params or {}).items() if value is not None})
+        payload = json.loads(data) if data else None
+        with self._lock:
+            if (method, path) in self.failing:
+                return FakeResponse(500, {"detail": "Serverfehler"})
+            if method != "GET":
+                self.writes.append((method, path, payload))
+                if self.on_write is not None:
+                    self.on_write(method, path, payload)
+            if path == "/api/documents/" and method == "GET":
+                return FakeResponse(200, self._list_documents(query))
+            if path == "/api/documents/bulk_edit/" and method == "POST":
+                for doc_id in payload["documents"]:
+                    tags = set(self.documents[int(doc_id)]["tags"])
+                    tags |= set(payload["parameters"]["add_tags"])
+                    tags -= set(payload["parameters"]["remove_tags"])
+                    self.documents[int(doc_id)]["tags"] = sorted(tags)
+                return FakeResponse(200, {"result": "OK"})
+            match = DOCUMENT_PATH_RE.match(path)
+            if match:
+                document = self.documents[int(match.group(1))]
+                if method == "PATCH":
+                    document.update(payload)
+                return FakeResponse(200, dict(document))
+            match = NOTES_PATH_RE.match(path)
+            if match:
+                notes = self.notes.setdefault(int(match.group(1)), [])
+                if method == "POST":
+                    notes.append({"id": len(notes) + 1, "note": payload["note"]})
+                    return FakeResponse(200, notes[-1])
+                return FakeResponse(200, list(notes))
+            if path in self.entities:
+                mapping = self.entities[path]
+                if method == "POST":
+                    label = str(payload.get("name") or payload.get("path"))
+                    mapping[label] = 100 * (ENTITY_PATHS.index(path) + 1) + len(mapping) + 1
+                    return FakeResponse(201, {"id": mapping[label], "name": label})
+                results = [{"id": entity_id, "name": label} for label, entity_id in mapping.items()]
+                return FakeResponse(200, {"count": len(results), "next": None, "results": results})
+            if path == "/api/custom_fields/":
+                return FakeResponse(200, {"count": 0, "next": None, "results": []})
+        return FakeResponse(404, {"detail": f"{method} {path} unbekannt"})
+
+    def _list_documents(self, query: Dict[str, Any]) -> Dict[str, Any]:
+        documents = sorted(self.documents.values(), key=lambda document: document["id"])
+        checksum = query.get("checksum") or query.get("checksum__exact")
+        if checksum:
+            self.checksum_queries.append(checksum)
+            self._lock.notify_all()
+            documents = [document for document in documents if document.get("checksum") == checksum]
+        if query.get("tags__id"):
+            documents = [document for document in documents if int(query["tags__id"]) in document["tags"]]
+        page_size = int(query.get("page_size") or 100)
+        page = int(query.get("page") or 1)
+        start = (page - 1) * page_size
+        results = [dict(document) for document in documents[start : start + page_size]]
+        next_url = None
+        if start + page_size < len(documents):
+            next_query = {key: value for key, value in query.items() if key != "page"}
+            next_query["page"] = page + 1
+            next_url = PAPERLESS_URL + "/api/documents/?" + "&".join(f"{key}={value}" for key, value in next_query.items())
+        return {"count": len(documents), "next": next_url, "results": results}
+
+
+class FakeSession:
+    def __init__(self, server: FakePaperless) -> None:
+        self.server = server
+        self.headers: Dict[str, str] = {}
+
+    def request(self, method: str, url: str, params=None, data=None, timeout=None) -> FakeResponse:
+        return self.server.handle(method, url, params, data)
+
+    def close(self) -> None:
+        pass
+
+
+def _document(doc_id: int, **overrides: Any) -> Dict[str, Any]:
+    document = {
+        "id": doc_id,
+        "title": f"Dokument {doc_id}",
+        # Lang genug für das Inhalts-Gate (min_content_chars / min_word_count).
+        "content": " ".join(f"Stromrechnung Position {index} Verbrauch kWh Betrag" for index in range(8)),
+        "tags": [],
+        "document_type": None,
+        "correspondent": None,
+        "storage_path": None,
+        "checksum": f"checksum-{doc_id}",
+        "created": "2024-01-01",
+        "modified": "2024-01-01T00:00:00Z",
+    }
+    document.update(overrides)
+    return document
+
+
+def _prediction(document_type: str = "Rechnung") -> Dict[str, Any]:
+    return {
+        "document_type": document_type,
+        "correspondent": "Stadtwerke",
+        "storage_path": "Privat",
+        "tags": ["Strom"],
+        "confidence": 0.95,
+        "summary": "Stromrechnung",
+        "_meta_usage": {"prompt_tokens": 1000, "completion_tokens": 100, "total_tokens": 1100},
+    }
+
+
+class ProcessDocumentsTestCase(unittest.TestCase):
+    """Gemeinsamer Aufbau: Arbeitsverzeichnis, Konfiguration, Fake-Paperless und Fake-KI."""
+
+    base_config: Dict[str, Any] = {}
+
+    def setUp(self) -> None:
+        self._tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmp.cleanup)
+        self.workdir = Path(self._tmp.name)
+        previous_cwd = os.getcwd()
+        os.chdir(self.workdir)
+        self.addCleanup(os.chdir, previous_cwd)
+        self.ai_calls: List[int] = []
+
+    def _config(self, **overrides: Any) -> "paperless_ai_sorter.AppConfig":
+        raw = {
+            "paperless_url": PAPERLESS_URL,
+            "paperless_token": "token",
+            "ai_api_key": "key",
+            "ai_model": "test-model",
+            "ai_base_url": "http://ai.test/v1",
+            "dry_run": False,
+            "max_documents": 50,
+            "enable_ai_notes": False,
+            "entity_review_rules_file": "",
+            "input_cost_per_1k_tokens_eur": 0.001,
+            "output_cost_per_1k_tokens_eur": 0.002,
+            **self.base_config,
+            **overrides,
+        }
+        config_path = self.workdir / "config.yaml"
+        config_path.write_text(json.dumps(raw), encoding="utf-8")
+        with mock.patch.object(paperless_ai_sorter.yaml, "safe_load", return_value=raw):
+            return load_config(str(config_path), cli_dry_run=False)
+
+    def _run(self, server: FakePaperless, config, classify=None, **kwargs: Any) -> None:
+        def fake_classify(_classifier: AiClassifier, document: Dict[str, Any]) -> Dict[str, Any]:
+            self.ai_calls.append(int(document["id"]))
+            return classify(document) if classify is not None else _prediction()
+
+        with mock.patch.object(PaperlessClient, "_build_session", lambda _client: server.session()), mock.patch.object(
+            AiClassifier, "classify", fake_classify
+        ):
+            process_documents(config, **kwargs)
+
+
+class StagedDuplicateRecheckTests(ProcessDocumentsTestCase):
+    """Veraltete Dubletten-Hinweise der Precheck-Worker."""
+
+    base_config = {
+        "ai_pipeline_mode": "staged",
+        "ai_pipeline_precheck_workers": 2,
+        "ai_pipeline_stage_queue_size": 16,
+        "precheck_duplicate_hash_gate": True,
+    }
+
+    def test_second_document_with_same_checksum_reuses_first_classification(self) -> None:
+        server = FakePaperless(
+            [_document(1, checksum="abc"), _document(2, checksum="abc")],
+            tags={},
+        )
+        config = self._config()
+
+        def classify_after_both_prechecks(_document: Dict[str, Any]) -> Dict[str, Any]:
+            # Wie im echten Lauf: Der Precheck von Dokument 2 ist fertig, bevor Dokument 1 geschrieben wird.
+            server.wait_for_checksum_queries(2)
+            return _prediction()
+
+        self._run(server, config, classify=classify_after_both_prechecks)
+
+        self.assertEqual(self.ai_calls, [1])
+        self.assertIsNotNone(server.documents[2]["document_type"])
+        self.assertEqual(server.documents[2]["document_type"], server.documents[1]["document_type"])
+        metrics = json.loads((self.workdir / "run_metrics.json").read_text(encoding="utf-8"))
+        precheck_stats = metrics["last_run"]["performance"]["pipeline"]["stages"]["precheck"]
+        self.assertEqual(precheck_stats["duplicate_rechecks"], 1)
+
+
+class StreamedChecksumIndexTests(ProcessDocumentsTestCase):
+    """Stream-Index kennt nur gelistete Dokumente; Originale außerhalb der Liste per Abfrage."""
+
+    base_config = {
+        "precheck_duplicate_hash_gate": True,
+        "precheck_duplicate_lookup_mode": "stream",
+        "process_only_tag": "#NEU",
+    }
+
+    def test_original_outside_the_listing_is_found_by_query(self) -> None:
+        server = FakePaperless(
+            [
+                # Bereits klassifiziertes Original ohne #NEU: nicht Teil der gefilterten Liste.
+                _document(1, checksum="abc", tags=[KI_TAG_ID], document_type=3),
+                _document(2, checksum="abc", tags=[NEU_TAG_ID]),
+            ],
+            tags={"#NEU": NEU_TAG_ID, "KI": KI_TAG_ID},
+        )
+        config = self._config()
+
+        self._run(server, config)
+
+        self.assertEqual(self.ai_calls, [])
+        self.assertIn("abc", server.checksum_queries)
+        metrics = json.loads((self.workdir / "run_metrics.json").read_text(encoding="utf-8"))
+        checksum_stats = metrics["last_run"]["performance"]["pipeline"]["checksum_index"]
+        self.assertEqual(checksum_stats["query_fallbacks"], 1)
+
+
+class CascadeClassificationCacheTests(ProcessDocumentsTestCase):
+    """Antworten des kleinen Kaskaden-Modells landen nicht im Klassifizierungs-Cache."""
+
+    base_config = {
+        "enable_classification_cache": True,
+        "enable_ai_cascade": True,
+        "cascade_ai_model": "small-model",
+        "cascade_ai_base_url": "http://local.test/v1",
+    }
+
+    def _run_single(self, doc_id: int, tier: str) -> None:
+        server = FakePaperless([_document(doc_id, title="Abschlag Strom")], tags={})
+
+        def classify(_document: Dict[str, Any]) -> Dict[str, Any]:
+            prediction = _prediction()
+            prediction["_meta_usage"] = dict(prediction["_meta_usage"], cascade_tier=tier)
+            return prediction
+
+        self._run(server, self._config(), classify=classify)
+
+    def test_local_tier_answer_is_not_cached_but_main_model_answer_is(self) -> None:
+        # Gleicher Titel und Text: gleicher Cache-Schlüssel über alle Läufe.
+        self._run_single(1, "local")
+        self._run_single(2, "main")
+        self._run_single(3, "main")
+
+        # Dokument 2 geht trotz gleichem Schlüssel an die KI; Dokument 3 trifft dessen Eintrag.
+        self.assertEqual(self.ai_calls, [1, 2])
+
+
+class TaxUsageRunTests(ProcessDocumentsTestCase):
+    """Tax-KI-Usage zählt zu Lauf-Tokens, Kosten und run_metrics.json."""
+
+    base_config = {
+        "enable_tax_enrichment": True,
+        "tax_export_dir": "tax_exports",
+        "cached_input_cost_per_1k_tokens_eur": 0.0005,
+    }
+
+    def test_tax_usage_is_added_to_run_tokens_and_cost(self) -> None:
+        server = FakePaperless([_document(1)], tags={})
+        config = self._config()
+
+        def fake_enrich(service, *, document, classification_prediction):
+            # Auch ein fehlgeschlagener Tax-Aufruf wurde bezahlt.
+            usage = service.extractor.usage_totals
+            usage["requests"] += 1
+            usage["prompt_tokens"] += 500
+            usage["cached_prompt_tokens"] += 200
+            usage["completion_tokens"] += 50
+            raise paperless_ai_sorter.TaxEnrichmentError("keine Steuerdaten")
+
+        with mock.patch.object(paperless_ai_sorter.TaxEnrichmentService, "enrich", fake_enrich):
+            self._run(server, config)
+
+        last_run = json.loads((self.workdir / "run_metrics.json").read_text(encoding="utf-8"))["last_run"]
+        self.assertEqual(last_run["prompt_tokens"], 1500)
+        self.assertEqual(last_run["cached_prompt_tokens"], 200)
+        self.assertEqual(last_run["completion_tokens"], 150)
+        self.assertEqual(last_run["total_tokens"], 1650)
+        classify_cost = 1000 * 0.001 / 1000 + 100 * 0.002 / 1000
+        tax_cost = 300 * 0.001 / 1000 + 200 * 0.0005 / 1000 + 50 * 0.002 / 1000
+        self.assertAlmostEqual(last_run["cost_eur"], classify_cost + tax_cost, places=6)
+        self.assertEqual(last_run["tax_enrichment"]["requests"], 1)
+        self.assertAlmostEqual(last_run["tax_enrichment"]["cost_eur"], tax_cost, places=6)
+
+
+class HedgeUsageRunTests(ProcessDocumentsTestCase):
+    """Tokens verworfener Hedge-Duplikate zählen zu Lauf-Tokens und Kosten."""
+
+    base_config = {
+        "enable_ai_hedging": True,
+        "cached_input_cost_per_1k_tokens_eur": 0.0005,
+    }
+
+    def test_discarded_duplicate_is_added_to_run_tokens_and_cost(self) -> None:
+        server = FakePaperless([_document(1)], tags={})
+        config = self._config()
+        hedgers: List[paperless_ai_sorter.RequestHedger] = []
+
+        class RecordingHedger(paperless_ai_sorter.RequestHedger):
+            def __init__(self, **kwargs: Any) -> None:
+                super().__init__(**kwargs)
+                hedgers.append(self)
+
+        def classify_with_discarded_duplicate(_document: Dict[str, Any]) -> Dict[str, Any]:
+            hedgers[0].record_duplicate_tokens(400, 40, 100)
+            return _prediction()
+
+        with mock.patch.object(paperless_ai_sorter, "RequestHedger", RecordingHedger):
+            self._run(server, config, classify=classify_with_discarded_duplicate)
+
+        last_run = json.loads((self.workdir / "run_metrics.json").read_text(encoding="utf-8"))["last_run"]
+        self.assertEqual(last_run["prompt_tokens"], 1400)
+        self.assertEqual(last_run["cached_prompt_tokens"], 100)
+        self.assertEqual(last_run["completion_tokens"], 140)
+        self.assertEqual(last_run["total_tokens"], 1540)
+        classify_cost = 1000 * 0.001 / 1000 + 100 * 0.002 / 1000
+        duplicate_cost = 300 * 0.001 / 1000 + 100 * 0.0005 / 1000 + 40 * 0.002 / 1000
+        self.assertAlmostEqual(last_run["cost_eur"], classify_cost + duplicate_cost, places=6)
+        hedging = last_run["performance"]["pipeline"]["hedging"]
+        self.assertEqual(hedging["duplicate_cached_prompt_tokens"], 100)
+        self.assertAlmostEqual(hedging["duplicate_cost_eur"], duplicate_cost, places=6)
+
+
+def _short_document(doc_id: int) -> Dict[str, Any]:
+    """Scheitert am Inhalts-Gate: Markierung KI_SKIP_PRECHECK, #NEU wird entfernt."""
+
+    return _document(doc_id, content="zu kurz", tags=[NEU_TAG_ID])
+
+
+class TagMutationBufferRunTests(ProcessDocumentsTestCase):
+    """Gepufferte Tag-Markierungen in einem echten Lauf."""
+
+    base_config = {"enable_tag_mutation_buffer": True, "tag_mutation_batch_size": 50}
+
+    def _bulk_edits(self, server: FakePaperless) -> List[Dict[str, Any]]:
+        return [payload for method, path, payload in server.writes if path == "/api/documents/bulk_edit/"]
+
+    def _run_state(self) -> Dict[str, Any]:
+        return json.loads((self.workdir / paperless_ai_sorter.RUN_STATE_FILE_DEFAULT).read_text(encoding="utf-8"))
+
+    def test_manual_stop_flushes_markings_before_saving_resume_state(self) -> None:
+        server = FakePaperless([_short_document(doc_id) for doc_id in range(1, 6)], tags={"#NEU": NEU_TAG_ID})
+        config = self._config()
+        states_before_stop: List[Dict[str, Any]] = []
+
+        def stop_after_third_document(method: str, path: str, _payload: Any) -> None:
+            if method == "POST" and path == "/api/documents/3/notes/":
+                # Markierungen 1-3 liegen noch im Puffer: Resume-Zustand darf sie nicht als erledigt führen.
+                states_before_stop.append(self._run_state())
+                paperless_ai_sorter.request_manual_stop(self.workdir / paperless_ai_sorter.STOP_REQUEST_FILE_DEFAULT)
+
+        server.on_write = stop_after_third_document
+
+        with self.assertRaises(paperless_ai_sorter.RunPausedError):
+            self._run(server, config)
+
+        skip_precheck_id = server.entities["/api/tags/"]["KI_SKIP_PRECHECK"]
+        self.assertEqual(states_before_stop[0]["completed_document_ids"], [])
+        self.assertEqual(
+            self._bulk_edits(server),
+            [
+                {
+                    "documents": [1, 2, 3],
+                    "method": "modify_tags",
+                    "parameters": {"add_tags": [skip_precheck_id], "remove_tags": [NEU_TAG_ID]},
+                }
+            ],
+        )
+        self.assertEqual(server.documents[3]["tags"], [skip_precheck_id])
+        self.assertEqual(server.documents[4]["tags"], [NEU_TAG_ID])
+        run_state = self._run_state()
+        self.assertEqual(run_state["status"], "paused")
+        self.assertEqual(run_state["pause_reason"], "manual_stop")
+        self.assertEqual(run_state["completed_document_ids"], [1, 2, 3])
+        self.assertFalse(any(method == "PATCH" for method, _path, _payload in server.writes))
+
+    def test_unexpected_error_still_flushes_buffered_markings(self) -> None:
+        server = FakePaperless([_short_document(doc_id) for doc_id in range(1, 4)], tags={"#NEU": NEU_TAG_ID})
+        config = self._config()
+
+        def crash_on_third_note(method: str, path: str, _payload: Any) -> None:
+            if method == "POST" and path == "/api/documents/3/notes/":
+                raise RuntimeError("Absturz mitten im Lauf")
+
+        server.on_write = crash_on_third_note
+
+        with self.assertRaises(RuntimeError):
+            self._run(server, config)
+
+        self.assertEqual([payload["documents"] for payload in self._bulk_edits(server)], [[1, 2, 3]])
+
+    def test_failed_neu_removal_is_counted_when_the_buffer_flushes(self) -> None:
+        note = "[KI-Update 2024-01-01]\nKurz-Zusammenfassung: Stromrechnung"
+        server = FakePaperless(
+            [_document(1, tags=[NEU_TAG_ID, KI_TAG_ID], document_type=3)],
+            tags={"#NEU": NEU_TAG_ID, "KI": KI_TAG_ID},
+        )
+        server.notes[1] = [{"id": 1, "note": note}]
+        server.failing = {("POST", "/api/documents/bulk_edit/"), ("PATCH", "/api/documents/1/")}
+        config = self._config(
+            already_classified_skip=True,
+            reprocess_ki_tagged_documents=True,
+            # Nur mit Tag-Filter erreichen bereits klassifizierte Dokumente das Gate.
+            process_only_tag="#NEU",
+        )
+        events: List[Dict[str, Any]] = []
+
+        def record_event(kind: str, **payload: Any) -> None:
+            events.append({"kind": kind, **payload})
+
+        with mock.patch.object(paperless_ai_sorter, "emit_runtime_event", record_event), mock.patch.object(
+            paperless_ai_sorter.time, "sleep"
+        ):
+            self._run(server, config)
+
+        final_progress = [event for event in events if event["kind"] == "progress"][-1]
+        self.assertEqual(final_progress["status"], "success")
+        self.assertEqual(final_progress["progress"]["skipped_with_neu_still_set"], 1)
+        self.assertEqual(server.documents[1]["tags"], [NEU_TAG_ID, KI_TAG_ID])
+        self.assertEqual(self.ai_calls, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,178 @@
+"""Tests for the local rule pre-classifier.
+
+Purpose:
+- Ensure `basis_config` rules (legal trigger terms, correspondent
+  normalization, meters, storage mappings) resolve fields deterministically.
+- Verify that complete matches skip the AI call and partial matches are
+  pinned in the payload and enforced on the AI answer.
+- Protect the legacy prompt: without the feature nothing changes.
+
+How to run:
+- `python3 -m unittest discover -s tests`
+"""
+
+from __future__ import annotations
+
+import sys
+import types
+import unittest
+from pathlib import Path
+
+
+ROOT = Path(__file__).resolve().parents[1]
+SRC_DIR = ROOT / "src"
+if str(SRC_DIR) not in sys.path:
+    sys.path.insert(0, str(SRC_DIR))
+
+try:
+    import yaml  # noqa: F401
+except ImportError:
+    sys.modules["yaml"] = types.SimpleNamespace(safe_load=lambda *_args, **_kwargs: {})
+
+from paperless_ai_sorter import AiClassifier  # noqa: E402
+from rule_classifier import RuleClassifier  # noqa: E402
+from test_ai_pipeline import _classifier_config  # noqa: E402
+
+
+BASIS_CONFIG = {
+    "identifiers": {
+        "meters": [
+            {"number": "1ESY 1160 6655", "correspondent": "Stadtwerke", "storage_path": "Haus/Energie"},
+            {"number": "123"},
+        ]
+    },
+    "classification_rules": {
+        "document_type": {
+            "legal_documents_force_type": {
+                "type": "Rechtsanwalt",
+                "trigger_terms": ["Rechtsanwalt", "Gericht", "Aktenzeichen"],
+            }
+        },
+        "correspondent": {
+            "normalize": [{"if_contains_any": ["Hotel", "Übernachtung"], "set_to": "Hotel"}],
+        },
+        "storage_path": {
+            "mappings": [
+                {"if_document_type": "Rechtsanwalt", "set_to": "Recht"},
+                {"if_correspondent": ["Stadtwerke"], "if_contains_any": ["Abschlag"], "set_to": "Haus/Energie"},
+            ],
+            "default": "Privat",
+        },
+    },
+}
+
+
+def _ai_answer(classifier: AiClassifier, calls: list) -> None:
+    content = (
+        '{"document_type": "Rechnung", "correspondent": "Falsch", "storage_path": "Privat", '
+        '"tags": [], "confidence": 0.7}'
+    )
+
+    def fake_post(req_body, **_kwargs):
+        calls.append(req_body)
+        return {"choices": [{"message": {"content": content}}], "usage": {"prompt_tokens": 10}}
+
+    classifier._post_chat_completion = fake_post  # type: ignore[method-assign]
+
+
+class RuleClassifierTests(unittest.TestCase):
+    """Regeln aus basis_config lokal auswerten."""
+
+    def test_compiles_only_usable_rules(self) -> None:
+        rules = RuleClassifier(BASIS_CONFIG)
+        # Zähler ohne Ziel-Felder und zu kurze Nummer werden ignoriert.
+        self.assertEqual((len(rules.term_rules), len(rules.meters), len(rules.storage_mappings)), (2, 1, 2))
+        self.assertEqual(RuleClassifier({}).rule_count, 0)
+
+    def test_meter_resolves_correspondent_and_storage_path(self) -> None:
+        match = RuleClassifier(BASIS_CONFIG).match({"title": "Jahresabrechnung", "content": "Zähler 1ESY-1160-6655"})
+        self.assertEqual(match.fields, {"correspondent": "Stadtwerke", "storage_path": "Haus/Energie"})
+        self.assertFalse(match.complete)
+
+    def test_legal_terms_need_two_hits_and_feed_storage_mapping(self) -> None:
+        rules = RuleClassifier(BASIS_CONFIG)
+        weak = rules.match({"title": "Brief", "content": "Termin beim Amtsgericht"})
+        self.assertEqual(weak.fields, {})
+        strong = rules.match({"title": "Brief", "content": "Amtsgericht, Aktenzeichen 4 C 12/24"})
+        self.assertEqual(strong.fields, {"document_type": "Rechtsanwalt", "storage_path": "Recht"})
+        self.assertEqual(strong.confidence["storage_path"], 0.95)
+
+    def test_correspondent_needs_title_hit_for_default_confidence(self) -> None:
+        rules = RuleClassifier(BASIS_CONFIG)
+        self.assertEqual(rules.match({"title": "x", "content": "Ihr Hotel am See"}).fields, {})
+        self.assertEqual(rules.match({"title": "Hotelrechnung", "content": ""}).fields, {"correspondent": "Hotel"})
+        lenient = RuleClassifier(BASIS_CONFIG, min_confidence=0.8)
+        self.assertEqual(lenient.match({"title": "x", "content": "Ihr Hotel am See"}).fields, {"correspondent": "Hotel"})
+
+    def test_conflicting_rules_drop_the_field(self) -> None:
+        match = RuleClassifier(BASIS_CONFIG).match(
+            {"title": "Hotel Übernachtung", "content": "Zähler 1ESY11606655"}
+        )
+        self.assertNotIn("correspondent", match.fields)
+        self.assertTrue(any("widersprüchlich" in reason for reason in match.reasons))
+
+
+class ClassifierRuleTests(unittest.TestCase):
+    """Integration in `AiClassifier.classify`/`classify_many`."""
+
+    def _classifier(self, **overrides) -> AiClassifier:
+        config = _classifier_config(basis_config=BASIS_CONFIG, enable_rule_classifier=True, **overrides)
+        classifier = AiClassifier(config)
+        self.addCleanup(classifier.session.close)
+        return classifier
+
+    def test_complete_match_skips_ai(self) -> None:
+        classifier = self._classifier()
+        calls: list = []
+        _ai_answer(classifier, calls)
+        prediction = classifier.classify(
+            {"id": 1, "title": "Hotel Post", "content": "Rechtsanwalt Müller, Aktenzeichen 7 O 3/24"}
+        )
+        self.assertEqual(calls, [])
+        self.assertEqual(
+            (prediction["document_type"], prediction["correspondent"], prediction["storage_path"]),
+            ("Rechtsanwalt", "Hotel", "Recht"),
+        )
+        self.assertEqual(prediction["_meta_usage"]["total_tokens"], 0)
+        self.assertTrue(prediction["_meta_rule_classifier"]["bypassed"])
+        self.assertEqual(classifier.rule_counters["bypassed"], 1)
+
+    def test_partial_match_is_pinned_in_payload_and_answer(self) -> None:
+        classifier = self._classifier()
+        calls: list = []
+        _ai_answer(classifier, calls)
+        prediction = classifier.classify({"id": 2, "title": "Abschlag", "content": "Zähler 1ESY11606655"})
+        self.assertEqual(len(calls), 1)
+        self.assertIn('"pinned_fields": {"correspondent": "Stadtwerke"', calls[0]["messages"][1]["content"])
+        self.assertIn("pinned_fields", calls[0]["messages"][0]["content"])
+        self.assertEqual(prediction["correspondent"], "Stadtwerke")
+        self.assertEqual(prediction["storage_path"], "Haus/Energie")
+        self.assertEqual(prediction["document_type"], "Rechnung")
+        self.assertEqual(classifier.rule_counters, {"checked": 1, "bypassed": 0, "pinned_documents": 1, "pinned_fields": 2})
+
+    def test_classify_many_removes_rule_resolved_documents(self) -> None:
+        classifier = self._classifier()
+        calls: list = []
+        _ai_answer(classifier, calls)
+        documents = [
+            {"id": 1, "title": "Hotel", "content": "Gericht, Aktenzeichen 1"},
+            {"id": 2, "title": "Brief", "content": "Hallo"},
+        ]
+        results = classifier.classify_many(documents)
+        self.assertTrue(results[0][0]["_meta_rule_classifier"]["bypassed"])
+        self.assertEqual(results[1][0]["correspondent"], "Falsch")
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(classifier.rule_counters["checked"], 2)
+
+    def test_disabled_feature_leaves_prompt_untouched(self) -> None:
+        enabled = self._classifier()
+        disabled = AiClassifier(_classifier_config(basis_config=BASIS_CONFIG))
+        self.addCleanup(disabled.session.close)
+        self.assertIsNone(disabled.rule_classifier)
+        self.assertNotIn("pinned_fields", disabled.system_prompt())
+        self.assertTrue(enabled.system_prompt().startswith(disabled.system_prompt()[:200]))
+        self.assertNotIn("pinned_fields", disabled._user_payload({"title": "Hotel", "content": "Gericht Aktenzeichen"}))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,129 @@
+"""Tests for the buffered tag markings.
+
+Purpose:
+- Ensure markings with the same change are written as chunked
+  `bulk_edit` `modify_tags` requests instead of one PATCH per document.
+- Verify the per-document PATCH fallback, the error callbacks and the
+  merging of repeated markings.
+
+How to run:
+- `python3 -m unittest discover -s tests`
+"""
+
+from __future__ import annotations
+
+import sys
+import unittest
+from pathlib import Path
+
+
+ROOT = Path(__file__).resolve().parents[1]
+SRC_DIR = ROOT / "src"
+if str(SRC_DIR) not in sys.path:
+    sys.path.insert(0, str(SRC_DIR))
+
+from tag_mutations import BULK_EDIT_PATH, TagMutationBuffer  # noqa: E402
+
+
+class FakeApiError(Exception):
+    pass
+
+
+class FakeClient:
+    """Zeichnet `_request`-Aufrufe auf; einzelne Methoden können fehlschlagen."""
+
+    def __init__(self, failing_methods: tuple = ()) -> None:
+        self.calls: list = []
+        self.failing_methods = failing_methods
+
+    def _request(self, method, path, payload=None, retries=0):
+        self.calls.append((method, path, payload))
+        if method in self.failing_methods:
+            raise FakeApiError(f"{method} {path} fehlgeschlagen")
+        return {}
+
+
+def _buffer(client: FakeClient, batch_size: int = 3) -> TagMutationBuffer:
+    return TagMutationBuffer(client, batch_size=batch_size, request_error=FakeApiError)
+
+
+class TagMutationBufferTests(unittest.TestCase):
+    """Bulk-Edit statt Einzel-PATCH."""
+
+    def test_groups_by_change_and_chunks_by_batch_size(self) -> None:
+        client = FakeClient()
+        buffer = _buffer(client, batch_size=2)
+        # #NEU (1) entfernen, KI_SKIP (5) setzen; Dokument 4 bekommt KI_FEHLER (6).
+        buffer.add(1, [1, 9], [5, 9])
+        buffer.add(4, [1], [6])
+        self.assertEqual(client.calls, [])
+        buffer.add(2, [1], [5])
+        # Gruppe voll: sofort geschrieben, die andere Gruppe bleibt gepuffert.
+        self.assertEqual(
+            client.calls,
+            [
+                (
+                    "POST",
+                    BULK_EDIT_PATH,
+                    {"documents": [1, 2], "method": "modify_tags", "parameters": {"add_tags": [5], "remove_tags": [1]}},
+                )
+            ],
+        )
+        self.assertEqual(buffer.pending_ids(), {4})
+        buffer.add(3, [1], [5])
+        buffer.flush()
+        self.assertEqual(len(buffer), 0)
+        self.assertEqual([call[2]["documents"] for call in client.calls[1:]], [[4], [3]])
+        stats = buffer.stats()
+        self.assertEqual((stats["bulk_requests"], stats["bulk_documents"], stats["patches_saved"]), (3, 4, 1))
+
+    def test_unchanged_tags_are_not_buffered(self) -> None:
+        client = FakeClient()
+        buffer = _buffer(client)
+        buffer.add(1, [1, 2], [2, 1])
+        buffer.flush()
+        self.assertEqual((client.calls, buffer.stats()["enqueued"]), ([], 1))
+
+    def test_repeated_marking_is_merged(self) -> None:
+        client = FakeClient(failing_methods=("POST",))
+        buffer = _buffer(client)
+        buffer.add(7, [1, 2], [2, 5])
+        buffer.add(7, [2, 5], [2, 5, 6])
+        self.assertEqual(buffer.stats()["merged"], 1)
+        buffer.flush()
+        self.assertEqual(client.calls[0][2]["parameters"], {"add_tags": [5, 6], "remove_tags": [1]})
+        # Fallback schreibt die zusammengeführte vollständige Liste.
+        self.assertEqual(client.calls[1], ("PATCH", "/api/documents/7/", {"tags": [2, 5, 6]}))
+
+    def test_bulk_failure_falls_back_to_patch_and_reports_errors(self) -> None:
+        client = FakeClient(failing_methods=("POST",))
+        buffer = _buffer(client)
+        errors: list = []
+        buffer.add(1, [1], [5], on_error=errors.append)
+        buffer.add(2, [1], [5], on_error=errors.append)
+        buffer.flush()
+        self.assertEqual([call[0] for call in client.calls], ["POST", "PATCH", "PATCH"])
+        self.assertEqual(errors, [])
+        self.assertEqual(buffer.stats()["fallback_patches"], 2)
+
+        client.failing_methods = ("POST", "PATCH")
+        buffer.add(3, [1], [5], on_error=errors.append)
+        buffer.flush()
+        self.assertEqual(len(errors), 1)
+        self.assertIsInstance(errors[0], FakeApiError)
+        stats = buffer.stats()
+        self.assertEqual((stats["bulk_failures"], stats["failed"], stats["pending"]), (2, 1, 0))
+
+    def test_pending_limit_flushes_all_groups(self) -> None:
+        client = FakeClient()
+        buffer = _buffer(client, batch_size=2)
+        # Jede Markierung bildet eine eigene Gruppe; bei 4 * batch_size wird alles geschrieben.
+        for doc_id in range(1, 8):
+            buffer.add(doc_id, [1], [100 + doc_id])
+        self.assertEqual((client.calls, len(buffer)), ([], 7))
+        buffer.add(8, [1], [108])
+        self.assertEqual((len(client.calls), len(buffer)), (8, 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
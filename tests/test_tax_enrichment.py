@@ -3,6 +3,7 @@
 Purpose:
 - Protect the fixed taxonomy, WISO mapping layer, evidence validation, and
   exports against regressions.
+- Ensure failed tax AI attempts return their rate-limiter reservation.
 
 How to run:
 - `python3 -m unittest discover -s tests`
@@ -14,6 +15,7 @@ import json
 import tempfile
 import unittest
 from pathlib import Path
+from unittest import mock
 
 
 import sys
@@ -24,7 +26,12 @@ SRC_DIR = ROOT / "src"
 if str(SRC_DIR) not in sys.path:
     sys.path.insert(0, str(SRC_DIR))
 
-from tax_enrichment import (
+import requests  # noqa: E402
+
+from ai_rate_limiter import AiRateLimiter  # noqa: E402
+from tax_enrichment import (  # noqa: E402
+    TaxEnrichmentAiExtractor,
+    TaxEnrichmentError,
     TaxEnrichmentProcessor,
     TaxExportCollector,
     build_tax_tag_labels,
@@ -319,5 +326,69 @@ class TaxEnrichmentTests(unittest.TestCase):
             self.assertIn("Arbeitsmittel Maus", csv_text)
 
 
+class _FakeResponse:
+    def __init__(self, status_code: int, body: str) -> None:
+        self.status_code = status_code
+        self.text = body
+        self.headers: dict = {}
+
+    def raise_for_status(self) -> None:
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"HTTP {self.status_code}", response=self)
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class _ScriptedSession:
+    """Liefert pro `post` das nächste Ergebnis; Exceptions werden geworfen."""
+
+    def __init__(self, outcomes) -> None:
+        self.outcomes = list(outcomes)
+
+    def post(self, *_args, **_kwargs):
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+class TaxExtractorRateLimitTests(unittest.TestCase):
+    """Reservierungen des geteilten Limiters bei fehlgeschlagenen Tax-Requests."""
+
+    def test_failed_attempts_release_their_reservation(self) -> None:
+        limiter = AiRateLimiter(tokens_per_minute=100000)
+        extractor = TaxEnrichmentAiExtractor(
+            ai_model="test-model",
+            ai_api_key="key",
+            ai_base_url="http://tax.invalid/v1",
+            request_timeout_seconds=5,
+            rate_limiter=limiter,
+        )
+        self.addCleanup(extractor.close)
+        req_body = {"model": "test-model", "messages": [{"role": "user", "content": "Beleg"}]}
+        session = _ScriptedSession(
+            [
+                requests.ConnectionError("weg"),
+                _FakeResponse(503, "busy"),
+                _FakeResponse(200, "kein json"),
+            ]
+        )
+
+        with mock.patch("tax_enrichment.time.sleep"), self.assertRaises(TaxEnrichmentError):
+            extractor._post_extraction(
+                req_body,
+                500,
+                base_url=extractor.ai_base_url,
+                session=session,  # type: ignore[arg-type]
+                limiter=limiter,
+            )
+
+        estimated = limiter.estimate_request_tokens(500, req_body)
+        stats = limiter.stats()
+        self.assertEqual(stats["requests"], 3)
+        self.assertEqual(stats["released_tokens"], 3 * estimated)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -5,6 +5,7 @@ Purpose:
 - Ensure Home-Assistant config export and standalone worker config import stay
   compatible.
 - Verify the worker exposes stable status and document links for UI/remote mode.
+- Ensure review/merge calls reuse one Paperless connection pool.
 
 How to run:
 - `python3 -m unittest discover -s tests`
@@ -20,6 +21,7 @@ import textwrap
 import threading
 import types
 import unittest
+from unittest import mock
 from urllib.request import urlopen
 from pathlib import Path
 
@@ -296,6 +298,51 @@ class WorkerManagerTests(unittest.TestCase):
             )
             self.assertEqual(status["progress_completed_documents"], 15)
 
+    def test_status_exposes_ai_endpoint_stats_live_and_after_run(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            manager = WorkerManager(
+                data_dir=Path(tmp_dir),
+                sorter_command=["python3", "-c", "print('ok')"],
+                auth_token="",
+            )
+            self.assertIsNone(manager.status_payload()["ai_endpoints"])
+
+            live = {"failovers": 1, "exhausted": 0, "endpoints": [{"name": "primary", "state": "open"}]}
+            manager._apply_runtime_payload({"kind": "progress", "ai_endpoints": live})
+            self.assertEqual(manager.status_payload()["ai_endpoints"], live)
+
+            finished = {"failovers": 2, "exhausted": 0, "endpoints": [{"name": "primary", "state": "closed"}]}
+            manager.paths.metrics_file.write_text(
+                json.dumps({"last_run": {"performance": {"pipeline": {"ai_endpoints": finished}}}, "totals": {}}),
+                encoding="utf-8",
+            )
+            manager._refresh_metrics_from_file()
+            self.assertEqual(manager.status_payload()["ai_endpoints"], finished)
+
+    def test_review_clients_share_one_paperless_transport(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            manager = WorkerManager(
+                data_dir=Path(tmp_dir),
+                sorter_command=["python3", "-c", "print('ok')"],
+                auth_token="",
+            )
+            self.assertIsNone(manager.status_payload()["paperless_http"])
+            manager.import_config_yaml(self._valid_yaml(), source="unit_test")
+
+            first = manager._load_paperless_client()
+            second = manager._load_paperless_client()
+            self.assertIs(first.transport, second.transport)
+            status = manager.status_payload()["paperless_http"]
+            self.assertEqual((status["requests"], status["hosts"]), (0, {}))
+
+            manager.import_config_yaml(self._valid_yaml() + "\npaperless_http_pool_size: 3", source="unit_test")
+            with mock.patch.object(first.transport, "close") as close_old:
+                third = manager._load_paperless_client()
+            self.assertIsNot(third.transport, first.transport)
+            # Clients aus laufenden Review-/Merge-Aufrufen behalten einen offenen Pool.
+            close_old.assert_not_called()
+            self.assertEqual(manager.status_payload()["paperless_http"]["pool_maxsize"], 3)
+
     def test_sorter_command_receives_entity_review_rules_file(self) -> None:
         with tempfile.TemporaryDirectory() as tmp_dir:
             manager = WorkerManager(